@@ -0,0 +1,75 @@
+#Benchmark de arranque en frío de la API. Mide, en procesos nuevos
+#(como un worker de uvicorn recién lanzado):
+#  1. Lo que tarda `import src.api`.
+#  2. Lo que tarda el arranque completo (import + lifespan) hasta
+#     poder responder la primera petición.
+#
+#Uso:
+#    python bench/arranque.py --repeticiones 10
+#    DB_INICIALIZAR_AL_ARRANCAR=0 python bench/arranque.py
+#
+#No hacen falta claves de Groq ni Tavily. Si no se define DATABASE_URL
+#se usa un SQLite temporal para no depender de PostgreSQL.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+SOLO_IMPORT = """
+import time
+t = time.perf_counter()
+import src.api
+print(time.perf_counter() - t)
+"""
+
+HASTA_PRIMERA_PETICION = """
+import time
+t = time.perf_counter()
+from fastapi.testclient import TestClient
+import src.api
+with TestClient(src.api.app) as cliente:
+    cliente.get("/auth/me")
+print(time.perf_counter() - t)
+"""
+
+
+def medir(codigo: str, repeticiones: int, entorno: dict) -> list:
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=RAIZ, env=entorno,
+            capture_output=True, text=True, check=True
+        )
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]))
+    return tiempos
+
+
+def informe(nombre: str, tiempos: list):
+    print(f"{nombre:<28} media {statistics.mean(tiempos) * 1000:8.1f} ms   "
+          f"mín {min(tiempos) * 1000:8.1f} ms   máx {max(tiempos) * 1000:8.1f} ms")
+
+
+def main():
+    argumentos = argparse.ArgumentParser(description="Benchmark de arranque en frío de src.api")
+    argumentos.add_argument("--repeticiones", type=int, default=5)
+    args = argumentos.parse_args()
+
+    entorno = dict(os.environ, PYTHONPATH=str(RAIZ))
+    # Sin claves: el arranque no debe necesitarlas
+    entorno.pop("GROQ_API_KEY", None)
+    entorno.pop("TAVILY_API_KEY", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        entorno.setdefault("DATABASE_URL", f"sqlite:///{tmp}/arranque.db")
+        print(f"🏁 Arranque en frío ({args.repeticiones} repeticiones, BD: {entorno['DATABASE_URL']})")
+        informe("import src.api", medir(SOLO_IMPORT, args.repeticiones, entorno))
+        informe("hasta la 1ª petición", medir(HASTA_PRIMERA_PETICION, args.repeticiones, entorno))
+
+
+if __name__ == "__main__":
+    main()
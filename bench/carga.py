@@ -0,0 +1,250 @@
+#Prueba de carga de la API sin red: Tavily y Groq se sustituyen por los
+#proveedores falsos (src/proveedores_falsos.py) y la base de datos se
+#rellena con datos de prueba. Varios usuarios virtuales recorren la
+#aplicación a la vez (login, listado, búsqueda, confirmar, resultados,
+#calendario compartido...) y al final se imprime, por operación, p50,
+#p95, p99 y peticiones por segundo.
+#
+#Uso:
+#    python bench/carga.py --usuarios 20 --duracion 30
+#    python bench/carga.py --latencia-ms 300 --tasa-429 0.05
+#    DATABASE_URL=postgresql://... python bench/carga.py   # PostgreSQL local
+#    python bench/carga.py --url http://localhost:8000     # servidor ya arrancado
+#                                                            (con PROVEEDORES_FALSOS=1)
+#
+#Sin --url la API se ejecuta en este mismo proceso (httpx + ASGITransport).
+#Si no se define DATABASE_URL se usa un SQLite temporal.
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+# Peso de cada operación en el tráfico (lectura dominante, como en producción)
+MEZCLA = {
+    "listar": 30,
+    "calendario_compartido": 20,
+    "vista_compartida": 8,
+    "stats": 8,
+    "mejores_marcas": 4,
+    "buscar": 12,
+    "confirmar": 8,
+    "resultados": 8,
+    "login": 2,
+}
+
+NOMBRES_CARRERA = ["Maratón de Valencia", "Medio Maratón de Sevilla", "Behobia San Sebastián", "Trail Picos",
+                   "San Silvestre Vallecana", "Maratón de Madrid", "10K Bilbao", "Ultra Sierra Nevada",
+                   "Triatlón de Zarautz", "Gravel Pirineos", "Maratón de Barcelona", "Carrera de la Mujer"]
+
+
+# --- Datos de prueba ---
+def sembrar(usuarios: int, carreras_por_usuario: int) -> list:
+    """
+    Crea usuarios con carreras y resultados. Las carreras son del catálogo y
+    las comparten todos los usuarios, como en producción. Devuelve
+    [(email, share_token, [(nombre, año)])].
+    """
+    from src.database import SessionLocal, UserDB, RaceDB, CarreraDB, ResultadoDB, inicializar_db
+    from src.estadisticas import reconstruir
+    from src.texto import normalizar_texto
+
+    inicializar_db()
+    db = SessionLocal()
+    perfiles = []
+    try:
+        hoy = date.today()
+        races = []
+        for c in range(carreras_por_usuario):
+            nombre = f"{NOMBRES_CARRERA[c % len(NOMBRES_CARRERA)]} {c}"
+            race = RaceDB(
+                nombre=nombre, nombre_normalizado=normalizar_texto(nombre),
+                deporte=random.choice(["Running", "Trail", "Ciclismo"]),
+                fecha=hoy + timedelta(days=random.randint(-700, 300)), localizacion="Valencia",
+                distancia_resumen="42 km, 10 km", url_oficial=None,
+                estado_inscripcion=random.choice(["abierta", "cerrada", "pendiente"])
+            )
+            db.add(race)
+            races.append(race)
+        db.flush()
+        for u in range(usuarios):
+            email = f"carga{u}-{uuid.uuid4().hex[:6]}@racehub.test"
+            usuario = UserDB(nombre_completo=f"Corredor {u}", email=email, share_token=uuid.uuid4().hex[:10])
+            db.add(usuario)
+            db.flush()
+            carreras = []
+            for race in races:
+                carrera = CarreraDB(user_id=usuario.id, race_id=race.id, fecha=race.fecha)
+                db.add(carrera)
+                db.flush()
+                if race.fecha < hoy and random.random() < 0.5:
+                    segundos = random.randint(2400, 15000)
+                    db.add(ResultadoDB(
+                        carrera_id=carrera.id, tiempo_oficial=f"{segundos // 3600}:{segundos % 3600 // 60:02d}:00",
+                        tiempo_segundos=segundos - segundos % 60, distancia_km=42.195 if segundos > 8000 else 10.0
+                    ))
+                carreras.append((race.nombre, race.fecha.year))
+            perfiles.append((email, usuario.share_token, carreras))
+        reconstruir(db)
+        db.commit()
+    finally:
+        db.close()
+    return perfiles
+
+
+# --- Usuarios virtuales ---
+class Mediciones:
+    def __init__(self):
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+
+    def anotar(self, operacion: str, segundos: float, ok: bool):
+        self.tiempos[operacion].append(segundos)
+        if not ok:
+            self.errores[operacion] += 1
+
+
+async def _peticion(mediciones: Mediciones, operacion: str, cliente, metodo: str, url: str, **kwargs):
+    inicio = time.perf_counter()
+    try:
+        respuesta = await cliente.request(metodo, url, **kwargs)
+        ok = respuesta.status_code < 400
+    except Exception:
+        respuesta, ok = None, False
+    mediciones.anotar(operacion, time.perf_counter() - inicio, ok)
+    return respuesta
+
+
+async def usuario_virtual(crear_cliente, perfil, fin: float, mediciones: Mediciones):
+    email, share_token, carreras = perfil
+    etag = None
+    operaciones, pesos = zip(*MEZCLA.items())
+    async with crear_cliente() as cliente:
+        await _peticion(mediciones, "login", cliente, "POST", "/auth/login", json={"email": email})
+        while time.perf_counter() < fin:
+            operacion = random.choices(operaciones, pesos)[0]
+            if operacion == "login":
+                await _peticion(mediciones, operacion, cliente, "POST", "/auth/login", json={"email": email})
+            elif operacion == "listar":
+                await _peticion(mediciones, operacion, cliente, "GET", "/carreras")
+            elif operacion == "stats":
+                await _peticion(mediciones, operacion, cliente, "GET", "/stats")
+            elif operacion == "mejores_marcas":
+                await _peticion(mediciones, operacion, cliente, "GET", "/resultados/mejores-marcas")
+            elif operacion == "calendario_compartido":
+                cabeceras = {"If-None-Match": etag} if etag and random.random() < 0.5 else {}
+                respuesta = await _peticion(mediciones, operacion, cliente, "GET",
+                                            f"/api/share/{share_token}/carreras", headers=cabeceras)
+                if respuesta is not None:
+                    etag = respuesta.headers.get("etag", etag)
+            elif operacion == "vista_compartida":
+                await _peticion(mediciones, operacion, cliente, "GET", f"/share/{share_token}")
+            elif operacion == "buscar":
+                # Mitad carreras conocidas (caché), mitad nuevas (Tavily + LLM falsos)
+                nombre = random.choice(NOMBRES_CARRERA)
+                if random.random() < 0.5:
+                    nombre = f"{nombre} {uuid.uuid4().hex[:4]}"
+                await _peticion(mediciones, operacion, cliente, "POST", "/carreras/buscar", json={"nombre": nombre})
+            elif operacion == "confirmar":
+                await _peticion(mediciones, operacion, cliente, "POST", "/carreras/confirmar", json={
+                    "nombre_oficial": f"Carrera de carga {uuid.uuid4().hex[:8]}", "deporte": "Running",
+                    "fecha": (date.today() + timedelta(days=random.randint(1, 300))).isoformat(),
+                    "lugar": "Valencia", "distancias": ["10 km"], "url_oficial": None, "estado_inscripcion": "abierta"
+                })
+            elif operacion == "resultados":
+                nombre, año = random.choice(carreras)
+                respuesta = await _peticion(mediciones, operacion, cliente, "POST", "/resultados/buscar", json={
+                    "nombre_carrera": nombre, "anio": año, "nombre_corredor": "Juan García López"
+                })
+                if respuesta is not None and respuesta.status_code == 202:
+                    await _peticion(mediciones, "resultados_estado", cliente, "GET", respuesta.json()["url_estado"])
+
+
+# --- Informe ---
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def informe(mediciones: Mediciones, duracion: float):
+    total = sum(len(v) for v in mediciones.tiempos.values())
+    print(f"\n{'operación':<24}{'n':>7}{'errores':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}{'rps':>8}")
+    for operacion in sorted(mediciones.tiempos, key=lambda o: -len(mediciones.tiempos[o])):
+        tiempos = mediciones.tiempos[operacion]
+        print(f"{operacion:<24}{len(tiempos):>7}{mediciones.errores[operacion]:>9}"
+              f"{percentil(tiempos, 50) * 1000:>10.1f}{percentil(tiempos, 95) * 1000:>10.1f}"
+              f"{percentil(tiempos, 99) * 1000:>10.1f}{max(tiempos) * 1000:>10.1f}{len(tiempos) / duracion:>8.1f}")
+    todos = [t for tiempos in mediciones.tiempos.values() for t in tiempos]
+    errores = sum(mediciones.errores.values())
+    print(f"\n🏁 {total} peticiones en {duracion:.1f}s -> {total / duracion:.1f} rps, {errores} errores, "
+          f"p50 {percentil(todos, 50) * 1000:.1f} ms, p95 {percentil(todos, 95) * 1000:.1f} ms, "
+          f"p99 {percentil(todos, 99) * 1000:.1f} ms")
+
+
+async def ejecutar(args, perfiles):
+    import httpx
+
+    if args.url:
+        crear_cliente = lambda: httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from src.api import app
+        transporte = httpx.ASGITransport(app=app)
+        crear_cliente = lambda: httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=60)
+
+    mediciones = Mediciones()
+    inicio = time.perf_counter()
+    fin = inicio + args.duracion
+    await asyncio.gather(*(
+        usuario_virtual(crear_cliente, perfiles[i % len(perfiles)], fin, mediciones) for i in range(args.usuarios)
+    ))
+    informe(mediciones, time.perf_counter() - inicio)
+
+
+def main():
+    argumentos = argparse.ArgumentParser(description="Prueba de carga de src.api con proveedores falsos")
+    argumentos.add_argument("--usuarios", type=int, default=20, help="usuarios virtuales concurrentes")
+    argumentos.add_argument("--duracion", type=float, default=20, help="segundos de carga")
+    argumentos.add_argument("--carreras", type=int, default=40, help="carreras sembradas por usuario")
+    argumentos.add_argument("--latencia-ms", type=float, default=150, help="latencia media de Tavily (el LLM, x4)")
+    argumentos.add_argument("--tasa-error", type=float, default=0.0)
+    argumentos.add_argument("--tasa-429", type=float, default=0.0)
+    argumentos.add_argument("--cuotas-reales", action="store_true",
+                            help="respetar GROQ_RPM/TAVILY_RPM (por defecto se levantan para medir la app)")
+    argumentos.add_argument("--url", help="atacar un servidor ya arrancado en vez de la app en proceso")
+    args = argumentos.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="racehub_carga_")
+    # Antes de importar src.*: la configuración se lee al importar
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/carga.db")
+    os.environ["PROVEEDORES_FALSOS"] = "1"
+    os.environ["FALSO_LATENCIA_MS"] = str(args.latencia_ms)
+    os.environ["FALSO_TASA_ERROR"] = str(args.tasa_error)
+    os.environ["FALSO_TASA_429"] = str(args.tasa_429)
+    os.environ["LIMITADOR_FICHERO"] = f"{tmp}/limitador.json"
+    os.environ["LIMITADOR_BACKOFF_BASE"] = "1.2"
+    if not args.cuotas_reales:
+        for proveedor in ("GROQ", "TAVILY"):
+            os.environ[f"{proveedor}_RPM"] = "100000"
+            os.environ[f"{proveedor}_RAFAGA"] = "1000"
+
+    usuarios_distintos = max(1, min(args.usuarios, 50))
+    print(f"🌱 Sembrando {usuarios_distintos} usuarios x {args.carreras} carreras en {os.environ['DATABASE_URL']}")
+    perfiles = sembrar(usuarios_distintos, args.carreras)
+    print(f"🚀 {args.usuarios} usuarios virtuales durante {args.duracion:.0f}s "
+          f"(latencia {args.latencia_ms:.0f} ms, errores {args.tasa_error:.0%}, 429 {args.tasa_429:.0%})")
+    asyncio.run(ejecutar(args, perfiles))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
--- Limpieza inicial (orden importa por foreign keys)
+-- Limpieza inicial (orden importa por foreign keys). Las cachés compartidas
+-- (extracciones, clasificaciones) no dependen de users y se conservan
+DROP TABLE IF EXISTS calendarios_ics;
+DROP TABLE IF EXISTS estadisticas_usuario;
+DROP TABLE IF EXISTS trabajos;
 DROP TABLE IF EXISTS resultados;
 DROP TABLE IF EXISTS carreras;
+DROP TABLE IF EXISTS races;
 DROP TABLE IF EXISTS users;
 
 -- 0. Tabla de Usuarios
@@ -9,6 +14,7 @@ CREATE TABLE users (
     nombre_completo VARCHAR(255) NOT NULL,
     email VARCHAR(255) UNIQUE NOT NULL,
     share_token VARCHAR(255) UNIQUE,
+    calendario_actualizado_en TIMESTAMP,       -- Last-Modified del calendario compartido
     creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -17,19 +23,41 @@ INSERT INTO users (id, nombre_completo, email)
 VALUES (1, 'Usuario Demo', 'demo@racehub.com')
 ON CONFLICT (id) DO NOTHING;
 
--- 1. Tabla de Carreras
-CREATE TABLE carreras (
+-- 1. Catálogo global de carreras (una fila por carrera real, compartida por todos los usuarios)
+CREATE TABLE races (
     id SERIAL PRIMARY KEY,
-    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE, -- Vinculación con el usuario
     nombre VARCHAR(255) NOT NULL,
+    nombre_normalizado VARCHAR(255) NOT NULL,   -- Sin tildes ni mayúsculas (búsqueda aproximada)
     deporte VARCHAR(100) NOT NULL,
     fecha DATE NOT NULL,
     localizacion VARCHAR(255),
     distancia_resumen VARCHAR(255),
     url_oficial TEXT,
     estado_inscripcion VARCHAR(50) DEFAULT 'pendiente',
-    CONSTRAINT carrera_usuario_unica UNIQUE (user_id, nombre, fecha) -- Evita duplicados POR usuario
+    comprobada_en TIMESTAMP,                    -- Última revisión automática (src/actualizador.py)
+    CONSTRAINT race_unica UNIQUE (nombre_normalizado, fecha) -- Una vez cada carrera real
+);
+CREATE INDEX ix_races_fecha_nombre ON races (fecha, nombre_normalizado); -- Próximas carreras para el actualizador
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX ix_races_nombre_trgm ON races USING gin (nombre_normalizado gin_trgm_ops); -- Búsqueda aproximada por nombre
+
+-- 1.1 Carreras de cada usuario (enlace al catálogo y lo que es solo suyo)
+CREATE TABLE carreras (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE, -- Vinculación con el usuario
+    race_id INTEGER NOT NULL REFERENCES races(id),
+    fecha DATE,                                 -- Copia de races.fecha (ordena la lista del usuario)
+    resultado_solicitado_en TIMESTAMP,          -- Búsqueda de resultado encolada tras la carrera
+    -- Datos que el usuario guardó distintos del catálogo (NULL = los de races). Solo los ve él
+    deporte_usuario VARCHAR(100),
+    localizacion_usuario VARCHAR(255),
+    distancia_resumen_usuario VARCHAR(255),
+    url_oficial_usuario TEXT,
+    estado_inscripcion_usuario VARCHAR(50),
+    CONSTRAINT carrera_usuario_unica UNIQUE (user_id, race_id) -- Evita duplicados POR usuario
 );
+CREATE INDEX ix_carreras_race ON carreras (race_id); -- Usuarios que siguen una carrera
+CREATE INDEX ix_carreras_user_fecha ON carreras (user_id, fecha, id); -- Lista de un usuario (paginación por cursor)
 
 -- 2. Tabla de Resultados (Tus marcas personales)
 -- ... (resto igual)
@@ -39,5 +67,71 @@ CREATE TABLE resultados (
     tiempo_oficial VARCHAR(50),                 -- Formato texto para flexibilidad (ej: "01:30:45")
     posicion_general INTEGER,
     ritmo_medio VARCHAR(50),                    -- Ej: "4:15 min/km"
-    comentarios TEXT                            -- Para sensaciones o clima
-);
\ No newline at end of file
+    comentarios TEXT,                           -- Para sensaciones o clima
+    tiempo_segundos INTEGER,                    -- tiempo_oficial en segundos (NULL si no se pudo leer)
+    ritmo_segundos_km INTEGER,                  -- ritmo_medio en segundos por km
+    distancia_km DOUBLE PRECISION               -- Distancia corrida (para agrupar mejores marcas)
+);
+CREATE INDEX ix_resultados_carrera_tiempo ON resultados (carrera_id, tiempo_segundos); -- Mejores marcas
+
+-- 3. Caché de extracciones (Tavily + LLM) compartida entre workers
+CREATE TABLE IF NOT EXISTS cache_extracciones (
+    clave VARCHAR(255) PRIMARY KEY,             -- "carrera:<nombre normalizado>:<año>"
+    datos TEXT NOT NULL,                        -- CarreraSchema en JSON
+    actualizado_en TIMESTAMP NOT NULL           -- Para calcular la caducidad (TTL)
+);
+
+-- 4. Tareas en segundo plano (búsqueda de resultados)
+CREATE TABLE IF NOT EXISTS trabajos (
+    id VARCHAR(32) PRIMARY KEY,                 -- uuid hex
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    tipo VARCHAR(50) NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente', -- pendiente, buscando, guardando, completado, error
+    parametros TEXT,                            -- JSON
+    resultado TEXT,                             -- JSON
+    error TEXT,
+    creado_en TIMESTAMP NOT NULL,
+    actualizado_en TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_trabajos_user_id ON trabajos(user_id);
+
+-- 5. Contadores por usuario para /stats (se ajustan al escribir carreras y resultados)
+CREATE TABLE IF NOT EXISTS estadisticas_usuario (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    dimension VARCHAR(20) NOT NULL,             -- total, deporte, anio, mes, abierta, resultados, con_resultado
+    clave VARCHAR(50) NOT NULL DEFAULT '',      -- "running", "2025", "2025-04", "2025-04-27"...
+    valor INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, dimension, clave)
+);
+
+-- 6. Clasificaciones completas descargadas una vez por carrera y año
+CREATE TABLE IF NOT EXISTS clasificaciones (
+    id SERIAL PRIMARY KEY,
+    clave VARCHAR(255) UNIQUE NOT NULL,         -- "<nombre normalizado>:<año>"
+    nombre_carrera VARCHAR(255) NOT NULL,
+    anio INTEGER NOT NULL,
+    url_fuente TEXT,
+    num_filas INTEGER NOT NULL DEFAULT 0,       -- 0 = no se encontró un listado legible
+    descargada_en TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS clasificacion_filas (
+    id SERIAL PRIMARY KEY,
+    clasificacion_id INTEGER NOT NULL REFERENCES clasificaciones(id) ON DELETE CASCADE,
+    clave_corredor VARCHAR(255) NOT NULL,       -- Palabras del nombre normalizadas y ordenadas
+    nombre VARCHAR(255) NOT NULL,
+    posicion_general INTEGER,
+    posicion_categoria INTEGER,
+    categoria VARCHAR(50),
+    tiempo VARCHAR(20),
+    ritmo VARCHAR(20)
+);
+CREATE INDEX IF NOT EXISTS ix_clasificacion_filas_corredor ON clasificacion_filas (clasificacion_id, clave_corredor);
+
+-- 7. Calendario compartido ya renderizado en iCalendar (/share/{token}.ics)
+CREATE TABLE IF NOT EXISTS calendarios_ics (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    cuerpo TEXT NOT NULL,                       -- VCALENDAR completo
+    etag VARCHAR(40) NOT NULL,
+    generado_en TIMESTAMP NOT NULL              -- Last-Modified
+);
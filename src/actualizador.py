@@ -0,0 +1,302 @@
+#Tareas programadas dentro del propio proceso (sin broker ni cron):
+#mantiene al día las carreras guardadas, que si no se quedan con la
+#fecha y el estado de inscripción del día en que se confirmaron.
+#
+#Cada ronda (cada ACTUALIZADOR_INTERVALO_MIN minutos):
+#  1. Encola la búsqueda de resultado de las carreras ya celebradas
+#     (una vez por carrera, con prioridad de fondo).
+#  2. Revisa las PRÓXIMAS carreras del catálogo (las que sigue algún
+#     usuario) empezando por las que hace más que no se comprueban. Cada
+#     una es una sola búsqueda la sigan cuantos usuarios la sigan, y solo
+#     se escriben los campos que cambian (src/catalogo.py).
+#Entre las dos no se pasa de ACTUALIZADOR_PRESUPUESTO búsquedas, y
+#todas van por el carril de fondo del limitador: nunca quitan cuota
+#a los usuarios que están esperando.
+#
+#Con varios workers de uvicorn, un fichero con cerrojo (flock) guarda
+#la hora de la última ronda y solo uno de ellos la ejecuta.
+#
+#Gasta cuota de Tavily y del LLM sin que nadie lo pida, así que está
+#desactivado salvo ACTUALIZADOR_ACTIVO=1 (y aun así no arranca sin las
+#claves o PROVEEDORES_FALSOS=1). Una carrera solo cuenta como comprobada
+#si la búsqueda sale bien; las que fallan se reintentan en otra ronda
+#y, mientras tanto, este worker no las vuelve a intentar durante
+#ACTUALIZADOR_ANTIGUEDAD_HORAS para que no bloqueen la cola.
+#
+#Uso manual (una ronda y salir):
+#    python -m src.actualizador
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from dateutil import parser
+from sqlalchemy import func
+from sqlalchemy.orm import Session, contains_eager
+
+from src import catalogo
+from src.database import SessionLocal, RaceDB, CarreraDB, ResultadoDB, UserDB
+from src.limitador import CuotaAgotada, PRIORIDAD_FONDO
+from src.main import buscar_y_extraer_datos, PROVEEDORES_FALSOS
+from src.metricas import contar, medir
+from src.trabajos import encolar_busqueda_resultado
+
+try:
+    import fcntl
+except ImportError:  # Windows: cada proceso decide por su cuenta
+    fcntl = None
+
+ACTUALIZADOR_ACTIVO = os.getenv("ACTUALIZADOR_ACTIVO", "0") == "1"
+ACTUALIZADOR_INTERVALO_MIN = float(os.getenv("ACTUALIZADOR_INTERVALO_MIN", "360"))
+# Búsquedas (Tavily + LLM) como máximo por ronda, sumando revisiones y resultados
+ACTUALIZADOR_PRESUPUESTO = int(os.getenv("ACTUALIZADOR_PRESUPUESTO", "20"))
+# No se vuelve a revisar una carrera comprobada hace menos de esto
+ACTUALIZADOR_ANTIGUEDAD_HORAS = float(os.getenv("ACTUALIZADOR_ANTIGUEDAD_HORAS", "24"))
+# Resultados: días tras la carrera antes de buscarlos, y hasta cuántos días atrás
+ACTUALIZADOR_DIAS_RESULTADOS = int(os.getenv("ACTUALIZADOR_DIAS_RESULTADOS", "1"))
+ACTUALIZADOR_VENTANA_RESULTADOS = int(os.getenv("ACTUALIZADOR_VENTANA_RESULTADOS", "90"))
+# Segundos tras el arranque antes de la primera ronda
+ACTUALIZADOR_RETRASO_INICIAL = float(os.getenv("ACTUALIZADOR_RETRASO_INICIAL", "60"))
+ACTUALIZADOR_FICHERO = os.getenv("ACTUALIZADOR_FICHERO",
+                                 os.path.join(tempfile.gettempdir(), "racehub_actualizador.json"))
+
+# Una fecha nueva más lejos que esto es otra edición, no un cambio de fecha
+MAX_DESPLAZAMIENTO_FECHA = timedelta(days=180)
+NUNCA = datetime(1970, 1, 1)
+
+_parar = threading.Event()
+_hilo: Optional[threading.Thread] = None
+_ultima_local = 0.0
+# race_id -> cuándo falló su última revisión en este worker
+_fallidas: Dict[int, datetime] = {}
+
+
+# --- 1. Resultados de carreras ya celebradas ---
+def encolar_resultados(limite: int) -> int:
+    """Encola hasta `limite` búsquedas de resultado pendientes. Devuelve cuántas."""
+    if limite <= 0:
+        return 0
+    hoy = date.today()
+    db: Session = SessionLocal()
+    try:
+        pendientes = (
+            db.query(CarreraDB, UserDB.nombre_completo)
+            .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+            .options(contains_eager(CarreraDB.race))
+            .join(UserDB, UserDB.id == CarreraDB.user_id)
+            .outerjoin(ResultadoDB, ResultadoDB.carrera_id == CarreraDB.id)
+            .filter(
+                RaceDB.fecha <= hoy - timedelta(days=ACTUALIZADOR_DIAS_RESULTADOS),
+                RaceDB.fecha >= hoy - timedelta(days=ACTUALIZADOR_VENTANA_RESULTADOS),
+                CarreraDB.resultado_solicitado_en.is_(None),
+                ResultadoDB.id.is_(None),
+            )
+            .order_by(RaceDB.fecha.desc(), CarreraDB.id)
+            .limit(limite)
+            .all()
+        )
+        for carrera, nombre_corredor in pendientes:
+            encolar_busqueda_resultado(carrera.user_id, carrera.nombre, carrera.fecha.year, nombre_corredor,
+                                       prioridad=PRIORIDAD_FONDO)
+            carrera.resultado_solicitado_en = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+    if pendientes:
+        contar("racehub_actualizador_resultados_encolados_total", len(pendientes))
+        print(f"🏁 Actualizador: {len(pendientes)} búsquedas de resultado encoladas")
+    return len(pendientes)
+
+
+# --- 2. Revisión de próximas carreras ---
+def _pendientes(db: Session, limite: int) -> list:
+    """
+    Ids de las próximas carreras del catálogo con seguidores, las revisadas
+    hace más tiempo primero (sin las que han fallado hace poco aquí).
+    """
+    hace = datetime.now() - timedelta(hours=ACTUALIZADOR_ANTIGUEDAD_HORAS)
+    for race_id in [race_id for race_id, cuando in _fallidas.items() if cuando < hace]:
+        del _fallidas[race_id]
+    ultima_revision = func.coalesce(RaceDB.comprobada_en, NUNCA)
+    seguida = db.query(CarreraDB.id).filter(CarreraDB.race_id == RaceDB.id).exists()
+    consulta = db.query(RaceDB.id).filter(RaceDB.fecha >= date.today(), ultima_revision < hace, seguida)
+    if _fallidas:
+        consulta = consulta.filter(RaceDB.id.notin_(list(_fallidas)))
+    return [race_id for (race_id,) in consulta.order_by(ultima_revision, RaceDB.fecha).limit(limite)]
+
+
+def _valores_nuevos(datos) -> dict:
+    """Campos de la extracción que se pueden aplicar a una carrera guardada (los vacíos no)."""
+    valores = {
+        "fecha": parser.parse(datos.fecha).date(),
+        "estado_inscripcion": datos.estado_inscripcion.lower(),
+        "localizacion": datos.lugar,
+        "distancia_resumen": ", ".join(datos.distancias),
+        "url_oficial": datos.url_oficial,
+    }
+    return {campo: valor for campo, valor in valores.items() if valor}
+
+
+def _cambios(db: Session, race: RaceDB, valores: dict) -> dict:
+    cambios = catalogo.cambios_de(race, valores)
+    fecha = cambios.get("fecha")
+    if fecha is not None:
+        ocupada = db.query(RaceDB.id).filter(
+            RaceDB.nombre_normalizado == race.nombre_normalizado, RaceDB.fecha == fecha
+        ).first() is not None
+        # Edición pasada, otra edición distinta o una que ya está en el catálogo
+        if fecha < date.today() or abs(fecha - race.fecha) > MAX_DESPLAZAMIENTO_FECHA or ocupada:
+            del cambios["fecha"]
+    return cambios
+
+
+def revisar_carrera(race_id: int) -> int:
+    """
+    Una búsqueda para una carrera del catálogo. Devuelve a cuántos usuarios
+    les cambió. Si la búsqueda falla la excepción sigue hacia arriba y la
+    carrera no se marca como comprobada.
+    """
+    db: Session = SessionLocal()
+    try:
+        race = db.get(RaceDB, race_id)
+        if race is None:
+            return 0
+        contar("racehub_actualizador_busquedas_total")
+        datos = buscar_y_extraer_datos(race.nombre, max_results=5, forzar_refresco=True, prioridad=PRIORIDAD_FONDO)
+        valores = _valores_nuevos(datos)
+
+        race.comprobada_en = datetime.now()
+        cambios = _cambios(db, race, valores)
+        usuarios = catalogo.aplicar_cambios(db, race, cambios)
+        for campo in cambios:
+            contar("racehub_actualizador_cambios_total", campo=campo)
+        if cambios:
+            print(f"🔄 Actualizador: '{race.nombre}' ({len(usuarios)} usuarios): {', '.join(cambios)}")
+        db.commit()
+        return len(usuarios)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def ejecutar_ronda(presupuesto: int = ACTUALIZADOR_PRESUPUESTO) -> dict:
+    """Una ronda completa. Los resultados se llevan como mucho la mitad del presupuesto."""
+    resumen = {"resultados_encolados": 0, "carreras_revisadas": 0, "carreras_actualizadas": 0, "carreras_fallidas": 0}
+    with medir("actualizador"):
+        resumen["resultados_encolados"] = encolar_resultados(presupuesto // 2)
+        restante = presupuesto - resumen["resultados_encolados"]
+
+        db: Session = SessionLocal()
+        try:
+            pendientes = _pendientes(db, restante) if restante > 0 else []
+        finally:
+            db.close()
+
+        for race_id in pendientes:
+            if _parar.is_set():
+                break
+            try:
+                resumen["carreras_actualizadas"] += revisar_carrera(race_id)
+            except CuotaAgotada as e:
+                print(f"⏳ Actualizador: ronda interrumpida, {e}")
+                break
+            except Exception as e:
+                print(f"⚠️ Actualizador: no se pudo revisar la carrera {race_id}: {e}")
+                contar("racehub_actualizador_fallos_total")
+                _fallidas[race_id] = datetime.now()
+                resumen["carreras_fallidas"] += 1
+                continue
+            _fallidas.pop(race_id, None)
+            resumen["carreras_revisadas"] += 1
+    print(f"🗓️ Actualizador: {resumen['carreras_revisadas']} carreras revisadas, "
+          f"{resumen['carreras_actualizadas']} actualizadas, {resumen['carreras_fallidas']} fallidas, "
+          f"{resumen['resultados_encolados']} resultados encolados")
+    return resumen
+
+
+# --- 3. Planificación ---
+def _me_toca() -> bool:
+    """True si ha pasado el intervalo desde la última ronda de CUALQUIER worker (y la reserva)."""
+    global _ultima_local
+    ahora = time.time()
+    intervalo = ACTUALIZADOR_INTERVALO_MIN * 60
+    if fcntl is None:
+        if ahora - _ultima_local < intervalo:
+            return False
+        _ultima_local = ahora
+        return True
+    with open(ACTUALIZADOR_FICHERO, "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False # Otro worker está decidiendo ahora mismo
+        try:
+            f.seek(0)
+            try:
+                estado = json.loads(f.read() or "{}")
+            except ValueError:
+                estado = {}
+            if ahora - estado.get("ultima_ronda", 0) < intervalo:
+                return False
+            f.seek(0)
+            f.truncate()
+            json.dump({"ultima_ronda": ahora, "pid": os.getpid()}, f)
+            return True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _bucle():
+    if _parar.wait(ACTUALIZADOR_RETRASO_INICIAL):
+        return
+    while True:
+        try:
+            if _me_toca():
+                ejecutar_ronda()
+        except Exception as e:
+            print(f"❌ Actualizador: error en la ronda: {e}")
+        # Cada minuto se mira si ya toca; la ronda la hace un solo worker
+        if _parar.wait(60):
+            return
+
+
+def _proveedores_configurados() -> bool:
+    return PROVEEDORES_FALSOS or bool(os.getenv("GROQ_API_KEY") and os.getenv("TAVILY_API_KEY"))
+
+
+def iniciar_actualizador():
+    global _hilo
+    if not ACTUALIZADOR_ACTIVO or _hilo is not None:
+        return
+    if not _proveedores_configurados():
+        print("⚠️ Actualizador desactivado: faltan GROQ_API_KEY o TAVILY_API_KEY")
+        return
+    _parar.clear()
+    _hilo = threading.Thread(target=_bucle, name="racehub-actualizador", daemon=True)
+    _hilo.start()
+    print(f"🗓️ Actualizador activo: una ronda cada {ACTUALIZADOR_INTERVALO_MIN:.0f} min, "
+          f"hasta {ACTUALIZADOR_PRESUPUESTO} búsquedas")
+
+
+def detener_actualizador():
+    """Apagado ordenado: la ronda en curso termina la carrera que está revisando."""
+    global _hilo
+    _parar.set()
+    if _hilo is not None:
+        _hilo.join(timeout=30)
+        _hilo = None
+
+
+if __name__ == "__main__":
+    from src.database import inicializar_db
+    from src.trabajos import cerrar_pool
+
+    inicializar_db()
+    ejecutar_ronda()
+    cerrar_pool() # Espera a las búsquedas de resultado encoladas
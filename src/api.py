@@ -1,15 +1,36 @@
-from fastapi import FastAPI, Depends, Request, HTTPException, Response
+from fastapi import FastAPI, Depends, Request, HTTPException, Response, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import Session, contains_eager
 from typing import List, Optional
+from contextlib import asynccontextmanager
+import anyio
+import asyncio
+import base64
+import calendar
+import json
+import os
 import shortuuid
-from src.database import SessionLocal, CarreraDB, UserDB, ResultadoDB
+import time
+from src.database import SessionLocal, RaceDB, CarreraDB, UserDB, ResultadoDB, inicializar_db, valor_efectivo
+from src.cache import CacheLRU, cache_extracciones
+from src.contexto import metricas_contexto
+from src.metricas import registro, iniciar_peticion, etapas_peticion, terminar_peticion
+from src.extractor_reglas import estadisticas_reglas
+from src.vuelo_unico import vuelos
 from pydantic import BaseModel
 from datetime import date
-from src.main import buscar_y_extraer_datos, guardar_en_db, CarreraSchema, buscar_resultado_usuario, guardar_resultado_db
+from src.main import abuscar_y_extraer_datos, abuscar_y_extraer_datos_stream, aprocesar_lote, guardar_en_db, guardar_lote_en_db, CarreraSchema
+from src.trabajos import encolar_busqueda_resultado, obtener_trabajo, cerrar_pool, caducar_trabajos
+from src.actualizador import iniciar_actualizador, detener_actualizador
+from src import estadisticas
+from src.tiempos import formatear_tiempo, formatear_ritmo
+from src.compartir import carrera_a_dict, obtener_feed, obtener_ics, regenerar_ics, respuesta_condicional, calendario_modificado, invalidar_feed
 from pathlib import Path
+from src.estaticos import ActivosEstaticos
+from src import intercambio
 
 # --- Dependencia de Base de Datos ---
 def get_db():
@@ -28,6 +49,10 @@ class UsuarioUpdate(BaseModel):
 
 class SolicitudCarrera(BaseModel):
     nombre: str
+    forzar_refresco: bool = False # Ignora la caché y vuelve a consultar Tavily + LLM
+
+class SolicitudLote(BaseModel):
+    nombres: List[str]
 
 class ConfirmacionCarrera(BaseModel):
     nombre_oficial: str
@@ -43,6 +68,26 @@ class SolicitudResultado(BaseModel):
     anio: int
     nombre_corredor: Optional[str] = None
 
+class UsuarioSesion(BaseModel):
+    # Copia ligera del usuario autenticado (lo que guarda la caché de sesiones)
+    id: int
+    email: str
+    nombre_completo: str
+    share_token: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class MejorMarcaOut(BaseModel):
+    deporte: str
+    distancia_km: float
+    tiempo_segundos: int
+    tiempo: str
+    ritmo: Optional[str]
+    carrera_id: int
+    carrera: str
+    fecha: Optional[date]
+
 class CarreraOut(BaseModel):
     id: int
     nombre: str
@@ -57,21 +102,100 @@ class CarreraOut(BaseModel):
         from_attributes = True
 
 # --- Configuración de la App ---
-app = FastAPI(title="RaceHub API")
+# Comprobación del esquema al arrancar. Los workers que se añaden para escalar
+# pueden saltársela con DB_INICIALIZAR_AL_ARRANCAR=0 (el primero ya la hizo).
+DB_INICIALIZAR_AL_ARRANCAR = os.getenv("DB_INICIALIZAR_AL_ARRANCAR", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_INICIALIZAR_AL_ARRANCAR:
+        await run_in_threadpool(inicializar_db)
+    # Tareas que un proceso anterior dejó a medias
+    caducadas = await run_in_threadpool(caducar_trabajos)
+    if caducadas:
+        print(f"🧹 {caducadas} tareas de resultados interrumpidas marcadas como error")
+    iniciar_actualizador()
+    # Hash y compresión de static/ antes de la primera petición
+    await run_in_threadpool(activos_estaticos.manifiesto)
+    yield
+    # Apagado ordenado: dejamos terminar la ronda del actualizador y las tareas de resultados en curso
+    await run_in_threadpool(detener_actualizador)
+    await run_in_threadpool(cerrar_pool)
+
+app = FastAPI(title="RaceHub API", lifespan=lifespan)
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    """Histograma por ruta (la plantilla, no la URL concreta) y log opcional de peticiones lentas."""
+    token = iniciar_peticion()
+    inicio = time.perf_counter()
+
+    def terminar(etapas: dict, estado: int):
+        ruta = getattr(request.scope.get("route"), "path", "sin_ruta")
+        terminar_peticion(etapas, request.method, ruta, estado, time.perf_counter() - inicio)
+
+    try:
+        respuesta = await call_next(request)
+    except BaseException:
+        terminar(etapas_peticion(token), 500)
+        raise
+    etapas = etapas_peticion(token)
+
+    # call_next vuelve con las cabeceras; el cuerpo (NDJSON, SSE, exportaciones)
+    # se envía después: la petición termina cuando se acaba de enviar
+    cuerpo = respuesta.body_iterator
+
+    async def enviar_y_medir():
+        try:
+            async for trozo in cuerpo:
+                yield trozo
+        finally:
+            terminar(etapas, respuesta.status_code)
+
+    respuesta.body_iterator = enviar_y_medir()
+    return respuesta
+
+@app.get("/metrics")
+def metricas_prometheus():
+    """Métricas de este worker en formato de texto de Prometheus."""
+    return Response(content=registro.texto(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Búsquedas simultáneas máximas por cada importación por lotes
+BATCH_CONCURRENCIA = int(os.getenv("BATCH_CONCURRENCIA", "5"))
+BATCH_MAX_CARRERAS = int(os.getenv("BATCH_MAX_CARRERAS", "50"))
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+# Ficheros con hash en el nombre, ya comprimidos y cacheables para siempre (ver src/estaticos.py)
+activos_estaticos = ActivosEstaticos(BASE_DIR / "static")
+app.mount("/static", activos_estaticos, name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.globals["estatico"] = activos_estaticos.url
 
 # --- Helper de Autenticación ---
-def get_current_user(request: Request, db: Session = Depends(get_db)):
+# Caché de sesiones: cookie user_email -> UsuarioSesion. Evita un SELECT (y abrir
+# una sesión de BD) en cada petición autenticada. Se invalida explícitamente al
+# cambiar el perfil, hacer login o crear el enlace de compartir; el TTL acota lo
+# que puede tardar otro worker en ver esos cambios.
+USUARIOS_CACHE_MAX = int(os.getenv("USUARIOS_CACHE_MAX", "2048"))
+USUARIOS_CACHE_TTL = float(os.getenv("USUARIOS_CACHE_TTL", "60"))
+cache_usuarios = CacheLRU(USUARIOS_CACHE_MAX, ttl_segundos=USUARIOS_CACHE_TTL)
+
+def get_current_user(request: Request) -> UsuarioSesion:
     user_email = request.cookies.get("user_email")
     if not user_email:
         raise HTTPException(status_code=401, detail="No has iniciado sesión")
     
-    user = db.query(UserDB).filter(UserDB.email == user_email).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario no válido")
+    user = cache_usuarios.get(user_email)
+    if user is None:
+        db = SessionLocal()
+        try:
+            fila = db.query(UserDB).filter(UserDB.email == user_email).first()
+        finally:
+            db.close()
+        if not fila:
+            raise HTTPException(status_code=401, detail="Usuario no válido")
+        user = UsuarioSesion.model_validate(fila)
+        cache_usuarios.set(user_email, user)
     return user
 
 # --- Endpoints de Autenticación ---
@@ -85,6 +209,7 @@ def login(datos: UsuarioLogin, response: Response, db: Session = Depends(get_db)
         db.commit()
         db.refresh(user)
     
+    cache_usuarios.invalidar(user.email)
     response.set_cookie(key="user_email", value=user.email, max_age=31536000)
     return {"mensaje": "Login exitoso", "user": user.email}
 
@@ -94,25 +219,47 @@ def logout(response: Response):
     return {"mensaje": "Logout exitoso"}
 
 @app.get("/auth/me")
-def check_auth(user: UserDB = Depends(get_current_user)):
+def check_auth(user: UsuarioSesion = Depends(get_current_user)):
     return {"email": user.email, "nombre": user.nombre_completo}
 
+@app.get("/cache/estadisticas")
+def estadisticas_cache(user: UsuarioSesion = Depends(get_current_user)):
+    """Aciertos y fallos de las cachés en memoria de este worker, y tokens ahorrados al LLM."""
+    return {
+        "usuarios": cache_usuarios.estadisticas(),
+        "extracciones": cache_extracciones.memoria.estadisticas(),
+        "contexto": metricas_contexto.estadisticas(),
+        "extractor_reglas": estadisticas_reglas.estadisticas(),
+        "vuelo_unico": vuelos.estadisticas(),
+    }
+
+@app.get("/stats")
+def obtener_estadisticas(user: UsuarioSesion = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Panel del usuario: se lee de los contadores de estadisticas_usuario, no de carreras/resultados."""
+    return estadisticas.resumen(db, user.id)
+
 # --- Gestión de Perfil ---
 @app.get("/perfil")
-def obtener_perfil(user: UserDB = Depends(get_current_user)):
+def obtener_perfil(user: UsuarioSesion = Depends(get_current_user)):
     return {"nombre": user.nombre_completo, "email": user.email}
 
 @app.post("/perfil")
-def actualizar_perfil(datos: UsuarioUpdate, user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
-    user.nombre_completo = datos.nombre_completo
+def actualizar_perfil(datos: UsuarioUpdate, user: UsuarioSesion = Depends(get_current_user), db: Session = Depends(get_db)):
+    fila = db.get(UserDB, user.id)
+    fila.nombre_completo = datos.nombre_completo
+    regenerar_ics(db, user.id) # El nombre aparece en el calendario compartido
     db.commit()
-    return {"mensaje": "Perfil actualizado", "nombre": user.nombre_completo}
+    cache_usuarios.invalidar(user.email)
+    invalidar_feed(user.id)
+    return {"mensaje": "Perfil actualizado", "nombre": fila.nombre_completo}
 
 # --- Búsqueda de Carreras ---
+# Endpoints async: la espera a Tavily y Groq no retiene hilos del threadpool,
+# así que las búsquedas largas no bloquean /carreras ni /auth/me.
 @app.post("/carreras/buscar")
-def buscar_carrera(solicitud: SolicitudCarrera):
+async def buscar_carrera(solicitud: SolicitudCarrera):
     try:
-        resultado = buscar_y_extraer_datos(solicitud.nombre, max_results=5)
+        resultado = await abuscar_y_extraer_datos(solicitud.nombre, max_results=5, forzar_refresco=solicitud.forzar_refresco)
         return {
             "nombre_oficial": resultado.nombre_oficial,
             "deporte": resultado.deporte,
@@ -125,8 +272,28 @@ def buscar_carrera(solicitud: SolicitudCarrera):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/carreras/buscar/stream")
+async def buscar_carrera_stream(solicitud: SolicitudCarrera, request: Request):
+    """
+    Igual que /carreras/buscar pero con progreso: un evento por línea (NDJSON)
+    o, si el cliente pide text/event-stream, en formato Server-Sent Events.
+    Eventos: inicio, fuentes, extrayendo, parcial (campos que el LLM ya ha
+    escrito) y, al final, resultado o error.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    eventos = abuscar_y_extraer_datos_stream(solicitud.nombre, max_results=5, forzar_refresco=solicitud.forzar_refresco)
+
+    async def generar():
+        async for evento in eventos:
+            datos = json.dumps(evento, ensure_ascii=False)
+            yield f"event: {evento['evento']}\ndata: {datos}\n\n" if sse else datos + "\n"
+
+    # X-Accel-Buffering: que nginx no acumule la respuesta y los eventos lleguen al momento
+    return StreamingResponse(generar(), media_type="text/event-stream" if sse else "application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/carreras/confirmar")
-def confirmar_carrera(datos: ConfirmacionCarrera, user: UserDB = Depends(get_current_user)):
+def confirmar_carrera(datos: ConfirmacionCarrera, user: UsuarioSesion = Depends(get_current_user)):
     try:
         carrera_schema = CarreraSchema(
             nombre_oficial=datos.nombre_oficial,
@@ -137,87 +304,355 @@ def confirmar_carrera(datos: ConfirmacionCarrera, user: UserDB = Depends(get_cur
             url_oficial=datos.url_oficial,
             estado_inscripcion=datos.estado_inscripcion
         )
-        guardar_en_db(carrera_schema, user_id=user.id)
-        return {"mensaje": "Carrera guardada correctamente", "nombre": datos.nombre_oficial}
+        # El usuario puede haber editado los datos: solo cambian SU carrera, no el catálogo
+        estado = guardar_en_db(carrera_schema, user_id=user.id)
+        mensajes = {
+            "insertada": "Carrera guardada correctamente",
+            "actualizada": "Carrera actualizada con los nuevos datos",
+            "omitida": "La carrera ya estaba guardada",
+        }
+        return {"mensaje": mensajes[estado], "nombre": datos.nombre_oficial, "estado": estado}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/carreras/batch")
+async def importar_lote(solicitud: SolicitudLote, user: UsuarioSesion = Depends(get_current_user)):
+    """
+    Importa una temporada entera: busca todas las carreras en paralelo
+    (hasta BATCH_CONCURRENCIA a la vez) y devuelve NDJSON, una línea por
+    carrera según va terminando. Al final guarda las encontradas con un
+    upsert en una sola transacción y envía una línea de resumen.
+    """
+    nombres = [n.strip() for n in solicitud.nombres if n and n.strip()]
+    if not nombres:
+        raise HTTPException(status_code=400, detail="La lista de carreras está vacía")
+    if len(nombres) > BATCH_MAX_CARRERAS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BATCH_MAX_CARRERAS} carreras por lote")
+
+    user_id = user.id
+
+    async def generar():
+        encontradas = []
+        async for nombre, datos, error in aprocesar_lote(nombres, BATCH_CONCURRENCIA):
+            if datos is not None:
+                encontradas.append(datos)
+                linea = {"nombre": nombre, "ok": True, "datos": datos.model_dump()}
+            else:
+                linea = {"nombre": nombre, "ok": False, "error": error}
+            yield json.dumps(linea, ensure_ascii=False) + "\n"
+
+        # Datos tal cual los devolvió la extracción: pueden refrescar el catálogo
+        estados = await run_in_threadpool(guardar_lote_en_db, encontradas, user_id, True) if encontradas else []
+        resumen = {
+            "total": len(nombres),
+            "encontradas": len(encontradas),
+            "errores": len(nombres) - len(encontradas),
+            "insertadas": sum(1 for e in estados if e["estado"] == "insertada"),
+            "actualizadas": sum(1 for e in estados if e["estado"] == "actualizada"),
+            "omitidas": sum(1 for e in estados if e["estado"] == "omitida"),
+            "estados": estados,
+        }
+        yield json.dumps({"resumen": resumen}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+# --- Importación y exportación masiva (CSV / NDJSON, ver src/intercambio.py) ---
+def _trozos_sincronos(request: Request):
+    """
+    El cuerpo de la petición como iterador normal, para leerlo desde un hilo
+    del threadpool: cada trozo se pide al bucle de eventos según hace falta.
+    """
+    trozos = request.stream().__aiter__()
+    while True:
+        try:
+            yield anyio.from_thread.run(trozos.__anext__)
+        except StopAsyncIteration:
+            return
+
+@app.post("/carreras/importar")
+async def importar_carreras(
+    request: Request,
+    formato: Optional[str] = Query(None, description="csv o ndjson (por defecto, según el Content-Type)"),
+    user: UsuarioSesion = Depends(get_current_user)
+):
+    """
+    Importa carreras (y resultados, si traen tiempo_oficial) desde el cuerpo
+    en bruto: curl --data-binary @calendario.csv -H 'Content-Type: text/csv'.
+    Sin búsquedas: los datos del fichero se guardan tal cual tras validarlos.
+    """
+    try:
+        formato = intercambio.formato_de(formato, request.headers.get("content-type", ""))
+        return await run_in_threadpool(intercambio.importar, _trozos_sincronos(request), formato, user.id)
+    except intercambio.ErrorImportacion as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/carreras/exportar")
+def exportar_carreras(
+    formato: str = Query("csv", description="csv o ndjson"),
+    user: UsuarioSesion = Depends(get_current_user)
+):
+    """Carreras del usuario con sus resultados, generadas por bloques (una fila por resultado)."""
+    if formato not in intercambio.FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (csv o ndjson)")
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        intercambio.exportar(user.id, formato), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="racehub-carreras.{formato}"'}
+    )
+
 # --- Resultados ---
-@app.post("/resultados/buscar")
-def buscar_resultado(solicitud: SolicitudResultado, user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
+# La búsqueda de resultados es una tarea en segundo plano: el endpoint responde
+# al instante con el id y el progreso se consulta por polling o por SSE.
+TRABAJOS_SSE_INTERVALO = float(os.getenv("TRABAJOS_SSE_INTERVALO", "1"))
+# Tiempo máximo de una conexión SSE: después el cliente puede volver a preguntar
+TRABAJOS_SSE_MAX_SEGUNDOS = float(os.getenv("TRABAJOS_SSE_MAX_SEGUNDOS", "600"))
+
+@app.post("/resultados/buscar", status_code=202)
+def buscar_resultado(solicitud: SolicitudResultado, user: UsuarioSesion = Depends(get_current_user)):
     try:
         nombre_busqueda = solicitud.nombre_corredor
         if not nombre_busqueda:
             nombre_busqueda = user.nombre_completo
 
-        datos_resultado = buscar_resultado_usuario(solicitud.nombre_carrera, solicitud.anio, nombre_busqueda)
-        guardar_resultado_db(datos_resultado, solicitud.nombre_carrera, solicitud.anio, user_id=user.id)
-        
-        if not datos_resultado.tiempo_oficial:
-             return {
-                "encontrado": False,
-                "mensaje": "No se encontraron tiempos exactos en las webs públicas.",
-                "corredor": nombre_busqueda
-            }
-
+        trabajo_id = encolar_busqueda_resultado(user.id, solicitud.nombre_carrera, solicitud.anio, nombre_busqueda)
         return {
-            "encontrado": True,
-            "mensaje": "Búsqueda completada",
+            "trabajo_id": trabajo_id,
+            "estado": "pendiente",
             "corredor": nombre_busqueda,
-            "tiempo": datos_resultado.tiempo_oficial,
-            "posicion": datos_resultado.posicion_general,
-            "posicion_categoria": datos_resultado.posicion_categoria,
-            "ritmo": datos_resultado.ritmo_medio
+            "url_estado": f"/resultados/trabajos/{trabajo_id}",
+            "url_eventos": f"/resultados/trabajos/{trabajo_id}/eventos"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/resultados/trabajos/{trabajo_id}")
+def estado_trabajo(trabajo_id: str, user: UsuarioSesion = Depends(get_current_user)):
+    trabajo = obtener_trabajo(trabajo_id, user.id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return trabajo
+
+@app.get("/resultados/trabajos/{trabajo_id}/eventos")
+async def eventos_trabajo(trabajo_id: str, request: Request, user: UsuarioSesion = Depends(get_current_user)):
+    """
+    Server-Sent Events: emite el estado de la tarea cada vez que cambia, hasta
+    que termina o pasan TRABAJOS_SSE_MAX_SEGUNDOS (evento "espera_agotada").
+    """
+    user_id = user.id
+    if not await run_in_threadpool(obtener_trabajo, trabajo_id, user_id):
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+
+    async def generar():
+        ultimo = None
+        limite = time.monotonic() + TRABAJOS_SSE_MAX_SEGUNDOS
+        while not await request.is_disconnected():
+            trabajo = await run_in_threadpool(obtener_trabajo, trabajo_id, user_id)
+            if trabajo and trabajo["actualizado_en"] != ultimo:
+                ultimo = trabajo["actualizado_en"]
+                yield f"event: {trabajo['estado']}\ndata: {json.dumps(trabajo, ensure_ascii=False)}\n\n"
+            if not trabajo or trabajo["terminado"]:
+                break
+            if time.monotonic() >= limite:
+                yield f"event: espera_agotada\ndata: {json.dumps(trabajo, ensure_ascii=False)}\n\n"
+                break
+            await asyncio.sleep(TRABAJOS_SSE_INTERVALO)
+
+    return StreamingResponse(generar(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def mejores_marcas(db: Session, user_id: int) -> List[dict]:
+    """
+    Mejor tiempo del usuario por deporte y distancia, calculado en SQL:
+    ROW_NUMBER() sobre los resultados con tiempo y distancia conocidos.
+    """
+    deporte = valor_efectivo("deporte").label("deporte")
+    puesto = func.row_number().over(
+        partition_by=(deporte, ResultadoDB.distancia_km),
+        order_by=(ResultadoDB.tiempo_segundos, RaceDB.fecha)
+    ).label("puesto")
+    ranking = (
+        db.query(
+            deporte, ResultadoDB.distancia_km, ResultadoDB.tiempo_segundos, ResultadoDB.ritmo_segundos_km,
+            CarreraDB.id.label("carrera_id"), RaceDB.nombre.label("carrera"), RaceDB.fecha, puesto
+        )
+        .join(CarreraDB, CarreraDB.id == ResultadoDB.carrera_id)
+        .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .filter(
+            CarreraDB.user_id == user_id,
+            ResultadoDB.tiempo_segundos.isnot(None),
+            ResultadoDB.distancia_km.isnot(None)
+        )
+        .subquery()
+    )
+    filas = (
+        db.query(ranking)
+        .filter(ranking.c.puesto == 1)
+        .order_by(ranking.c.deporte, ranking.c.distancia_km)
+        .all()
+    )
+    return [
+        {
+            "deporte": f.deporte,
+            "distancia_km": f.distancia_km,
+            "tiempo_segundos": f.tiempo_segundos,
+            "tiempo": formatear_tiempo(f.tiempo_segundos),
+            "ritmo": formatear_ritmo(f.ritmo_segundos_km or round(f.tiempo_segundos / f.distancia_km)),
+            "carrera_id": f.carrera_id,
+            "carrera": f.carrera,
+            "fecha": f.fecha,
+        }
+        for f in filas
+    ]
+
+@app.get("/resultados/mejores-marcas", response_model=List[MejorMarcaOut])
+def listar_mejores_marcas(user: UsuarioSesion = Depends(get_current_user), db: Session = Depends(get_db)):
+    return mejores_marcas(db, user.id)
+
 # --- Listado y Gestión de Carreras ---
+def _usuario_opcional(request: Request) -> Optional[UsuarioSesion]:
+    try:
+        return get_current_user(request)
+    except HTTPException:
+        return None
+
 @app.get("/", response_class=HTMLResponse)
-async def leer_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+def leer_index(request: Request):
+    # La primera página del mes en curso va incrustada en el HTML: se pinta sin
+    # esperar a una segunda petición a /carreras (null = sin sesión)
+    datos_iniciales = None
+    user = _usuario_opcional(request)
+    if user is not None:
+        hoy = date.today()
+        desde = hoy.replace(day=1)
+        hasta = hoy.replace(day=calendar.monthrange(hoy.year, hoy.month)[1])
+        db = SessionLocal()
+        try:
+            carreras, siguiente = pagina_carreras(db, user.id, desde, hasta)
+        finally:
+            db.close()
+        datos_iniciales = {"mes": desde.strftime("%Y-%m"), "carreras": [carrera_a_dict(c) for c in carreras],
+                           "siguiente": siguiente}
+    respuesta = templates.TemplateResponse("index.html", {"request": request, "datos_iniciales": datos_iniciales})
+    respuesta.headers["Cache-Control"] = "private, no-cache" # Lleva los datos del usuario
+    return respuesta
+
+# Paginación por cursor (keyset) ordenada por (fecha, id) de las carreras del
+# usuario, con la copia de la fecha que guarda cada enlace (índice
+# ix_carreras_user_fecha). El cursor es opaco para el cliente: codifica la última
+# (fecha, id) entregada y la siguiente página empieza justo después.
+CARRERAS_LIMITE_POR_DEFECTO = 100
+CARRERAS_LIMITE_MAX = 500
+
+def _codificar_cursor(carrera: CarreraDB) -> str:
+    crudo = json.dumps([carrera.fecha.isoformat(), carrera.id]).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+def _decodificar_cursor(cursor: str):
+    try:
+        fecha_txt, carrera_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return date.fromisoformat(fecha_txt), int(carrera_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor no válido")
+
+def pagina_carreras(db: Session, user_id: int, desde: Optional[date] = None, hasta: Optional[date] = None,
+                    deportes: Optional[List[str]] = None, cursor: Optional[str] = None,
+                    limite: int = CARRERAS_LIMITE_POR_DEFECTO):
+    """Devuelve (carreras, siguiente_cursor). siguiente_cursor es None en la última página."""
+    # Los datos de la carrera están en el catálogo: un JOIN que además rellena carrera.race
+    consulta = (
+        db.query(CarreraDB)
+        .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .options(contains_eager(CarreraDB.race))
+        .filter(CarreraDB.user_id == user_id)
+    )
+    if desde:
+        consulta = consulta.filter(CarreraDB.fecha >= desde)
+    if hasta:
+        consulta = consulta.filter(CarreraDB.fecha <= hasta)
+    if deportes:
+        consulta = consulta.filter(func.lower(valor_efectivo("deporte")).in_([d.lower() for d in deportes]))
+    if cursor:
+        fecha_cursor, id_cursor = _decodificar_cursor(cursor)
+        consulta = consulta.filter(or_(
+            CarreraDB.fecha > fecha_cursor,
+            and_(CarreraDB.fecha == fecha_cursor, CarreraDB.id > id_cursor)
+        ))
+
+    # Pedimos una fila de más para saber si hay otra página sin hacer un COUNT
+    carreras = consulta.order_by(CarreraDB.fecha, CarreraDB.id).limit(limite + 1).all()
+    if len(carreras) > limite:
+        carreras = carreras[:limite]
+        return carreras, _codificar_cursor(carreras[-1])
+    return carreras, None
 
 @app.get("/carreras", response_model=List[CarreraOut])
-def listar_carreras(user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
-    carreras = db.query(CarreraDB).filter(CarreraDB.user_id == user.id).all()
+def listar_carreras(
+    response: Response,
+    desde: Optional[date] = Query(None, alias="from", description="Fecha mínima (YYYY-MM-DD)"),
+    hasta: Optional[date] = Query(None, alias="to", description="Fecha máxima (YYYY-MM-DD)"),
+    deporte: Optional[List[str]] = Query(None, description="Filtra por deporte (se puede repetir)"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limite: int = Query(CARRERAS_LIMITE_POR_DEFECTO, ge=1, le=CARRERAS_LIMITE_MAX),
+    user: UsuarioSesion = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    carreras, siguiente = pagina_carreras(db, user.id, desde, hasta, deporte, cursor, limite)
+    # El cuerpo sigue siendo una lista; el cursor de la siguiente página va en la cabecera
+    if siguiente:
+        response.headers["X-Next-Cursor"] = siguiente
     return carreras
 
 @app.delete("/carreras/{carrera_id}")
-def eliminar_carrera(carrera_id: int, user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
+def eliminar_carrera(carrera_id: int, user: UsuarioSesion = Depends(get_current_user), db: Session = Depends(get_db)):
     carrera = db.query(CarreraDB).filter(CarreraDB.id == carrera_id, CarreraDB.user_id == user.id).first()
     if not carrera:
         raise HTTPException(status_code=404, detail="Carrera no encontrada o no te pertenece")
     
     nombre = carrera.nombre
+    estadisticas.ajustar(db, user.id, estadisticas.carrera_eliminada(db, carrera))
     db.delete(carrera)
+    calendario_modificado(db, user.id)
     db.commit()
     return {"mensaje": f"Carrera '{nombre}' eliminada correctamente"}
 
 # --- Share Feature ---
 @app.get("/share/token")
-def get_share_token(user: UserDB = Depends(get_current_user), db: Session = Depends(get_db)):
-    if not user.share_token:
-        user.share_token = shortuuid.ShortUUID().random(length=10)
-        db.commit()
-        db.refresh(user)
-    return {"share_token": user.share_token, "share_url": f"/share/{user.share_token}"}
+def get_share_token(user: UsuarioSesion = Depends(get_current_user), db: Session = Depends(get_db)):
+    share_token = user.share_token
+    if not share_token:
+        fila = db.get(UserDB, user.id)
+        if not fila.share_token:
+            fila.share_token = shortuuid.ShortUUID().random(length=10)
+            db.commit()
+        share_token = fila.share_token
+        cache_usuarios.invalidar(user.email)
+    return {"share_token": share_token, "share_url": f"/share/{share_token}", "ics_url": f"/share/{share_token}.ics"}
+
+# Antes que /share/{share_token}: esa ruta también casaría con "<token>.ics"
+@app.get("/share/{share_token}.ics")
+def public_calendar_ics(share_token: str, request: Request):
+    # Suscripción desde apps de calendario: .ics ya renderizado, con ETag/Last-Modified y 304
+    ics = obtener_ics(share_token)
+    if not ics:
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+    return respuesta_condicional(request, ics["cuerpo"], ics["etag"], ics["last_modified"], "text/calendar; charset=utf-8")
 
 @app.get("/share/{share_token}", response_class=HTMLResponse)
-async def public_calendar_view(request: Request, share_token: str, db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter(UserDB.share_token == share_token).first()
-    if not user:
+def public_calendar_view(request: Request, share_token: str):
+    feed = obtener_feed(share_token)
+    if not feed:
         raise HTTPException(status_code=404, detail="Calendario no encontrado")
     return templates.TemplateResponse("public.html", {
         "request": request, 
         "share_token": share_token, 
-        "owner_name": user.nombre_completo
+        "owner_name": feed["owner_name"],
+        # El listado ya serializado, para no pedirlo aparte a /api/share/{token}/carreras
+        "carreras_iniciales": feed["cuerpo_html"]
     })
 
 @app.get("/api/share/{share_token}/carreras", response_model=List[CarreraOut])
-def list_public_carreras(share_token: str, db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter(UserDB.share_token == share_token).first()
-    if not user:
+def list_public_carreras(share_token: str, request: Request):
+    # Servido desde la caché por token, con ETag/Last-Modified y respuestas 304
+    feed = obtener_feed(share_token)
+    if not feed:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    carreras = db.query(CarreraDB).filter(CarreraDB.user_id == user.id).all()
-    return carreras
+    return respuesta_condicional(request, feed["cuerpo"], feed["etag"], feed["last_modified"], "application/json")
@@ -0,0 +1,143 @@
+#Resolución aproximada de carreras por nombre (p. ej. al guardar un
+#resultado: "Maraton Madrid" -> "Zurich Rock 'n' Roll Maratón de Madrid").
+#
+#  - Los nombres se comparan normalizados (sin tildes, minúsculas) sobre
+#    la columna races.nombre_normalizado.
+#  - En PostgreSQL se usa pg_trgm: similarity / word_similarity con un
+#    índice GIN de trigramas, en una sola consulta indexada.
+#  - En otros motores (SQLite en pruebas) se usa un índice de trigramas
+#    en memoria con la misma puntuación.
+#  - La puntuación suma un extra si el año de la carrera coincide con el
+#    del resultado, para no confundir ediciones distintas.
+
+import os
+from collections import defaultdict
+from typing import Optional, Tuple
+
+from sqlalchemy import case, extract, func, literal, or_, text
+from sqlalchemy.orm import Session, contains_eager
+
+from src.database import RaceDB, CarreraDB
+from src.texto import normalizar_texto
+
+SIMILITUD_UMBRAL = float(os.getenv("SIMILITUD_UMBRAL", "0.3"))
+SIMILITUD_BONUS_AÑO = float(os.getenv("SIMILITUD_BONUS_ANIO", "0.2"))
+
+
+# --- Trigramas (mismo criterio que pg_trgm) ---
+def trigramas(texto: str) -> set:
+    """Trigramas de cada palabra con relleno de espacios: 'sol' -> '  s', ' so', 'sol', 'ol '."""
+    resultado = set()
+    for palabra in normalizar_texto(texto).split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+def similitud(a: set, b: set) -> float:
+    """Equivalente a similarity(): trigramas comunes / trigramas totales."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similitud_palabras(consulta: set, nombre: set) -> float:
+    """Aproximación a word_similarity(): qué parte de la consulta aparece en el nombre."""
+    if not consulta:
+        return 0.0
+    return len(consulta & nombre) / len(consulta)
+
+
+class IndiceTrigramas:
+    """Índice invertido trigrama -> ids, para motores sin pg_trgm."""
+
+    def __init__(self):
+        self._por_trigrama = defaultdict(set)
+        self._trigramas = {}
+
+    def añadir(self, clave, texto: str):
+        trigs = trigramas(texto)
+        self._trigramas[clave] = trigs
+        for t in trigs:
+            self._por_trigrama[t].add(clave)
+
+    def buscar(self, texto: str):
+        """Devuelve [(clave, puntuación)] de los candidatos que comparten algún trigrama."""
+        consulta = trigramas(texto)
+        candidatos = set()
+        for t in consulta:
+            candidatos |= self._por_trigrama.get(t, set())
+        return [
+            (clave, max(similitud(consulta, self._trigramas[clave]), similitud_palabras(consulta, self._trigramas[clave])))
+            for clave in candidatos
+        ]
+
+
+# --- Resolución ---
+def _resolver_postgres(db: Session, user_id: int, consulta: str, año: Optional[int]):
+    # % y <% filtran con los umbrales de pg_trgm (0.3 y 0.6 por defecto), no con
+    # el nuestro: se igualan solo para esta transacción
+    umbral = float(SIMILITUD_UMBRAL)
+    db.execute(text(f"SET LOCAL pg_trgm.similarity_threshold = {umbral}"))
+    db.execute(text(f"SET LOCAL pg_trgm.word_similarity_threshold = {umbral}"))
+    nombre = RaceDB.nombre_normalizado
+    parecido = func.greatest(func.similarity(nombre, consulta), func.word_similarity(consulta, nombre))
+    bonus = case((extract("year", RaceDB.fecha) == año, SIMILITUD_BONUS_AÑO), else_=0) if año else literal(0)
+    puntuacion = (parecido + bonus).label("puntuacion")
+    return (
+        db.query(CarreraDB, puntuacion)
+        .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .options(contains_eager(CarreraDB.race))
+        .filter(
+            CarreraDB.user_id == user_id,
+            # Operadores indexables con gin_trgm_ops
+            or_(nombre.op("%")(consulta), literal(consulta).op("<%")(nombre)),
+            parecido >= SIMILITUD_UMBRAL
+        )
+        .order_by(puntuacion.desc())
+        .first()
+    )
+
+
+def _resolver_en_memoria(db: Session, user_id: int, consulta: str, año: Optional[int]):
+    filas = db.query(CarreraDB.id, RaceDB.nombre_normalizado, RaceDB.nombre, RaceDB.fecha).join(
+        RaceDB, RaceDB.id == CarreraDB.race_id
+    ).filter(CarreraDB.user_id == user_id).all()
+    indice = IndiceTrigramas()
+    fechas = {}
+    for carrera_id, nombre_normalizado, nombre, fecha in filas:
+        indice.añadir(carrera_id, nombre_normalizado or nombre)
+        fechas[carrera_id] = fecha
+
+    mejor_id, mejor = None, 0.0
+    for carrera_id, parecido in indice.buscar(consulta):
+        if parecido < SIMILITUD_UMBRAL:
+            continue
+        fecha = fechas[carrera_id]
+        puntuacion = parecido + (SIMILITUD_BONUS_AÑO if año and fecha and fecha.year == año else 0)
+        if puntuacion > mejor:
+            mejor_id, mejor = carrera_id, puntuacion
+    if mejor_id is None:
+        return None
+    return db.get(CarreraDB, mejor_id), mejor
+
+
+def resolver_carrera(db: Session, user_id: int, nombre_carrera: str,
+                     año: Optional[int] = None) -> Tuple[Optional[CarreraDB], float]:
+    """
+    Busca entre las carreras del usuario la que mejor encaja con el nombre
+    (y el año, si se indica). Devuelve (carrera, puntuación) o (None, 0.0).
+    """
+    consulta = normalizar_texto(nombre_carrera)
+    if not consulta:
+        return None, 0.0
+
+    if db.get_bind().dialect.name == "postgresql":
+        encontrada = _resolver_postgres(db, user_id, consulta, año)
+    else:
+        encontrada = _resolver_en_memoria(db, user_id, consulta, año)
+
+    if not encontrada:
+        return None, 0.0
+    carrera, puntuacion = encontrada
+    return carrera, float(puntuacion)
@@ -0,0 +1,137 @@
+#Caché de extracciones de carreras. Evita repetir la búsqueda en
+#Tavily y la llamada al LLM cuando otro usuario ya consultó la misma
+#carrera hace poco. Tiene dos niveles:
+#  1. Memoria del proceso (LRU): respuesta en microsegundos.
+#  2. Tabla `cache_extracciones` en PostgreSQL con caducidad (TTL):
+#     sobrevive a reinicios y la comparten todos los workers.
+
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.database import SessionLocal, CacheExtraccionDB
+
+CACHE_EXTRACCION_MAX = int(os.getenv("CACHE_EXTRACCION_MAX", "512"))
+CACHE_EXTRACCION_TTL_HORAS = float(os.getenv("CACHE_EXTRACCION_TTL_HORAS", "24"))
+
+
+class CacheLRU:
+    """
+    Caché en memoria con expulsión LRU y caducidad opcional.
+    Es segura entre hilos y lleva la cuenta de aciertos y fallos.
+    """
+
+    def __init__(self, max_items: int, ttl_segundos: Optional[float] = None):
+        self.max_items = max_items
+        self.ttl_segundos = ttl_segundos
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                guardado_en, valor = entrada
+                if self.ttl_segundos is None or (datetime.now() - guardado_en).total_seconds() < self.ttl_segundos:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            self.fallos += 1
+            return None
+
+    def set(self, clave, valor, guardado_en: Optional[datetime] = None):
+        with self._lock:
+            self._datos[clave] = (guardado_en or datetime.now(), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_items,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+
+class CacheExtracciones:
+    """
+    Caché de dos niveles (memoria + PostgreSQL) para los datos extraídos
+    de una carrera. Guarda diccionarios serializables en JSON.
+    """
+
+    def __init__(self, max_items: int, ttl_horas: float):
+        self.ttl = timedelta(hours=ttl_horas)
+        self.memoria = CacheLRU(max_items, ttl_segundos=self.ttl.total_seconds())
+
+    def obtener(self, clave: str) -> Optional[dict]:
+        datos = self.memoria.get(clave)
+        if datos is not None:
+            return datos
+        return self._obtener_bd(clave)
+
+    def _obtener_bd(self, clave: str) -> Optional[dict]:
+        """Segundo nivel (sin mirar la memoria: quien llama ya lo ha hecho y contado el fallo)."""
+        db = SessionLocal()
+        try:
+            fila = db.get(CacheExtraccionDB, clave)
+            if not fila or datetime.now() - fila.actualizado_en >= self.ttl:
+                return None
+            datos = json.loads(fila.datos)
+            # Subimos la entrada a memoria conservando su antigüedad real
+            self.memoria.set(clave, datos, guardado_en=fila.actualizado_en)
+            return datos
+        except Exception as e:
+            # La caché nunca debe tumbar una búsqueda: ante cualquier fallo, vamos al proveedor
+            print(f"⚠️ Caché de extracciones no disponible: {e}")
+            return None
+        finally:
+            db.close()
+
+    def guardar(self, clave: str, datos: dict):
+        self.memoria.set(clave, datos)
+
+        db = SessionLocal()
+        try:
+            db.merge(CacheExtraccionDB(
+                clave=clave,
+                datos=json.dumps(datos, ensure_ascii=False),
+                actualizado_en=datetime.now()
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ No se pudo persistir la caché de '{clave}': {e}")
+        finally:
+            db.close()
+
+    async def aobtener(self, clave: str) -> Optional[dict]:
+        """Versión para código async: la memoria se consulta en el acto y solo
+        el acceso a PostgreSQL se delega a un hilo."""
+        datos = self.memoria.get(clave)
+        if datos is not None:
+            return datos
+        return await asyncio.to_thread(self._obtener_bd, clave)
+
+    async def aguardar(self, clave: str, datos: dict):
+        await asyncio.to_thread(self.guardar, clave, datos)
+
+
+cache_extracciones = CacheExtracciones(CACHE_EXTRACCION_MAX, CACHE_EXTRACCION_TTL_HORAS)
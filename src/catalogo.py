@@ -0,0 +1,160 @@
+#Catálogo global de carreras (tabla races). Cada carrera real (nombre
+#normalizado + fecha) se guarda UNA vez y cada usuario solo tiene un
+#enlace a ella en la tabla carreras, con lo que es suyo: resultados,
+#cuándo se encoló la búsqueda de resultado y los datos que guardó
+#distintos del catálogo. Así una carrera popular que siguen miles de
+#usuarios ocupa una fila, y la extracción y las revisiones del
+#actualizador se hacen una vez por carrera.
+#
+#Quién escribe qué:
+#  - La extracción (búsquedas del servidor) y el actualizador cambian la
+#    carrera del catálogo con aplicar_cambios, que ajusta estadísticas y
+#    calendarios de TODOS sus seguidores en la misma transacción.
+#  - Lo que un usuario confirma o importa a mano va a SU enlace
+#    (personalizar). Nunca cambia lo que ven los demás: si no, cualquiera
+#    podría cambiar la URL de una carrera en los calendarios públicos de
+#    todos los que la siguen. Lo personalizado dura hasta que la
+#    extracción o el actualizador cambian ESE dato en el catálogo: el
+#    dato oficial nuevo manda (si no, una inscripción que se cierra no
+#    llegaría a quien guardó la carrera cuando estaba abierta).
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+
+from src import estadisticas
+from src.compartir import calendarios_modificados
+from src.database import RaceDB, CarreraDB, CAMPOS_PERSONALIZABLES, insert_dialecto
+from src.metricas import contar
+
+# Campos que una nueva extracción puede refrescar en una carrera del catálogo.
+# La clave (nombre_normalizado, fecha) es la restricción race_unica.
+CAMPOS_ACTUALIZABLES = CAMPOS_PERSONALIZABLES
+
+# Lo que se guarda en el catálogo cuando una carrera nueva la trae un usuario
+# y no la extracción: el resto de datos son solo suyos hasta que se revise
+CAMPOS_IDENTIDAD = ("nombre", "nombre_normalizado", "fecha", "deporte")
+
+Clave = Tuple[str, object]
+
+
+def cambios_de(race: RaceDB, valores: dict) -> dict:
+    """Campos de `valores` que difieren de la carrera (los vacíos no borran lo que ya hay)."""
+    return {campo: valor for campo, valor in valores.items() if valor and getattr(race, campo) != valor}
+
+
+def _vista(enlace: CarreraDB) -> tuple:
+    """Lo que ve el usuario de una carrera de su lista."""
+    return (enlace.fecha,) + tuple(getattr(enlace, campo) for campo in CAMPOS_PERSONALIZABLES)
+
+
+def aplicar_cambios(db: Session, race: RaceDB, cambios: dict) -> List[int]:
+    """
+    Escribe los cambios en la carrera del catálogo (sin commit). Solo para la
+    extracción y el actualizador. Los seguidores dejan de tener personalizados
+    los campos que cambian; a los que ven algo distinto se les ajustan las
+    estadísticas y se marca su calendario para volver a generarlo. Devuelve
+    esos usuarios.
+    """
+    if not cambios:
+        return []
+    seguidores = db.query(CarreraDB).filter(CarreraDB.race_id == race.id)
+    enlaces = seguidores.all()
+    antes = {enlace.id: (_vista(enlace), estadisticas.contribucion_carrera(enlace)) for enlace in enlaces}
+    for campo, valor in cambios.items():
+        setattr(race, campo, valor)
+    propios = {getattr(CarreraDB, f"{campo}_usuario"): None for campo in cambios if campo in CAMPOS_PERSONALIZABLES}
+    if "fecha" in cambios:
+        # La copia que ordena la lista de cada seguidor
+        propios[CarreraDB.fecha] = cambios["fecha"]
+    if propios:
+        # Un UPDATE para todos; "evaluate" cambia también los enlaces ya cargados
+        seguidores.update(propios, synchronize_session="evaluate")
+
+    deltas: Dict[int, Counter] = {}
+    for enlace in enlaces:
+        vista, contribucion = antes[enlace.id]
+        if _vista(enlace) == vista:
+            continue
+        delta = deltas.setdefault(enlace.user_id, Counter())
+        delta.subtract(contribucion)
+        delta.update(estadisticas.contribucion_carrera(enlace))
+    for user_id, delta in deltas.items():
+        estadisticas.ajustar(db, user_id, delta)
+    calendarios_modificados(db, list(deltas))
+    return list(deltas)
+
+
+def valores_propios(race: RaceDB, valores: dict) -> dict:
+    """
+    Columnas *_usuario de un enlace para que el usuario vea `valores`: lo
+    que coincide con el catálogo queda en NULL (sigue al catálogo) y los
+    valores vacíos no cambian nada.
+    """
+    return {
+        f"{campo}_usuario": valor if valor != getattr(race, campo) else None
+        for campo, valor in valores.items() if valor and campo in CAMPOS_PERSONALIZABLES
+    }
+
+
+def personalizar(enlace: CarreraDB, valores: dict) -> Optional[Counter]:
+    """
+    Guarda en el enlace del usuario los datos que confirma o importa (sin
+    commit y sin tocar el catálogo). Devuelve el delta de sus estadísticas,
+    o None si no cambia nada de lo que ve.
+    """
+    vista, contribucion = _vista(enlace), estadisticas.contribucion_carrera(enlace)
+    for columna, valor in valores_propios(enlace.race, valores).items():
+        setattr(enlace, columna, valor)
+    if _vista(enlace) == vista:
+        return None
+    delta = Counter()
+    delta.subtract(contribucion)
+    delta.update(estadisticas.contribucion_carrera(enlace))
+    return delta
+
+
+def _insertar_races(db: Session, nuevas: List[dict]) -> int:
+    insert = insert_dialecto(db)
+    # RETURNING: solo las que inserta esta transacción (otra puede haber ganado la carrera)
+    return len(db.execute(insert(RaceDB.__table__).values(nuevas).on_conflict_do_nothing(
+        index_elements=["nombre_normalizado", "fecha"]
+    ).returning(RaceDB.id)).all())
+
+
+def asegurar_races(db: Session, filas: Dict[Clave, dict], completas: bool = True,
+                   insertar: Optional[Callable[[Session, List[dict]], int]] = None) -> Dict[Clave, RaceDB]:
+    """
+    Crea en el catálogo las carreras que falten (INSERT ... ON CONFLICT DO
+    NOTHING, por si otro usuario la guarda a la vez) y devuelve
+    {(nombre_normalizado, fecha): RaceDB}. Con completas=False (datos de un
+    usuario, no de la extracción) solo se guardan los CAMPOS_IDENTIDAD.
+    `insertar` sustituye al INSERT (la importación usa COPY): recibe las
+    filas que faltan y devuelve cuántas ha creado.
+    """
+    if not filas:
+        return {}
+
+    def cargar():
+        return {
+            (race.nombre_normalizado, race.fecha): race
+            for race in db.query(RaceDB).filter(or_(*(
+                and_(RaceDB.nombre_normalizado == nombre, RaceDB.fecha == fecha) for nombre, fecha in filas
+            )))
+        }
+
+    existentes = cargar()
+    nuevas = [fila for clave, fila in filas.items() if clave not in existentes]
+    creadas = 0
+    if nuevas:
+        if not completas:
+            nuevas = [{campo: fila[campo] for campo in CAMPOS_IDENTIDAD} for fila in nuevas]
+        creadas = (insertar or _insertar_races)(db, nuevas)
+        existentes = cargar()
+    if creadas:
+        contar("racehub_catalogo_carreras_total", creadas, origen="nueva")
+    if len(filas) > creadas:
+        contar("racehub_catalogo_carreras_total", len(filas) - creadas, origen="existente")
+    return existentes
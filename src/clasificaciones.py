@@ -0,0 +1,255 @@
+#Índice local de clasificaciones. Cuando diez socios de un club
+#buscan su resultado en la misma carrera, no tiene sentido repetir diez
+#veces Tavily + LLM: la clasificación completa (tabla HTML o listado en
+#PDF) se descarga y se interpreta UNA vez por carrera y año, se guarda
+#en clasificacion_filas y cada búsqueda posterior es una consulta local
+#por nombre normalizado.
+#
+#El nombre se indexa con sus palabras sin tildes y ordenadas, así que
+#"ESPÍN RODRÍGUEZ, Jaime" y "Jaime Espin Rodriguez" caen en la misma
+#clave. La descarga la orquesta src/main.py (que tiene los clientes de
+#Tavily); aquí están el parser, el guardado y la consulta.
+
+import os
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal, ClasificacionDB, ClasificacionFilaDB, insert_dialecto
+from src.texto import normalizar_texto
+
+CLASIFICACION_MIN_FILAS = int(os.getenv("CLASIFICACION_MIN_FILAS", "20"))
+# Si no se encontró un listado legible, cuánto esperar antes de volver a intentarlo
+CLASIFICACION_REINTENTO_HORAS = float(os.getenv("CLASIFICACION_REINTENTO_HORAS", "24"))
+
+PATRON_TIEMPO = re.compile(r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b|\b\d{1,2}:\d{2}\b")
+PATRON_RITMO = re.compile(r"\b\d{1,2}:\d{2}\s*(?:min)?/km\b", re.IGNORECASE)
+PATRON_CATEGORIA = re.compile(
+    r"^(?:[MFHV]-?[A-Z0-9]{1,6}|[A-Z]{1,4}-?\d{1,3}|SEN\w*|VET\w*|SUB-?\d+|JUN\w*|PROM\w*|ABS\w*|MASTER\w*)$"
+)
+# Fila de listado en texto (PDF): "12 345 ESPÍN RODRÍGUEZ, Jaime M-SEN 4 3:05:11"
+PATRON_FILA = re.compile(
+    r"^\s*(?P<pos>\d{1,5})[.º)]?\s+(?:(?P<dorsal>\d{1,6})\s+)?(?P<resto>\D.*?\d{1,2}:\d{2}.*)$"
+)
+
+CABECERAS = {
+    "posicion_general": ("pos", "puesto", "clasif", "general", "#"),
+    "nombre": ("nombre", "corredor", "atleta", "apellidos", "participante", "name"),
+    "categoria": ("cat", "categoria", "category"),
+    "posicion_categoria": ("pos cat", "puesto cat", "pos. cat", "clasif cat"),
+    "tiempo": ("tiempo", "oficial", "real", "time", "neto", "marca"),
+    "ritmo": ("ritmo", "min/km", "pace"),
+}
+
+
+def clave_corredor(nombre: str) -> str:
+    """Palabras normalizadas y ordenadas: el orden "Apellidos, Nombre" deja de importar."""
+    return " ".join(sorted(normalizar_texto(nombre).split()))
+
+
+def clave_clasificacion(nombre_carrera: str, año: int) -> str:
+    return f"{normalizar_texto(nombre_carrera)}:{año}"
+
+
+# --- Parser ---
+def _entero(texto: Optional[str]) -> Optional[int]:
+    coincidencia = re.search(r"\d+", texto or "")
+    return int(coincidencia.group(0)) if coincidencia else None
+
+
+def _columnas(celdas: List[str]) -> dict:
+    """Índice de cada campo a partir de una fila de cabecera."""
+    columnas = {}
+    for i, celda in enumerate(celdas):
+        texto = normalizar_texto(celda)
+        if not texto:
+            continue
+        # Las más específicas primero ("pos cat" antes que "pos")
+        for campo in ("posicion_categoria", "ritmo", "categoria", "nombre", "tiempo", "posicion_general"):
+            if campo not in columnas and any(texto == c or texto.startswith(c) for c in CABECERAS[campo]):
+                columnas[campo] = i
+                break
+    return columnas if "nombre" in columnas and ("tiempo" in columnas or "posicion_general" in columnas) else {}
+
+
+def _fila_tabla(celdas: List[str], columnas: dict) -> Optional[dict]:
+    def celda(campo):
+        i = columnas.get(campo)
+        return celdas[i].strip() if i is not None and i < len(celdas) else None
+
+    nombre = celda("nombre")
+    if not nombre or not re.search(r"[^\W\d_]{2,}", nombre):
+        return None
+    tiempo = celda("tiempo")
+    return {
+        "nombre": nombre,
+        "posicion_general": _entero(celda("posicion_general")),
+        "posicion_categoria": _entero(celda("posicion_categoria")),
+        "categoria": celda("categoria") or None,
+        "tiempo": PATRON_TIEMPO.search(tiempo).group(0) if tiempo and PATRON_TIEMPO.search(tiempo) else None,
+        "ritmo": celda("ritmo") or None,
+    }
+
+
+def _fila_texto(linea: str) -> Optional[dict]:
+    coincidencia = PATRON_FILA.match(linea)
+    if not coincidencia:
+        return None
+    resto = coincidencia.group("resto")
+    tiempo = PATRON_TIEMPO.search(resto)
+    ritmo = PATRON_RITMO.search(resto)
+
+    # Nombre: palabras hasta el primer número; las últimas que parecen categoría se separan
+    palabras = re.split(r"\s+", resto[:tiempo.start()].strip())
+    nombre, categoria, posicion_categoria = [], None, None
+    for palabra in palabras:
+        if re.fullmatch(r"\d+", palabra):
+            if categoria and posicion_categoria is None:
+                posicion_categoria = int(palabra)
+            continue
+        if PATRON_CATEGORIA.match(palabra) and len(nombre) >= 2:
+            categoria = palabra
+            continue
+        if categoria is None:
+            nombre.append(palabra)
+    nombre = " ".join(nombre).strip(" ,;-")
+    if not re.search(r"[^\W\d_]{2,}", nombre):
+        return None
+    return {
+        "nombre": nombre,
+        "posicion_general": int(coincidencia.group("pos")),
+        "posicion_categoria": posicion_categoria,
+        "categoria": categoria,
+        "tiempo": tiempo.group(0),
+        "ritmo": ritmo.group(0) if ritmo else None,
+    }
+
+
+def parsear_clasificacion(texto: str) -> List[dict]:
+    """
+    Filas de una clasificación en texto: tablas markdown/HTML convertidas a
+    texto ("| 1 | NOMBRE | 1:23:45 |", con cabecera) o listados de PDF
+    ("1 NOMBRE M-SEN 1:23:45"). Ignora lo que no parezca una fila.
+    """
+    filas, columnas = [], {}
+    for linea in (texto or "").splitlines():
+        if "|" in linea or "\t" in linea:
+            celdas = [c.strip() for c in re.split(r"\||\t", linea.strip().strip("|"))]
+            if all(re.fullmatch(r":?-{2,}:?", c) or not c for c in celdas):
+                continue # separador de markdown
+            cabecera = _columnas(celdas)
+            if cabecera:
+                columnas = cabecera
+                continue
+            if columnas:
+                fila = _fila_tabla(celdas, columnas)
+                if fila:
+                    filas.append(fila)
+                continue
+            linea = " ".join(celdas)
+        fila = _fila_texto(linea)
+        if fila:
+            filas.append(fila)
+    return filas
+
+
+# --- Guardado y consulta ---
+def obtener_clasificacion(nombre_carrera: str, año: int) -> Optional[dict]:
+    """Clasificación ya descargada (o intento fallido reciente), o None si hay que descargarla."""
+    db: Session = SessionLocal()
+    try:
+        clasificacion = db.query(ClasificacionDB).filter(
+            ClasificacionDB.clave == clave_clasificacion(nombre_carrera, año)
+        ).first()
+        if clasificacion is None:
+            return None
+        if clasificacion.num_filas == 0 and \
+                clasificacion.descargada_en < datetime.now() - timedelta(hours=CLASIFICACION_REINTENTO_HORAS):
+            return None
+        return {"id": clasificacion.id, "num_filas": clasificacion.num_filas, "url_fuente": clasificacion.url_fuente}
+    finally:
+        db.close()
+
+
+def guardar_clasificacion(nombre_carrera: str, año: int, url_fuente: Optional[str], filas: List[dict]) -> dict:
+    """Sustituye la clasificación de esa carrera y año. Con filas=[] registra el intento fallido."""
+    db: Session = SessionLocal()
+    try:
+        clave = clave_clasificacion(nombre_carrera, año)
+        # Upsert de la cabecera: si dos workers guardan la misma a la vez, el
+        # segundo espera al bloqueo de la fila y la sustituye entera
+        insert = insert_dialecto(db)
+        sentencia = insert(ClasificacionDB.__table__).values(
+            clave=clave, nombre_carrera=nombre_carrera, anio=año, url_fuente=url_fuente,
+            num_filas=len(filas), descargada_en=datetime.now()
+        )
+        clasificacion_id = db.execute(sentencia.on_conflict_do_update(
+            index_elements=["clave"],
+            set_={campo: sentencia.excluded[campo] for campo in
+                  ("nombre_carrera", "anio", "url_fuente", "num_filas", "descargada_en")}
+        ).returning(ClasificacionDB.id)).scalar_one()
+        # Las filas anteriores se borran aquí: SQLite no aplica el ON DELETE CASCADE
+        db.query(ClasificacionFilaDB).filter(
+            ClasificacionFilaDB.clasificacion_id == clasificacion_id
+        ).delete(synchronize_session=False)
+        db.bulk_insert_mappings(ClasificacionFilaDB, [
+            dict(fila, clasificacion_id=clasificacion_id, clave_corredor=clave_corredor(fila["nombre"]))
+            for fila in filas
+        ])
+        db.commit()
+        print(f"📋 Clasificación de '{nombre_carrera}' {año}: {len(filas)} corredores indexados")
+        return {"id": clasificacion_id, "num_filas": len(filas), "url_fuente": url_fuente}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _fila_a_dict(fila: ClasificacionFilaDB) -> dict:
+    return {
+        "nombre": fila.nombre,
+        "posicion_general": fila.posicion_general,
+        "posicion_categoria": fila.posicion_categoria,
+        "categoria": fila.categoria,
+        "tiempo": fila.tiempo,
+        "ritmo": fila.ritmo,
+    }
+
+
+def buscar_corredor(clasificacion_id: int, nombre_corredor: str) -> Optional[dict]:
+    """
+    Fila del corredor: primero por clave exacta (índice); si no, la única fila
+    que contiene todas sus palabras ("Jaime Espín" -> "ESPÍN RODRÍGUEZ, Jaime").
+    """
+    clave = clave_corredor(nombre_corredor)
+    if not clave:
+        return None
+    db: Session = SessionLocal()
+    try:
+        fila = db.query(ClasificacionFilaDB).filter(
+            ClasificacionFilaDB.clasificacion_id == clasificacion_id,
+            ClasificacionFilaDB.clave_corredor == clave
+        ).first()
+        if fila:
+            return _fila_a_dict(fila)
+
+        palabras = set(clave.split())
+        mas_rara = max(palabras, key=len)
+        candidatas = db.query(ClasificacionFilaDB).filter(
+            ClasificacionFilaDB.clasificacion_id == clasificacion_id,
+            ClasificacionFilaDB.clave_corredor.like(f"%{mas_rara}%")
+        ).limit(500).all()
+        encajan = [f for f in candidatas if palabras <= set(f.clave_corredor.split())]
+        if not encajan:
+            return None
+        encajan.sort(key=lambda f: len(f.clave_corredor.split()))
+        # Dos corredores igual de parecidos: no adivinamos
+        if len(encajan) > 1 and len(encajan[0].clave_corredor.split()) == len(encajan[1].clave_corredor.split()):
+            print(f"⚠️ '{nombre_corredor}' es ambiguo en la clasificación ({len(encajan)} coincidencias)")
+            return None
+        return _fila_a_dict(encajan[0])
+    finally:
+        db.close()
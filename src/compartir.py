@@ -0,0 +1,301 @@
+#Calendario público compartido (/share/{token}). Los enlaces se
+#publican en chats de clubes y los abren muchos visitantes anónimos,
+#así que el listado se sirve desde una caché por token:
+#  - Se carga con UNA consulta (users JOIN carreras JOIN races).
+#  - Se guarda ya serializado, con un ETag fuerte (hash del cuerpo) y
+#    un Last-Modified (users.calendario_actualizado_en).
+#  - Se invalida cuando el dueño añade o borra carreras; el TTL acota
+#    lo que tarda en enterarse el resto de workers.
+#
+#La suscripción desde apps de calendario (/share/{token}.ics) va más
+#lejos: esas apps consultan el feed cada pocos minutos, así que el
+#VCALENDAR se renderiza al CAMBIAR las carreras (calendario_modificado)
+#y se guarda ya hecho en calendarios_ics. Servirlo es leer ese blob
+#(o tomarlo de la caché del worker) y contestar 304 si no ha cambiado.
+#Cuando cambia una carrera del catálogo que siguen muchos usuarios, sus
+#.ics se borran (calendarios_modificados) y se renderizan al pedirlos.
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from jinja2.utils import htmlsafe_json_dumps
+from sqlalchemy import select
+from sqlalchemy.orm import Session, contains_eager
+
+from src.cache import CacheLRU
+from src.database import engine, SessionLocal, UserDB, RaceDB, CarreraDB, CalendarioIcsDB, insert_dialecto
+
+COMPARTIR_CACHE_MAX = int(os.getenv("COMPARTIR_CACHE_MAX", "1024"))
+COMPARTIR_CACHE_TTL = float(os.getenv("COMPARTIR_CACHE_TTL", "30"))
+
+cache_compartidos = CacheLRU(COMPARTIR_CACHE_MAX, ttl_segundos=COMPARTIR_CACHE_TTL)
+cache_ics = CacheLRU(COMPARTIR_CACHE_MAX, ttl_segundos=COMPARTIR_CACHE_TTL)
+# user_id -> share_token de lo que hay en las dos cachés, para poder invalidar
+# por usuario. Con el mismo TTL y sitio para ambas, dura lo que sus entradas
+_token_por_usuario = CacheLRU(2 * COMPARTIR_CACHE_MAX, ttl_segundos=COMPARTIR_CACHE_TTL)
+
+
+def carrera_a_dict(carrera: CarreraDB) -> dict:
+    """Mismos campos que CarreraOut en la API."""
+    return {
+        "id": carrera.id,
+        "nombre": carrera.nombre,
+        "deporte": carrera.deporte,
+        "fecha": carrera.fecha.isoformat() if carrera.fecha else None,
+        "localizacion": carrera.localizacion,
+        "distancia_resumen": carrera.distancia_resumen,
+        "url_oficial": carrera.url_oficial,
+        "estado_inscripcion": carrera.estado_inscripcion,
+    }
+
+
+def calendario_modificado(db: Session, user_id: int):
+    """
+    Llamar dentro de la transacción que añade, modifica o borra carreras
+    del usuario (antes del commit). Marca la fecha de cambio, vuelve a
+    renderizar su .ics y descarta su calendario compartido de la caché
+    de este worker.
+    """
+    db.query(UserDB).filter(UserDB.id == user_id).update(
+        {UserDB.calendario_actualizado_en: datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)},
+        synchronize_session=False
+    )
+    regenerar_ics(db, user_id)
+    invalidar_feed(user_id)
+
+
+def calendarios_modificados(db: Session, user_ids: list):
+    """
+    Como calendario_modificado pero para muchos usuarios a la vez (los
+    seguidores de una carrera del catálogo que cambia): en vez de renderizar
+    cada .ics dentro de la transacción, se borra y obtener_ics lo vuelve a
+    generar la primera vez que alguien lo pida.
+    """
+    if not user_ids:
+        return
+    db.query(UserDB).filter(UserDB.id.in_(user_ids)).update(
+        {UserDB.calendario_actualizado_en: datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)},
+        synchronize_session=False
+    )
+    db.query(CalendarioIcsDB).filter(CalendarioIcsDB.user_id.in_(user_ids)).delete(synchronize_session=False)
+    for user_id in user_ids:
+        invalidar_feed(user_id)
+
+
+def invalidar_feed(user_id: int):
+    """Descarta el calendario compartido del usuario de la caché de este worker."""
+    share_token = _token_por_usuario.get(user_id)
+    if share_token:
+        _token_por_usuario.invalidar(user_id)
+        cache_compartidos.invalidar(share_token)
+        cache_ics.invalidar(share_token)
+
+
+def _cargar_feed(share_token: str) -> Optional[dict]:
+    db: Session = SessionLocal()
+    try:
+        filas = (
+            db.query(UserDB, CarreraDB)
+            .outerjoin(CarreraDB, CarreraDB.user_id == UserDB.id)
+            .outerjoin(RaceDB, RaceDB.id == CarreraDB.race_id)
+            .options(contains_eager(CarreraDB.race))
+            .filter(UserDB.share_token == share_token)
+            .order_by(RaceDB.fecha, CarreraDB.id)
+            .all()
+        )
+    finally:
+        db.close()
+    if not filas:
+        return None
+
+    usuario = filas[0][0]
+    carreras = [carrera_a_dict(carrera) for _, carrera in filas if carrera is not None]
+    cuerpo = json.dumps(carreras, ensure_ascii=False).encode("utf-8")
+    # Sin cambios registrados todavía: la hora de carga sirve como Last-Modified
+    modificado = usuario.calendario_actualizado_en or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    return {
+        "user_id": usuario.id,
+        "owner_name": usuario.nombre_completo,
+        "cuerpo": cuerpo,
+        # Mismo listado escapado para incrustarlo en public.html dentro de <script>
+        "cuerpo_html": htmlsafe_json_dumps(carreras, ensure_ascii=False),
+        "etag": '"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"',
+        "last_modified": modificado.replace(tzinfo=timezone.utc),
+    }
+
+
+def obtener_feed(share_token: str) -> Optional[dict]:
+    """Calendario compartido ya serializado (desde la caché si está)."""
+    feed = cache_compartidos.get(share_token)
+    if feed is None:
+        feed = _cargar_feed(share_token)
+        if feed is None:
+            return None
+        cache_compartidos.set(share_token, feed)
+        _token_por_usuario.set(feed["user_id"], share_token)
+    return feed
+
+
+# --- iCalendar (RFC 5545) ---
+def _escapar_ics(texto: str) -> str:
+    return (texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _plegar(linea: str) -> str:
+    """Líneas de 75 octetos como máximo; las siguientes empiezan por un espacio."""
+    trozos, actual, tamaño = [], "", 0
+    for caracter in linea:
+        octetos = len(caracter.encode("utf-8"))
+        if tamaño + octetos > 75:
+            trozos.append(actual)
+            actual, tamaño = " ", 1
+        actual += caracter
+        tamaño += octetos
+    trozos.append(actual)
+    return "\r\n".join(trozos)
+
+
+def renderizar_ics(owner_name: str, carreras: list, generado_en: datetime) -> str:
+    """VCALENDAR con un evento de día completo por carrera (las que tienen fecha)."""
+    sello = generado_en.strftime("%Y%m%dT%H%M%SZ")
+    lineas = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//RaceHub//Calendario compartido//ES",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escapar_ics(f'Carreras de {owner_name}')}",
+        # Sugerencia de cada cuánto refrescar a las apps que la respetan
+        "REFRESH-INTERVAL;VALUE=DURATION:PT6H",
+        "X-PUBLISHED-TTL:PT6H",
+    ]
+    for carrera in carreras:
+        if carrera.fecha is None:
+            continue
+        descripcion = [f"Deporte: {carrera.deporte}"]
+        if carrera.distancia_resumen:
+            descripcion.append(f"Distancias: {carrera.distancia_resumen}")
+        if carrera.estado_inscripcion:
+            descripcion.append(f"Inscripción: {carrera.estado_inscripcion}")
+        lineas += [
+            "BEGIN:VEVENT",
+            f"UID:carrera-{carrera.id}@racehub",
+            f"DTSTAMP:{sello}",
+            f"DTSTART;VALUE=DATE:{carrera.fecha.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{(carrera.fecha + timedelta(days=1)).strftime('%Y%m%d')}",
+            f"SUMMARY:{_escapar_ics(carrera.nombre)}",
+        ]
+        if carrera.localizacion:
+            lineas.append(f"LOCATION:{_escapar_ics(carrera.localizacion)}")
+        if carrera.url_oficial:
+            lineas.append(f"URL:{carrera.url_oficial}")
+        descripcion = _escapar_ics("\n".join(descripcion))
+        lineas += [f"DESCRIPTION:{descripcion}", "END:VEVENT"]
+    lineas.append("END:VCALENDAR")
+    return "\r\n".join(_plegar(linea) for linea in lineas) + "\r\n"
+
+
+def regenerar_ics(db: Session, user_id: int):
+    """Renderiza y guarda el .ics del usuario dentro de la transacción en curso (sin commit)."""
+    db.flush() # Las carreras recién añadidas o borradas tienen que verse en la consulta
+    usuario = db.get(UserDB, user_id)
+    if usuario is None:
+        return
+    carreras = (
+        db.query(CarreraDB)
+        .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .options(contains_eager(CarreraDB.race))
+        .filter(CarreraDB.user_id == user_id)
+        .order_by(RaceDB.fecha, CarreraDB.id)
+        .all()
+    )
+    generado_en = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    cuerpo = renderizar_ics(usuario.nombre_completo, carreras, generado_en)
+    etag = '"' + hashlib.sha256(cuerpo.encode("utf-8")).hexdigest()[:32] + '"'
+
+    insert = insert_dialecto(db)
+    sentencia = insert(CalendarioIcsDB.__table__).values(
+        user_id=user_id, cuerpo=cuerpo, etag=etag, generado_en=generado_en
+    )
+    db.execute(sentencia.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"cuerpo": sentencia.excluded.cuerpo, "etag": sentencia.excluded.etag,
+              "generado_en": sentencia.excluded.generado_en}
+    ))
+
+
+def _leer_ics(share_token: str):
+    # Una fila por clave primaria, sin pasar por el ORM
+    consulta = (
+        select(UserDB.id, CalendarioIcsDB.cuerpo, CalendarioIcsDB.etag, CalendarioIcsDB.generado_en)
+        .select_from(UserDB)
+        .outerjoin(CalendarioIcsDB, CalendarioIcsDB.user_id == UserDB.id)
+        .where(UserDB.share_token == share_token)
+    )
+    with engine.connect() as conexion:
+        return conexion.execute(consulta).first()
+
+
+def obtener_ics(share_token: str) -> Optional[dict]:
+    """Calendario .ics ya renderizado (desde la caché si está), o None si el token no existe."""
+    ics = cache_ics.get(share_token)
+    if ics is not None:
+        return ics
+
+    fila = _leer_ics(share_token)
+    if fila is None:
+        return None
+    if fila.cuerpo is None:
+        # Usuario anterior a los .ics precalculados: se genera la primera vez
+        db: Session = SessionLocal()
+        try:
+            regenerar_ics(db, fila.id)
+            db.commit()
+        finally:
+            db.close()
+        fila = _leer_ics(share_token)
+
+    ics = {
+        "user_id": fila.id,
+        "cuerpo": fila.cuerpo.encode("utf-8"),
+        "etag": fila.etag,
+        "last_modified": fila.generado_en.replace(tzinfo=timezone.utc),
+    }
+    cache_ics.set(share_token, ics)
+    _token_por_usuario.set(fila.id, share_token)
+    return ics
+
+
+def _no_modificado(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match manda sobre If-Modified-Since (RFC 9110)
+        candidatos = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+        return "*" in candidatos or etag in candidatos
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def respuesta_condicional(request: Request, cuerpo: bytes, etag: str, last_modified: datetime,
+                          media_type: str) -> Response:
+    """Respuesta con ETag/Last-Modified que contesta 304 si el cliente ya tiene esta versión."""
+    cabeceras = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "public, max-age=0, must-revalidate",
+    }
+    if _no_modificado(request, etag, last_modified):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type=media_type, headers=cabeceras)
@@ -0,0 +1,228 @@
+#Selección del contexto que se manda al LLM. Antes se concatenaba el
+#`content` completo de cada resultado de Tavily; una página de
+#clasificaciones puede tener miles de líneas y eso se paga en
+#latencia, tokens y 429 de Groq. Ahora, entre la búsqueda y la
+#extracción:
+#  1. Cada resultado se trocea en fragmentos de ~CONTEXTO_TROZO caracteres.
+#  2. Se descartan los fragmentos repetidos o casi repetidos (muchas webs
+#     copian la misma nota de prensa).
+#  3. Se puntúa cada fragmento según lo que busca el prompt: palabras del
+#     nombre de la carrera o del corredor, fechas, distancias y filas
+#     "Pos. Nombre Tiempo".
+#  4. Se llenan los fragmentos mejor puntuados hasta el presupuesto de
+#     tokens y se devuelven en su orden original, agrupados por fuente.
+
+import os
+import re
+import threading
+from typing import List, Optional
+
+from src.metricas import contar
+from src.texto import normalizar_texto
+
+CONTEXTO_TOKENS_CARRERA = int(os.getenv("CONTEXTO_TOKENS_CARRERA", "2500"))
+CONTEXTO_TOKENS_RESULTADO = int(os.getenv("CONTEXTO_TOKENS_RESULTADO", "3500"))
+CONTEXTO_TROZO = int(os.getenv("CONTEXTO_TROZO", "700")) # caracteres por fragmento
+CONTEXTO_SIMILITUD_DUPLICADO = float(os.getenv("CONTEXTO_SIMILITUD_DUPLICADO", "0.8"))
+
+# Palabras que no ayudan a distinguir fragmentos
+PALABRAS_VACIAS = {
+    "de", "del", "la", "el", "los", "las", "y", "en", "a", "al", "por", "para", "con", "un", "una",
+    "carrera", "fecha", "distancias", "oficiales", "clasificacion", "resultados", "pdf", "completo",
+}
+
+MESES = r"(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre)"
+PATRON_FECHA = re.compile(rf"\b\d{{1,2}}\s+de\s+{MESES}\b|\b\d{{1,2}}[/-]\d{{1,2}}[/-]\d{{2,4}}\b|\b\d{{4}}-\d{{2}}-\d{{2}}\b")
+PATRON_DISTANCIA = re.compile(r"\b\d+(?:[.,]\d+)?\s*(?:km|k|kms|kilometros|millas)\b|\bmedia maraton\b|\bmaraton\b")
+PATRON_TIEMPO = re.compile(r"\b\d{1,2}:\d{2}:\d{2}\b")
+# Fila de clasificación: "123. APELLIDO, Nombre ... 1:23:45" / "123 Nombre Apellido 01:23:45"
+PATRON_FILA = re.compile(r"^\s*\d{1,5}\s*[.)º]?\s+\D{3,}?\d{1,2}:\d{2}:\d{2}", re.MULTILINE)
+PATRON_INSCRIPCION = re.compile(r"\binscripci\w*\b|\breglamento\b|\brecorrido\b|\bsalida\b")
+
+
+def estimar_tokens(texto: str) -> int:
+    """Aproximación de tokens sin tokenizador (~4 caracteres por token en español)."""
+    return (len(texto) + 3) // 4
+
+
+class MetricasContexto:
+    """Tokens recibidos de Tavily frente a tokens enviados al LLM, acumulados en este worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.tokens_originales = 0
+        self.tokens_enviados = 0
+        self.fragmentos_duplicados = 0
+
+    def registrar(self, originales: int, enviados: int, duplicados: int):
+        with self._lock:
+            self.llamadas += 1
+            self.tokens_originales += originales
+            self.tokens_enviados += enviados
+            self.fragmentos_duplicados += duplicados
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            ahorrados = self.tokens_originales - self.tokens_enviados
+            return {
+                "llamadas": self.llamadas,
+                "tokens_originales": self.tokens_originales,
+                "tokens_enviados": self.tokens_enviados,
+                "tokens_ahorrados": ahorrados,
+                "ahorro_medio_por_llamada": round(ahorrados / self.llamadas) if self.llamadas else 0,
+                "fragmentos_duplicados": self.fragmentos_duplicados,
+            }
+
+
+metricas_contexto = MetricasContexto()
+
+
+# --- 1. Troceado ---
+def trocear(texto: str, tamano: int = CONTEXTO_TROZO) -> List[str]:
+    """Agrupa líneas consecutivas en fragmentos de hasta `tamano` caracteres."""
+    fragmentos, actual = [], ""
+    for linea in (texto or "").splitlines():
+        linea = linea.strip()
+        if not linea:
+            continue
+        # Líneas enormes (páginas sin saltos): se cortan en trozos fijos
+        while len(linea) > tamano:
+            if actual:
+                fragmentos.append(actual)
+                actual = ""
+            fragmentos.append(linea[:tamano])
+            linea = linea[tamano:]
+        if actual and len(actual) + len(linea) + 1 > tamano:
+            fragmentos.append(actual)
+            actual = ""
+        actual = f"{actual}\n{linea}" if actual else linea
+    if actual:
+        fragmentos.append(actual)
+    return fragmentos
+
+
+# --- 2. Duplicados ---
+def _tejas(texto: str) -> set:
+    """Conjunto de trigramas de palabras (shingles) del texto normalizado."""
+    palabras = normalizar_texto(texto).split()
+    if len(palabras) < 3:
+        return {" ".join(palabras)}
+    return {" ".join(palabras[i:i + 3]) for i in range(len(palabras) - 2)}
+
+
+class DetectorDuplicados:
+    """Jaccard de shingles contra los fragmentos ya vistos, vía índice invertido (sin comparar todos con todos)."""
+
+    def __init__(self, umbral: float = CONTEXTO_SIMILITUD_DUPLICADO):
+        self.umbral = umbral
+        self._por_teja = {}
+        self._tamanos = []
+
+    def es_duplicado(self, texto: str) -> bool:
+        tejas = _tejas(texto)
+        comunes = {}
+        for teja in tejas:
+            for otro in self._por_teja.get(teja, ()):
+                comunes[otro] = comunes.get(otro, 0) + 1
+        for otro, n in comunes.items():
+            if n / (len(tejas) + self._tamanos[otro] - n) >= self.umbral:
+                return True
+        indice = len(self._tamanos)
+        self._tamanos.append(len(tejas))
+        for teja in tejas:
+            self._por_teja.setdefault(teja, []).append(indice)
+        return False
+
+
+# --- 3. Puntuación ---
+def _terminos(texto: str) -> set:
+    return {p for p in normalizar_texto(texto).split() if p not in PALABRAS_VACIAS and len(p) > 1}
+
+
+def puntuar(fragmento: str, terminos_principales: set, terminos_secundarios: set, modo: str) -> float:
+    normalizado = normalizar_texto(fragmento)
+    palabras = set(normalizado.split())
+    puntos = 3.0 * len(terminos_principales & palabras) + 1.0 * len(terminos_secundarios & palabras)
+    if terminos_principales and terminos_principales <= palabras:
+        puntos += 5 # Aparece el nombre completo (en cualquier orden: "Apellidos, Nombre")
+
+    minusculas = fragmento.lower()
+    if modo == "resultado":
+        puntos += min(len(PATRON_FILA.findall(fragmento)), 5)
+        puntos += 0.5 * min(len(PATRON_TIEMPO.findall(fragmento)), 6)
+    else:
+        puntos += 2.0 * min(len(PATRON_FECHA.findall(minusculas)), 3)
+        puntos += 1.5 * min(len(PATRON_DISTANCIA.findall(normalizado)), 4)
+        puntos += 1.0 * min(len(PATRON_INSCRIPCION.findall(normalizado)), 2)
+    return puntos
+
+
+# --- 4. Selección ---
+def seleccionar(resultados: List[dict], terminos_principales: set, terminos_secundarios: set, modo: str,
+                presupuesto_tokens: int, con_cabeceras: bool) -> str:
+    """
+    Devuelve el contexto para el prompt: los fragmentos más relevantes que
+    caben en el presupuesto, en su orden original.
+    """
+    candidatos, duplicados, tokens_originales = [], 0, 0
+    detector = DetectorDuplicados()
+    for i, res in enumerate(resultados):
+        contenido = res.get("content") or ""
+        tokens_originales += estimar_tokens(contenido)
+        for j, fragmento in enumerate(trocear(contenido)):
+            if detector.es_duplicado(fragmento):
+                duplicados += 1
+                continue
+            puntos = puntuar(fragmento, terminos_principales, terminos_secundarios, modo)
+            candidatos.append((puntos, i, j, fragmento))
+
+    # Los fragmentos sin ninguna señal solo entran si no hay otra cosa
+    if any(c[0] > 0 for c in candidatos):
+        candidatos = [c for c in candidatos if c[0] > 0]
+
+    def cabecera(i: int) -> str:
+        res = resultados[i]
+        return f"--- FUENTE: {res.get('url', '')} ---\nTÍTULO: {res.get('title', '')}" if con_cabeceras else "---"
+
+    # Mejor puntuados primero; a igualdad, los de las primeras fuentes (Tavily ya las ordena).
+    # El coste incluye el salto de línea y, la primera vez, la cabecera de la fuente.
+    elegidos, fuentes, gastado = [], set(), 0
+    for puntos, i, j, fragmento in sorted(candidatos, key=lambda c: (-c[0], c[1], c[2])):
+        coste = estimar_tokens(fragmento + "\n")
+        if i not in fuentes:
+            coste += estimar_tokens(cabecera(i) + "\n")
+        if gastado + coste > presupuesto_tokens:
+            continue
+        elegidos.append((i, j, fragmento))
+        fuentes.add(i)
+        gastado += coste
+
+    partes, fuente_actual = [], None
+    for i, j, fragmento in sorted(elegidos):
+        if i != fuente_actual:
+            fuente_actual = i
+            if con_cabeceras or partes:
+                partes.append(cabecera(i))
+        partes.append(fragmento)
+    contexto = "\n".join(partes)
+
+    enviados = estimar_tokens(contexto)
+    metricas_contexto.registrar(tokens_originales, enviados, duplicados)
+    contar("racehub_contexto_tokens_total", tokens_originales, tipo="originales", modo=modo)
+    contar("racehub_contexto_tokens_total", enviados, tipo="enviados", modo=modo)
+    print(f"✂️ Contexto: {tokens_originales} -> {enviados} tokens "
+          f"({len(elegidos)}/{len(candidatos)} fragmentos, {duplicados} duplicados)")
+    return contexto
+
+
+def contexto_carrera(resultados: List[dict], nombre_carrera: str, año: Optional[int] = None) -> str:
+    secundarios = {str(año)} if año else set()
+    return seleccionar(resultados, _terminos(nombre_carrera), secundarios, "carrera",
+                       CONTEXTO_TOKENS_CARRERA, con_cabeceras=False)
+
+
+def contexto_resultado(resultados: List[dict], nombre_carrera: str, año: int, nombre_corredor: str) -> str:
+    secundarios = _terminos(nombre_carrera) | {str(año)}
+    return seleccionar(resultados, _terminos(nombre_corredor), secundarios, "resultado",
+                       CONTEXTO_TOKENS_RESULTADO, con_cabeceras=True)
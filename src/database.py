@@ -1,12 +1,16 @@
 #Este módulo gestiona la persistencia de datos mediante SQLAlchemy. 
-#Define el esquema de la base de datos utilizando un modelo ORM (CarreraDB) 
+#Define el esquema de la base de datos utilizando un modelo ORM (RaceDB, CarreraDB...) 
 #y configura la fábrica de sesiones para interactuar con el servidor PostgreSQL
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Date, ForeignKey
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import create_engine, func, inspect, text, Column, Integer, Float, String, Date, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from dotenv import load_dotenv
+from src.texto import normalizar_texto
+from src.tiempos import medidas_resultado
 
 load_dotenv()
 
@@ -26,27 +30,107 @@ class UserDB(Base):
     nombre_completo = Column(String, nullable=False)
     email = Column(String, unique=True, index=True)
     share_token = Column(String, unique=True, index=True, nullable=True)
+    # Última vez que cambió su lista de carreras (Last-Modified del calendario compartido)
+    calendario_actualizado_en = Column(DateTime, nullable=True)
     
     # Relación: Un usuario tiene muchas carreras guardadas
     carreras = relationship("CarreraDB", back_populates="usuario")
 
-class CarreraDB(Base):
-    __tablename__ = "carreras" # Nombre real de la tabla en Postgres
+class RaceDB(Base):
+    __tablename__ = "races"
 
+    # Catálogo global: cada carrera real (nombre normalizado + fecha) una sola
+    # vez, la sigan los usuarios que la sigan. La extracción y las revisiones
+    # del actualizador escriben aquí (ver src/catalogo.py)
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id")) # FK al usuario
-    nombre = Column(String, nullable=False)
+    nombre = Column(String, nullable=False) # Nombre oficial con el que se guardó por primera vez
+    # nombre sin tildes ni mayúsculas, para la búsqueda aproximada (índice de trigramas)
+    nombre_normalizado = Column(String, nullable=False)
     deporte = Column(String, nullable=False)
     fecha = Column(Date)
     localizacion = Column(String)
     distancia_resumen = Column(String)
     url_oficial = Column(String)
     estado_inscripcion = Column(String, default="pendiente")
+    # Última revisión de fecha e inscripción (src/actualizador.py)
+    comprobada_en = Column(DateTime, nullable=True)
+
+    enlaces = relationship("CarreraDB", back_populates="race")
+
+    __table_args__ = (
+        # Una fila por carrera real; es también el destino de los upserts (ON CONFLICT)
+        UniqueConstraint("nombre_normalizado", "fecha", name="race_unica"),
+        # Próximas carreras para el actualizador
+        Index("ix_races_fecha_nombre", "fecha", "nombre_normalizado"),
+    )
+
+# Datos de una carrera que cada usuario puede tener a su manera (al confirmarla
+# o importarla) sin cambiarlos para el resto de seguidores
+CAMPOS_PERSONALIZABLES = ("deporte", "localizacion", "distancia_resumen", "url_oficial", "estado_inscripcion")
+
+def _de_la_carrera(campo: str):
+    """Atributo de solo lectura: el valor propio del usuario si lo tiene, si no el del catálogo."""
+    def leer(self):
+        propio = getattr(self, f"{campo}_usuario", None)
+        return propio if propio is not None else getattr(self.race, campo)
+    return property(leer)
+
+class CarreraDB(Base):
+    __tablename__ = "carreras" # Nombre real de la tabla en Postgres
+
+    # Enlace usuario -> carrera del catálogo, con lo que es de cada usuario. El
+    # id se conserva de cuando cada usuario tenía su copia: lo usan los
+    # resultados y la API.
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id")) # FK al usuario
+    race_id = Column(Integer, ForeignKey("races.id"), nullable=False)
+    # Copia de races.fecha para ordenar y paginar la lista del usuario con su
+    # propio índice. La mantiene al día catalogo.aplicar_cambios
+    fecha = Column(Date)
+    # Cuándo se encoló la búsqueda de resultado tras la carrera (src/actualizador.py)
+    resultado_solicitado_en = Column(DateTime, nullable=True)
+    # Lo que el usuario guardó distinto del catálogo (NULL = el dato del catálogo).
+    # Solo lo ve él: el catálogo lo cambian la extracción y el actualizador.
+    deporte_usuario = Column(String, nullable=True)
+    localizacion_usuario = Column(String, nullable=True)
+    distancia_resumen_usuario = Column(String, nullable=True)
+    url_oficial_usuario = Column(String, nullable=True)
+    estado_inscripcion_usuario = Column(String, nullable=True)
     
     # Relaciones
     usuario = relationship("UserDB", back_populates="carreras")
+    race = relationship("RaceDB", back_populates="enlaces", lazy="joined")
     resultados = relationship("ResultadoDB", back_populates="carrera")
 
+    # Datos de la carrera (carrera.nombre, carrera.deporte...). Solo lectura: los
+    # propios del usuario o, si no tiene, los de RaceDB. En consultas SQL hay
+    # que unir RaceDB y usar valor_efectivo() para los personalizables.
+    nombre = _de_la_carrera("nombre")
+    nombre_normalizado = _de_la_carrera("nombre_normalizado")
+    deporte = _de_la_carrera("deporte")
+    localizacion = _de_la_carrera("localizacion")
+    distancia_resumen = _de_la_carrera("distancia_resumen")
+    url_oficial = _de_la_carrera("url_oficial")
+    estado_inscripcion = _de_la_carrera("estado_inscripcion")
+
+    __table_args__ = (
+        # Una vez por usuario cada carrera; es también el destino de los upserts (ON CONFLICT)
+        UniqueConstraint("user_id", "race_id", name="carrera_usuario_unica"),
+        # Usuarios que siguen una carrera (cambios del catálogo)
+        Index("ix_carreras_race", "race_id"),
+        # Lista de un usuario (paginación por cursor sobre fecha, id)
+        Index("ix_carreras_user_fecha", "user_id", "fecha", "id"),
+    )
+
+def valor_efectivo(campo: str):
+    """
+    Expresión SQL del dato que ve el usuario (el suyo o el del catálogo),
+    para consultas que ya unen carreras y races.
+    """
+    if campo not in CAMPOS_PERSONALIZABLES:
+        return getattr(RaceDB, campo)
+    return func.coalesce(getattr(CarreraDB, f"{campo}_usuario"), getattr(RaceDB, campo))
+
 class ResultadoDB(Base):
     __tablename__ = "resultados"
 
@@ -56,9 +140,326 @@ class ResultadoDB(Base):
     posicion_general = Column(Integer)
     ritmo_medio = Column(String)
     comentarios = Column(String, nullable=True)
+    # Versiones numéricas de los campos de texto (ver src/tiempos.py), para
+    # poder ordenar y agregar en SQL. NULL si no se pudieron interpretar.
+    tiempo_segundos = Column(Integer, nullable=True)
+    ritmo_segundos_km = Column(Integer, nullable=True)
+    distancia_km = Column(Float, nullable=True)
 
     # Esto permite acceder a la info de la carrera desde un resultado: resultado.carrera.nombre
     carrera = relationship("CarreraDB", back_populates="resultados")
 
-# Crea la tabla si no existe
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    __table_args__ = (
+        # Mejores marcas: por carrera, el menor tiempo
+        Index("ix_resultados_carrera_tiempo", "carrera_id", "tiempo_segundos"),
+    )
+
+class CacheExtraccionDB(Base):
+    __tablename__ = "cache_extracciones"
+
+    # Clave normalizada: "carrera:<nombre normalizado>:<año>"
+    clave = Column(String, primary_key=True)
+    datos = Column(Text, nullable=False) # CarreraSchema serializado en JSON
+    actualizado_en = Column(DateTime, nullable=False) # Marca para calcular la caducidad (TTL)
+
+class TrabajoDB(Base):
+    __tablename__ = "trabajos"
+
+    # Tareas en segundo plano (búsquedas de resultados). Viven en la BD para que
+    # cualquier worker pueda responder al consultar su estado.
+    id = Column(String, primary_key=True) # uuid hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    tipo = Column(String, nullable=False)
+    estado = Column(String, nullable=False, default="pendiente") # pendiente, buscando, guardando, completado, error
+    parametros = Column(Text) # JSON
+    resultado = Column(Text, nullable=True) # JSON
+    error = Column(String, nullable=True)
+    creado_en = Column(DateTime, nullable=False)
+    actualizado_en = Column(DateTime, nullable=False)
+
+class ClasificacionDB(Base):
+    __tablename__ = "clasificaciones"
+
+    # Clasificación completa de una carrera y año, descargada una vez y
+    # compartida por todos los usuarios (ver src/clasificaciones.py)
+    id = Column(Integer, primary_key=True, index=True)
+    clave = Column(String, unique=True, nullable=False) # "<nombre normalizado>:<año>"
+    nombre_carrera = Column(String, nullable=False)
+    anio = Column(Integer, nullable=False)
+    url_fuente = Column(String, nullable=True)
+    num_filas = Column(Integer, nullable=False, default=0) # 0 = no se encontró un listado legible
+    descargada_en = Column(DateTime, nullable=False)
+
+    filas = relationship("ClasificacionFilaDB", back_populates="clasificacion", cascade="all, delete-orphan")
+
+class ClasificacionFilaDB(Base):
+    __tablename__ = "clasificacion_filas"
+
+    id = Column(Integer, primary_key=True)
+    clasificacion_id = Column(Integer, ForeignKey("clasificaciones.id", ondelete="CASCADE"), nullable=False)
+    # Palabras del nombre normalizadas y ordenadas: "ESPÍN RODRÍGUEZ, Jaime" y
+    # "Jaime Espin Rodriguez" dan la misma clave
+    clave_corredor = Column(String, nullable=False)
+    nombre = Column(String, nullable=False) # Tal como aparece en el listado
+    posicion_general = Column(Integer, nullable=True)
+    posicion_categoria = Column(Integer, nullable=True)
+    categoria = Column(String, nullable=True)
+    tiempo = Column(String, nullable=True)
+    ritmo = Column(String, nullable=True)
+
+    clasificacion = relationship("ClasificacionDB", back_populates="filas")
+
+    __table_args__ = (
+        Index("ix_clasificacion_filas_corredor", "clasificacion_id", "clave_corredor"),
+    )
+
+class EstadisticaDB(Base):
+    __tablename__ = "estadisticas_usuario"
+
+    # Contadores por usuario que se mantienen al escribir (ver src/estadisticas.py),
+    # para que /stats no tenga que recorrer carreras y resultados.
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    dimension = Column(String, primary_key=True) # total, deporte, anio, mes, abierta, resultados, con_resultado
+    clave = Column(String, primary_key=True) # "running", "2025", "2025-04", "2025-04-27"... ("" si no aplica)
+    valor = Column(Integer, nullable=False, default=0)
+
+class CalendarioIcsDB(Base):
+    __tablename__ = "calendarios_ics"
+
+    # Calendario compartido ya renderizado en iCalendar (/share/{token}.ics). Se
+    # regenera al cambiar las carreras del usuario, no en cada consulta de las
+    # apps de calendario (ver src/compartir.py)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    cuerpo = Column(Text, nullable=False)
+    etag = Column(String, nullable=False)
+    generado_en = Column(DateTime, nullable=False)
+
+def insert_dialecto(db):
+    """INSERT con soporte de ON CONFLICT para el motor de la sesión (PostgreSQL o SQLite)."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+# Columnas añadidas después de crear las tablas originales. create_all no altera
+# tablas existentes, así que inicializar_db las añade si faltan.
+COLUMNAS_NUEVAS = [
+    ("users", "calendario_actualizado_en", "TIMESTAMP"),
+    # También en las bases anteriores al catálogo: _migrar_catalogo la conserva en los enlaces
+    ("carreras", "resultado_solicitado_en", "TIMESTAMP"),
+    ("carreras", "fecha", "DATE"),
+    ("carreras", "deporte_usuario", "VARCHAR"),
+    ("carreras", "localizacion_usuario", "VARCHAR"),
+    ("carreras", "distancia_resumen_usuario", "VARCHAR"),
+    ("carreras", "url_oficial_usuario", "VARCHAR"),
+    ("carreras", "estado_inscripcion_usuario", "VARCHAR"),
+    ("resultados", "tiempo_segundos", "INTEGER"),
+    ("resultados", "ritmo_segundos_km", "INTEGER"),
+    ("resultados", "distancia_km", "FLOAT"),
+]
+
+def _migrar_columnas():
+    inspector = inspect(engine)
+    with engine.begin() as conexion:
+        for tabla, columna, tipo in COLUMNAS_NUEVAS:
+            existentes = {c["name"] for c in inspector.get_columns(tabla)}
+            if columna not in existentes:
+                conexion.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}"))
+                print(f"🛠️ Migración: añadida columna {tabla}.{columna}")
+
+# Igual que con las columnas: create_all no crea índices nuevos en tablas ya existentes
+INDICES_NUEVOS = [
+    ("resultados", "ix_resultados_carrera_tiempo"),
+    ("carreras", "ix_carreras_user_fecha"),
+]
+
+# Índices que sustituyó otro de INDICES_NUEVOS
+INDICES_OBSOLETOS = ["ix_carreras_user_race"]
+
+def _migrar_indices():
+    for tabla, nombre in INDICES_NUEVOS:
+        indice = next(i for i in Base.metadata.tables[tabla].indexes if i.name == nombre)
+        indice.create(bind=engine, checkfirst=True)
+    with engine.begin() as conexion:
+        for nombre in INDICES_OBSOLETOS:
+            conexion.execute(text(f"DROP INDEX IF EXISTS {nombre}"))
+
+# Columnas que tenía carreras cuando cada usuario guardaba su propia copia
+COLUMNAS_CATALOGO = ["nombre", "nombre_normalizado", "deporte", "fecha", "localizacion", "distancia_resumen",
+                     "url_oficial", "estado_inscripcion", "comprobada_en"]
+
+def _migrar_catalogo():
+    """
+    Pasa las carreras por usuario al catálogo global: una fila de races por
+    cada (nombre normalizado, fecha) distinta, con los datos de la copia
+    revisada más recientemente y el nombre más repetido, y carreras se
+    queda con el enlace y con lo que la copia de cada usuario tenía distinto.
+    Las copias repetidas de un mismo usuario se funden en la más antigua
+    (sus resultados pasan a ella). Los ids de carreras se conservan.
+    """
+    inspector = inspect(engine)
+    existentes = {c["name"] for c in inspector.get_columns("carreras")}
+    if "nombre" not in existentes:
+        return
+    columnas = ["id", "user_id", "resultado_solicitado_en"] + COLUMNAS_CATALOGO
+    seleccion = ", ".join(c if c in existentes else f"NULL AS {c}" for c in columnas)
+
+    with engine.begin() as conexion:
+        filas = conexion.execute(text(f"SELECT {seleccion} FROM carreras ORDER BY id").columns(
+            fecha=Date, comprobada_en=DateTime, resultado_solicitado_en=DateTime
+        )).mappings().all()
+
+        # 1. Una carrera del catálogo por (nombre normalizado, fecha)
+        grupos = {}
+        for fila in filas:
+            clave = (fila["nombre_normalizado"] or normalizar_texto(fila["nombre"]), fila["fecha"])
+            grupos.setdefault(clave, []).append(fila)
+        races = {}
+        for (nombre_normalizado, fecha), copias in grupos.items():
+            revisadas = [c["comprobada_en"] for c in copias if c["comprobada_en"]]
+            base = max(copias, key=lambda c: (c["comprobada_en"] or datetime.min, c["id"]))
+            races[(nombre_normalizado, fecha)] = {
+                **{campo: base[campo] for campo in COLUMNAS_CATALOGO},
+                # El nombre más repetido entre los usuarios
+                "nombre": Counter(c["nombre"] for c in copias).most_common(1)[0][0],
+                "nombre_normalizado": nombre_normalizado,
+                "comprobada_en": max(revisadas) if revisadas else None,
+            }
+        if races:
+            conexion.execute(RaceDB.__table__.insert(), list(races.values()))
+        race_ids = {
+            (fila.nombre_normalizado, fila.fecha): fila.id
+            for fila in conexion.execute(text("SELECT id, nombre_normalizado, fecha FROM races").columns(fecha=Date))
+        }
+
+        # 2. Un enlace por usuario y carrera; los repetidos se funden. Lo que la
+        # copia del usuario tenía distinto del catálogo se queda como suyo
+        enlaces, fundidas = {}, {}
+        for clave, copias in grupos.items():
+            for fila in copias:
+                enlace = (fila["user_id"], race_ids[clave])
+                if enlace in enlaces:
+                    fundidas[fila["id"]] = enlaces[enlace]["id"]
+                else:
+                    enlaces[enlace] = {"id": fila["id"], "user_id": fila["user_id"], "race_id": race_ids[clave],
+                                       "fecha": fila["fecha"],
+                                       "resultado_solicitado_en": fila["resultado_solicitado_en"], **{
+                                           f"{campo}_usuario": fila[campo] if fila[campo] not in (None, races[clave][campo]) else None
+                                           for campo in CAMPOS_PERSONALIZABLES
+                                       }}
+        if fundidas:
+            conexion.execute(
+                text("UPDATE resultados SET carrera_id = :destino WHERE carrera_id = :origen"),
+                [{"origen": origen, "destino": destino} for origen, destino in fundidas.items()]
+            )
+
+        # 3. carreras pasa a ser la tabla de enlaces
+        if engine.dialect.name == "postgresql":
+            conexion.execute(text("ALTER TABLE carreras ADD COLUMN race_id INTEGER REFERENCES races(id)"))
+            if enlaces:
+                propios = ", ".join(f"{campo}_usuario = :{campo}_usuario" for campo in CAMPOS_PERSONALIZABLES)
+                conexion.execute(text(f"UPDATE carreras SET race_id = :race_id, {propios} WHERE id = :id"),
+                                 list(enlaces.values()))
+            if fundidas:
+                conexion.execute(text("DELETE FROM carreras WHERE id = ANY(:ids)"), {"ids": list(fundidas)})
+            # Con las columnas se van también la antigua restricción única y sus índices.
+            # fecha se queda: ya es la de la carrera del catálogo (es parte de la clave)
+            conexion.execute(text("ALTER TABLE carreras " + ", ".join(
+                f"DROP COLUMN IF EXISTS {c}" for c in COLUMNAS_CATALOGO if c in existentes and c != "fecha"
+            )))
+            conexion.execute(text("ALTER TABLE carreras ALTER COLUMN race_id SET NOT NULL, "
+                                  "ALTER COLUMN fecha DROP NOT NULL"))
+            conexion.execute(text(
+                "ALTER TABLE carreras ADD CONSTRAINT carrera_usuario_unica UNIQUE (user_id, race_id)"
+            ))
+            conexion.execute(text("CREATE INDEX ix_carreras_race ON carreras (race_id)"))
+        else:
+            # SQLite no borra columnas con índices o restricciones: se rehace la
+            # tabla sin que el renombrado toque la FK de resultados
+            conexion.execute(text("PRAGMA legacy_alter_table = ON"))
+            for indice in inspector.get_indexes("carreras"):
+                conexion.execute(text(f"DROP INDEX IF EXISTS {indice['name']}"))
+            conexion.execute(text("ALTER TABLE carreras RENAME TO carreras_legado"))
+            CarreraDB.__table__.create(bind=conexion)
+            if enlaces:
+                conexion.execute(CarreraDB.__table__.insert(), list(enlaces.values()))
+            conexion.execute(text("DROP TABLE carreras_legado"))
+            conexion.execute(text("PRAGMA legacy_alter_table = OFF"))
+
+        # 4. Contadores y .ics se recalculan (los ids fundidos cambian los UID)
+        conexion.execute(text("DELETE FROM estadisticas_usuario"))
+        conexion.execute(text("DELETE FROM calendarios_ics"))
+    print(f"🛠️ Migración: {len(filas)} carreras de usuario -> {len(races)} en el catálogo "
+          f"({len(fundidas)} repetidas fundidas)")
+
+def _rellenar_fechas():
+    """Copia races.fecha en los enlaces creados antes de que carreras tuviera la columna."""
+    with engine.begin() as conexion:
+        rellenadas = conexion.execute(text(
+            "UPDATE carreras SET fecha = (SELECT races.fecha FROM races WHERE races.id = carreras.race_id) "
+            "WHERE fecha IS NULL"
+        )).rowcount
+    if rellenadas:
+        print(f"🛠️ Migración: copiada la fecha del catálogo en {rellenadas} carreras")
+
+def _rellenar_tiempos():
+    """Calcula tiempo/ritmo/distancia numéricos de los resultados guardados solo como texto."""
+    with engine.begin() as conexion:
+        filas = conexion.execute(text(
+            "SELECT r.id, r.tiempo_oficial, r.ritmo_medio, rc.distancia_resumen "
+            "FROM resultados r LEFT JOIN carreras c ON c.id = r.carrera_id "
+            "LEFT JOIN races rc ON rc.id = c.race_id "
+            "WHERE r.tiempo_segundos IS NULL AND r.ritmo_segundos_km IS NULL AND r.distancia_km IS NULL"
+        )).all()
+        cambios = []
+        for fila in filas:
+            tiempo, ritmo, distancia = medidas_resultado(fila.tiempo_oficial, fila.ritmo_medio, fila.distancia_resumen)
+            if tiempo is not None or ritmo is not None or distancia is not None:
+                cambios.append({"id": fila.id, "tiempo": tiempo, "ritmo": ritmo, "distancia": distancia})
+        if cambios:
+            conexion.execute(
+                text("UPDATE resultados SET tiempo_segundos = :tiempo, ritmo_segundos_km = :ritmo, "
+                     "distancia_km = :distancia WHERE id = :id"),
+                cambios
+            )
+            print(f"🛠️ Migración: convertidos {len(cambios)} tiempos de resultados")
+
+def _crear_indice_trigramas():
+    """
+    Índice GIN de trigramas para la búsqueda aproximada de carreras. Solo
+    PostgreSQL (extensión pg_trgm); en otros motores se busca en memoria.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    try:
+        with engine.begin() as conexion:
+            conexion.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conexion.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_races_nombre_trgm "
+                "ON races USING gin (nombre_normalizado gin_trgm_ops)"
+            ))
+    except Exception as e:
+        print(f"⚠️ No se pudo crear el índice de trigramas (¿falta pg_trgm?): {e}")
+
+def inicializar_db():
+    """
+    Crea las tablas que falten. Ya no se ejecuta al importar el módulo: la
+    llama el arranque de la API (lifespan) o la CLI, de modo que importar
+    src.database no abre ninguna conexión.
+    """
+    Base.metadata.create_all(bind=engine)
+    _migrar_columnas()
+    # Después del catálogo: en bases antiguas carreras aún no tiene race_id
+    _migrar_catalogo()
+    _rellenar_fechas()
+    _migrar_indices()
+    _rellenar_tiempos()
+    # Import local: src.estadisticas depende de los modelos de este módulo
+    from src.estadisticas import inicializar_estadisticas
+    db = SessionLocal()
+    try:
+        inicializar_estadisticas(db)
+    finally:
+        db.close()
+    _crear_indice_trigramas()
\ No newline at end of file
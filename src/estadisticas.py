@@ -0,0 +1,150 @@
+#Estadísticas por usuario para el panel (/stats). En vez de recorrer
+#carreras y resultados en cada carga, se mantienen contadores en la
+#tabla estadisticas_usuario que se ajustan en la MISMA transacción que
+#escribe los datos:
+#  - upsert_carreras (guardar_en_db / guardar_lote_en_db)
+#  - guardar_resultado_db
+#  - eliminar_carrera
+#Leer el panel es una consulta por clave primaria, crezca lo que crezca
+#el historial.
+
+from collections import Counter
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from src.database import RaceDB, CarreraDB, ResultadoDB, EstadisticaDB, insert_dialecto, valor_efectivo
+
+ESTADO_ABIERTA = "abierta"
+
+
+def contribucion(deporte: str, fecha: Optional[date], estado_inscripcion: Optional[str]) -> Counter:
+    """Contadores que aporta una carrera: total, deporte, año, mes e inscripción abierta."""
+    cambios = Counter({("total", ""): 1, ("deporte", deporte or ""): 1})
+    if fecha:
+        cambios[("anio", str(fecha.year))] += 1
+        cambios[("mes", fecha.strftime("%Y-%m"))] += 1
+        if (estado_inscripcion or "").lower() == ESTADO_ABIERTA:
+            # Por fecha: al leer se cuentan solo las que aún no se han celebrado
+            cambios[("abierta", fecha.isoformat())] += 1
+    return cambios
+
+
+def contribucion_carrera(carrera) -> Counter:
+    """contribucion() de un CarreraDB, un RaceDB o un dict con sus columnas."""
+    if isinstance(carrera, dict):
+        return contribucion(carrera["deporte"], carrera["fecha"], carrera["estado_inscripcion"])
+    return contribucion(carrera.deporte, carrera.fecha, carrera.estado_inscripcion)
+
+
+def ajustar(db: Session, user_id: int, cambios: Counter):
+    """Suma los deltas a los contadores del usuario (sin commit: va en la transacción del llamante)."""
+    filas = [
+        {"user_id": user_id, "dimension": dimension, "clave": clave, "valor": delta}
+        for (dimension, clave), delta in cambios.items() if delta
+    ]
+    if not filas:
+        return
+    insert = insert_dialecto(db)
+    sentencia = insert(EstadisticaDB.__table__).values(filas)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=["user_id", "dimension", "clave"],
+        set_={"valor": EstadisticaDB.__table__.c.valor + sentencia.excluded.valor}
+    )
+    db.execute(sentencia)
+    if any(fila["valor"] < 0 for fila in filas):
+        db.query(EstadisticaDB).filter(EstadisticaDB.user_id == user_id, EstadisticaDB.valor <= 0).delete(
+            synchronize_session=False
+        )
+
+
+def resultado_añadido(db: Session, carrera_id: int) -> Counter:
+    """Deltas de guardar un resultado (llamar ANTES de añadirlo)."""
+    tenia_resultado = db.query(ResultadoDB.id).filter(ResultadoDB.carrera_id == carrera_id).first() is not None
+    cambios = Counter({("resultados", ""): 1})
+    if not tenia_resultado:
+        cambios[("con_resultado", "")] += 1
+    return cambios
+
+
+def carrera_eliminada(db: Session, carrera: CarreraDB) -> Counter:
+    """Deltas de borrar una carrera, incluidos sus resultados."""
+    resultados = db.query(func.count(ResultadoDB.id)).filter(ResultadoDB.carrera_id == carrera.id).scalar()
+    cambios = Counter()
+    cambios.subtract(contribucion_carrera(carrera))
+    if resultados:
+        cambios[("resultados", "")] -= resultados
+        cambios[("con_resultado", "")] -= 1
+    return cambios
+
+
+def resumen(db: Session, user_id: int, hoy: Optional[date] = None) -> dict:
+    """Panel del usuario a partir de sus contadores."""
+    hoy = hoy or date.today()
+    filas = db.query(EstadisticaDB.dimension, EstadisticaDB.clave, EstadisticaDB.valor).filter(
+        EstadisticaDB.user_id == user_id
+    ).all()
+
+    por_dimension = {}
+    for dimension, clave, valor in filas:
+        por_dimension.setdefault(dimension, {})[clave] = valor
+
+    total = por_dimension.get("total", {}).get("", 0)
+    con_resultado = por_dimension.get("con_resultado", {}).get("", 0)
+    return {
+        "carreras": total,
+        "por_deporte": por_dimension.get("deporte", {}),
+        "por_anio": dict(sorted(por_dimension.get("anio", {}).items())),
+        "por_mes": dict(sorted(por_dimension.get("mes", {}).items())),
+        "inscripciones_abiertas": sum(
+            valor for clave, valor in por_dimension.get("abierta", {}).items() if clave >= hoy.isoformat()
+        ),
+        "resultados": {
+            "total": por_dimension.get("resultados", {}).get("", 0),
+            "carreras_con_resultado": con_resultado,
+            "cobertura": round(con_resultado / total, 3) if total else 0.0,
+        },
+    }
+
+
+def reconstruir(db: Session, user_id: Optional[int] = None):
+    """
+    Recalcula los contadores desde cero (de un usuario o de todos). Solo para
+    la migración inicial o para reparar; el camino normal es ajustar().
+    """
+    consulta_carreras = db.query(
+        CarreraDB.user_id, valor_efectivo("deporte"), RaceDB.fecha, valor_efectivo("estado_inscripcion")
+    ).join(RaceDB, RaceDB.id == CarreraDB.race_id)
+    consulta_resultados = (
+        db.query(CarreraDB.user_id, ResultadoDB.carrera_id, func.count(ResultadoDB.id))
+        .join(CarreraDB, CarreraDB.id == ResultadoDB.carrera_id)
+        .group_by(CarreraDB.user_id, ResultadoDB.carrera_id)
+    )
+    borrado = db.query(EstadisticaDB)
+    if user_id is not None:
+        consulta_carreras = consulta_carreras.filter(CarreraDB.user_id == user_id)
+        consulta_resultados = consulta_resultados.filter(CarreraDB.user_id == user_id)
+        borrado = borrado.filter(EstadisticaDB.user_id == user_id)
+
+    por_usuario = {}
+    for usuario, deporte, fecha, estado in consulta_carreras:
+        por_usuario.setdefault(usuario, Counter()).update(contribucion(deporte, fecha, estado))
+    for usuario, _, resultados in consulta_resultados:
+        cambios = por_usuario.setdefault(usuario, Counter())
+        cambios[("resultados", "")] += resultados
+        cambios[("con_resultado", "")] += 1
+
+    borrado.delete(synchronize_session=False)
+    for usuario, cambios in por_usuario.items():
+        if usuario is not None:
+            ajustar(db, usuario, cambios)
+
+
+def inicializar_estadisticas(db: Session):
+    """Primera vez que existe la tabla: la rellena con los datos ya guardados."""
+    if db.query(EstadisticaDB.user_id).first() is None and db.query(CarreraDB.id).first() is not None:
+        reconstruir(db)
+        db.commit()
+        print("🛠️ Migración: calculadas las estadísticas de los usuarios")
@@ -0,0 +1,132 @@
+#Ficheros estáticos (static/) con el hash del contenido en el nombre y
+#ya comprimidos. Las plantillas no enlazan /static/script.js sino
+#/static/script.<hash>.js (función estatico() de Jinja): como la URL
+#cambia cuando cambia el fichero, se puede servir con
+#"Cache-Control: immutable" y el navegador no vuelve a preguntar.
+#
+#Cada fichero se lee, se le calcula el hash y se comprime (gzip y, si
+#está instalado el paquete brotli, br) UNA vez por worker, la primera
+#vez que se pide. Cada petición solo elige la variante según
+#Accept-Encoding. Las rutas sin hash siguen funcionando (StaticFiles)
+#para páginas que el navegador tenga guardadas de antes.
+
+import gzip
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin él se sirve solo gzip
+    brotli = None
+
+# Tipos que merece la pena comprimir (las imágenes ya vienen comprimidas)
+COMPRIMIBLES = {".js", ".css", ".html", ".svg", ".json", ".txt"}
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _preferida(accept_encoding: str, variantes: dict) -> str:
+    """Codificación a servir: br > gzip > sin comprimir, entre las que acepta el cliente."""
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+    for codificacion in ("br", "gzip"):
+        if codificacion in variantes and aceptadas.get(codificacion, aceptadas.get("*", 0)) > 0:
+            return codificacion
+    return "identity"
+
+
+class ActivosEstaticos:
+    """App ASGI para /static: nombres con hash desde memoria, el resto con StaticFiles."""
+
+    def __init__(self, directorio: Path):
+        self.directorio = Path(directorio)
+        self._respaldo = StaticFiles(directory=str(self.directorio))
+        self._lock = threading.Lock()
+        self._manifiesto = None # "script.js" -> "script.<hash>.js"
+        self._activos = {} # "script.<hash>.js" -> {variantes, media_type, huella}
+
+    def _construir(self):
+        manifiesto, activos = {}, {}
+        for ruta in sorted(self.directorio.rglob("*")):
+            if not ruta.is_file():
+                continue
+            contenido = ruta.read_bytes()
+            huella = hashlib.sha256(contenido).hexdigest()[:12]
+            relativa = ruta.relative_to(self.directorio).as_posix()
+            versionada = f"{relativa[:-len(ruta.suffix)]}.{huella}{ruta.suffix}" if ruta.suffix else f"{relativa}.{huella}"
+
+            variantes = {"identity": contenido}
+            if ruta.suffix in COMPRIMIBLES:
+                # mtime=0: la misma entrada da siempre los mismos bytes, en todos los workers
+                variantes["gzip"] = gzip.compress(contenido, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    variantes["br"] = brotli.compress(contenido, quality=11)
+                # Si comprimido no ahorra nada no vale la pena
+                variantes = {c: v for c, v in variantes.items() if c == "identity" or len(v) < len(contenido)}
+
+            manifiesto[relativa] = versionada
+            activos[versionada] = {
+                "variantes": variantes,
+                "media_type": mimetypes.guess_type(ruta.name)[0] or "application/octet-stream",
+                "huella": huella,
+            }
+        ahorro = sum(len(a["variantes"]["identity"]) - min(len(v) for v in a["variantes"].values())
+                     for a in activos.values())
+        print(f"📦 Estáticos: {len(activos)} ficheros con hash ({ahorro / 1024:.1f} KB menos comprimidos)")
+        return manifiesto, activos
+
+    def _cargar(self):
+        if self._manifiesto is None:
+            with self._lock:
+                if self._manifiesto is None:
+                    self._manifiesto, self._activos = self._construir()
+        return self._manifiesto
+
+    def url(self, nombre: str) -> str:
+        """URL con hash de un fichero de static/ (para las plantillas)."""
+        return "/static/" + self._cargar().get(nombre, nombre)
+
+    def manifiesto(self) -> dict:
+        return dict(self._cargar())
+
+    async def __call__(self, scope, receive, send):
+        self._cargar()
+        activo = None
+        if scope["type"] == "http":
+            # Montada en /static: la ruta llega completa y root_path dice qué parte es del montaje
+            ruta = scope["path"]
+            if ruta.startswith(scope.get("root_path", "")):
+                ruta = ruta[len(scope.get("root_path", "")):]
+            activo = self._activos.get(ruta.lstrip("/"))
+        if activo is None or scope["method"] not in ("GET", "HEAD"):
+            await self._respaldo(scope, receive, send)
+            return
+
+        cabeceras_peticion = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        codificacion = _preferida(cabeceras_peticion.get("accept-encoding", ""), activo["variantes"])
+        # Un ETag por variante (son bytes distintos); todas comparten el hash del original
+        etag = f'"{activo["huella"]}"' if codificacion == "identity" else f'"{activo["huella"]}-{codificacion}"'
+        cabeceras = {"Cache-Control": CACHE_INMUTABLE, "ETag": etag, "Vary": "Accept-Encoding"}
+        if activo["huella"] in cabeceras_peticion.get("if-none-match", ""):
+            respuesta = Response(status_code=304, headers=cabeceras)
+        else:
+            if codificacion != "identity":
+                cabeceras["Content-Encoding"] = codificacion
+            cuerpo = activo["variantes"][codificacion]
+            if scope["method"] == "HEAD":
+                cabeceras["Content-Length"] = str(len(cuerpo))
+                cuerpo = b""
+            respuesta = Response(content=cuerpo, media_type=activo["media_type"], headers=cabeceras)
+        await respuesta(scope, receive, send)
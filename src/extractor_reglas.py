@@ -0,0 +1,292 @@
+#Extractor determinista de carreras (sin LLM). Muchos fragmentos de
+#Tavily ya dicen la fecha y las distancias tal cual ("domingo 27 de
+#abril de 2025 ... 42K, 21K, 10K"). Con reglas (dateutil con meses en
+#español, expresiones regulares de distancias, palabras clave) se
+#rellenan los campos de CarreraSchema y se calcula una confianza.
+#buscar_y_extraer_datos solo llama al LLM si la confianza no llega a
+#EXTRACTOR_REGLAS_UMBRAL o falta algún campo obligatorio.
+#
+#La confianza tiene que reflejar la evidencia, no solo que haya un dato:
+#  - Una fecha solo cuenta como segura si está junto a palabras de la
+#    carrera ("se celebrará el...", "salida", "maratón"). Las que van con
+#    inscripción, plazo, publicación o dorsales no son la de la carrera.
+#  - El deporte se decide por palabras completas, sumando cuántas veces
+#    aparece cada uno (y con más peso si está en el nombre buscado):
+#    un "ciclistas" o un "desnivel" en una crónica de un maratón no lo
+#    convierten en ciclismo o trail.
+
+import os
+import re
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+from dateutil import parser
+
+from src.texto import normalizar_texto
+from src.tiempos import parsear_distancia_km
+
+EXTRACTOR_REGLAS_UMBRAL = float(os.getenv("EXTRACTOR_REGLAS_UMBRAL", "0.8"))
+
+# Peso de cada campo en la confianza (suman 1)
+PESOS = {"fecha": 0.35, "distancias": 0.25, "lugar": 0.15, "nombre_oficial": 0.15, "deporte": 0.10}
+
+
+class ParserInfoEspañol(parser.parserinfo):
+    """Meses y días en español para dateutil ("domingo 27 de abril de 2025")."""
+    JUMP = [" ", ".", ",", ";", "-", "/", "'", "de", "del", "el", "at", "on", "and", "ad", "m", "t", "of", "st", "nd",
+            "rd", "th"]
+    WEEKDAYS = [("lun", "lunes"), ("mar", "martes"), ("mié", "miércoles", "mie", "miercoles"), ("jue", "jueves"),
+                ("vie", "viernes"), ("sáb", "sábado", "sab", "sabado"), ("dom", "domingo")]
+    MONTHS = [("ene", "enero"), ("feb", "febrero"), ("mar", "marzo"), ("abr", "abril"), ("may", "mayo"),
+              ("jun", "junio"), ("jul", "julio"), ("ago", "agosto"), ("sep", "sept", "septiembre", "setiembre"),
+              ("oct", "octubre"), ("nov", "noviembre"), ("dic", "diciembre")]
+
+
+PARSER_ES = ParserInfoEspañol(dayfirst=True)
+
+MESES = r"(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre)"
+PATRON_FECHA_TEXTO = re.compile(rf"\b(\d{{1,2}})\s+de\s+({MESES})(?:\s+(?:de|del)\s+(\d{{4}}))?", re.IGNORECASE)
+PATRON_FECHA_NUMERICA = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b|\b(\d{4})-(\d{2})-(\d{2})\b")
+PATRON_DISTANCIA = re.compile(
+    r"\b\d{1,3}(?:[.,]\d{1,3})?\s*(?:km|k|kms|kilómetros|kilometros)\b|\bmedia\s+marat[oó]n\b|\bmarat[oó]n\b",
+    re.IGNORECASE
+)
+PATRON_LUGAR = re.compile(
+    r"\b(?i:lugar|localidad|ubicaci[oó]n|salida)\s*:\s*"
+    r"([A-ZÁÉÍÓÚÑ][\wáéíóúñ'-]+(?:\s+(?:de\s+|del\s+)?[A-ZÁÉÍÓÚÑ][\wáéíóúñ'-]+)*)"
+)
+PATRON_LUGAR_NOMBRE = re.compile(r"\b(?i:de|del)\s+([A-ZÁÉÍÓÚÑ][\wÁÉÍÓÚÑáéíóúñ'-]+(?:\s+[A-ZÁÉÍÓÚÑ][\wáéíóúñ'-]+)*)\s*$")
+
+# Contexto de una fecha (texto normalizado de la misma frase): lo que la ancla a
+# la carrera y lo que dice que es otra cosa. Manda la palabra más cercana.
+PATRON_CONTEXTO_CARRERA = re.compile(
+    r"\b(?:se celebra\w*|celebrara|tendra lugar|tiene lugar|celebracion|edicion|salida|carrera|prueba|"
+    r"maraton|trail|triatlon|marcha|fecha)\b"
+)
+PATRON_CONTEXTO_OTRA = re.compile(
+    r"\b(?:inscripcion\w*|inscrib\w*|plazo|limite|cierre|cierra|hasta|publicad\w*|publicacion|actualizad\w*|"
+    r"actualizacion|noticia|dorsal\w*|feria|recogida|presentacion|entrenamiento\w*)\b"
+)
+# Caracteres de la misma frase que se miran antes y después de cada fecha
+CONTEXTO_ANTES, CONTEXTO_DESPUES = 80, 40
+# Peso de una mención de fecha según su contexto ("otra" no cuenta)
+PESO_MENCION = {"carrera": 1.0, "neutra": 0.3}
+
+# Palabras clave (completas, también en plural) -> deporte, con su peso: las ambiguas pesan poco
+DEPORTES = [
+    ("Triatlón", {"triatlon": 1.0, "triathlon": 1.0, "duatlon": 1.0, "ironman": 1.0}),
+    ("Gravel", {"gravel": 1.0}),
+    ("Ciclismo", {"ciclismo": 1.0, "cicloturista": 1.0, "btt": 1.0, "mtb": 1.0, "ciclista": 0.3, "bicicleta": 0.3}),
+    ("Trail", {"trail": 1.0, "skyrace": 1.0, "ultra": 0.3, "montana": 0.3, "desnivel": 0.2}),
+    ("Running", {"maraton": 1.0, "carrera popular": 1.0, "(?<!trail )running": 1.0, "san silvestre": 1.0,
+                 "42k": 0.5, "21k": 0.5, "10k": 0.5, "5k": 0.5}),
+]
+PATRONES_DEPORTE = [
+    (deporte, [(re.compile(rf"\b{clave}s?\b"), peso) for clave, peso in claves.items()]) for deporte, claves in DEPORTES
+]
+# Una mención en el nombre buscado vale por varias en el texto
+PESO_NOMBRE_DEPORTE = 3
+
+INSCRIPCION = [
+    ("cerrada", ("inscripciones cerradas", "inscripcion cerrada", "dorsales agotados", "agotadas", "sold out")),
+    ("abierta", ("inscripciones abiertas", "inscripcion abierta", "inscribete", "abiertas las inscripciones",
+                 "ya puedes inscribirte")),
+]
+
+
+class EstadisticasReglas:
+    """Cuántas extracciones se resolvieron sin LLM en este worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.resueltas = 0
+        self.derivadas_al_llm = 0
+
+    def registrar(self, resuelta: bool):
+        with self._lock:
+            if resuelta:
+                self.resueltas += 1
+            else:
+                self.derivadas_al_llm += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self.resueltas + self.derivadas_al_llm
+            return {
+                "resueltas_sin_llm": self.resueltas,
+                "derivadas_al_llm": self.derivadas_al_llm,
+                "ratio_sin_llm": round(self.resueltas / total, 3) if total else 0.0,
+            }
+
+
+estadisticas_reglas = EstadisticasReglas()
+
+
+# --- Campos ---
+def _tipo_mencion(texto: str, inicio: int, fin: int) -> str:
+    """'carrera', 'otra' o 'neutra' según las palabras de la misma frase alrededor de una fecha."""
+    antes = normalizar_texto(re.split(r"[.\n]\s", texto[max(0, inicio - CONTEXTO_ANTES):inicio])[-1])
+    despues = normalizar_texto(re.split(r"[.\n]\s", texto[fin:fin + CONTEXTO_DESPUES])[0])
+    carrera = max((m.end() for m in PATRON_CONTEXTO_CARRERA.finditer(antes)), default=-1)
+    otra = max((m.end() for m in PATRON_CONTEXTO_OTRA.finditer(antes)), default=-1)
+    if otra > carrera:
+        return "otra"
+    if carrera >= 0:
+        return "carrera"
+    if PATRON_CONTEXTO_OTRA.search(despues):
+        return "otra"
+    return "carrera" if PATRON_CONTEXTO_CARRERA.search(despues) else "neutra"
+
+
+def _fechas(texto: str) -> List[Tuple[date, bool, str]]:
+    """Fechas del texto como (fecha, tenía_año, tipo de mención)."""
+    encontradas = []
+    for coincidencia in PATRON_FECHA_TEXTO.finditer(texto):
+        dia, mes, año = coincidencia.groups()
+        try:
+            por_defecto = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            fecha = parser.parse(f"{dia} {mes} {año or ''}", parserinfo=PARSER_ES, default=por_defecto).date()
+        except (ValueError, OverflowError):
+            continue
+        if not año and fecha < date.today():
+            fecha = fecha.replace(year=fecha.year + 1) # "27 de abril" ya pasado: la del año que viene
+        encontradas.append((fecha, bool(año), _tipo_mencion(texto, *coincidencia.span())))
+    for coincidencia in PATRON_FECHA_NUMERICA.finditer(texto):
+        try:
+            fecha = parser.parse(coincidencia.group(0), parserinfo=PARSER_ES, dayfirst=True, yearfirst=False).date()
+        except (ValueError, OverflowError):
+            continue
+        encontradas.append((fecha, True, _tipo_mencion(texto, *coincidencia.span())))
+    return encontradas
+
+
+def extraer_fecha(texto: str, año: int) -> Tuple[Optional[date], float]:
+    """
+    La fecha futura (>= año) con más peso entre las menciones que no son de
+    otra cosa. Solo es segura si alguna mención está anclada a la carrera.
+    """
+    pesos, ancladas, con_año = Counter(), Counter(), set()
+    for fecha, tenia_año, tipo in _fechas(texto):
+        if tipo == "otra" or fecha.year < año or fecha < date.today():
+            continue
+        pesos[fecha] += PESO_MENCION[tipo]
+        ancladas[fecha] += tipo == "carrera"
+        if tenia_año:
+            con_año.add(fecha)
+    if not pesos:
+        return None, 0.0
+    fecha, peso = pesos.most_common(1)[0]
+    # Sin ancla es solo una fecha que aparece por ahí; con una, probable; con dos o más, segura
+    base = 1.0 if ancladas[fecha] >= 2 else 0.8 if ancladas[fecha] == 1 else 0.4
+    confianza = base * peso / sum(pesos.values())
+    if fecha not in con_año:
+        confianza *= 0.7 # El año se ha supuesto
+    return fecha, confianza
+
+
+def extraer_distancias(texto: str) -> Tuple[List[str], float]:
+    kms = Counter()
+    for coincidencia in PATRON_DISTANCIA.finditer(texto):
+        km = parsear_distancia_km(coincidencia.group(0))
+        if km and 1 <= km <= 400:
+            kms[km] += 1
+    if not kms:
+        return [], 0.0
+    nombres = {42.195: "Maratón", 21.0975: "Media maratón"}
+    distancias = [nombres.get(km, f"{km:g} km") for km in sorted(kms, reverse=True)]
+    # Una sola mención suelta es poco fiable; varias coincidencias, mucho
+    return distancias, min(1.0, 0.5 + 0.25 * max(kms.values()))
+
+
+def extraer_deporte(texto_normalizado: str, nombre_a_buscar: str = "") -> Tuple[Optional[str], float]:
+    """
+    El deporte con más puntos (palabras completas por su peso; las del nombre
+    buscado valen PESO_NOMBRE_DEPORTE veces más). La confianza es su parte
+    del total, rebajada si apenas hay menciones.
+    """
+    nombre = normalizar_texto(nombre_a_buscar)
+    puntos = Counter()
+    for deporte, patrones in PATRONES_DEPORTE:
+        for patron, peso in patrones:
+            veces = len(patron.findall(texto_normalizado)) + PESO_NOMBRE_DEPORTE * len(patron.findall(nombre))
+            if veces:
+                puntos[deporte] += peso * veces
+    if not puntos:
+        return None, 0.0
+    deporte, mejor = puntos.most_common(1)[0]
+    return deporte, (mejor / sum(puntos.values())) * min(1.0, mejor / 2)
+
+
+def extraer_estado(texto_normalizado: str) -> str:
+    for estado, claves in INSCRIPCION:
+        if any(clave in texto_normalizado for clave in claves):
+            return estado
+    return "pendiente"
+
+
+def extraer_lugar(texto: str, nombre_a_buscar: str) -> Tuple[Optional[str], float]:
+    explicitos = Counter(m.group(1).strip(" .-") for m in PATRON_LUGAR.finditer(texto))
+    if explicitos:
+        return explicitos.most_common(1)[0][0], 1.0
+    # "Maratón de Valencia" -> "Valencia": solo una suposición, algo más creíble si el texto lo nombra
+    coincidencia = PATRON_LUGAR_NOMBRE.search(nombre_a_buscar.strip().title())
+    if coincidencia:
+        lugar = coincidencia.group(1)
+        return lugar, 0.4 if normalizar_texto(lugar) in normalizar_texto(texto) else 0.2
+    return None, 0.0
+
+
+def extraer_nombre(resultados: List[dict], nombre_a_buscar: str) -> Tuple[str, float]:
+    """El trozo de título que contiene todas las palabras buscadas; si no, el nombre buscado."""
+    terminos = set(normalizar_texto(nombre_a_buscar).split())
+    for res in resultados:
+        for trozo in re.split(r"\s[|–—-]\s", res.get("title") or ""):
+            trozo = trozo.strip()
+            if terminos and terminos <= set(normalizar_texto(trozo).split()) and 3 <= len(trozo) <= 80:
+                return trozo, 1.0
+    return nombre_a_buscar.strip(), 0.4
+
+
+def extraer_url(resultados: List[dict], nombre_a_buscar: str) -> Optional[str]:
+    """La primera URL cuyo dominio contiene alguna palabra significativa del nombre."""
+    terminos = [t for t in normalizar_texto(nombre_a_buscar).split() if len(t) > 3]
+    for res in resultados:
+        dominio = normalizar_texto(urlparse(res.get("url") or "").netloc).replace(" ", "")
+        if any(t in dominio for t in terminos):
+            return res["url"]
+    return None
+
+
+# --- Extracción completa ---
+def extraer_carrera(resultados: List[dict], nombre_a_buscar: str, año: int) -> Tuple[Optional[dict], float]:
+    """
+    Rellena los campos de CarreraSchema a partir de los resultados de Tavily.
+    Devuelve (datos, confianza); datos es None si falta algún campo obligatorio.
+    """
+    texto = "\n".join(f"{res.get('title') or ''}\n{res.get('content') or ''}" for res in resultados)
+    normalizado = normalizar_texto(texto)
+
+    fecha, c_fecha = extraer_fecha(texto, año)
+    distancias, c_distancias = extraer_distancias(texto)
+    deporte, c_deporte = extraer_deporte(normalizado, nombre_a_buscar)
+    lugar, c_lugar = extraer_lugar(texto, nombre_a_buscar)
+    nombre, c_nombre = extraer_nombre(resultados, nombre_a_buscar)
+
+    confianza = (PESOS["fecha"] * c_fecha + PESOS["distancias"] * c_distancias + PESOS["deporte"] * c_deporte
+                 + PESOS["lugar"] * c_lugar + PESOS["nombre_oficial"] * c_nombre)
+    if not (fecha and distancias and deporte and lugar and len(nombre) >= 3):
+        return None, round(confianza, 3)
+
+    datos = {
+        "nombre_oficial": nombre,
+        "deporte": deporte,
+        "fecha": fecha.isoformat(),
+        "lugar": lugar,
+        "distancias": distancias,
+        "url_oficial": extraer_url(resultados, nombre_a_buscar),
+        "estado_inscripcion": extraer_estado(normalizado),
+    }
+    return datos, round(confianza, 3)
@@ -0,0 +1,329 @@
+#Importación y exportación masiva del calendario de un usuario (CSV o
+#NDJSON), para clubes que mueven cientos de carreras y resultados entre
+#hojas de cálculo y RaceHub.
+#
+#Importar (POST /carreras/importar):
+#  - El cuerpo se lee en trozos según llega y se parte en líneas: en
+#    memoria solo hay un lote de IMPORTAR_LOTE filas.
+#  - Cada fila se valida con CarreraSchema; las que fallan se informan
+#    con su número de línea y no paran la importación.
+#  - Cada lote es una transacción que pasa por upsert_carreras (enlace
+#    con el usuario, estadísticas y calendario). En PostgreSQL las
+#    carreras que faltan en el catálogo entran con COPY a una tabla
+#    temporal + un INSERT ... SELECT. Como todo lo que trae un usuario,
+#    al catálogo solo van los datos que identifican la carrera (nombre,
+#    fecha, deporte); el resto se queda en SU enlace. Los resultados
+#    (tiempo_oficial...) se insertan de una vez, sin repetir los que ya
+#    estaban.
+#
+#Exportar (GET /carreras/exportar): carreras JOIN races LEFT JOIN
+#resultados con un cursor de servidor (stream_results), escrito en
+#bloques de EXPORTAR_LOTE filas. El mismo fichero se puede volver a
+#importar.
+
+import codecs
+import csv
+import io
+import json
+import os
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from src import estadisticas
+from src.database import engine, SessionLocal, RaceDB, CarreraDB, ResultadoDB, valor_efectivo
+from src.main import CarreraSchema, fila_race, upsert_carreras
+from src.metricas import contar, medir
+from src.tiempos import medidas_resultado
+
+IMPORTAR_LOTE = int(os.getenv("IMPORTAR_LOTE", "500"))
+IMPORTAR_MAX_FILAS = int(os.getenv("IMPORTAR_MAX_FILAS", "50000"))
+# Una línea más larga que esto no es una fila de calendario (y no se guarda entera en memoria)
+IMPORTAR_MAX_LINEA = int(os.getenv("IMPORTAR_MAX_LINEA", "65536"))
+# Errores de fila que se devuelven en el resumen (el total se cuenta siempre)
+IMPORTAR_MAX_ERRORES = 100
+EXPORTAR_LOTE = int(os.getenv("EXPORTAR_LOTE", "1000"))
+
+FORMATOS = ("csv", "ndjson")
+# Columnas del fichero exportado (y aceptadas al importar)
+COLUMNAS_EXPORTACION = ["carrera_id", "nombre", "deporte", "fecha", "localizacion", "distancia_resumen", "url_oficial",
+                        "estado_inscripcion", "tiempo_oficial", "posicion_general", "ritmo_medio", "comentarios"]
+# Nombres de la exportación -> campos de CarreraSchema
+ALIAS = {"nombre": "nombre_oficial", "localizacion": "lugar", "distancia_resumen": "distancias"}
+
+
+class ErrorImportacion(ValueError):
+    """El fichero entero no se puede importar (no una fila suelta)."""
+
+
+def formato_de(formato: Optional[str], content_type: str) -> str:
+    """Formato pedido en la query o, si no, deducido del Content-Type. CSV por defecto."""
+    if formato:
+        formato = formato.lower()
+        if formato not in FORMATOS:
+            raise ErrorImportacion(f"Formato no soportado: {formato} (csv o ndjson)")
+        return formato
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "application/json" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+# --- 1. Lectura por trozos ---
+def lineas(trozos: Iterable[bytes]) -> Iterator[str]:
+    """Líneas (con su salto) de un cuerpo que llega en trozos de bytes UTF-8 (con o sin BOM)."""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pendiente = ""
+    for trozo in trozos:
+        # La última parte puede estar a medias: espera al siguiente trozo
+        *completas, pendiente = (pendiente + decodificador.decode(trozo)).split("\n")
+        if len(pendiente) > IMPORTAR_MAX_LINEA:
+            raise ErrorImportacion(f"Línea de más de {IMPORTAR_MAX_LINEA} caracteres")
+        for linea in completas:
+            yield linea + "\n"
+    pendiente += decodificador.decode(b"", final=True)
+    if pendiente:
+        yield pendiente
+
+
+def filas(texto: Iterable[str], formato: str) -> Iterator[tuple]:
+    """(número de línea, dict) por cada fila del fichero. Las filas ilegibles dan (línea, ValueError)."""
+    if formato == "csv":
+        lector = csv.DictReader(texto)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, ValueError(f"JSON no válido: {e}")
+            continue
+        yield numero, fila if isinstance(fila, dict) else ValueError("Cada línea debe ser un objeto JSON")
+
+
+# --- 2. Validación ---
+def _texto(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+
+def interpretar(fila: dict):
+    """(CarreraSchema, resultado o None) de una fila; ValueError si no es válida."""
+    datos = {ALIAS.get(str(k).strip().lower(), str(k).strip().lower()): v for k, v in fila.items() if k}
+    distancias = datos.get("distancias")
+    if isinstance(distancias, str):
+        datos["distancias"] = [d.strip() for d in distancias.split(",") if d.strip()]
+    campos = {}
+    for campo in CarreraSchema.model_fields:
+        valor = datos.get(campo)
+        valor = valor if isinstance(valor, list) else _texto(valor)
+        if valor is not None:
+            campos[campo] = valor
+    try:
+        carrera = CarreraSchema(**campos)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+    resultado = None
+    tiempo = _texto(datos.get("tiempo_oficial"))
+    if tiempo:
+        posicion = _texto(datos.get("posicion_general"))
+        try:
+            posicion = int(float(posicion)) if posicion else None
+        except ValueError:
+            raise ValueError(f"posicion_general: no es un número ({posicion})")
+        resultado = {"tiempo_oficial": tiempo, "posicion_general": posicion,
+                     "ritmo_medio": _texto(datos.get("ritmo_medio")), "comentarios": _texto(datos.get("comentarios"))}
+    return carrera, resultado
+
+
+# --- 3. Carga por lotes ---
+def _copiar_races(db: Session, nuevas: list) -> int:
+    """
+    PostgreSQL (insertar de catalogo.asegurar_races): COPY de las carreras que
+    faltan a una tabla temporal y un solo INSERT ... SELECT al catálogo. Solo
+    lleva los campos de identidad y el estado de inscripción por defecto, que
+    un INSERT en SQL no rellena; devuelve cuántas ha creado (RETURNING: las
+    que otro guardó a la vez no cuentan).
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for fila in nuevas:
+        escritor.writerow([fila["nombre"], fila["nombre_normalizado"], fila["fecha"].isoformat(), fila["deporte"]])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS importacion_races (nombre TEXT, nombre_normalizado TEXT, fecha DATE, "
+            "deporte TEXT) ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_expert("COPY importacion_races FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+            "INSERT INTO races (nombre, nombre_normalizado, fecha, deporte, estado_inscripcion) "
+            "SELECT DISTINCT ON (nombre_normalizado, fecha) nombre, nombre_normalizado, fecha, deporte, 'pendiente' "
+            "FROM importacion_races ON CONFLICT (nombre_normalizado, fecha) DO NOTHING RETURNING id"
+        )
+        return len(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def _guardar_resultados(db: Session, user_id: int, resultados: list) -> int:
+    """Inserta los resultados del lote que no estuvieran ya (mismo enlace y tiempo). Devuelve cuántos."""
+    claves = {(fila["nombre_normalizado"], fila["fecha"]) for fila, _ in resultados}
+    enlaces = {
+        (nombre_normalizado, fecha): (carrera_id, distancia_resumen)
+        for carrera_id, nombre_normalizado, fecha, distancia_resumen in db.query(
+            CarreraDB.id, RaceDB.nombre_normalizado, RaceDB.fecha, valor_efectivo("distancia_resumen")
+        ).join(RaceDB, RaceDB.id == CarreraDB.race_id).filter(
+            CarreraDB.user_id == user_id, tuple_(RaceDB.nombre_normalizado, RaceDB.fecha).in_(claves)
+        )
+    }
+    ids = [carrera_id for carrera_id, _ in enlaces.values()]
+    existentes = {
+        (carrera_id, tiempo) for carrera_id, tiempo in
+        db.query(ResultadoDB.carrera_id, ResultadoDB.tiempo_oficial).filter(ResultadoDB.carrera_id.in_(ids))
+    }
+    con_resultado = {carrera_id for carrera_id, _ in existentes}
+
+    nuevos, cambios = [], Counter()
+    for fila, resultado in resultados:
+        carrera_id, distancia_resumen = enlaces[(fila["nombre_normalizado"], fila["fecha"])]
+        if (carrera_id, resultado["tiempo_oficial"]) in existentes:
+            continue
+        existentes.add((carrera_id, resultado["tiempo_oficial"]))
+        tiempo_segundos, ritmo_segundos_km, distancia_km = medidas_resultado(
+            resultado["tiempo_oficial"], resultado["ritmo_medio"], distancia_resumen
+        )
+        nuevos.append({
+            "carrera_id": carrera_id, **resultado,
+            "tiempo_segundos": tiempo_segundos, "ritmo_segundos_km": ritmo_segundos_km, "distancia_km": distancia_km,
+        })
+        cambios[("resultados", "")] += 1
+        if carrera_id not in con_resultado:
+            con_resultado.add(carrera_id)
+            cambios[("con_resultado", "")] += 1
+    if nuevos:
+        db.execute(ResultadoDB.__table__.insert(), nuevos)
+        estadisticas.ajustar(db, user_id, cambios)
+    return len(nuevos)
+
+
+def _cargar_lote(lote: list, user_id: int) -> dict:
+    """Guarda un lote de (CarreraSchema, resultado) en una transacción. Devuelve sus contadores."""
+    filas_race = [fila_race(carrera) for carrera, _ in lote]
+    db: Session = SessionLocal()
+    try:
+        with medir("importar_lote"):
+            # copy_expert es de psycopg2; con otro driver, el INSERT de siempre
+            dialecto = db.get_bind().dialect
+            copiar = _copiar_races if (dialecto.name, dialecto.driver) == ("postgresql", "psycopg2") else None
+            estados = upsert_carreras(db, [carrera for carrera, _ in lote], user_id, insertar_races=copiar)
+            resultados = [(fila, resultado) for fila, (_, resultado) in zip(filas_race, lote) if resultado]
+            guardados = _guardar_resultados(db, user_id, resultados) if resultados else 0
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    contadores = Counter(e["estado"] for e in estados)
+    contadores["resultados"] = guardados
+    return contadores
+
+
+def importar(trozos: Iterable[bytes], formato: str, user_id: int) -> dict:
+    """Importa un fichero que llega por trozos. Lotes ya guardados no se deshacen si falla uno posterior."""
+    resumen = Counter()
+    errores, lote = [], []
+
+    def cargar():
+        resumen.update(_cargar_lote(lote, user_id))
+        contar("racehub_intercambio_filas_total", len(lote), operacion="importar")
+        lote.clear()
+
+    for numero, fila in filas(lineas(trozos), formato):
+        resumen["filas"] += 1
+        if resumen["filas"] > IMPORTAR_MAX_FILAS:
+            raise ErrorImportacion(f"Máximo {IMPORTAR_MAX_FILAS} filas por importación")
+        try:
+            if isinstance(fila, Exception):
+                raise fila
+            lote.append(interpretar(fila))
+        except ValueError as e:
+            resumen["errores"] += 1
+            if len(errores) < IMPORTAR_MAX_ERRORES:
+                errores.append({"linea": numero, "error": str(e)})
+            continue
+        if len(lote) >= IMPORTAR_LOTE:
+            cargar()
+    if lote:
+        cargar()
+
+    print(f"📥 Importación (User {user_id}): {resumen['filas']} filas, {resumen['insertada']} insertadas, "
+          f"{resumen['resultados']} resultados, {resumen['errores']} errores")
+    return {
+        "filas": resumen["filas"],
+        "insertadas": resumen["insertada"],
+        "actualizadas": resumen["actualizada"],
+        "omitidas": resumen["omitida"],
+        "resultados": resumen["resultados"],
+        "errores": resumen["errores"],
+        "detalle_errores": errores,
+    }
+
+
+# --- 4. Exportación ---
+def _consulta_exportacion(user_id: int):
+    return (
+        # Mismo orden que COLUMNAS_EXPORTACION; los datos, los que ve el usuario
+        select(CarreraDB.id.label("carrera_id"), RaceDB.nombre, valor_efectivo("deporte").label("deporte"),
+               RaceDB.fecha, *(valor_efectivo(campo).label(campo) for campo in
+                                 ("localizacion", "distancia_resumen", "url_oficial", "estado_inscripcion")),
+               ResultadoDB.tiempo_oficial, ResultadoDB.posicion_general, ResultadoDB.ritmo_medio, ResultadoDB.comentarios)
+        .select_from(CarreraDB)
+        .join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .outerjoin(ResultadoDB, ResultadoDB.carrera_id == CarreraDB.id)
+        .where(CarreraDB.user_id == user_id)
+        .order_by(RaceDB.fecha, CarreraDB.id, ResultadoDB.id)
+    )
+
+
+def exportar(user_id: int, formato: str) -> Iterator[bytes]:
+    """
+    Carreras y resultados del usuario en bloques de bytes. En PostgreSQL
+    stream_results usa un cursor de servidor: nunca está todo en memoria.
+    """
+    if formato == "csv":
+        yield "\ufeff".encode("utf-8") # BOM: que Excel lo abra como UTF-8
+        cabecera = io.StringIO()
+        csv.writer(cabecera).writerow(COLUMNAS_EXPORTACION)
+        yield cabecera.getvalue().encode("utf-8")
+
+    total = 0
+    with engine.connect() as conexion:
+        resultado = conexion.execution_options(stream_results=True, yield_per=EXPORTAR_LOTE).execute(
+            _consulta_exportacion(user_id)
+        )
+        for bloque in resultado.partitions():
+            buffer = io.StringIO()
+            if formato == "csv":
+                escritor = csv.writer(buffer)
+                for fila in bloque:
+                    escritor.writerow(["" if valor is None else valor for valor in fila])
+            else:
+                for fila in bloque:
+                    datos = dict(fila._mapping)
+                    datos["fecha"] = datos["fecha"].isoformat() if datos["fecha"] else None
+                    buffer.write(json.dumps(datos, ensure_ascii=False) + "\n")
+            total += len(bloque)
+            yield buffer.getvalue().encode("utf-8")
+    contar("racehub_intercambio_filas_total", total, operacion="exportar")
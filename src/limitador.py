@@ -0,0 +1,245 @@
+#Capa de admisión para las llamadas a los proveedores externos
+#(Groq y Tavily). Es un "token bucket" por proveedor dimensionado a
+#nuestra cuota, cuyo estado se guarda en un fichero protegido con
+#un cerrojo (flock) para que lo compartan todos los workers de
+#uvicorn de la máquina.
+#
+#  - Dos carriles de prioridad: las peticiones 'interactiva' pueden
+#    gastar todo el cubo; las de 'fondo' (lotes, tareas programadas)
+#    solo gastan por encima de una reserva para no quitar cuota a
+#    los usuarios que están esperando.
+#  - Espera adaptativa: un 429 bloquea el proveedor para TODOS los
+#    workers durante Retry-After (o un backoff exponencial con jitter),
+#    en lugar de que cada worker reintente por su cuenta a la vez.
+#    Quedarse sin el cupo del plan (UsageLimitExceededError de Tavily)
+#    no es un 429: reintentar no sirve y se corta con CuotaAgotada.
+#
+#Leer y escribir el estado es E/S con un cerrojo que puede esperar a
+#otro worker: la versión asíncrona lo hace en un hilo (asyncio.to_thread)
+#para no bloquear el bucle de eventos.
+
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from src.metricas import medir, contar
+
+try:
+    import fcntl
+except ImportError:  # Windows: el estado queda solo en memoria del proceso
+    fcntl = None
+
+PRIORIDAD_INTERACTIVA = "interactiva"
+PRIORIDAD_FONDO = "fondo"
+
+LIMITADOR_FICHERO = os.getenv("LIMITADOR_FICHERO", os.path.join(tempfile.gettempdir(), "racehub_limitador.json"))
+# Fracción del cubo reservada a las peticiones interactivas
+LIMITADOR_RESERVA_INTERACTIVA = float(os.getenv("LIMITADOR_RESERVA_INTERACTIVA", "0.3"))
+LIMITADOR_MAX_REINTENTOS = int(os.getenv("LIMITADOR_MAX_REINTENTOS", "3"))
+LIMITADOR_BACKOFF_BASE = float(os.getenv("LIMITADOR_BACKOFF_BASE", "2"))
+LIMITADOR_BACKOFF_MAX = float(os.getenv("LIMITADOR_BACKOFF_MAX", "60"))
+# Espera máxima en cola antes de rendirse (segundos)
+LIMITADOR_ESPERA_MAX = float(os.getenv("LIMITADOR_ESPERA_MAX", "120"))
+
+
+def _cuota(proveedor: str, rpm_por_defecto: int) -> dict:
+    rpm = float(os.getenv(f"{proveedor.upper()}_RPM", str(rpm_por_defecto)))
+    rafaga = float(os.getenv(f"{proveedor.upper()}_RAFAGA", str(max(1, rpm // 6))))
+    return {"por_segundo": rpm / 60, "capacidad": rafaga}
+
+
+CUOTAS = {
+    "groq": _cuota("groq", 30),
+    "tavily": _cuota("tavily", 100),
+}
+
+
+class CuotaAgotada(Exception):
+    """No se consiguió turno con el proveedor dentro de LIMITADOR_ESPERA_MAX, o se acabó el cupo del plan."""
+
+
+class LimitadorCompartido:
+    def __init__(self, ruta: str, cuotas: dict):
+        self.ruta = ruta
+        self.cuotas = cuotas
+        self._lock = threading.Lock()
+        self._estado_local = {}
+
+    # --- Estado compartido ---
+    @contextmanager
+    def _estado(self):
+        """Abre el estado compartido en exclusiva y lo guarda al salir."""
+        with self._lock:
+            if fcntl is None:
+                yield self._estado_local
+                return
+            with open(self.ruta, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    contenido = f.read()
+                    try:
+                        estado = json.loads(contenido) if contenido else {}
+                    except ValueError:
+                        estado = {}
+                    yield estado
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(estado, f)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _cubo(self, estado: dict, proveedor: str, ahora: float) -> dict:
+        cuota = self.cuotas[proveedor]
+        cubo = estado.setdefault(proveedor, {
+            "tokens": cuota["capacidad"], "actualizado": ahora, "bloqueado_hasta": 0, "penalizacion": 0
+        })
+        transcurrido = max(0.0, ahora - cubo["actualizado"])
+        cubo["tokens"] = min(cuota["capacidad"], cubo["tokens"] + transcurrido * cuota["por_segundo"])
+        cubo["actualizado"] = ahora
+        return cubo
+
+    def _intentar(self, proveedor: str, prioridad: str) -> float:
+        """Toma un token si puede. Devuelve 0 si lo consiguió o los segundos a esperar."""
+        cuota = self.cuotas[proveedor]
+        with self._estado() as estado:
+            ahora = time.time()
+            cubo = self._cubo(estado, proveedor, ahora)
+            if ahora < cubo["bloqueado_hasta"]:
+                return cubo["bloqueado_hasta"] - ahora
+
+            reserva = cuota["capacidad"] * LIMITADOR_RESERVA_INTERACTIVA if prioridad == PRIORIDAD_FONDO else 0
+            if cubo["tokens"] - 1 >= reserva:
+                cubo["tokens"] -= 1
+                return 0
+            return (1 + reserva - cubo["tokens"]) / cuota["por_segundo"]
+
+    # --- API pública ---
+    def adquirir(self, proveedor: str, prioridad: str = PRIORIDAD_INTERACTIVA):
+        limite = time.time() + LIMITADOR_ESPERA_MAX
+        while True:
+            espera = self._intentar(proveedor, prioridad)
+            if espera == 0:
+                return
+            if time.time() + espera > limite:
+                raise CuotaAgotada(f"⚠️ Cuota de {proveedor} agotada. Intenta de nuevo en unos minutos.")
+            # El jitter evita que todos los workers despierten en el mismo instante
+            time.sleep(espera + random.uniform(0, 0.25))
+
+    async def aadquirir(self, proveedor: str, prioridad: str = PRIORIDAD_INTERACTIVA):
+        limite = time.time() + LIMITADOR_ESPERA_MAX
+        while True:
+            espera = await asyncio.to_thread(self._intentar, proveedor, prioridad)
+            if espera == 0:
+                return
+            if time.time() + espera > limite:
+                raise CuotaAgotada(f"⚠️ Cuota de {proveedor} agotada. Intenta de nuevo en unos minutos.")
+            await asyncio.sleep(espera + random.uniform(0, 0.25))
+
+    def registrar_429(self, proveedor: str, retry_after: float = None) -> float:
+        """Bloquea el proveedor para todos los workers y vacía su cubo. Devuelve la espera aplicada."""
+        with self._estado() as estado:
+            ahora = time.time()
+            cubo = self._cubo(estado, proveedor, ahora)
+            cubo["penalizacion"] += 1
+            if retry_after is None:
+                retry_after = min(LIMITADOR_BACKOFF_MAX, LIMITADOR_BACKOFF_BASE ** cubo["penalizacion"])
+                retry_after *= random.uniform(0.8, 1.2)
+            cubo["bloqueado_hasta"] = max(cubo["bloqueado_hasta"], ahora + retry_after)
+            cubo["tokens"] = 0
+            return retry_after
+
+    def registrar_exito(self, proveedor: str):
+        """Cada éxito relaja el backoff acumulado por 429 anteriores."""
+        with self._estado() as estado:
+            cubo = self._cubo(estado, proveedor, time.time())
+            if cubo["penalizacion"]:
+                cubo["penalizacion"] -= 1
+
+
+limitador = LimitadorCompartido(LIMITADOR_FICHERO, CUOTAS)
+
+
+def es_rate_limit(e: Exception) -> bool:
+    if getattr(e, "status_code", None) == 429:
+        return True
+    error_str = str(e)
+    return "429" in error_str or "Rate limit" in error_str
+
+
+def _cupo_agotado(proveedor: str, e: Exception):
+    """Si el proveedor dice que se acabó el cupo del plan, CuotaAgotada (sin reintentos)."""
+    if type(e).__name__ == "UsageLimitExceededError":
+        contar("racehub_proveedor_cupo_agotado_total", proveedor=proveedor)
+        raise CuotaAgotada(f"⚠️ Se ha agotado el cupo del plan de {proveedor}.") from e
+
+
+def _retry_after(e: Exception):
+    """Lee la cabecera Retry-After de la respuesta HTTP del proveedor, si la hay."""
+    respuesta = getattr(e, "response", None)
+    cabeceras = getattr(respuesta, "headers", None)
+    if not cabeceras:
+        return None
+    try:
+        return float(cabeceras.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def llamar_proveedor(proveedor: str, funcion, *args, prioridad: str = PRIORIDAD_INTERACTIVA, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs) pasando antes por el cubo del proveedor.
+    Ante un 429 bloquea el proveedor de forma compartida y reintenta hasta
+    LIMITADOR_MAX_REINTENTOS veces.
+    """
+    etapa = f"{proveedor}.{getattr(funcion, '__name__', 'llamada')}"
+    for intento in range(LIMITADOR_MAX_REINTENTOS + 1):
+        with medir("espera_limitador", proveedor=proveedor):
+            limitador.adquirir(proveedor, prioridad)
+        contar("racehub_proveedor_llamadas_total", proveedor=proveedor)
+        try:
+            with medir(etapa):
+                resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            _cupo_agotado(proveedor, e)
+            if not es_rate_limit(e):
+                raise
+            contar("racehub_proveedor_429_total", proveedor=proveedor)
+            if intento == LIMITADOR_MAX_REINTENTOS:
+                raise
+            espera = limitador.registrar_429(proveedor, _retry_after(e))
+            contar("racehub_proveedor_reintentos_total", proveedor=proveedor)
+            print(f"⏳ 429 de {proveedor}: pausa compartida de {espera:.1f}s (intento {intento + 1})")
+            continue
+        limitador.registrar_exito(proveedor)
+        return resultado
+
+
+async def allamar_proveedor(proveedor: str, funcion, *args, prioridad: str = PRIORIDAD_INTERACTIVA, **kwargs):
+    """Versión asíncrona de llamar_proveedor: `funcion` devuelve un awaitable."""
+    etapa = f"{proveedor}.{getattr(funcion, '__name__', 'llamada')}"
+    for intento in range(LIMITADOR_MAX_REINTENTOS + 1):
+        with medir("espera_limitador", proveedor=proveedor):
+            await limitador.aadquirir(proveedor, prioridad)
+        contar("racehub_proveedor_llamadas_total", proveedor=proveedor)
+        try:
+            with medir(etapa):
+                resultado = await funcion(*args, **kwargs)
+        except Exception as e:
+            _cupo_agotado(proveedor, e)
+            if not es_rate_limit(e):
+                raise
+            contar("racehub_proveedor_429_total", proveedor=proveedor)
+            if intento == LIMITADOR_MAX_REINTENTOS:
+                raise
+            espera = await asyncio.to_thread(limitador.registrar_429, proveedor, _retry_after(e))
+            contar("racehub_proveedor_reintentos_total", proveedor=proveedor)
+            print(f"⏳ 429 de {proveedor}: pausa compartida de {espera:.1f}s (intento {intento + 1})")
+            continue
+        await asyncio.to_thread(limitador.registrar_exito, proveedor)
+        return resultado
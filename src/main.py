@@ -6,28 +6,34 @@
 #lógica de control de duplicados basada en restricciones de
 #integridad referencial.
 
+import asyncio
 import os
+import threading
+from collections import Counter
 from datetime import datetime
 from dotenv import load_dotenv
-from tavily import TavilyClient
-from langchain_groq import ChatGroq
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import Callable, List, Optional
 from dateutil import parser
 from sqlalchemy.orm import Session
-from src.database import SessionLocal, CarreraDB, ResultadoDB
+from src.database import SessionLocal, CarreraDB, ResultadoDB, inicializar_db, insert_dialecto
+from src.cache import cache_extracciones
+from src.compartir import calendario_modificado
+from src.texto import normalizar_texto
+from src.busqueda_difusa import resolver_carrera
+from src import estadisticas, catalogo
+from src.extractor_reglas import extraer_carrera, estadisticas_reglas, EXTRACTOR_REGLAS_UMBRAL
+from src.clasificaciones import (obtener_clasificacion, guardar_clasificacion, buscar_corredor,
+                                  parsear_clasificacion, clave_corredor, clave_clasificacion,
+                                  CLASIFICACION_MIN_FILAS)
+from src.contexto import contexto_carrera, contexto_resultado
+from src.tiempos import medidas_resultado
+from src.metricas import medir, registrar_tokens
+from src.vuelo_unico import vuelos
+from src.limitador import llamar_proveedor, allamar_proveedor, es_rate_limit, PRIORIDAD_INTERACTIVA, PRIORIDAD_FONDO
 
 load_dotenv()
 
-# Validación de variables de entorno requeridas
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-if not TAVILY_API_KEY:
-    raise ValueError("❌ ERROR: TAVILY_API_KEY no está configurada en el archivo .env")
-if not GROQ_API_KEY:
-    raise ValueError("❌ ERROR: GROQ_API_KEY no está configurada en el archivo .env")
-
 # --- 1. SCHEMA ---
 #Obliga a la IA a que su respuesta tenga una estructura fija.
 # Si la IA intenta responder con un párrafo,
@@ -76,106 +82,492 @@ class ResultadoSchema(BaseModel):
     ritmo_medio: Optional[str] = Field(None, description="Ritmo medio (ej: '4:30 min/km'). Null si no hay datos.")
 
 #---Motores---
-tavily = TavilyClient(api_key=TAVILY_API_KEY)
-
-# Configuración con reintentos para manejar Rate Limits (Error 429)
-# Aumentamos max_retries y timeout para dar margen en casos de saturación
-llm = ChatGroq(
-    model_name="llama-3.3-70b-versatile", 
-    temperature=0, 
-    api_key=GROQ_API_KEY,
-    max_retries=3
-)
-llm_estructurado_carreras = llm.with_structured_output(CarreraSchema)
-llm_estructurado_resultado = llm.with_structured_output(ResultadoSchema)
-#Convierte a un modelo de lenguaje (que es un generador de
+# Los clientes se crean de forma perezosa en el primer uso: importar este módulo
+# (y por tanto arrancar la API) no carga LangChain/Tavily ni exige las claves,
+# así que un worker que solo sirve lecturas arranca sin ellas.
+_motores = {}
+# Reentrante: la fábrica de llm_carreras/llm_resultado pide a su vez get_llm()
+_motores_lock = threading.RLock()
+
+def _requerir_clave(nombre: str) -> str:
+    # Validación de variables de entorno requeridas
+    valor = os.getenv(nombre)
+    if not valor:
+        raise ValueError(f"❌ ERROR: {nombre} no está configurada en el archivo .env")
+    return valor
+
+def _motor(nombre: str, fabrica):
+    motor = _motores.get(nombre)
+    if motor is None:
+        with _motores_lock:
+            motor = _motores.get(nombre)
+            if motor is None:
+                motor = _motores[nombre] = fabrica()
+    return motor
+
+# Pruebas de carga y benchmarks sin red: ver src/proveedores_falsos.py
+PROVEEDORES_FALSOS = os.getenv("PROVEEDORES_FALSOS", "0") == "1"
+
+def _crear_tavily():
+    if PROVEEDORES_FALSOS:
+        from src.proveedores_falsos import TavilyFalso
+        return TavilyFalso()
+    from tavily import TavilyClient
+    return TavilyClient(api_key=_requerir_clave("TAVILY_API_KEY"))
+
+def _crear_tavily_async():
+    # Para la tubería asíncrona (no ocupa hilos)
+    if PROVEEDORES_FALSOS:
+        from src.proveedores_falsos import TavilyFalsoAsync
+        return TavilyFalsoAsync()
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient(api_key=_requerir_clave("TAVILY_API_KEY"))
+
+def _crear_llm():
+    if PROVEEDORES_FALSOS:
+        from src.proveedores_falsos import LLMFalso
+        return LLMFalso()
+    from langchain_groq import ChatGroq
+    # Sin reintentos propios: los 429 los gestiona src/limitador.py, que reparte
+    # la cuota entre workers y aplica una espera compartida en lugar de que cada
+    # cliente reintente por su cuenta a la vez.
+    return ChatGroq(
+        model_name="llama-3.3-70b-versatile", 
+        temperature=0, 
+        api_key=_requerir_clave("GROQ_API_KEY"),
+        max_retries=0
+    )
+
+def get_tavily():
+    return _motor("tavily", _crear_tavily)
+
+def get_tavily_async():
+    return _motor("tavily_async", _crear_tavily_async)
+
+def get_llm():
+    return _motor("llm", _crear_llm)
+
+#with_structured_output convierte a un modelo de lenguaje (que es un generador de
 #texto probabilístico) en una función de software 
 #determinista que devuelve un objeto Python.
+# include_raw=True: además del objeto validado devuelven el mensaje original,
+# que trae los tokens consumidos (ver _salida_estructurada)
+def get_llm_carreras():
+    return _motor("llm_carreras", lambda: get_llm().with_structured_output(CarreraSchema, include_raw=True))
+
+def get_llm_resultado():
+    return _motor("llm_resultado", lambda: get_llm().with_structured_output(ResultadoSchema, include_raw=True))
+
+def _salida_estructurada(respuesta: dict, etapa: str):
+    """Anota los tokens de la llamada y devuelve el objeto validado (o lanza el error de validación)."""
+    registrar_tokens(etapa, respuesta.get("raw"))
+    if respuesta.get("parsing_error") is not None:
+        raise respuesta["parsing_error"]
+    if respuesta.get("parsed") is None:
+        raise ValueError("❌ El LLM no devolvió datos estructurados")
+    return respuesta["parsed"]
 
 # --- 2. FUNCIÓN DE GUARDADO ---
-def guardar_en_db(datos_ia: CarreraSchema, user_id: int = 1):
-    db: Session = SessionLocal()
-    try:
-        fecha_objeto = parser.parse(datos_ia.fecha).date()
-
-        nueva_carrera = CarreraDB(
-            user_id=user_id, # Asignamos al usuario
-            nombre=datos_ia.nombre_oficial,
-            deporte=datos_ia.deporte, 
-            fecha=fecha_objeto,
-            localizacion=datos_ia.lugar,
-            distancia_resumen=", ".join(datos_ia.distancias),
-            url_oficial=datos_ia.url_oficial,
-            estado_inscripcion=datos_ia.estado_inscripcion.lower() 
+def fila_race(datos_ia: CarreraSchema) -> dict:
+    """Columnas de RaceDB (catálogo global) a partir de una extracción."""
+    return {
+        "nombre": datos_ia.nombre_oficial,
+        "nombre_normalizado": normalizar_texto(datos_ia.nombre_oficial),
+        "deporte": datos_ia.deporte,
+        "fecha": parser.parse(datos_ia.fecha).date(),
+        "localizacion": datos_ia.lugar,
+        "distancia_resumen": ", ".join(datos_ia.distancias),
+        "url_oficial": datos_ia.url_oficial,
+        "estado_inscripcion": datos_ia.estado_inscripcion.lower(),
+    }
+
+def upsert_carreras(db: Session, lista_datos: List[CarreraSchema], user_id: int,
+                    desde_extraccion: bool = False, insertar_races=None) -> List[dict]:
+    """
+    Guarda varias carreras en la sesión recibida (no hace commit): crea en
+    el catálogo las que no estaban y enlaza al usuario con un único INSERT
+    ... ON CONFLICT. Con desde_extraccion=True (datos de una búsqueda del
+    servidor) refresca además la carrera del catálogo para todos sus
+    seguidores; si no (lo que confirma o importa el usuario) los datos que
+    difieren del catálogo se guardan solo en su enlace (ver src/catalogo.py).
+    Devuelve el estado de cada carrera para este usuario: 'insertada',
+    'actualizada' u 'omitida' (ya estaba igual o repetida en el lote).
+    insertar_races: ver catalogo.asegurar_races (COPY de la importación).
+    """
+    filas, estados = {}, []
+    for datos_ia in lista_datos:
+        fila = fila_race(datos_ia)
+        clave = (fila["nombre_normalizado"], fila["fecha"])
+        if clave in filas:
+            estados.append({"nombre": fila["nombre"], "estado": "omitida"})
+            continue
+        filas[clave] = fila
+        estados.append({"nombre": fila["nombre"], "clave": clave})
+    if not filas:
+        return estados
+
+    races = catalogo.asegurar_races(db, filas, completas=desde_extraccion, insertar=insertar_races)
+    enlazadas = {
+        enlace.race_id: enlace for enlace in db.query(CarreraDB).filter(
+            CarreraDB.user_id == user_id,
+            CarreraDB.race_id.in_({race.id for race in races.values()})
         )
+    }
 
-        db.add(nueva_carrera) 
-        db.commit() 
-        print(f"✅ Guardada: {datos_ia.nombre_oficial} (User {user_id})")
-    
+    por_clave, enlaces, cambios = {}, [], Counter()
+    modificada = False
+    for clave, fila in filas.items():
+        race = races[clave]
+        valores = {campo: fila[campo] for campo in catalogo.CAMPOS_ACTUALIZABLES}
+        refrescada = False
+        if desde_extraccion:
+            # Si ya la seguía, aplicar_cambios ajusta también sus contadores y su calendario
+            refrescada = user_id in catalogo.aplicar_cambios(db, race, catalogo.cambios_de(race, valores))
+        if race.id not in enlazadas:
+            por_clave[clave] = "insertada"
+            enlace = {"user_id": user_id, "race_id": race.id, "fecha": race.fecha,
+                      **catalogo.valores_propios(race, valores)}
+            enlaces.append(enlace)
+            cambios.update(estadisticas.contribucion_carrera({
+                campo: enlace.get(f"{campo}_usuario") or getattr(race, campo)
+                for campo in ("deporte", "fecha", "estado_inscripcion")
+            }))
+            continue
+        if not desde_extraccion:
+            delta = catalogo.personalizar(enlazadas[race.id], valores)
+            if delta is not None:
+                refrescada = modificada = True
+                cambios.update(delta)
+        por_clave[clave] = "actualizada" if refrescada else "omitida"
+
+    if enlaces:
+        # Mismas columnas en todas las filas del INSERT de varias filas
+        columnas = {columna for enlace in enlaces for columna in enlace}
+        insert = insert_dialecto(db)
+        db.execute(insert(CarreraDB.__table__).values(
+            [{columna: enlace.get(columna) for columna in columnas} for enlace in enlaces]
+        ).on_conflict_do_nothing(index_elements=["user_id", "race_id"]))
+    if enlaces or modificada:
+        estadisticas.ajustar(db, user_id, cambios)
+        calendario_modificado(db, user_id)
+
+    for estado in estados:
+        if "clave" in estado:
+            estado["estado"] = por_clave[estado.pop("clave")]
+    return estados
+
+def guardar_lote_en_db(lista_datos: List[CarreraSchema], user_id: int, desde_extraccion: bool = False) -> List[dict]:
+    """Guarda varias carreras en UNA sola transacción (ver upsert_carreras)."""
+    db: Session = SessionLocal()
+    try:
+        with medir("guardar_carreras"):
+            estados = upsert_carreras(db, lista_datos, user_id, desde_extraccion)
+            db.commit()
+        resumen = ", ".join(f"{sum(1 for e in estados if e['estado'] == x)} {x}s"
+                            for x in ("insertada", "actualizada", "omitida"))
+        print(f"✅ Lote guardado (User {user_id}): {resumen}")
+        return estados
     except Exception as e:
-        #Si intentas insertar una carrera duplicada (misma fecha y nombre), la base de datos lanzará un error.
         db.rollback()
-        if "unique_violation" in str(e).lower() or "duplicate key" in str(e).lower():
-            print(f"⚠️ Aviso: La carrera '{datos_ia.nombre_oficial}' ya existe para esa fecha.")
-        else:
-            print(f"❌ Error al guardar: {e}")
+        print(f"❌ Error al guardar el lote: {e}")
+        raise
     finally:
         db.close()
 
+def guardar_en_db(datos_ia: CarreraSchema, user_id: int = 1, desde_extraccion: bool = False) -> str:
+    """Guarda (o refresca) una carrera. Devuelve 'insertada', 'actualizada' u 'omitida'."""
+    estado = guardar_lote_en_db([datos_ia], user_id, desde_extraccion)[0]["estado"]
+    if estado == "omitida":
+        print(f"⚠️ Aviso: La carrera '{datos_ia.nombre_oficial}' ya existe para esa fecha.")
+    return estado
+
 # --- 3. FUNCIÓN COMÚN DE BÚSQUEDA Y EXTRACCIÓN ---
-def buscar_y_extraer_datos(nombre_a_buscar: str, max_results: int = 6):
+# La tubería búsqueda -> contexto -> prompt -> LLM existe en dos versiones:
+# la síncrona (CLI, hilos) y la asíncrona (endpoints async de la API).
+# Ambas comparten los helpers de esta sección para no divergir.
+
+def clave_cache_carrera(nombre_a_buscar: str, año: int) -> str:
+    """Clave de caché: nombre normalizado (sin tildes ni mayúsculas) + año."""
+    return f"carrera:{normalizar_texto(nombre_a_buscar)}:{año}"
+
+def _query_carrera(nombre_a_buscar: str, año: int) -> str:
+    return f"fecha y distancias oficiales carrera {nombre_a_buscar} {año}"
+
+def _contexto_carrera(busqueda: dict, nombre_a_buscar: str) -> str:
+    if not busqueda.get('results'):
+        raise ValueError(f"❌ No se encontraron resultados para '{nombre_a_buscar}'")
+        
+    contexto = contexto_carrera(busqueda['results'], nombre_a_buscar, datetime.now().year)
+    
+    if not contexto.strip():
+        raise ValueError("❌ El contexto de búsqueda está vacío")
+    return contexto
+
+def _prompt_carrera(nombre_a_buscar: str, contexto: str, año: int) -> str:
+    return f"""
+    Eres un analista de datos deportivos. Tu objetivo es extraer info precisa de: {nombre_a_buscar}.
+    
+    Contexto encontrado en internet:
+    {contexto}
+    
+    INSTRUCCIONES PARA EVITAR ERRORES:
+    1. FECHA: Busca la fecha de la PRÓXIMA edición. Si ves fechas de 2024 o anteriores, DESCÁRTALAS. Solo acepta fechas iguales o posteriores a {año}
+    2. DISTANCIA: Busca el apartado de 'Recorrido' o 'Reglamento'. No inventes km. Si hay varias distancias, lístalas todas.
+    3. VERIFICACIÓN: Si los datos parecen contradictorios, prioriza la fuente que parezca la web oficial (.com o .es del evento).
+    4. DEPORTE: Identifica correctamente el tipo de deporte (Running, Trail, Ciclismo, Gravel, Triatlón, etc.).
+    """
+
+def _extraer_por_reglas(busqueda: dict, nombre_a_buscar: str, año: int) -> Optional[CarreraSchema]:
+    """Camino rápido sin LLM: solo si el extractor de reglas está seguro y el resultado valida."""
+    with medir("extractor_reglas"):
+        datos, confianza = extraer_carrera(busqueda['results'], nombre_a_buscar, año)
+    carrera = None
+    if datos is not None and confianza >= EXTRACTOR_REGLAS_UMBRAL:
+        try:
+            with medir("validacion"):
+                carrera = CarreraSchema(**datos)
+        except ValueError as e:
+            print(f"⚠️ Extractor de reglas: datos no válidos ({e}), se usa el LLM")
+    estadisticas_reglas.registrar(carrera is not None)
+    if carrera is not None:
+        print(f"⚡ Extractor de reglas (confianza {confianza:.2f}): '{nombre_a_buscar}' resuelta sin LLM")
+    return carrera
+
+def _validar_nombre(nombre_a_buscar: str):
+    if not nombre_a_buscar or not nombre_a_buscar.strip():
+        raise ValueError("❌ ERROR: El nombre de la carrera no puede estar vacío")
+
+def buscar_y_extraer_datos(nombre_a_buscar: str, max_results: int = 6, forzar_refresco: bool = False,
+                           prioridad: str = PRIORIDAD_INTERACTIVA):
     """
     Función centralizada que busca en internet y extrae datos estructurados.
     Retorna el objeto CarreraSchema extraído por la IA.
+    Consulta antes la caché de extracciones; con forzar_refresco=True
+    se ignora la caché y se vuelve a preguntar a Tavily y al LLM.
     """
-    if not nombre_a_buscar or not nombre_a_buscar.strip():
-        raise ValueError("❌ ERROR: El nombre de la carrera no puede estar vacío")
+    _validar_nombre(nombre_a_buscar)
     
     año_actual = datetime.now().year
-    query_optimizada = f"fecha y distancias oficiales carrera {nombre_a_buscar} {año_actual}"
+    clave_cache = clave_cache_carrera(nombre_a_buscar, año_actual)
+
+    if not forzar_refresco:
+        en_cache = cache_extracciones.obtener(clave_cache)
+        if en_cache is not None:
+            print(f"⚡ Caché: datos de '{nombre_a_buscar}' servidos sin llamar a Tavily ni al LLM")
+            return CarreraSchema(**en_cache)
+
+    # Búsquedas idénticas simultáneas (de hilos o de asyncio) comparten una sola llamada
+    return vuelos.ejecutar(clave_cache, _extraer_carrera, nombre_a_buscar, año_actual, clave_cache, max_results, prioridad)
+
+def _extraer_carrera(nombre_a_buscar: str, año_actual: int, clave_cache: str, max_results: int, prioridad: str):
     print(f"Buscando datos maestros de: {nombre_a_buscar}...")
     
     try:
-        busqueda = tavily.search(query=query_optimizada, search_depth="advanced", max_results=max_results)
-        
-        if not busqueda.get('results'):
-            raise ValueError(f"❌ No se encontraron resultados para '{nombre_a_buscar}'")
-            
-        contexto = "\n---\n".join([res['content'] for res in busqueda['results']])
-        
-        if not contexto.strip():
-            raise ValueError("❌ El contexto de búsqueda está vacío")
-        
+        busqueda = llamar_proveedor("tavily", get_tavily().search, query=_query_carrera(nombre_a_buscar, año_actual),
+                                    search_depth="advanced", max_results=max_results, prioridad=prioridad)
+        contexto = _contexto_carrera(busqueda, nombre_a_buscar)
     except Exception as e:
         print(f"❌ Error en la búsqueda con Tavily: {e}")
         raise
+
+    datos_extraidos = _extraer_por_reglas(busqueda, nombre_a_buscar, año_actual)
+    if datos_extraidos is not None:
+        cache_extracciones.guardar(clave_cache, datos_extraidos.model_dump())
+        return datos_extraidos
     
-    prompt = f"""
-    Eres un analista de datos deportivos. Tu objetivo es extraer info precisa de: {nombre_a_buscar}.
-    
-    Contexto encontrado en internet:
-    {contexto}
+    try:
+        datos_extraidos = _salida_estructurada(
+            llamar_proveedor("groq", get_llm_carreras().invoke, _prompt_carrera(nombre_a_buscar, contexto, año_actual),
+                             prioridad=prioridad),
+            "llm_carrera"
+        )
+        cache_extracciones.guardar(clave_cache, datos_extraidos.model_dump())
+        return datos_extraidos
+    except Exception as e:
+        if es_rate_limit(e):
+            print(f"⏳ Límite de cuota excedido (Groq 429). Reintentos agotados.")
+            raise ValueError("⚠️ El servicio de IA está saturado (Rate Limit 429). Por favor espera unos minutos antes de intentar de nuevo.")
+        
+        print(f"❌ Error al procesar con el LLM: {e}")
+        raise
+
+async def abuscar_y_extraer_datos(nombre_a_buscar: str, max_results: int = 6, forzar_refresco: bool = False,
+                                  prioridad: str = PRIORIDAD_INTERACTIVA):
+    """
+    Versión asíncrona de buscar_y_extraer_datos: usa el cliente async de
+    Tavily y `ainvoke` del LLM, así que la espera a los proveedores no
+    ocupa ningún hilo del servidor.
+    """
+    _validar_nombre(nombre_a_buscar)
     
-    INSTRUCCIONES PARA EVITAR ERRORES:
-    1. FECHA: Busca la fecha de la PRÓXIMA edición. Si ves fechas de 2024 o anteriores, DESCÁRTALAS. Solo acepta fechas iguales o posteriores a {año_actual}
-    2. DISTANCIA: Busca el apartado de 'Recorrido' o 'Reglamento'. No inventes km. Si hay varias distancias, lístalas todas.
-    3. VERIFICACIÓN: Si los datos parecen contradictorios, prioriza la fuente que parezca la web oficial (.com o .es del evento).
-    4. DEPORTE: Identifica correctamente el tipo de deporte (Running, Trail, Ciclismo, Gravel, Triatlón, etc.).
+    año_actual = datetime.now().year
+    clave_cache = clave_cache_carrera(nombre_a_buscar, año_actual)
+
+    if not forzar_refresco:
+        en_cache = await cache_extracciones.aobtener(clave_cache)
+        if en_cache is not None:
+            print(f"⚡ Caché: datos de '{nombre_a_buscar}' servidos sin llamar a Tavily ni al LLM")
+            return CarreraSchema(**en_cache)
+
+    return await vuelos.aejecutar(
+        clave_cache, lambda: _aextraer_carrera(nombre_a_buscar, año_actual, clave_cache, max_results, prioridad)
+    )
+
+async def _aextraer_carrera(nombre_a_buscar: str, año_actual: int, clave_cache: str, max_results: int, prioridad: str,
+                            progreso: Optional[Callable[[dict], None]] = None):
+    """
+    La tubería asíncrona (Tavily, reglas o LLM, caché). Con `progreso` va
+    avisando de cada paso con los eventos de abuscar_y_extraer_datos_stream
+    (fuentes, extrayendo, parcial*, resultado) y el LLM se lee en streaming.
     """
+    avisar = progreso or (lambda evento: None)
+    print(f"Buscando datos maestros de: {nombre_a_buscar}...")
+    
+    try:
+        busqueda = await allamar_proveedor("tavily", get_tavily_async().search, query=_query_carrera(nombre_a_buscar, año_actual),
+                                           search_depth="advanced", max_results=max_results, prioridad=prioridad)
+        fuentes = _fuentes(busqueda)
+        avisar({"evento": "fuentes", "total": len(fuentes), "fuentes": fuentes})
+        contexto = _contexto_carrera(busqueda, nombre_a_buscar)
+    except Exception as e:
+        print(f"❌ Error en la búsqueda con Tavily: {e}")
+        raise
+
+    datos_extraidos = _extraer_por_reglas(busqueda, nombre_a_buscar, año_actual)
+    if datos_extraidos is not None:
+        await cache_extracciones.aguardar(clave_cache, datos_extraidos.model_dump())
+        avisar({"evento": "resultado", "origen": "reglas", "datos": datos_extraidos.model_dump()})
+        return datos_extraidos
     
+    avisar({"evento": "extrayendo"})
+    prompt = _prompt_carrera(nombre_a_buscar, contexto, año_actual)
     try:
-        datos_extraidos = llm_estructurado_carreras.invoke(prompt)
+        if progreso is None:
+            datos_extraidos = _salida_estructurada(
+                await allamar_proveedor("groq", get_llm_carreras().ainvoke, prompt, prioridad=prioridad),
+                "llm_carrera"
+            )
+        else:
+            datos_extraidos = await _aextraer_con_parciales(prompt, prioridad, avisar)
+        await cache_extracciones.aguardar(clave_cache, datos_extraidos.model_dump())
+        avisar({"evento": "resultado", "origen": "llm", "datos": datos_extraidos.model_dump()})
         return datos_extraidos
     except Exception as e:
-        error_str = str(e)
-        if "429" in error_str or "Rate limit" in error_str:
-            print(f"⏳ Límite de cuota excedido (Groq 429). Intentando reintentar o abortar.")
+        if es_rate_limit(e):
+            print(f"⏳ Límite de cuota excedido (Groq 429). Reintentos agotados.")
             raise ValueError("⚠️ El servicio de IA está saturado (Rate Limit 429). Por favor espera unos minutos antes de intentar de nuevo.")
         
         print(f"❌ Error al procesar con el LLM: {e}")
         raise
 
+# --- 3.1 BÚSQUEDA CON PROGRESO (streaming) ---
+# La misma tubería (_aextraer_carrera) avisando de cada paso: la interfaz
+# enseña las fuentes en cuanto llegan y va rellenando los campos a medida que
+# el LLM los escribe. Cada evento es un dict {"evento": ..., ...}:
+#   inicio -> fuentes -> extrayendo -> parcial* -> resultado   (o error)
+
+def get_llm_carreras_stream():
+    # Llamada a herramienta "a mano" en lugar de with_structured_output: así se
+    # pueden leer los argumentos (el JSON de CarreraSchema) según llegan los trozos
+    return _motor("llm_carreras_stream",
+                  lambda: get_llm().bind_tools([CarreraSchema], tool_choice=CarreraSchema.__name__))
+
+async def astream_carrera(prompt: str):
+    """
+    Abre el stream del LLM y espera el primer trozo. Los 429 llegan antes de
+    ese primer trozo, así que pasando esto por allamar_proveedor se reintentan
+    con la espera compartida como cualquier otra llamada.
+    """
+    iterador = get_llm_carreras_stream().astream(prompt).__aiter__()
+    return iterador, await anext(iterador, None)
+
+def _fuentes(busqueda: dict) -> List[dict]:
+    return [{"url": r.get("url"), "titulo": r.get("title")} for r in busqueda.get("results", [])]
+
+async def _aextraer_con_parciales(prompt: str, prioridad: str, avisar: Callable[[dict], None]) -> CarreraSchema:
+    """Extracción con el LLM en streaming, avisando de los campos según los escribe."""
+    iterador, trozo = await allamar_proveedor("groq", astream_carrera, prompt, prioridad=prioridad)
+    try:
+        acumulado, enviados = None, {}
+        while trozo is not None:
+            acumulado = trozo if acumulado is None else acumulado + trozo
+            # AIMessageChunk interpreta el JSON incompleto de la herramienta en tool_calls
+            argumentos = acumulado.tool_calls[0]["args"] if acumulado.tool_calls else {}
+            nuevos = {campo: valor for campo, valor in argumentos.items() if enviados.get(campo) != valor}
+            if nuevos:
+                enviados.update(nuevos)
+                avisar({"evento": "parcial", "campos": nuevos})
+            trozo = await anext(iterador, None)
+    finally:
+        # Si la búsqueda se cancela a mitad, se cierra también el stream del LLM
+        if hasattr(iterador, "aclose"):
+            await iterador.aclose()
+
+    registrar_tokens("llm_carrera", acumulado)
+    if acumulado is None or not acumulado.tool_calls:
+        raise ValueError("❌ El LLM no devolvió datos estructurados")
+    with medir("validacion"):
+        return CarreraSchema(**acumulado.tool_calls[0]["args"])
+
+async def abuscar_y_extraer_datos_stream(nombre_a_buscar: str, max_results: int = 6, forzar_refresco: bool = False,
+                                         prioridad: str = PRIORIDAD_INTERACTIVA):
+    """
+    Generador asíncrono de eventos de progreso de la búsqueda. El último
+    evento es siempre 'resultado' (con el CarreraSchema validado en 'datos')
+    o 'error' (con el mensaje en 'detalle'); nunca lanza excepciones.
+    Comparte vuelo con las búsquedas iguales en curso: si ya había una, no
+    hay eventos intermedios y el resultado llega con origen 'agrupada'.
+    """
+    try:
+        _validar_nombre(nombre_a_buscar)
+    except ValueError as e:
+        yield {"evento": "error", "detalle": str(e)}
+        return
+
+    año_actual = datetime.now().year
+    clave_cache = clave_cache_carrera(nombre_a_buscar, año_actual)
+    yield {"evento": "inicio", "nombre": nombre_a_buscar}
+
+    if not forzar_refresco:
+        en_cache = await cache_extracciones.aobtener(clave_cache)
+        if en_cache is not None:
+            print(f"⚡ Caché: datos de '{nombre_a_buscar}' servidos sin llamar a Tavily ni al LLM")
+            yield {"evento": "resultado", "origen": "cache", "datos": CarreraSchema(**en_cache).model_dump()}
+            return
+
+    eventos = asyncio.Queue()
+    lider = False
+
+    def liderar():
+        nonlocal lider
+        lider = True
+        return _aextraer_carrera(nombre_a_buscar, año_actual, clave_cache, max_results, prioridad,
+                                 progreso=eventos.put_nowait)
+
+    busqueda = asyncio.ensure_future(vuelos.aejecutar(clave_cache, liderar))
+    try:
+        # Los eventos del líder según llegan, hasta que termina la búsqueda
+        while not busqueda.done() or not eventos.empty():
+            siguiente = asyncio.ensure_future(eventos.get())
+            await asyncio.wait({siguiente, busqueda}, return_when=asyncio.FIRST_COMPLETED)
+            if siguiente.done():
+                yield siguiente.result()
+            else:
+                siguiente.cancel()
+        datos_extraidos = busqueda.result()
+        if not lider:
+            yield {"evento": "resultado", "origen": "agrupada", "datos": datos_extraidos.model_dump()}
+    except Exception as e:
+        detalle = str(e)
+        if es_rate_limit(e):
+            detalle = "⚠️ El servicio de IA está saturado (Rate Limit 429). Por favor espera unos minutos antes de intentar de nuevo."
+        print(f"❌ Error en la búsqueda de '{nombre_a_buscar}': {detalle}")
+        yield {"evento": "error", "detalle": detalle}
+    finally:
+        # Si el cliente se desconecta deja de esperar; la búsqueda sigue para
+        # quien la comparta y termina en la caché
+        busqueda.cancel()
+
 # --- 4. FUNCIÓN PARA EJECUCIÓN INTERACTIVA (CLI) ---
 def ejecutar_proyecto(nombre_a_buscar, user_id: int = 1):
     """
@@ -200,7 +592,7 @@ def ejecutar_proyecto(nombre_a_buscar, user_id: int = 1):
 
     if confirmacion == 's':
         user_id = int(input("ID de usuario (1 para demo): ") or 1)
-        guardar_en_db(datos_extraidos, user_id)
+        guardar_en_db(datos_extraidos, user_id, desde_extraccion=True)
     else:
         print("❌ Operación cancelada por el usuario. Los datos no se han guardado.")
 
@@ -214,45 +606,55 @@ def procesar_carrera_desde_web(nombre_a_buscar: str, user_id: int = 1):
     
     try:
         datos_extraidos = buscar_y_extraer_datos(nombre_a_buscar, max_results=5)
-        guardar_en_db(datos_extraidos, user_id)
+        guardar_en_db(datos_extraidos, user_id, desde_extraccion=True)
         return datos_extraidos
     except Exception as e:
         print(f"❌ Error al procesar carrera desde web: {e}")
         raise
 
-def buscar_resultado_usuario(nombre_carrera: str, año: int, nombre: str):
-    # ESTRATEGIA DE BÚSQUEDA MEJORADA
-    # 1. Quitamos comillas para permitir formatos "Apellidos, Nombre"
-    # 2. Añadimos palabras clave típicas de listados
-    query_principal = f"{nombre_carrera} {año} clasificación {nombre}"
-    
-    print(f"🔎 Buscando: {query_principal}...")
-    
+async def aprocesar_lote(nombres: List[str], concurrencia: int, max_results: int = 5):
+    """
+    Lanza abuscar_y_extraer_datos para varias carreras a la vez, como mucho
+    `concurrencia` en vuelo, y va entregando (nombre, datos, error) según
+    termina cada una. Si el consumidor se va, se cancelan las pendientes.
+    Usa el carril de fondo del limitador para no quitar cuota a las
+    búsquedas interactivas.
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def procesar(nombre: str):
+        async with semaforo:
+            try:
+                return nombre, await abuscar_y_extraer_datos(nombre, max_results=max_results, prioridad=PRIORIDAD_FONDO), None
+            except Exception as e:
+                return nombre, None, str(e)
+
+    tareas = [asyncio.create_task(procesar(nombre)) for nombre in nombres]
     try:
-        # Buscamos con un poco más de profundidad (max_results=10) para pillar listados largos
-        busqueda = tavily.search(query=query_principal, search_depth="advanced", max_results=10)
-        
-        # Si no hay suerte, intentamos buscar el PDF o la web de resultados general
-        if not busqueda.get('results'):
-             print("⚠️ Búsqueda específica vacía, intentando buscar listados generales...")
-             query_general = f"{nombre_carrera} {año} resultados pdf completo"
-             busqueda = tavily.search(query=query_general, search_depth="advanced", max_results=5)
-             
-        if not busqueda.get('results'):
-            # Devolvemos un objeto vacío en lugar de lanzar error, para que la API lo maneje
-            return ResultadoSchema(tiempo_oficial=None, posicion_general=None, posicion_categoria=None, ritmo_medio=None)
-            
-        # Preparamos el contexto incluyendo el Título de la página, que a veces tiene la fecha o el evento real
-        contexto = "\n".join([
-            f"--- FUENTE: {res['url']} ---\nTÍTULO: {res['title']}\nCONTENIDO: {res['content']}\n" 
-            for res in busqueda['results']
-        ])
-        
-    except Exception as e:
-        print(f"❌ Error en la búsqueda con Tavily: {e}")
-        raise
-    
-    prompt = f"""
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+# ESTRATEGIA DE BÚSQUEDA MEJORADA
+# 1. Quitamos comillas para permitir formatos "Apellidos, Nombre"
+# 2. Añadimos palabras clave típicas de listados
+def _query_resultado(nombre_carrera: str, año: int, nombre: str) -> str:
+    return f"{nombre_carrera} {año} clasificación {nombre}"
+
+def _query_resultado_general(nombre_carrera: str, año: int) -> str:
+    return f"{nombre_carrera} {año} resultados pdf completo"
+
+def _resultado_vacio() -> ResultadoSchema:
+    return ResultadoSchema(tiempo_oficial=None, posicion_general=None, posicion_categoria=None, ritmo_medio=None)
+
+def _contexto_resultado(busqueda: dict, nombre_carrera: str, año: int, nombre: str) -> str:
+    # Cada fragmento va con la URL y el Título de su página, que a veces tiene la fecha o el evento real
+    return contexto_resultado(busqueda['results'], nombre_carrera, año, nombre)
+
+def _prompt_resultado(nombre_carrera: str, año: int, nombre: str, contexto: str) -> str:
+    return f"""
     Eres un experto rastreador de resultados deportivos.
     
     OBJETIVO: Encontrar el tiempo de "{nombre}" en "{nombre_carrera}" del año {año}.
@@ -276,13 +678,106 @@ def buscar_resultado_usuario(nombre_carrera: str, año: int, nombre: str):
        
     4. IMPORTANTE: Muchas veces los resultados están en formato "Pos. Nombre Tiempo". Busca ese patrón.
     """
+
+# --- Índice local de clasificaciones ---
+# Antes de buscar a un corredor en la web, se mira si ya tenemos la clasificación
+# completa de esa carrera y año. Si no, se descarga una vez (Tavily search +
+# extract, que sirve tanto tablas HTML como PDFs) y se indexa para todos.
+CLASIFICACION_URLS = int(os.getenv("CLASIFICACION_URLS", "3"))
+
+def _descargar_clasificacion(nombre_carrera: str, año: int, prioridad: str) -> dict:
+    # Varios corredores de la misma carrera a la vez: una sola descarga
+    return vuelos.ejecutar(f"clasificacion:{clave_clasificacion(nombre_carrera, año)}",
+                           _descargar_clasificacion_web, nombre_carrera, año, prioridad)
+
+def _descargar_clasificacion_web(nombre_carrera: str, año: int, prioridad: str) -> dict:
+    busqueda = llamar_proveedor("tavily", get_tavily().search, query=_query_resultado_general(nombre_carrera, año),
+                                search_depth="advanced", max_results=5, prioridad=prioridad)
+    urls = [res['url'] for res in busqueda.get('results', []) if res.get('url')][:CLASIFICACION_URLS]
+
+    mejor_url, mejores_filas = None, []
+    if urls:
+        extraido = llamar_proveedor("tavily", get_tavily().extract, urls=urls, extract_depth="advanced",
+                                    prioridad=prioridad)
+        for pagina in extraido.get('results', []):
+            filas = parsear_clasificacion(pagina.get('raw_content') or "")
+            if len(filas) > len(mejores_filas):
+                mejor_url, mejores_filas = pagina.get('url'), filas
+
+    if len(mejores_filas) < CLASIFICACION_MIN_FILAS:
+        print(f"⚠️ No se encontró un listado completo de '{nombre_carrera}' {año}")
+        mejores_filas = []
+    return guardar_clasificacion(nombre_carrera, año, mejor_url, mejores_filas)
+
+def _resultado_desde_clasificacion(nombre_carrera: str, año: int, nombre: str,
+                                   prioridad: str = PRIORIDAD_INTERACTIVA) -> Optional[ResultadoSchema]:
+    """ResultadoSchema desde el índice local, o None si no está (y hay que ir a la web + LLM)."""
+    try:
+        clasificacion = obtener_clasificacion(nombre_carrera, año) or \
+            _descargar_clasificacion(nombre_carrera, año, prioridad)
+        if not clasificacion["num_filas"]:
+            return None
+        fila = buscar_corredor(clasificacion["id"], nombre)
+    except Exception as e:
+        print(f"⚠️ Índice de clasificaciones no disponible: {e}")
+        return None
+    if fila is None:
+        print(f"🔎 '{nombre}' no aparece en la clasificación indexada, se busca en la web")
+        return None
+    print(f"📋 '{nombre}' encontrado en la clasificación local (sin Tavily ni LLM)")
+    return ResultadoSchema(
+        tiempo_oficial=fila["tiempo"],
+        posicion_general=fila["posicion_general"],
+        posicion_categoria=fila["posicion_categoria"],
+        ritmo_medio=fila["ritmo"]
+    )
+
+def clave_resultado(nombre_carrera: str, año: int, nombre: str) -> str:
+    return f"resultado:{normalizar_texto(nombre_carrera)}:{año}:{clave_corredor(nombre)}"
+
+def buscar_resultado_usuario(nombre_carrera: str, año: int, nombre: str, prioridad: str = PRIORIDAD_INTERACTIVA):
+    return vuelos.ejecutar(clave_resultado(nombre_carrera, año, nombre), _buscar_resultado_usuario,
+                           nombre_carrera, año, nombre, prioridad)
+
+def _buscar_resultado_usuario(nombre_carrera: str, año: int, nombre: str, prioridad: str):
+    local = _resultado_desde_clasificacion(nombre_carrera, año, nombre, prioridad)
+    if local is not None:
+        return local
+
+    query_principal = _query_resultado(nombre_carrera, año, nombre)
+    
+    print(f"🔎 Buscando: {query_principal}...")
+    
+    try:
+        # Buscamos con un poco más de profundidad (max_results=10) para pillar listados largos
+        busqueda = llamar_proveedor("tavily", get_tavily().search, query=query_principal, search_depth="advanced", max_results=10,
+                                    prioridad=prioridad)
+        
+        # Si no hay suerte, intentamos buscar el PDF o la web de resultados general
+        if not busqueda.get('results'):
+             print("⚠️ Búsqueda específica vacía, intentando buscar listados generales...")
+             busqueda = llamar_proveedor("tavily", get_tavily().search, query=_query_resultado_general(nombre_carrera, año),
+                                        search_depth="advanced", max_results=5, prioridad=prioridad)
+             
+        if not busqueda.get('results'):
+            # Devolvemos un objeto vacío en lugar de lanzar error, para que la API lo maneje
+            return _resultado_vacio()
+            
+        contexto = _contexto_resultado(busqueda, nombre_carrera, año, nombre)
+        
+    except Exception as e:
+        print(f"❌ Error en la búsqueda con Tavily: {e}")
+        raise
     
     try:
-        datos_extraidos = llm_estructurado_resultado.invoke(prompt)
+        datos_extraidos = _salida_estructurada(
+            llamar_proveedor("groq", get_llm_resultado().invoke, _prompt_resultado(nombre_carrera, año, nombre, contexto),
+                             prioridad=prioridad),
+            "llm_resultado"
+        )
         return datos_extraidos
     except Exception as e:
-        error_str = str(e)
-        if "429" in error_str or "Rate limit" in error_str:
+        if es_rate_limit(e):
             print(f"⏳ Límite de cuota excedido (Groq 429).")
             raise ValueError("⚠️ El servicio de IA está saturado (Rate Limit 429). Intenta más tarde.")
         print(f"❌ Error al procesar con el LLM: {e}")
@@ -290,47 +785,53 @@ def buscar_resultado_usuario(nombre_carrera: str, año: int, nombre: str):
 
 # --- 2.1 FUNCIÓN PARA GUARDAR RESULTADOS ---
 def guardar_resultado_db(datos_ia: ResultadoSchema, nombre_carrera: str, año: int, user_id: int):
+    with medir("guardar_resultado"):
+        _guardar_resultado_db(datos_ia, nombre_carrera, año, user_id)
+
+def _guardar_resultado_db(datos_ia: ResultadoSchema, nombre_carrera: str, año: int, user_id: int):
     db: Session = SessionLocal()
     try:
-        # 1. Primero buscamos la carrera EN LA LISTA DEL USUARIO
-        carrera_existente = db.query(CarreraDB).filter(
-            CarreraDB.user_id == user_id,
-            CarreraDB.nombre.ilike(f"%{nombre_carrera}%")
-        ).first()
+        # 1. Buscamos la carrera EN LA LISTA DEL USUARIO. El nombre que llega del
+        # formulario rara vez coincide con el oficial ("Maraton Madrid" vs
+        # "Zurich Maratón de Madrid"), así que se resuelve por similitud de trigramas.
+        carrera_existente, puntuacion = resolver_carrera(db, user_id, nombre_carrera, año)
 
-        if not carrera_existente:
-             # Si no existe, buscamos si tiene alguna carrera ese año con nombre similar
-             # Esto es un fallback por si el nombre varía ligeramente
-             print(f"⚠️ Búsqueda exacta falló. Buscando aproximada para user {user_id}...")
-             carrera_existente = db.query(CarreraDB).filter(
-                CarreraDB.user_id == user_id,
-                CarreraDB.nombre.ilike(f"%{nombre_carrera[:5]}%") 
-             ).first()
-             
         if not carrera_existente:
             print(f"⚠️ No se puede guardar el resultado: La carrera '{nombre_carrera}' no existe en la BD del usuario {user_id}.")
-            return
+            raise ValueError(f"La carrera '{nombre_carrera}' no está en tu lista")
+        print(f"🔗 '{nombre_carrera}' -> '{carrera_existente.nombre}' (puntuación {puntuacion:.2f})")
 
         # 2. Creamos el registro del resultado
         cat_info = f"Pos. Cat: {datos_ia.posicion_categoria}" if datos_ia.posicion_categoria else ""
+        tiempo_segundos, ritmo_segundos_km, distancia_km = medidas_resultado(
+            datos_ia.tiempo_oficial, datos_ia.ritmo_medio, carrera_existente.distancia_resumen
+        )
         nuevo_resultado = ResultadoDB(
             carrera_id=carrera_existente.id,
             tiempo_oficial=datos_ia.tiempo_oficial or "No encontrado",
             posicion_general=datos_ia.posicion_general,
             ritmo_medio=datos_ia.ritmo_medio,
-            comentarios=f"Auto {año}. {cat_info}"
+            comentarios=f"Auto {año}. {cat_info}",
+            tiempo_segundos=tiempo_segundos,
+            ritmo_segundos_km=ritmo_segundos_km,
+            distancia_km=distancia_km
         )
 
+        estadisticas.ajustar(db, user_id, estadisticas.resultado_añadido(db, carrera_existente.id))
         db.add(nuevo_resultado)
         db.commit()
         print(f"✅ Resultado guardado para: {nombre_carrera}")
 
     except Exception as e:
+        # Quien lo llama (la tarea de resultados) tiene que saber que no se guardó
+        db.rollback()
         print(f"❌ Error al guardar resultado: {e}")
+        raise
     finally:
         db.close()
 
 if __name__ == "__main__":
+    inicializar_db()
     carrera = input("Carrera a añadir: ")
     user_id = int(input("ID de usuario (1 para demo): ") or 1)
     ejecutar_proyecto(carrera, user_id)
\ No newline at end of file
@@ -0,0 +1,171 @@
+#Instrumentación: cuánto tarda cada etapa (Tavily, LLM, guardado, cada
+#endpoint), cuántos tokens gasta el LLM y cuántos 429/reintentos hay.
+#Se exponen en formato de texto de Prometheus en /metrics (sin depender
+#de prometheus_client) y, opcionalmente, se registra en el log cada
+#petición que supere METRICAS_PETICION_LENTA segundos con el desglose
+#de sus etapas.
+#
+#Uso:
+#    with medir("tavily"):
+#        ...
+#    contar("racehub_proveedor_429_total", proveedor="groq")
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+# 0 desactiva el log de peticiones lentas
+METRICAS_PETICION_LENTA = float(os.getenv("METRICAS_PETICION_LENTA", "0"))
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_TOKENS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+AYUDA = {
+    "racehub_etapa_segundos": "Duración de cada etapa interna (proveedores, guardado...)",
+    "racehub_http_segundos": "Duración de cada petición HTTP por ruta",
+    "racehub_llm_tokens": "Tokens por llamada al LLM",
+    "racehub_llm_tokens_total": "Tokens acumulados del LLM",
+    "racehub_proveedor_llamadas_total": "Llamadas a proveedores externos",
+    "racehub_proveedor_reintentos_total": "Reintentos tras un 429",
+    "racehub_proveedor_429_total": "Respuestas 429 de proveedores externos",
+    "racehub_proveedor_cupo_agotado_total": "Llamadas rechazadas porque se acabó el cupo del plan del proveedor",
+    "racehub_contexto_tokens_total": "Tokens de contexto recibidos de Tavily y enviados al LLM",
+    "racehub_vuelo_unico_total": "Búsquedas por clave: las que llaman al proveedor (lider) y las que esperan a una igual (agrupada)",
+    "racehub_actualizador_busquedas_total": "Búsquedas del actualizador programado",
+    "racehub_actualizador_cambios_total": "Campos de carreras corregidos por el actualizador",
+    "racehub_actualizador_fallos_total": "Revisiones del actualizador que fallaron (la carrera sigue pendiente)",
+    "racehub_actualizador_resultados_encolados_total": "Búsquedas de resultado encoladas tras la carrera",
+    "racehub_catalogo_carreras_total": "Carreras guardadas por usuarios: nuevas en el catálogo o ya existentes",
+    "racehub_intercambio_filas_total": "Filas importadas o exportadas en CSV/NDJSON",
+}
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+class Registro:
+    """Contadores e histogramas en memoria de este worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores: Dict[Tuple[str, Etiquetas], float] = {}
+        # (nombre, etiquetas) -> [cuentas por bucket..., suma, total]
+        self._histogramas: Dict[Tuple[str, Etiquetas], list] = {}
+        self._buckets: Dict[str, tuple] = {}
+
+    def contar(self, nombre: str, valor: float = 1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre: str, valor: float, buckets: tuple = BUCKETS_SEGUNDOS, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._buckets.setdefault(nombre, buckets)
+            datos = self._histogramas.setdefault(clave, [0] * (len(buckets) + 2))
+            for i, limite in enumerate(self._buckets[nombre]):
+                if valor <= limite:
+                    datos[i] += 1
+            datos[-2] += valor
+            datos[-1] += 1
+
+    def texto(self) -> str:
+        """Formato de exposición de texto de Prometheus (0.0.4)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {clave: list(datos) for clave, datos in self._histogramas.items()}
+            buckets = dict(self._buckets)
+
+        lineas, vistos = [], set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                lineas.append(f"# HELP {nombre} {AYUDA.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), valor in sorted(contadores.items()):
+            cabecera(nombre, "counter")
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for (nombre, etiquetas), datos in sorted(histogramas.items()):
+            cabecera(nombre, "histogram")
+            for limite, cuenta in zip(buckets[nombre], datos):
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', _numero(limite)),))} {cuenta}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {datos[-1]}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(datos[-2])}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {datos[-1]}")
+        return "\n".join(lineas) + "\n"
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def _etiquetas(etiquetas: Etiquetas) -> str:
+    if not etiquetas:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in etiquetas) + "}"
+
+
+registro = Registro()
+
+# Desglose por etapas de la petición en curso (para el log de peticiones lentas).
+# run_in_threadpool y asyncio.to_thread copian el contexto, así que las etapas
+# que se ejecutan en hilos también se apuntan aquí.
+_etapas_peticion: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("etapas_peticion", default=None)
+
+
+def contar(nombre: str, valor: float = 1, **etiquetas):
+    registro.contar(nombre, valor, **etiquetas)
+
+
+@contextmanager
+def medir(etapa: str, **etiquetas):
+    """Mide un bloque en el histograma racehub_etapa_segundos{etapa=...}."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        registro.observar("racehub_etapa_segundos", duracion, etapa=etapa, **etiquetas)
+        etapas = _etapas_peticion.get()
+        if etapas is not None:
+            etapas[etapa] = etapas.get(etapa, 0.0) + duracion
+
+
+def registrar_tokens(etapa: str, mensaje):
+    """Tokens de entrada/salida de un AIMessage de LangChain (usage_metadata), si los trae."""
+    uso = getattr(mensaje, "usage_metadata", None) or {}
+    for tipo, campo in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+        tokens = uso.get(campo)
+        if tokens:
+            registro.observar("racehub_llm_tokens", tokens, BUCKETS_TOKENS, etapa=etapa, tipo=tipo)
+            registro.contar("racehub_llm_tokens_total", tokens, etapa=etapa, tipo=tipo)
+
+
+def iniciar_peticion() -> contextvars.Token:
+    return _etapas_peticion.set({})
+
+
+def etapas_peticion(token: contextvars.Token) -> dict:
+    """
+    Cierra el contexto de iniciar_peticion y devuelve el dict de etapas. Las
+    tareas que ya lo heredaron (el cuerpo de un StreamingResponse) siguen
+    anotando en él hasta terminar_peticion.
+    """
+    etapas = _etapas_peticion.get()
+    _etapas_peticion.reset(token)
+    # Aún vacío si el cuerpo no ha empezado: hay que devolver ese mismo dict
+    return etapas if etapas is not None else {}
+
+
+def terminar_peticion(etapas: dict, metodo: str, ruta: str, estado: int, duracion: float):
+    registro.observar("racehub_http_segundos", duracion, metodo=metodo, ruta=ruta, estado=str(estado))
+    if METRICAS_PETICION_LENTA and duracion >= METRICAS_PETICION_LENTA:
+        desglose = ", ".join(f"{etapa} {segundos:.2f}s" for etapa, segundos in
+                             sorted(etapas.items(), key=lambda e: -e[1]))
+        print(f"🐢 Petición lenta: {metodo} {ruta} -> {estado} en {duracion:.2f}s"
+              + (f" ({desglose})" if desglose else ""))
@@ -0,0 +1,203 @@
+#Sustitutos locales de Tavily y Groq para pruebas de carga y benchmarks
+#sin red ni cuota. Se activan con PROVEEDORES_FALSOS=1: las fábricas de
+#motores de src/main.py devuelven estos objetos en lugar de los reales.
+#
+#Imitan la interfaz que usa la aplicación:
+#  - TavilyFalso / TavilyFalsoAsync: search(query=..., ...) y extract(urls=...)
+#  - LLMFalso: with_structured_output(Schema, include_raw=True) -> invoke/ainvoke
+#             bind_tools([Schema], tool_choice=...) -> astream (trozos de la herramienta)
+#
+#Comportamiento configurable por entorno:
+#  FALSO_LATENCIA_MS   latencia media de cada llamada (±50 % de jitter)
+#  FALSO_TASA_ERROR    probabilidad de error genérico (0..1)
+#  FALSO_TASA_429      probabilidad de responder 429 (0..1)
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from datetime import date
+
+FALSO_LATENCIA_MS = float(os.getenv("FALSO_LATENCIA_MS", "150"))
+FALSO_TASA_ERROR = float(os.getenv("FALSO_TASA_ERROR", "0"))
+FALSO_TASA_429 = float(os.getenv("FALSO_TASA_429", "0"))
+
+CORREDORES = ["GARCÍA LÓPEZ, Juan", "MARTÍNEZ RUIZ, Ana", "PÉREZ SANZ, Luis", "SÁNCHEZ GIL, Marta",
+              "FERNÁNDEZ MORA, Pablo", "ROMERO DÍAZ, Lucía", "NAVARRO TORRES, Carlos", "GIL MOLINA, Elena"]
+
+
+class Error429Falso(Exception):
+    """Mismo aspecto que un 429 de los SDK (status_code), para que lo reconozca es_rate_limit."""
+    status_code = 429
+
+    def __init__(self):
+        super().__init__("429 Too Many Requests (proveedor falso)")
+        self.headers = {"retry-after": "1"}
+
+
+class ErrorFalso(Exception):
+    """Fallo genérico del proveedor (timeout, 500...)."""
+
+
+def _latencia() -> float:
+    return max(0.0, random.uniform(0.5, 1.5) * FALSO_LATENCIA_MS / 1000)
+
+
+def _quizas_fallar():
+    tirada = random.random()
+    if tirada < FALSO_TASA_429:
+        raise Error429Falso()
+    if tirada < FALSO_TASA_429 + FALSO_TASA_ERROR:
+        raise ErrorFalso("Error simulado del proveedor")
+
+
+def _proxima_fecha(semilla: str) -> date:
+    hoy = date.today()
+    dias = 30 + sum(map(ord, semilla)) % 300
+    return date.fromordinal(hoy.toordinal() + dias)
+
+
+def _nombre_en_query(query: str) -> str:
+    """El nombre de la carrera dentro de las queries de src/main.py."""
+    query = re.sub(r"^fecha y distancias oficiales carrera\s+", "", query)
+    return re.sub(r"\s+\d{4}\b.*$", "", query).strip() or query
+
+
+def _clasificacion(filas: int = 300) -> str:
+    lineas = ["| Pos | Dorsal | Nombre | Categoría | Pos. Cat | Tiempo |", "|---|---|---|---|---|---|"]
+    for i in range(1, filas + 1):
+        # Las primeras filas llevan los nombres tal cual (los busca bench/carga.py)
+        nombre = CORREDORES[i - 1] if i <= len(CORREDORES) else CORREDORES[i % len(CORREDORES)].replace(",", f" {i},")
+        segundos = 8000 + i * 20
+        lineas.append(f"| {i} | {1000 + i} | {nombre} | M-SEN | {i // 4 + 1} | "
+                      f"{segundos // 3600}:{segundos % 3600 // 60:02d}:{segundos % 60:02d} |")
+    return "\n".join(lineas)
+
+
+def respuesta_search(query: str, max_results: int = 5, **kwargs) -> dict:
+    """Resultados enlatados: la mitad de las carreras traen fecha y distancias claras."""
+    nombre = _nombre_en_query(query)
+    fecha = _proxima_fecha(nombre)
+    clara = sum(map(ord, nombre)) % 2 == 0
+    meses = ["enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septiembre", "octubre",
+             "noviembre", "diciembre"]
+    fecha_texto = f"{fecha.day} de {meses[fecha.month - 1]} de {fecha.year}"
+    resultados = [{
+        "url": f"https://www.{re.sub(r'[^a-z]', '', nombre.lower())[:20] or 'carrera'}.com/",
+        "title": f"{nombre.title()} - Web oficial",
+        "content": (f"La {nombre} se celebrará el {fecha_texto}. Distancias: 42K, 21K y 10K. "
+                    f"Salida: Valencia. Inscripciones abiertas." if clara else
+                    f"Toda la información de {nombre}: recorrido, reglamento y noticias."),
+        "score": 0.9,
+    }]
+    for i in range(1, max_results):
+        resultados.append({
+            "url": f"https://noticias{i}.example.com/{i}",
+            "title": f"Noticias {nombre}",
+            "content": f"Crónica de la {nombre}. " + "Texto de relleno de la noticia. " * 40,
+            "score": 0.5 / i,
+        })
+    return {"query": query, "results": resultados}
+
+
+def respuesta_extract(urls, **kwargs) -> dict:
+    urls = [urls] if isinstance(urls, str) else urls
+    return {"results": [{"url": url, "raw_content": _clasificacion()} for url in urls], "failed_results": []}
+
+
+class TavilyFalso:
+    def search(self, query: str, **kwargs) -> dict:
+        time.sleep(_latencia())
+        _quizas_fallar()
+        return respuesta_search(query, **kwargs)
+
+    def extract(self, urls, **kwargs) -> dict:
+        time.sleep(_latencia())
+        _quizas_fallar()
+        return respuesta_extract(urls, **kwargs)
+
+
+class TavilyFalsoAsync:
+    async def search(self, query: str, **kwargs) -> dict:
+        await asyncio.sleep(_latencia())
+        _quizas_fallar()
+        return respuesta_search(query, **kwargs)
+
+    async def extract(self, urls, **kwargs) -> dict:
+        await asyncio.sleep(_latencia())
+        _quizas_fallar()
+        return respuesta_extract(urls, **kwargs)
+
+
+class _MensajeFalso:
+    """Lo mínimo de un AIMessage que lee la aplicación (usage_metadata)."""
+
+    def __init__(self, prompt: str):
+        entrada = len(prompt) // 4
+        self.usage_metadata = {"input_tokens": entrada, "output_tokens": 60, "total_tokens": entrada + 60}
+
+
+class _SalidaEstructuradaFalsa:
+    def __init__(self, esquema, include_raw: bool):
+        self.esquema = esquema
+        self.include_raw = include_raw
+
+    def _datos(self, prompt: str):
+        nombre_esquema = self.esquema.__name__
+        if nombre_esquema == "CarreraSchema":
+            coincidencia = re.search(r"extraer info precisa de: (.+?)\.\s*$", prompt, re.MULTILINE)
+            nombre = coincidencia.group(1).strip() if coincidencia else "Carrera de prueba"
+            datos = self.esquema(
+                nombre_oficial=nombre.title(), deporte="Running", fecha=_proxima_fecha(nombre).isoformat(),
+                lugar="Valencia", distancias=["42 km", "10 km"], url_oficial=None, estado_inscripcion="abierta"
+            )
+        else:
+            datos = self.esquema(tiempo_oficial="3:05:11", posicion_general=812, posicion_categoria=95,
+                                 ritmo_medio="4:23 min/km")
+        if self.include_raw:
+            return {"raw": _MensajeFalso(prompt), "parsed": datos, "parsing_error": None}
+        return datos
+
+    def invoke(self, prompt: str):
+        time.sleep(_latencia() * 4) # el LLM es la etapa más lenta
+        _quizas_fallar()
+        return self._datos(prompt)
+
+    async def ainvoke(self, prompt: str):
+        await asyncio.sleep(_latencia() * 4)
+        _quizas_fallar()
+        return self._datos(prompt)
+
+
+class _HerramientaFalsa(_SalidaEstructuradaFalsa):
+    """Streaming de una llamada a herramienta: el JSON de argumentos llega en trozos."""
+
+    TROZOS = 12
+
+    def __init__(self, esquema):
+        super().__init__(esquema, include_raw=False)
+
+    async def astream(self, prompt: str):
+        from langchain_core.messages import AIMessageChunk
+
+        await asyncio.sleep(_latencia()) # hasta el primer token
+        _quizas_fallar()
+        argumentos = json.dumps(self._datos(prompt).model_dump(), ensure_ascii=False)
+        paso = max(1, len(argumentos) // self.TROZOS)
+        for i in range(0, len(argumentos), paso):
+            await asyncio.sleep(_latencia() * 3 / self.TROZOS)
+            yield AIMessageChunk(content="", tool_call_chunks=[{
+                "name": self.esquema.__name__ if i == 0 else None, "args": argumentos[i:i + paso],
+                "id": "falso" if i == 0 else None, "index": 0,
+            }])
+        yield AIMessageChunk(content="", usage_metadata=_MensajeFalso(prompt).usage_metadata)
+
+
+class LLMFalso:
+    def with_structured_output(self, esquema, include_raw: bool = False):
+        return _SalidaEstructuradaFalsa(esquema, include_raw)
+
+    def bind_tools(self, herramientas, tool_choice=None):
+        return _HerramientaFalsa(herramientas[0])
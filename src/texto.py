@@ -0,0 +1,21 @@
+#Utilidades de normalización de texto compartidas por la caché
+#de extracciones y el resto de búsquedas por nombre. Dos nombres
+#que solo se diferencian en tildes, mayúsculas o signos de
+#puntuación ("Maratón de Madrid" / "maraton  de madrid!")
+#producen la misma forma normalizada.
+
+import re
+import unicodedata
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Devuelve el texto en minúsculas, sin tildes, sin signos de puntuación
+    y con los espacios colapsados.
+    """
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    sin_signos = re.sub(r"[^\w\s]", " ", sin_tildes.lower())
+    return re.sub(r"\s+", " ", sin_signos).strip()
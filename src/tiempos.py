@@ -0,0 +1,206 @@
+#Conversión de los tiempos, ritmos y distancias que devuelve el LLM
+#(texto libre: "1:30:45", "4'30\"/km", "Media maratón") a números
+#que la base de datos puede ordenar y agregar:
+#  - tiempo -> segundos
+#  - ritmo -> segundos por km
+#  - distancia -> km
+#Todo devuelve None si el texto no se puede interpretar.
+
+import re
+from typing import List, Optional
+
+from src.texto import normalizar_texto
+
+KM_POR_MILLA = 1.609344
+
+# Distancias con nombre propio (texto ya normalizado)
+DISTANCIAS_CON_NOMBRE = {
+    "media maraton": 21.0975,
+    "medio maraton": 21.0975,
+    "half marathon": 21.0975,
+    "maraton": 42.195,
+    "marathon": 42.195,
+}
+
+
+# "1h 30m 45s", "3h05'12\"", "45'12''": cada componente con su unidad. Todos son
+# opcionales, así que se recorren las coincidencias (finditer) hasta una que no
+# esté vacía: con re.search bastaría con "Tiempo 1h30m" para no encontrar nada.
+PATRON_TIEMPO_UNIDADES = re.compile(
+    r"(?:(\d+)\s*h(?:oras?)?)?\s*"
+    r"(?:(\d+)\s*(?:min(?:utos?)?|m|'(?!')))?\s*"
+    r"(?:(\d+)\s*(?:s(?:eg(?:undos?)?)?|\"|''))?"
+)
+# "3h05": los minutos tras las horas pueden ir sin unidad
+PATRON_MINUTOS_SUELTOS = re.compile(r"\s*(\d{1,2})\b(?!\s*[:.,]?\d)")
+# "1:30:45", "2.30.15" y "45:12" ("45.12" sería un decimal: con dos partes solo ":")
+PATRON_TIEMPO_RELOJ = re.compile(
+    r"(\d{1,3})(?::(\d{1,2})(?::(\d{1,2}))?|\.(\d{1,2})\.(\d{1,2}))(?:[.,]\d+)?"
+)
+
+# Ritmos posibles en segundos por km, de ~60 km/h (bici) a ~3 km/h (ultras,
+# marcha). Con la distancia deciden si "1:30" es mm:ss o h:mm.
+RITMO_MIN_S_KM = 60
+RITMO_MAX_S_KM = 1200
+
+
+def _a_segundos(partes: List[str]) -> Optional[int]:
+    """['1', '30', '45'] -> 5445; ['45', '12'] -> 2712 (mm:ss)."""
+    try:
+        numeros = [float(p) for p in partes]
+    except ValueError:
+        return None
+    if len(numeros) == 3:
+        horas, minutos, segundos = numeros
+    elif len(numeros) == 2:
+        horas, (minutos, segundos) = 0, numeros
+    else:
+        return None
+    if minutos >= 60 or segundos >= 60:
+        return None
+    return round(horas * 3600 + minutos * 60 + segundos)
+
+
+def _dos_partes(primera: str, segunda: str, distancia_km: Optional[float]) -> Optional[int]:
+    """
+    "1:30": mm:ss o h:mm según el ritmo que daría cada lectura en esa
+    distancia. Sin distancia, mm:ss; si caben las dos o ninguna, None.
+    """
+    minutos_segundos = _a_segundos([primera, segunda])
+    if not distancia_km:
+        return minutos_segundos
+    horas_minutos = _a_segundos([primera, segunda, "0"])
+    posibles = [segundos for segundos in (minutos_segundos, horas_minutos)
+                if segundos and RITMO_MIN_S_KM <= segundos / distancia_km <= RITMO_MAX_S_KM]
+    return posibles[0] if len(posibles) == 1 else None
+
+
+def parsear_tiempo(texto: Optional[str], distancia_km: Optional[float] = None) -> Optional[int]:
+    """
+    '1:30:45', '01:30:45.3', '2.30.15', '45:12', '1h 30m 45s', '3h05'12\"', '3h05'
+    -> segundos. Con distancia_km, '1:30' se lee como h:mm si mm:ss no es un
+    ritmo posible (y al revés).
+    """
+    if not texto:
+        return None
+    texto = texto.strip().lower()
+
+    coincidencia = PATRON_TIEMPO_RELOJ.search(texto)
+    if coincidencia:
+        horas, minutos, segundos, minutos_punto, segundos_punto = coincidencia.groups()
+        if minutos_punto is not None:
+            return _a_segundos([horas, minutos_punto, segundos_punto])
+        if segundos is not None:
+            return _a_segundos([horas, minutos, segundos])
+        return _dos_partes(horas, minutos, distancia_km)
+
+    for coincidencia in PATRON_TIEMPO_UNIDADES.finditer(texto):
+        if not any(coincidencia.groups()):
+            continue
+        horas, minutos, segundos = (int(g) if g else 0 for g in coincidencia.groups())
+        if coincidencia.group(1) and not (coincidencia.group(2) or coincidencia.group(3)):
+            sueltos = PATRON_MINUTOS_SUELTOS.match(texto, coincidencia.end())
+            if sueltos:
+                minutos = int(sueltos.group(1))
+        return _a_segundos([str(horas), str(minutos), str(segundos)])
+    return None
+
+
+def parsear_ritmo(texto: Optional[str]) -> Optional[int]:
+    """'4:30 min/km', '4'30\"/km', '7:15/mi' -> segundos por km."""
+    if not texto:
+        return None
+    texto = texto.strip().lower()
+    coincidencia = re.search(r"(\d{1,2})\s*[:']\s*(\d{1,2})", texto)
+    if not coincidencia:
+        return None
+    segundos = _a_segundos(list(coincidencia.groups()))
+    if segundos is None or segundos == 0:
+        return None
+    if re.search(r"/\s*mi|milla", texto):
+        return round(segundos / KM_POR_MILLA)
+    return segundos
+
+
+def parsear_distancia_km(texto: Optional[str]) -> Optional[float]:
+    """'42k', '21,097 km', '10K', 'Media Maratón', '100 millas' -> km."""
+    if not texto:
+        return None
+    normalizado = normalizar_texto(texto)
+    for nombre, km in DISTANCIAS_CON_NOMBRE.items():
+        if nombre in normalizado:
+            return km
+
+    coincidencia = re.search(r"(\d+(?:[.,]\d+)?)\s*(km|k|kms|kilometros|mi|millas|miles|m)\b", texto.lower())
+    if not coincidencia:
+        return None
+    valor = float(coincidencia.group(1).replace(",", "."))
+    unidad = coincidencia.group(2)
+    if unidad in ("mi", "millas", "miles"):
+        valor *= KM_POR_MILLA
+    elif unidad == "m":
+        valor /= 1000
+    # "42k" y "Maratón" tienen que caer en la misma distancia al agrupar marcas
+    for km in set(DISTANCIAS_CON_NOMBRE.values()):
+        if abs(valor - km) / km < 0.01:
+            return km
+    return round(valor, 3) if valor > 0 else None
+
+
+def distancias_km(distancia_resumen: Optional[str]) -> List[float]:
+    """Distancias de una carrera ('42k, 21k, 10k', como la guarda fila_race) en km."""
+    if not distancia_resumen:
+        return []
+    distancias = (parsear_distancia_km(parte) for parte in distancia_resumen.split(", "))
+    return sorted({d for d in distancias if d})
+
+
+def distancia_resultado(distancia_resumen: Optional[str], tiempo_segundos: Optional[int],
+                        ritmo_segundos_km: Optional[int]) -> Optional[float]:
+    """
+    Distancia que corrió el usuario. Si la carrera tiene una sola distancia
+    es esa; si tiene varias, la más cercana a tiempo / ritmo.
+    """
+    candidatas = distancias_km(distancia_resumen)
+    if len(candidatas) == 1:
+        return candidatas[0]
+    if candidatas and tiempo_segundos and ritmo_segundos_km:
+        estimada = tiempo_segundos / ritmo_segundos_km
+        return min(candidatas, key=lambda d: abs(d - estimada))
+    return None
+
+
+def medidas_resultado(tiempo_oficial: Optional[str], ritmo_medio: Optional[str],
+                      distancia_resumen: Optional[str]) -> tuple:
+    """
+    (tiempo_segundos, ritmo_segundos_km, distancia_km) de un resultado
+    guardado como texto. Un "1:30" se lee con las distancias de la carrera;
+    si con varias sale distinto, decide el ritmo y sin él se queda en None.
+    """
+    candidatas = distancias_km(distancia_resumen)
+    ritmo = parsear_ritmo(ritmo_medio)
+    if not candidatas:
+        tiempo = parsear_tiempo(tiempo_oficial)
+    else:
+        lecturas = {parsear_tiempo(tiempo_oficial, d) for d in candidatas} - {None}
+        if len(lecturas) > 1 and ritmo:
+            lecturas = {min(lecturas, key=lambda t: min(abs(t / ritmo - d) for d in candidatas))}
+        tiempo = lecturas.pop() if len(lecturas) == 1 else None
+    return tiempo, ritmo, distancia_resultado(distancia_resumen, tiempo, ritmo)
+
+
+def formatear_tiempo(segundos: Optional[int]) -> Optional[str]:
+    """5445 -> '1:30:45'."""
+    if segundos is None:
+        return None
+    horas, resto = divmod(int(segundos), 3600)
+    minutos, segundos = divmod(resto, 60)
+    return f"{horas}:{minutos:02d}:{segundos:02d}"
+
+
+def formatear_ritmo(segundos_km: Optional[int]) -> Optional[str]:
+    """270 -> '4:30 min/km'."""
+    if segundos_km is None:
+        return None
+    minutos, segundos = divmod(int(segundos_km), 60)
+    return f"{minutos}:{segundos:02d} min/km"
@@ -0,0 +1,165 @@
+#Cola de tareas en segundo plano para las búsquedas de resultados.
+#El endpoint solo registra la tarea y devuelve su id; un pool local
+#de hilos (sin broker externo) ejecuta buscar_resultado_usuario y
+#guarda el resultado. El estado se persiste en la tabla `trabajos`,
+#así que cualquier worker puede responder a la consulta de progreso.
+#
+#Si el proceso muere (reinicio, despliegue) las tareas que tenía a medias
+#se quedarían "buscando" para siempre. Una tarea sin terminar que lleva
+#más de TRABAJOS_TIMEOUT_MIN sin avanzar se da por perdida y pasa a
+#"error": al arrancar (caducar_trabajos) y al consultarla.
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from src.database import SessionLocal, TrabajoDB
+from src.main import buscar_resultado_usuario, guardar_resultado_db
+from src.limitador import PRIORIDAD_INTERACTIVA
+
+TRABAJOS_WORKERS = int(os.getenv("TRABAJOS_WORKERS", "4"))
+TRABAJOS_TIMEOUT_MIN = int(os.getenv("TRABAJOS_TIMEOUT_MIN", "15"))
+
+ESTADOS_FINALES = ("completado", "error")
+ERROR_CADUCADO = "La tarea se interrumpió (reinicio del servidor o tiempo agotado). Vuelve a lanzar la búsqueda."
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=TRABAJOS_WORKERS, thread_name_prefix="racehub-trabajo")
+    return _pool
+
+
+def cerrar_pool():
+    """Espera a que terminen las tareas en curso (apagado ordenado del servidor)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=False)
+        _pool = None
+
+
+def respuesta_resultado(datos_resultado, nombre_corredor: str) -> dict:
+    """Respuesta pública de una búsqueda de resultado (misma forma que devolvía la API)."""
+    if not datos_resultado.tiempo_oficial:
+        return {
+            "encontrado": False,
+            "mensaje": "No se encontraron tiempos exactos en las webs públicas.",
+            "corredor": nombre_corredor
+        }
+
+    return {
+        "encontrado": True,
+        "mensaje": "Búsqueda completada",
+        "corredor": nombre_corredor,
+        "tiempo": datos_resultado.tiempo_oficial,
+        "posicion": datos_resultado.posicion_general,
+        "posicion_categoria": datos_resultado.posicion_categoria,
+        "ritmo": datos_resultado.ritmo_medio
+    }
+
+
+def _actualizar(trabajo_id: str, **campos):
+    db: Session = SessionLocal()
+    try:
+        db.query(TrabajoDB).filter(TrabajoDB.id == trabajo_id).update(
+            dict(campos, actualizado_en=datetime.now())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def caducar_trabajos(trabajo_id: Optional[str] = None) -> int:
+    """
+    Pasa a "error" las tareas sin terminar que llevan más de TRABAJOS_TIMEOUT_MIN
+    sin actualizarse (todas, o solo `trabajo_id`). Devuelve cuántas.
+    """
+    limite = datetime.now() - timedelta(minutes=TRABAJOS_TIMEOUT_MIN)
+    db: Session = SessionLocal()
+    try:
+        consulta = db.query(TrabajoDB).filter(TrabajoDB.estado.notin_(ESTADOS_FINALES), TrabajoDB.actualizado_en < limite)
+        if trabajo_id is not None:
+            consulta = consulta.filter(TrabajoDB.id == trabajo_id)
+        caducadas = consulta.update(
+            {"estado": "error", "error": ERROR_CADUCADO, "actualizado_en": datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+        return caducadas
+    finally:
+        db.close()
+
+
+def _ejecutar_busqueda_resultado(trabajo_id: str, user_id: int, nombre_carrera: str, año: int, nombre_corredor: str,
+                                 prioridad: str):
+    try:
+        _actualizar(trabajo_id, estado="buscando")
+        datos_resultado = buscar_resultado_usuario(nombre_carrera, año, nombre_corredor, prioridad=prioridad)
+
+        _actualizar(trabajo_id, estado="guardando")
+        guardar_resultado_db(datos_resultado, nombre_carrera, año, user_id)
+
+        respuesta = respuesta_resultado(datos_resultado, nombre_corredor)
+        _actualizar(trabajo_id, estado="completado", resultado=json.dumps(respuesta, ensure_ascii=False))
+        print(f"✅ Tarea {trabajo_id} completada")
+    except Exception as e:
+        print(f"❌ Tarea {trabajo_id} fallida: {e}")
+        try:
+            _actualizar(trabajo_id, estado="error", error=str(e))
+        except Exception as e_bd:
+            print(f"❌ No se pudo registrar el fallo de la tarea {trabajo_id}: {e_bd}")
+
+
+def encolar_busqueda_resultado(user_id: int, nombre_carrera: str, año: int, nombre_corredor: str,
+                               prioridad: str = PRIORIDAD_INTERACTIVA) -> str:
+    """Registra la tarea, la manda al pool y devuelve su id al instante."""
+    trabajo_id = uuid.uuid4().hex
+    ahora = datetime.now()
+
+    db: Session = SessionLocal()
+    try:
+        db.add(TrabajoDB(
+            id=trabajo_id,
+            user_id=user_id,
+            tipo="resultado",
+            estado="pendiente",
+            parametros=json.dumps({"nombre_carrera": nombre_carrera, "anio": año, "nombre_corredor": nombre_corredor},
+                                  ensure_ascii=False),
+            creado_en=ahora,
+            actualizado_en=ahora
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    _get_pool().submit(_ejecutar_busqueda_resultado, trabajo_id, user_id, nombre_carrera, año, nombre_corredor, prioridad)
+    return trabajo_id
+
+
+def obtener_trabajo(trabajo_id: str, user_id: int) -> Optional[dict]:
+    """Estado de una tarea del usuario, o None si no existe o es de otro usuario."""
+    caducar_trabajos(trabajo_id)
+    db: Session = SessionLocal()
+    try:
+        trabajo = db.query(TrabajoDB).filter(TrabajoDB.id == trabajo_id, TrabajoDB.user_id == user_id).first()
+        if not trabajo:
+            return None
+        return {
+            "trabajo_id": trabajo.id,
+            "tipo": trabajo.tipo,
+            "estado": trabajo.estado,
+            "terminado": trabajo.estado in ESTADOS_FINALES,
+            "resultado": json.loads(trabajo.resultado) if trabajo.resultado else None,
+            "error": trabajo.error,
+            "creado_en": trabajo.creado_en.isoformat(),
+            "actualizado_en": trabajo.actualizado_en.isoformat(),
+        }
+    finally:
+        db.close()
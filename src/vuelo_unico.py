@@ -0,0 +1,117 @@
+#Agrupación de búsquedas idénticas en curso ("single flight"). Cuando
+#una carrera popular abre inscripciones, decenas de usuarios buscan el
+#mismo nombre en pocos segundos; sin esto cada petición lanza su propio
+#Tavily + LLM antes de que la primera haya llegado a guardar en caché.
+#
+#La primera petición con una clave ("carrera:<nombre normalizado>:<año>")
+#hace la llamada (líder); las que llegan mientras tanto esperan y
+#reciben el mismo resultado o el mismo error. Funciona a la vez desde
+#hilos (threadpool, CLI, tareas) y desde asyncio: el resultado se
+#publica en un concurrent.futures.Future que unos esperan con
+#.result() y otros con await.
+#
+#Es por worker: entre workers distintos ya ayuda la caché de
+#extracciones compartida en PostgreSQL.
+#
+#Si al líder lo cancelan (tarea asyncio cancelada, Ctrl+C en su hilo) la
+#cancelación es SUYA: a los que esperaban les llega un VueloCancelado,
+#una excepción normal, en lugar de un CancelledError que cancelaría su
+#propia petición sin que nadie la haya cancelado.
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from src.metricas import contar
+
+
+class VueloCancelado(Exception):
+    """El líder de una búsqueda agrupada se canceló antes de terminar."""
+
+
+class _Vuelo:
+    def __init__(self):
+        self.futuro = Future()
+        self.agrupadas = 0
+        self.tarea = None # asyncio.Task del líder asíncrono (hay que guardar la referencia)
+
+
+def _tipo(clave: str) -> str:
+    return clave.split(":", 1)[0]
+
+
+class VueloUnico:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vuelos = {}
+        self.lideres = 0
+        self.agrupadas = 0
+
+    def _unirse(self, clave: str):
+        """Devuelve (vuelo, es_lider): el vuelo en curso con esa clave o uno nuevo."""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            es_lider = vuelo is None
+            if es_lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.lideres += 1
+            else:
+                vuelo.agrupadas += 1
+                self.agrupadas += 1
+        contar("racehub_vuelo_unico_total", tipo=_tipo(clave), rol="lider" if es_lider else "agrupada")
+        return vuelo, es_lider
+
+    def _aterrizar(self, clave: str, vuelo: _Vuelo, resultado=None, error: BaseException = None):
+        # Fuera del registro ANTES de publicar: quien llegue después empieza de cero (o acierta en caché)
+        with self._lock:
+            if self._vuelos.get(clave) is vuelo:
+                del self._vuelos[clave]
+        if error is not None:
+            vuelo.futuro.set_exception(error)
+        else:
+            vuelo.futuro.set_result(resultado)
+        if vuelo.agrupadas:
+            print(f"🛬 '{clave}': {vuelo.agrupadas + 1} búsquedas idénticas resueltas con una sola llamada")
+
+    def ejecutar(self, clave: str, funcion, *args, **kwargs):
+        """funcion(*args, **kwargs), salvo que ya haya una igual en curso: entonces espera la suya."""
+        vuelo, es_lider = self._unirse(clave)
+        if not es_lider:
+            return vuelo.futuro.result()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            self._aterrizar(clave, vuelo, error=e)
+            raise
+        except BaseException as e:
+            # KeyboardInterrupt, CancelledError...: no se propagan a otros hilos
+            self._aterrizar(clave, vuelo, error=VueloCancelado(f"Búsqueda '{clave}' cancelada ({type(e).__name__})"))
+            raise
+        self._aterrizar(clave, vuelo, resultado)
+        return resultado
+
+    async def aejecutar(self, clave: str, fabrica):
+        """Versión asíncrona: `fabrica()` devuelve la corrutina que hace la llamada."""
+        vuelo, es_lider = self._unirse(clave)
+        if es_lider:
+            # En su propia tarea: si el cliente que la lanzó se desconecta, los demás siguen esperando
+            vuelo.tarea = asyncio.ensure_future(fabrica())
+
+            def terminada(tarea: asyncio.Task):
+                if tarea.cancelled():
+                    self._aterrizar(clave, vuelo, error=VueloCancelado(f"Búsqueda '{clave}' cancelada"))
+                elif tarea.exception() is not None:
+                    self._aterrizar(clave, vuelo, error=tarea.exception())
+                else:
+                    self._aterrizar(clave, vuelo, tarea.result())
+
+            vuelo.tarea.add_done_callback(terminada)
+        # shield: cancelar a un seguidor no debe cancelar el Future compartido
+        return await asyncio.shield(asyncio.wrap_future(vuelo.futuro))
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {"en_curso": len(self._vuelos), "lideres": self.lideres, "agrupadas": self.agrupadas}
+
+
+vuelos = VueloUnico()
@@ -1,6 +1,8 @@
         let datosEncontrados = null;
         let vistaActual = 'tabla'; // 'tabla' o 'calendario'
         let carrerasCache = [];
+        let mesVisible = mesDe(new Date()); // 'YYYY-MM' que se está viendo
+        let cargaActual = 0; // Descarta respuestas de un mes que ya no se ve
 
         console.log("Script loaded");
 
@@ -31,14 +33,75 @@
             renderizarCarreras(carrerasCache);
         }
 
+        function mesDe(fecha) {
+            return `${fecha.getFullYear()}-${String(fecha.getMonth() + 1).padStart(2, '0')}`;
+        }
+
+        // Primer y último día ('YYYY-MM-DD') de un mes 'YYYY-MM'
+        function rangoDelMes(mes) {
+            const [anio, numero] = mes.split('-').map(Number);
+            const ultimo = new Date(anio, numero, 0).getDate();
+            return [`${mes}-01`, `${mes}-${String(ultimo).padStart(2, '0')}`];
+        }
+
+        function cambiarMes(desplazamiento) {
+            const [anio, numero] = mesVisible.split('-').map(Number);
+            mesVisible = mesDe(new Date(anio, numero - 1 + desplazamiento, 1));
+            cargarCarreras();
+        }
+
+        function pintarMes() {
+            const [anio, numero] = mesVisible.split('-').map(Number);
+            const nombre = new Date(anio, numero - 1, 1).toLocaleDateString('es-ES', { month: 'long', year: 'numeric' });
+            document.getElementById('mesActual').textContent = nombre.charAt(0).toUpperCase() + nombre.slice(1);
+        }
+
+        // Primera página del mes en curso que el servidor incrusta en index.html.
+        // Solo vale para la primera carga: después (al guardar, borrar, cambiar
+        // de mes...) se pide a /carreras.
+        function datosIncrustados() {
+            const nodo = document.getElementById('datosIniciales');
+            if (!nodo) return undefined;
+            nodo.remove();
+            return JSON.parse(nodo.textContent);
+        }
+
         async function cargarCarreras() {
+            const carga = ++cargaActual;
             try {
-                const response = await fetch('/carreras', { credentials: 'include' });
-                if (response.status === 401) {
+                const iniciales = datosIncrustados();
+                if (iniciales === null) {
+                    // El servidor ya sabe que no hay sesión
                     document.getElementById('modalLogin').style.display = 'flex';
                     return;
                 }
-                const carreras = await response.json();
+                // Solo el mes visible; dentro de él, el listado viene paginado
+                // por cursor y seguimos X-Next-Cursor hasta su última carrera
+                const incrustados = iniciales && iniciales.mes === mesVisible ? iniciales : null;
+                const [desde, hasta] = rangoDelMes(mesVisible);
+                pintarMes();
+                let carreras = incrustados ? incrustados.carreras : [];
+                let cursor = incrustados ? incrustados.siguiente : null;
+                if (incrustados) {
+                    // Se pinta ya lo que llegó con la página; el resto se añade al llegar
+                    carrerasCache = carreras;
+                    renderizarCarreras(carreras);
+                }
+                let pedirPrimera = !incrustados;
+                while (pedirPrimera || cursor) {
+                    const parametros = new URLSearchParams({ from: desde, to: hasta });
+                    if (cursor) parametros.set('cursor', cursor);
+                    const response = await fetch(`/carreras?${parametros}`, { credentials: 'include' });
+                    if (response.status === 401) {
+                        document.getElementById('modalLogin').style.display = 'flex';
+                        return;
+                    }
+                    const pagina = await response.json();
+                    if (carga !== cargaActual) return; // Se cambió de mes mientras tanto
+                    carreras = carreras.concat(pagina);
+                    cursor = response.headers.get('X-Next-Cursor');
+                    pedirPrimera = false;
+                }
                 carrerasCache = carreras;
                 renderizarCarreras(carreras);
                 
@@ -99,7 +162,7 @@
             const listaDiv = document.getElementById('lista-carreras');
             
             if (!carreras || carreras.length === 0) {
-                listaDiv.innerHTML = '<p style="text-align: center; color: #666; padding: 40px;">📭 No se añadió ninguna carrera todavía.</p>';
+                listaDiv.innerHTML = '<p style="text-align: center; color: #666; padding: 40px;">📭 No tienes carreras este mes.</p>';
                 return;
             }
             
@@ -228,10 +291,35 @@
             listaDiv.innerHTML = html;
         }
 
+        function mostrarConfirmacion(datos, parcial) {
+            // Con parcial=true se pinta lo que la IA lleva escrito, sin botones
+            const confirmacionDiv = document.getElementById('confirmacion');
+            const valor = (v) => (v === undefined || v === null || v === '') ? '<em style="color:#999;">…</em>' : v;
+            confirmacionDiv.innerHTML = `
+                <div style="background: #e8f5e9; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #27ae60;">
+                    <h3 style="margin-top: 0; color: #27ae60;">${parcial ? '✍️ La IA está rellenando los datos...' : '📋 Datos encontrados por la IA:'}</h3>
+                    <p><strong>🏆 Nombre:</strong> ${valor(datos.nombre_oficial)}</p>
+                    <p><strong>🚴 Deporte:</strong> ${valor(datos.deporte)}</p>
+                    <p><strong>📅 Fecha:</strong> ${valor(datos.fecha)}</p>
+                    <p><strong>📍 Lugar:</strong> ${valor(datos.lugar)}</p>
+                    <p><strong>📏 Distancias:</strong> ${valor((datos.distancias || []).join(', '))}</p>
+                    <p><strong>🔗 URL:</strong> ${parcial ? valor(datos.url_oficial) : (datos.url_oficial || 'No disponible')}</p>
+                    <p><strong>📝 Estado:</strong> ${valor(datos.estado_inscripcion)}</p>
+                    ${parcial ? '' : `
+                    <div style="margin-top: 20px; display: flex; gap: 10px;">
+                        <button onclick="confirmarGuardado()" style="background: #27ae60;">✅ Confirmar y Guardar</button>
+                        <button onclick="cancelarBusqueda()" style="background: #e74c3c;">❌ Cancelar</button>
+                    </div>`}
+                </div>
+            `;
+            confirmacionDiv.style.display = 'block';
+        }
+
         async function buscarCarrera() {
             const input = document.getElementById('nombreInput');
             const btn = document.getElementById('btnBuscar');
             const loading = document.getElementById('loading');
+            const loadingTexto = document.getElementById('loadingTexto');
             const confirmacionDiv = document.getElementById('confirmacion');
             const nombre = input.value;
 
@@ -239,44 +327,64 @@
 
             // Ocultar confirmación previa si existe
             confirmacionDiv.style.display = 'none';
+            datosEncontrados = null;
 
             // Interfaz: Bloqueamos botón y mostramos carga
             btn.disabled = true;
+            loadingTexto.textContent = 'Buscando en internet...';
             loading.style.display = 'block';
 
             try {
-                const response = await fetch('/carreras/buscar', {
+                // Versión con progreso: un evento JSON por línea según avanza la búsqueda
+                const response = await fetch('/carreras/buscar/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ nombre: nombre })
                 });
 
-                if (response.ok) {
-                    datosEncontrados = await response.json();
-                    
+                if (!response.ok) {
+                    const error = await response.json();
+                    return alert("❌ Error: " + (error.detail || "No se pudo procesar"));
+                }
+
+                const lector = response.body.getReader();
+                const decodificador = new TextDecoder();
+                let pendiente = '';
+                let parcial = {};
+                let error = null;
+
+                while (true) {
+                    const { value, done } = await lector.read();
+                    if (done) break;
+                    pendiente += decodificador.decode(value, { stream: true });
+                    const lineas = pendiente.split('\n');
+                    pendiente = lineas.pop();
+
+                    for (const linea of lineas) {
+                        if (!linea.trim()) continue;
+                        const evento = JSON.parse(linea);
+                        if (evento.evento === 'fuentes') {
+                            loadingTexto.textContent = `${evento.total} fuentes encontradas, analizándolas...`;
+                        } else if (evento.evento === 'extrayendo') {
+                            loadingTexto.textContent = 'La IA está leyendo las fuentes...';
+                        } else if (evento.evento === 'parcial') {
+                            Object.assign(parcial, evento.campos);
+                            mostrarConfirmacion(parcial, true);
+                        } else if (evento.evento === 'resultado') {
+                            datosEncontrados = evento.datos;
+                        } else if (evento.evento === 'error') {
+                            error = evento.detalle;
+                        }
+                    }
+                }
+
+                if (datosEncontrados) {
                     // Mostrar datos encontrados para confirmación
-                    confirmacionDiv.innerHTML = `
-                        <div style="background: #e8f5e9; padding: 20px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #27ae60;">
-                            <h3 style="margin-top: 0; color: #27ae60;">📋 Datos encontrados por la IA:</h3>
-                            <p><strong>🏆 Nombre:</strong> ${datosEncontrados.nombre_oficial}</p>
-                            <p><strong>🚴 Deporte:</strong> ${datosEncontrados.deporte}</p>
-                            <p><strong>📅 Fecha:</strong> ${datosEncontrados.fecha}</p>
-                            <p><strong>📍 Lugar:</strong> ${datosEncontrados.lugar}</p>
-                            <p><strong>📏 Distancias:</strong> ${datosEncontrados.distancias.join(', ')}</p>
-                            <p><strong>🔗 URL:</strong> ${datosEncontrados.url_oficial || 'No disponible'}</p>
-                            <p><strong>📝 Estado:</strong> ${datosEncontrados.estado_inscripcion}</p>
-                            
-                            <div style="margin-top: 20px; display: flex; gap: 10px;">
-                                <button onclick="confirmarGuardado()" style="background: #27ae60;">✅ Confirmar y Guardar</button>
-                                <button onclick="cancelarBusqueda()" style="background: #e74c3c;">❌ Cancelar</button>
-                            </div>
-                        </div>
-                    `;
-                    confirmacionDiv.style.display = 'block';
+                    mostrarConfirmacion(datosEncontrados, false);
                     input.value = ''; // Limpiar input
                 } else {
-                    const error = await response.json();
-                    alert("❌ Error: " + (error.detail || "No se pudo procesar"));
+                    confirmacionDiv.style.display = 'none';
+                    alert("❌ Error: " + (error || "No se pudo procesar"));
                 }
             } catch (err) {
                 alert("❌ Error de conexión: " + err);
@@ -434,7 +542,9 @@
                 });
 
                 if (response.ok) {
-                    const data = await response.json();
+                    // La búsqueda corre en segundo plano: seguimos su progreso por SSE
+                    const tarea = await response.json();
+                    const data = await esperarTarea(tarea.url_eventos, loading);
                     
                     if (data.encontrado) {
                         const mensaje = `
@@ -456,13 +566,45 @@
                     alert("❌ Error: " + (error.detail || "No se pudo procesar"));
                 }
             } catch (err) {
-                alert("❌ Error de conexión: " + err);
+                alert("❌ Error: " + (err.message || err));
             } finally {
                 loading.style.display = 'none';
                 loading.innerHTML = textoOriginal;
             }
         }
 
+        // Escucha los eventos SSE de una tarea hasta que termina y devuelve su resultado
+        function esperarTarea(urlEventos, loading) {
+            const textos = {
+                pendiente: '⏳ En cola...',
+                buscando: '🔍 Buscando tu resultado oficial...',
+                guardando: '💾 Guardando resultado...'
+            };
+            return new Promise((resolve, reject) => {
+                const fuente = new EventSource(urlEventos, { withCredentials: true });
+                const alCambiar = (evento) => {
+                    const tarea = JSON.parse(evento.data);
+                    if (tarea.estado === 'completado') {
+                        fuente.close();
+                        resolve(tarea.resultado);
+                    } else if (tarea.estado === 'error') {
+                        fuente.close();
+                        reject(new Error(tarea.error || 'La búsqueda ha fallado'));
+                    } else if (evento.type === 'espera_agotada') {
+                        fuente.close();
+                        reject(new Error('La búsqueda sigue en curso; consulta tus resultados en unos minutos'));
+                    } else {
+                        loading.innerHTML = `<div class="spinner"></div> ${textos[tarea.estado] || tarea.estado}`;
+                    }
+                };
+                ['pendiente', 'buscando', 'guardando', 'completado', 'error', 'espera_agotada'].forEach(e => fuente.addEventListener(e, alCambiar));
+                fuente.onerror = () => {
+                    fuente.close();
+                    reject(new Error('Se perdió la conexión con el servidor'));
+                };
+            });
+        }
+
         // --- Funciones de Compartir ---
 async function compartirCalendario() {
     if (!usuarioActual) {
@@ -501,6 +643,6 @@ function copiarEnlace(event) {
     setTimeout(() => btn.innerText = originalText, 2000);
 }
 
-// Cargar al inicio
-        // cargarPerfil() se llama dentro de cargarCarreras si hay login
-        cargarCarreras();
+// Carga al inicio: en el DOMContentLoaded de arriba (una sola vez, para
+// aprovechar la primera página incrustada). cargarPerfil() se llama dentro
+// de cargarCarreras si hay login.
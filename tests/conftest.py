@@ -0,0 +1,102 @@
+#Configuración común de las pruebas. Cada prueba que usa la base de datos
+#recibe una SQLite nueva en un directorio temporal; las de PostgreSQL
+#solo se ejecutan si RACEHUB_TEST_POSTGRES_URL apunta a una base vacía.
+
+import os
+import tempfile
+
+# Antes de importar src: nada de conexiones a la base real, ni claves, ni hilos de fondo
+_directorio = tempfile.mkdtemp(prefix="racehub-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directorio, 'importacion.db')}"
+os.environ["LIMITADOR_FICHERO"] = os.path.join(_directorio, "limitador.json")
+os.environ["ACTUALIZADOR_FICHERO"] = os.path.join(_directorio, "actualizador.json")
+os.environ["ACTUALIZADOR_ACTIVO"] = "0"
+os.environ.pop("GROQ_API_KEY", None)
+os.environ.pop("TAVILY_API_KEY", None)
+
+import pytest
+from sqlalchemy import create_engine
+
+from src import database, compartir, intercambio
+from src.cache import cache_extracciones
+
+POSTGRES_URL = os.getenv("RACEHUB_TEST_POSTGRES_URL")
+
+
+def _usar_motor(monkeypatch, motor):
+    """Apunta los módulos que guardan el engine (y la fábrica de sesiones) al motor de la prueba."""
+    for modulo in (database, compartir, intercambio):
+        monkeypatch.setattr(modulo, "engine", motor)
+    database.SessionLocal.configure(bind=motor)
+    compartir.cache_compartidos.limpiar()
+    compartir.cache_ics.limpiar()
+    compartir._token_por_usuario.limpiar()
+    cache_extracciones.memoria.limpiar()
+
+
+@pytest.fixture
+def motor(tmp_path, monkeypatch):
+    """SQLite vacía (sin tablas)."""
+    nuevo = create_engine(f"sqlite:///{tmp_path / 'racehub.db'}")
+    _usar_motor(monkeypatch, nuevo)
+    yield nuevo
+    nuevo.dispose()
+
+
+@pytest.fixture
+def motor_postgres(monkeypatch):
+    """PostgreSQL vacía de RACEHUB_TEST_POSTGRES_URL (se borran sus tablas antes y después)."""
+    if not POSTGRES_URL:
+        pytest.skip("RACEHUB_TEST_POSTGRES_URL no está definida")
+    nuevo = create_engine(POSTGRES_URL)
+    _borrar_tablas(nuevo)
+    _usar_motor(monkeypatch, nuevo)
+    yield nuevo
+    _borrar_tablas(nuevo)
+    nuevo.dispose()
+
+
+def _borrar_tablas(motor):
+    with motor.begin() as conexion:
+        conexion.exec_driver_sql("DROP SCHEMA public CASCADE")
+        conexion.exec_driver_sql("CREATE SCHEMA public")
+
+
+@pytest.fixture
+def bd(motor):
+    """SQLite con el esquema actual ya creado."""
+    database.inicializar_db()
+    return motor
+
+
+@pytest.fixture
+def sesion(bd):
+    db = database.SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def clientes(bd):
+    """Fábrica de TestClient ya con sesión iniciada: clientes("ana@x.com")."""
+    from fastapi.testclient import TestClient
+    from src.api import app
+
+    def crear(email: str) -> TestClient:
+        cliente = TestClient(app)
+        assert cliente.post("/auth/login", json={"email": email}).status_code == 200
+        return cliente
+    return crear
+
+
+@pytest.fixture
+def proveedores_falsos(tmp_path, monkeypatch):
+    """Tavily y Groq de src/proveedores_falsos.py, sin latencia y sin esperas del limitador."""
+    from src import limitador, main, proveedores_falsos as falsos
+
+    monkeypatch.setattr(main, "PROVEEDORES_FALSOS", True)
+    monkeypatch.setattr(main, "_motores", {})
+    monkeypatch.setattr(falsos, "FALSO_LATENCIA_MS", 0)
+    cuotas = {proveedor: {"por_segundo": 1000, "capacidad": 1000} for proveedor in ("groq", "tavily")}
+    monkeypatch.setattr(limitador, "limitador", limitador.LimitadorCompartido(str(tmp_path / "limitador.json"), cuotas))
+    return falsos
@@ -0,0 +1,98 @@
+#Actualizador programado (src/actualizador.py): qué cuenta como
+#comprobada, qué pasa con los fallos y que no arranque sin claves.
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from src import actualizador
+from src.database import SessionLocal, RaceDB, CarreraDB
+from src.limitador import CuotaAgotada
+from tests.test_catalogo import _confirmar
+
+
+@pytest.fixture
+def valencia(clientes, monkeypatch):
+    """Una próxima carrera que sigue un usuario, nunca revisada."""
+    monkeypatch.setattr(actualizador, "_fallidas", {})
+    _confirmar(clientes("ana@x.com"))
+    db = SessionLocal()
+    try:
+        return db.query(RaceDB).one().id
+    finally:
+        db.close()
+
+
+def _race(race_id):
+    db = SessionLocal()
+    try:
+        return db.get(RaceDB, race_id)
+    finally:
+        db.close()
+
+
+def _buscar(monkeypatch, resultado):
+    def buscar(nombre, **kwargs):
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+    monkeypatch.setattr(actualizador, "buscar_y_extraer_datos", buscar)
+
+
+def test_revision_correcta_marca_y_aplica_cambios(valencia, monkeypatch):
+    _buscar(monkeypatch, SimpleNamespace(fecha="2030-12-01", estado_inscripcion="Cerrada", lugar="Valencia",
+                                         distancias=["42 km"], url_oficial=None))
+
+    resumen = actualizador.ejecutar_ronda(presupuesto=4)
+
+    assert resumen["carreras_revisadas"] == 1 and resumen["carreras_actualizadas"] == 1
+    race = _race(valencia)
+    assert race.comprobada_en is not None and race.estado_inscripcion == "cerrada"
+
+
+def test_revision_fallida_no_cuenta_como_comprobada(valencia, monkeypatch):
+    # Sin clave del LLM (o cualquier otro fallo) la carrera sigue pendiente
+    _buscar(monkeypatch, ValueError("❌ ERROR: GROQ_API_KEY no está configurada en el archivo .env"))
+
+    resumen = actualizador.ejecutar_ronda(presupuesto=4)
+
+    assert resumen["carreras_revisadas"] == 0 and resumen["carreras_fallidas"] == 1
+    assert _race(valencia).comprobada_en is None
+    # Este worker no la reintenta en la siguiente ronda, pero sigue pendiente
+    db = SessionLocal()
+    try:
+        assert actualizador._pendientes(db, 10) == []
+        actualizador._fallidas.clear()
+        assert actualizador._pendientes(db, 10) == [valencia]
+    finally:
+        db.close()
+
+
+def test_cuota_agotada_interrumpe_la_ronda_sin_marcar(valencia, monkeypatch):
+    _buscar(monkeypatch, CuotaAgotada("tavily"))
+
+    resumen = actualizador.ejecutar_ronda(presupuesto=4)
+
+    assert resumen["carreras_revisadas"] == 0 and resumen["carreras_fallidas"] == 0
+    assert _race(valencia).comprobada_en is None
+    assert actualizador._fallidas == {}
+
+
+def test_no_se_vuelve_a_revisar_antes_de_tiempo(valencia, monkeypatch):
+    db = SessionLocal()
+    try:
+        db.get(RaceDB, valencia).comprobada_en = datetime.now()
+        db.commit()
+        assert actualizador._pendientes(db, 10) == []
+        assert db.query(CarreraDB).count() == 1
+    finally:
+        db.close()
+
+
+def test_sin_claves_no_arranca_aunque_este_activo(monkeypatch):
+    monkeypatch.setattr(actualizador, "ACTUALIZADOR_ACTIVO", True)
+    monkeypatch.setattr(actualizador, "PROVEEDORES_FALSOS", False)
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    actualizador.iniciar_actualizador()
+    assert actualizador._hilo is None
@@ -0,0 +1,76 @@
+#Arranque sin efectos secundarios (src.api, src.main, src.database):
+#importar no conecta con la base de datos ni carga los clientes de Groq y
+#Tavily; las tablas se crean en el lifespan y las claves solo se piden
+#al usar el proveedor.
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src import main
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+ARRANCAR = """
+import json, os, sys
+import src.api
+importado = {"modulos": [m for m in ("tavily", "langchain_groq") if m in sys.modules],
+             "base_creada": os.path.exists(os.environ["RUTA_BD"])}
+if sys.argv[1] == "peticion":
+    from fastapi.testclient import TestClient
+    with TestClient(src.api.app) as cliente:
+        importado["estado"] = cliente.get("/auth/me").status_code
+print(json.dumps(importado))
+"""
+
+
+def _arrancar(tmp_path, modo, **entorno):
+    ruta = tmp_path / "racehub.db"
+    variables = {k: v for k, v in os.environ.items() if k not in ("GROQ_API_KEY", "TAVILY_API_KEY")}
+    variables.update(DATABASE_URL=f"sqlite:///{ruta}", RUTA_BD=str(ruta), **entorno)
+    salida = subprocess.run([sys.executable, "-c", ARRANCAR, modo], cwd=RAIZ, env=variables,
+                            capture_output=True, text=True, timeout=60)
+    assert salida.returncode == 0, salida.stderr
+    return json.loads(salida.stdout.strip().splitlines()[-1]), ruta
+
+
+def _tablas(ruta):
+    with sqlite3.connect(ruta) as conexion:
+        return {fila[0] for fila in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def test_importar_no_conecta_ni_carga_proveedores(tmp_path):
+    importado, _ = _arrancar(tmp_path, "importar")
+    assert importado == {"modulos": [], "base_creada": False}
+
+
+def test_el_lifespan_crea_el_esquema(tmp_path):
+    importado, ruta = _arrancar(tmp_path, "peticion")
+    assert importado["estado"] == 401 and importado["modulos"] == []
+    assert {"users", "races", "carreras", "resultados"} <= _tablas(ruta)
+
+
+def test_workers_extra_pueden_saltarse_el_esquema(tmp_path):
+    # El primer worker ya creó el esquema; si falta una tabla, solo un arranque normal la repone
+    _, ruta = _arrancar(tmp_path, "peticion")
+    with sqlite3.connect(ruta) as conexion:
+        conexion.execute("DROP TABLE cache_extracciones")
+    _arrancar(tmp_path, "peticion", DB_INICIALIZAR_AL_ARRANCAR="0")
+    assert "cache_extracciones" not in _tablas(ruta)
+    _arrancar(tmp_path, "peticion")
+    assert "cache_extracciones" in _tablas(ruta)
+
+
+def test_la_clave_se_pide_al_usar_el_proveedor(monkeypatch):
+    monkeypatch.setattr(main, "_motores", {})
+    monkeypatch.setattr(main, "PROVEEDORES_FALSOS", False)
+    with pytest.raises(ValueError, match="TAVILY_API_KEY no está configurada"):
+        main.get_tavily()
+    with pytest.raises(ValueError, match="GROQ_API_KEY no está configurada"):
+        main.get_llm_carreras()
+    assert main._motores == {}
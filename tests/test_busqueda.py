@@ -0,0 +1,192 @@
+#Búsqueda asíncrona de carreras (POST /carreras/buscar) contra los
+#proveedores falsos: caché, refresco forzado y búsquedas simultáneas
+#sin ocupar hilos; la importación de temporadas (POST /carreras/batch)
+#y la búsqueda con progreso (POST /carreras/buscar/stream).
+
+import asyncio
+import json
+import time
+
+import httpx
+
+from src import api, limitador, main
+from src.api import app
+
+MUJER = "Carrera de la Mujer" # su búsqueda falsa no trae fecha: pasa por el LLM
+
+
+def _contar_busquedas(falsos, monkeypatch):
+    consultas = []
+    original = falsos.respuesta_search
+    monkeypatch.setattr(falsos, "respuesta_search", lambda query, **kw: consultas.append(query) or original(query, **kw))
+    return consultas
+
+
+def test_buscar_y_despues_desde_la_cache(clientes, proveedores_falsos, monkeypatch):
+    ana = clientes("ana@x.com")
+    consultas = _contar_busquedas(proveedores_falsos, monkeypatch)
+
+    respuesta = ana.post("/carreras/buscar", json={"nombre": MUJER})
+    assert respuesta.status_code == 200, respuesta.text
+    datos = respuesta.json()
+    assert (datos["nombre_oficial"], datos["deporte"], datos["lugar"]) == ("Carrera De La Mujer", "Running", "Valencia")
+    assert datos["distancias"] == ["42 km", "10 km"]
+
+    assert ana.post("/carreras/buscar", json={"nombre": "carrera de la MUJER"}).json() == datos
+    assert len(consultas) == 1
+    assert ana.post("/carreras/buscar", json={"nombre": MUJER, "forzar_refresco": True}).status_code == 200
+    assert len(consultas) == 2
+
+
+def test_nombre_vacio(clientes, proveedores_falsos):
+    respuesta = clientes("ana@x.com").post("/carreras/buscar", json={"nombre": "   "})
+    assert respuesta.status_code == 500 and "no puede estar vacío" in respuesta.json()["detail"]
+
+
+def test_busquedas_simultaneas_se_esperan_a_la_vez(bd, proveedores_falsos, monkeypatch):
+    # ~0.1 s de Tavily y ~0.4 s de LLM por búsqueda: seguidas serían 2 s como poco
+    monkeypatch.setattr(proveedores_falsos, "FALSO_LATENCIA_MS", 100)
+    nombres = [f"{MUJER} {i}" for i in range(8)]
+
+    async def escenario():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://racehub") as cliente:
+            inicio = time.perf_counter()
+            respuestas = await asyncio.gather(*(cliente.post("/carreras/buscar", json={"nombre": n}) for n in nombres))
+            return respuestas, time.perf_counter() - inicio
+
+    respuestas, duracion = asyncio.run(escenario())
+    assert [r.status_code for r in respuestas] == [200] * len(nombres)
+    assert sorted(r.json()["nombre_oficial"] for r in respuestas) == sorted(n.title() for n in nombres)
+    assert duracion < 1.8
+
+
+#--- Importación de una temporada (POST /carreras/batch) ---
+
+def _lote(cliente, nombres):
+    respuesta = cliente.post("/carreras/batch", json={"nombres": nombres})
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.headers["content-type"].startswith("application/x-ndjson")
+    *lineas, resumen = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    return lineas, resumen["resumen"]
+
+
+def test_lote_busca_guarda_e_informa(clientes, proveedores_falsos, monkeypatch):
+    ana = clientes("ana@x.com")
+    original = main.abuscar_y_extraer_datos
+
+    async def buscar(nombre, **kwargs):
+        if nombre == "Inexistente":
+            raise ValueError("❌ No se encontraron resultados para 'Inexistente'")
+        return await original(nombre, **kwargs)
+    monkeypatch.setattr(main, "abuscar_y_extraer_datos", buscar)
+
+    lineas, resumen = _lote(ana, [MUJER, " ", "Inexistente", "10K Bilbao"])
+    assert sorted(l["nombre"] for l in lineas) == ["10K Bilbao", MUJER, "Inexistente"]
+    fallida = next(l for l in lineas if not l["ok"])
+    assert fallida["nombre"] == "Inexistente" and "No se encontraron" in fallida["error"]
+    assert (resumen["total"], resumen["encontradas"], resumen["errores"], resumen["insertadas"]) == (3, 2, 1, 2)
+    assert sorted(c["nombre"] for c in ana.get("/carreras").json()) == ["10K Bilbao", "Carrera De La Mujer"]
+
+    # Otra vez: ya están (los datos vienen de la caché y no cambian)
+    _, resumen = _lote(ana, [MUJER, "10K Bilbao"])
+    assert (resumen["insertadas"], resumen["omitidas"]) == (0, 2)
+
+
+def test_lote_respeta_la_concurrencia(clientes, proveedores_falsos, monkeypatch):
+    monkeypatch.setattr(api, "BATCH_CONCURRENCIA", 2)
+    en_vuelo, maximo = 0, 0
+
+    async def buscar(nombre, **kwargs):
+        nonlocal en_vuelo, maximo
+        en_vuelo += 1
+        maximo = max(maximo, en_vuelo)
+        await asyncio.sleep(0.02)
+        en_vuelo -= 1
+        raise ValueError("sin datos")
+    monkeypatch.setattr(main, "abuscar_y_extraer_datos", buscar)
+
+    _, resumen = _lote(clientes("ana@x.com"), [f"Carrera {i}" for i in range(7)])
+    assert resumen["errores"] == 7 and maximo == 2
+
+
+def test_lote_vacio_o_demasiado_grande(clientes, monkeypatch):
+    ana = clientes("ana@x.com")
+    assert ana.post("/carreras/batch", json={"nombres": ["", "  "]}).status_code == 400
+    monkeypatch.setattr(api, "BATCH_MAX_CARRERAS", 3)
+    assert ana.post("/carreras/batch", json={"nombres": ["a", "b", "c", "d"]}).status_code == 400
+
+
+#--- Búsqueda con progreso (POST /carreras/buscar/stream) ---
+
+def _eventos(cliente, nombre, **cabeceras):
+    respuesta = cliente.post("/carreras/buscar/stream", json={"nombre": nombre}, headers=cabeceras)
+    assert respuesta.status_code == 200
+    return respuesta, [json.loads(linea) for linea in respuesta.text.splitlines()]
+
+
+def test_stream_con_campos_parciales_del_llm(clientes, proveedores_falsos):
+    ana = clientes("ana@x.com")
+    respuesta, eventos = _eventos(ana, MUJER)
+    assert respuesta.headers["content-type"].startswith("application/x-ndjson")
+    assert respuesta.headers["x-accel-buffering"] == "no"
+
+    tipos = [e["evento"] for e in eventos]
+    assert tipos[:3] == ["inicio", "fuentes", "extrayendo"] and tipos[-1] == "resultado"
+    assert set(tipos[3:-1]) == {"parcial"} and len(tipos) > 5
+    assert eventos[1]["total"] == 5 and eventos[1]["fuentes"][0]["url"].startswith("https://")
+    resultado = eventos[-1]
+    assert resultado["origen"] == "llm" and resultado["datos"]["nombre_oficial"] == "Carrera De La Mujer"
+    # Los parciales van completando los mismos campos que el resultado
+    campos = {}
+    for evento in eventos[3:-1]:
+        campos.update(evento["campos"])
+    assert campos["nombre_oficial"] == "Carrera De La Mujer" and campos["distancias"] == ["42 km", "10 km"]
+
+    # La segunda vez sale de la caché
+    _, eventos = _eventos(ana, MUJER)
+    assert [e["evento"] for e in eventos] == ["inicio", "resultado"] and eventos[-1]["origen"] == "cache"
+
+
+def test_stream_sse_y_errores(clientes, proveedores_falsos, monkeypatch):
+    ana = clientes("ana@x.com")
+    respuesta = ana.post("/carreras/buscar/stream", json={"nombre": MUJER}, headers={"Accept": "text/event-stream"})
+    assert respuesta.headers["content-type"].startswith("text/event-stream")
+    bloques = [b for b in respuesta.text.split("\n\n") if b]
+    assert bloques[0].startswith("event: inicio\ndata: {") and bloques[-1].startswith("event: resultado\n")
+
+    _, eventos = _eventos(ana, "")
+    assert eventos == [{"evento": "error", "detalle": "❌ ERROR: El nombre de la carrera no puede estar vacío"}]
+
+    # Un 429 del proveedor (ya sin reintentos) acaba en un evento de error, no en un 500
+    monkeypatch.setattr(proveedores_falsos, "FALSO_TASA_429", 1)
+    monkeypatch.setattr(limitador, "LIMITADOR_MAX_REINTENTOS", 0)
+    _, eventos = _eventos(ana, "Otra carrera")
+    assert [e["evento"] for e in eventos] == ["inicio", "error"] and "429" in eventos[-1]["detalle"]
+
+
+def test_stream_y_busqueda_normal_comparten_vuelo(bd, proveedores_falsos, monkeypatch):
+    monkeypatch.setattr(proveedores_falsos, "FALSO_LATENCIA_MS", 100)
+    consultas = _contar_busquedas(proveedores_falsos, monkeypatch)
+
+    async def escenario(primero, segundo):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://racehub") as cliente:
+            peticiones = {
+                "stream": lambda: cliente.post("/carreras/buscar/stream", json={"nombre": MUJER, "forzar_refresco": True}),
+                "normal": lambda: cliente.post("/carreras/buscar", json={"nombre": MUJER, "forzar_refresco": True}),
+            }
+            lider = asyncio.ensure_future(peticiones[primero]())
+            await asyncio.sleep(0.05) # el líder ya está esperando a Tavily
+            return dict(zip((primero, segundo), await asyncio.gather(lider, peticiones[segundo]())))
+
+    for primero, segundo in (("normal", "stream"), ("stream", "normal")):
+        respuestas = asyncio.run(escenario(primero, segundo))
+        eventos = [json.loads(linea) for linea in respuestas["stream"].text.splitlines()]
+        assert eventos[-1]["datos"] == respuestas["normal"].json()
+        # El que llega después espera al vuelo en curso: sin eventos intermedios
+        if primero == "normal":
+            assert [e["evento"] for e in eventos] == ["inicio", "resultado"] and eventos[-1]["origen"] == "agrupada"
+        else:
+            assert "parcial" in {e["evento"] for e in eventos} and eventos[-1]["origen"] == "llm"
+    assert len(consultas) == 2 # una búsqueda por escenario
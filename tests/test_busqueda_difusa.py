@@ -0,0 +1,101 @@
+#Resolución aproximada del nombre de una carrera entre las del usuario
+#(src/busqueda_difusa.py).
+
+import pytest
+
+from src import busqueda_difusa, database
+from src.busqueda_difusa import resolver_carrera, similitud, similitud_palabras, trigramas
+from src.database import SessionLocal, ResultadoDB, UserDB
+from src.main import CarreraSchema, ResultadoSchema, guardar_lote_en_db, guardar_resultado_db
+
+CARRERAS = [
+    ("Zurich Rock 'n' Roll Maratón de Madrid", "2029-04-22"),
+    ("Zurich Rock 'n' Roll Maratón de Madrid", "2030-04-28"),
+    ("Medio Maratón de Madrid", "2030-03-31"),
+    ("Maratón de Valencia Trinidad Alfonso", "2030-12-01"),
+]
+
+
+def _cargar():
+    db = SessionLocal()
+    try:
+        usuarios = [UserDB(nombre_completo=email, email=email) for email in ("ana@x.com", "bea@x.com")]
+        db.add_all(usuarios)
+        db.commit()
+        ana, bea = (u.id for u in usuarios)
+    finally:
+        db.close()
+    lote = [CarreraSchema(nombre_oficial=nombre, deporte="Running", fecha=fecha, lugar="España", distancias=["42 km"],
+                          url_oficial=None, estado_inscripcion="abierta") for nombre, fecha in CARRERAS]
+    guardar_lote_en_db(lote, ana)
+    guardar_lote_en_db([CarreraSchema(nombre_oficial="Behobia - San Sebastián", deporte="Running", fecha="2030-11-09",
+                                      lugar="España", distancias=["20 km"], url_oficial=None, estado_inscripcion="abierta")], bea)
+    return ana, bea
+
+
+def _resolver(user_id, nombre, año=None):
+    db = SessionLocal()
+    try:
+        carrera, puntuacion = resolver_carrera(db, user_id, nombre, año)
+        return (carrera.nombre, carrera.fecha.isoformat()) if carrera else None, puntuacion
+    finally:
+        db.close()
+
+
+def test_trigramas_como_pg_trgm():
+    assert trigramas("Sol") == {"  s", " so", "sol", "ol "}
+    assert trigramas("Maratón") == trigramas("maraton")
+    assert similitud(trigramas("madrid"), trigramas("madrid")) == 1.0
+    assert similitud(set(), trigramas("madrid")) == 0.0
+    # Toda la consulta aparece en un nombre más largo
+    assert similitud_palabras(trigramas("maraton madrid"), trigramas("zurich maraton de madrid")) == 1.0
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def usuarios(request):
+    if request.param == "postgresql":
+        request.getfixturevalue("motor_postgres")
+    else:
+        request.getfixturevalue("motor")
+    database.inicializar_db()
+    return _cargar()
+
+
+def test_nombre_informal_y_edicion_por_año(usuarios):
+    ana, _ = usuarios
+    encontrada, puntuacion = _resolver(ana, "Maraton Madrid", 2030)
+    assert encontrada == ("Zurich Rock 'n' Roll Maratón de Madrid", "2030-04-28")
+    assert puntuacion > 1.0 # parecido + el extra del año
+
+    assert _resolver(ana, "maratón de madrid", 2029)[0][1] == "2029-04-22"
+    assert _resolver(ana, "Medio Maratón Madrid", 2030)[0][0] == "Medio Maratón de Madrid"
+    assert _resolver(ana, "VALENCIA maraton")[0][0] == "Maratón de Valencia Trinidad Alfonso"
+
+
+def test_sin_parecido_o_de_otro_usuario(usuarios):
+    ana, bea = usuarios
+    assert _resolver(ana, "Ultra Trail du Mont Blanc", 2030) == (None, 0.0)
+    assert _resolver(ana, "Behobia San Sebastian", 2030) == (None, 0.0)
+    assert _resolver(bea, "Behobia San Sebastian", 2030)[0][0] == "Behobia - San Sebastián"
+    assert _resolver(ana, "  ¡! ") == (None, 0.0)
+
+
+def test_el_resultado_se_guarda_en_la_edicion_del_año(bd):
+    ana, _ = _cargar()
+    guardar_resultado_db(ResultadoSchema(tiempo_oficial="3:30:00"), "Maraton Madrid", 2029, ana)
+    db = SessionLocal()
+    try:
+        resultado = db.query(ResultadoDB).one()
+        assert resultado.carrera.fecha.isoformat() == "2029-04-22"
+    finally:
+        db.close()
+
+
+def test_umbral_por_debajo_del_de_pg_trgm(usuarios, monkeypatch):
+    _, bea = usuarios
+    # Parecido ~0.26: por debajo del umbral por defecto, por encima de uno de 0.2
+    larga = "behobia san sebastian edicion clasica de noviembre entre irun y donostia por la costa"
+    assert _resolver(bea, larga) == (None, 0.0)
+    monkeypatch.setattr(busqueda_difusa, "SIMILITUD_UMBRAL", 0.2)
+    encontrada, puntuacion = _resolver(bea, larga)
+    assert encontrada == ("Behobia - San Sebastián", "2030-11-09") and 0.2 <= puntuacion < 0.3
@@ -0,0 +1,76 @@
+#Cachés en memoria (CacheLRU) y de extracciones en dos niveles
+#(src/cache.py) delante de buscar_y_extraer_datos.
+
+import asyncio
+from datetime import datetime, timedelta
+
+from src import main
+from src.cache import CacheExtracciones, CacheLRU
+from src.database import SessionLocal, CacheExtraccionDB
+from tests.test_busqueda import _contar_busquedas
+
+
+def test_lru_expulsa_la_menos_usada():
+    cache = CacheLRU(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1 # "b" pasa a ser la menos usada
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.estadisticas() == {"entradas": 2, "max_entradas": 2, "aciertos": 3, "fallos": 1}
+
+
+def test_lru_caduca_e_invalida():
+    cache = CacheLRU(10, ttl_segundos=60)
+    cache.set("vieja", 1, guardado_en=datetime.now() - timedelta(seconds=61))
+    cache.set("nueva", 2)
+    assert cache.get("vieja") is None
+    assert cache.estadisticas()["entradas"] == 1
+    cache.invalidar("nueva")
+    assert cache.get("nueva") is None
+
+
+def test_extracciones_sobreviven_a_la_memoria(bd):
+    cache = CacheExtracciones(10, ttl_horas=24)
+    cache.guardar("valencia|2030", {"nombre_oficial": "Maratón de Valencia"})
+
+    # Otro worker (memoria vacía) la lee de la tabla y la sube a su memoria
+    otro = CacheExtracciones(10, ttl_horas=24)
+    assert otro.obtener("valencia|2030") == {"nombre_oficial": "Maratón de Valencia"}
+    assert otro.memoria.estadisticas()["entradas"] == 1
+
+
+def test_extracciones_caducadas_no_valen(bd):
+    db = SessionLocal()
+    try:
+        db.add(CacheExtraccionDB(clave="vieja", datos="{}", actualizado_en=datetime.now() - timedelta(hours=25)))
+        db.commit()
+    finally:
+        db.close()
+    assert CacheExtracciones(10, ttl_horas=24).obtener("vieja") is None
+
+
+def test_la_busqueda_pasa_por_la_cache(bd, proveedores_falsos, monkeypatch):
+    consultas = _contar_busquedas(proveedores_falsos, monkeypatch)
+    primera = main.buscar_y_extraer_datos("Maratón de Valencia")
+    # Mismo nombre sin tildes ni mayúsculas: misma clave, sin llamar a Tavily
+    assert main.buscar_y_extraer_datos("maraton de VALENCIA") == primera
+    assert len(consultas) == 1
+
+    main.buscar_y_extraer_datos("Maratón de Valencia", forzar_refresco=True)
+    assert len(consultas) == 2
+
+
+def test_un_fallo_asincrono_cuenta_una_vez(bd):
+    cache = CacheExtracciones(10, ttl_horas=24)
+
+    assert asyncio.run(cache.aobtener("nada")) is None
+    assert cache.memoria.estadisticas()["fallos"] == 1
+
+    asyncio.run(cache.aguardar("valencia", {"x": 1}))
+    cache.memoria.limpiar()
+    assert asyncio.run(cache.aobtener("valencia")) == {"x": 1} # de la tabla
+    assert asyncio.run(cache.aobtener("valencia")) == {"x": 1} # ya de memoria
+    assert cache.memoria.estadisticas()["fallos"] == 2
+    assert cache.memoria.estadisticas()["aciertos"] == 1
@@ -0,0 +1,150 @@
+#Catálogo global de carreras (src/catalogo.py): una fila por carrera
+#real, lo que confirma o importa un usuario solo lo ve él, y la
+#extracción y el actualizador refrescan la carrera para todos.
+
+from collections import Counter
+
+from src import catalogo, estadisticas
+from src.database import SessionLocal, RaceDB, CarreraDB, EstadisticaDB
+from src.main import CarreraSchema, guardar_lote_en_db
+
+VALENCIA = {
+    "nombre_oficial": "Maratón de Valencia", "deporte": "Running", "fecha": "2030-12-01", "lugar": "Valencia",
+    "distancias": ["42 km"], "url_oficial": "https://www.valenciaciudaddelrunning.com", "estado_inscripcion": "abierta",
+}
+
+
+def _confirmar(cliente, **cambios):
+    respuesta = cliente.post("/carreras/confirmar", json={**VALENCIA, **cambios})
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()["estado"]
+
+
+def _contadores(db):
+    return sorted((e.user_id, e.dimension, e.clave, e.valor) for e in db.query(EstadisticaDB))
+
+
+def _contadores_cuadran():
+    db = SessionLocal()
+    try:
+        antes = _contadores(db)
+        estadisticas.reconstruir(db)
+        db.commit()
+        return antes == _contadores(db)
+    finally:
+        db.close()
+
+
+def test_dos_usuarios_comparten_una_carrera_del_catalogo(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    assert _confirmar(ana) == "insertada"
+    assert _confirmar(bea, nombre_oficial="Maraton de Valencia") == "insertada"
+    assert _confirmar(bea, nombre_oficial="Maraton de Valencia") == "omitida"
+
+    db = SessionLocal()
+    try:
+        assert db.query(RaceDB).count() == 1
+        assert db.query(CarreraDB).count() == 2
+    finally:
+        db.close()
+    assert _contadores_cuadran()
+
+
+def test_lo_que_confirma_un_usuario_no_cambia_el_calendario_de_otro(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    _confirmar(ana)
+    token = ana.get("/share/token").json()["share_token"]
+    ics_antes = ana.get(f"/share/{token}.ics").text
+
+    # Bea guarda la misma carrera con otra URL y otro lugar
+    assert _confirmar(bea, url_oficial="https://evil.example", lugar="Villa Mala") == "insertada"
+    assert _confirmar(bea, url_oficial="https://evil.example", lugar="Villa Mala", estado_inscripcion="cerrada") == "actualizada"
+
+    # Bea ve lo suyo...
+    [suya] = bea.get("/carreras").json()
+    assert (suya["url_oficial"], suya["localizacion"], suya["estado_inscripcion"]) == (
+        "https://evil.example", "Villa Mala", "cerrada")
+    # ...y Ana, su lista, su calendario compartido y su .ics siguen igual
+    for carreras in (ana.get("/carreras").json(), ana.get(f"/api/share/{token}/carreras").json()):
+        assert [(c["url_oficial"], c["localizacion"]) for c in carreras] == [
+            ("https://www.valenciaciudaddelrunning.com", "Valencia")]
+    ics = ana.get(f"/share/{token}.ics").text
+    assert "evil.example" not in ics and ics == ics_antes
+
+    db = SessionLocal()
+    try:
+        race = db.query(RaceDB).one()
+        assert race.url_oficial is None or "evil" not in race.url_oficial
+    finally:
+        db.close()
+    assert _contadores_cuadran()
+
+
+def test_la_primera_confirmacion_no_publica_sus_datos_en_el_catalogo(clientes):
+    mala, ana = clientes("mala@x.com"), clientes("ana@x.com")
+    _confirmar(mala, url_oficial="https://evil.example", lugar="Villa Mala")
+    # Ana la guarda sin URL: no hereda la de quien la guardó primero
+    _confirmar(ana, url_oficial=None)
+    [carrera] = ana.get("/carreras").json()
+    assert carrera["url_oficial"] is None
+    assert carrera["localizacion"] == "Valencia"
+
+
+def test_la_extraccion_refresca_el_catalogo_para_los_seguidores(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    _confirmar(ana)
+    _confirmar(bea, url_oficial="https://bea.example")
+    db = SessionLocal()
+    try:
+        ana_id = db.query(CarreraDB).order_by(CarreraDB.id).first().user_id
+    finally:
+        db.close()
+
+    # Una búsqueda del servidor (p. ej. /carreras/batch de Ana) completa el catálogo
+    extraida = CarreraSchema(**VALENCIA)
+    assert guardar_lote_en_db([extraida], ana_id, desde_extraccion=True)[0]["estado"] == "omitida"
+    [de_bea] = bea.get("/carreras").json()
+    # Bea había guardado otra URL; la oficial nueva manda
+    assert de_bea["url_oficial"] == "https://www.valenciaciudaddelrunning.com"
+
+    # Bea personaliza el lugar; otra extracción cambia solo la inscripción
+    _confirmar(bea, lugar="Ciutat de les Arts")
+    extraida = CarreraSchema(**{**VALENCIA, "estado_inscripcion": "cerrada"})
+    assert guardar_lote_en_db([extraida], ana_id, desde_extraccion=True)[0]["estado"] == "actualizada"
+
+    [de_ana] = ana.get("/carreras").json()
+    [de_bea] = bea.get("/carreras").json()
+    assert de_ana["estado_inscripcion"] == "cerrada"
+    # Bea ve el estado nuevo y conserva el lugar que guardó ella
+    assert (de_bea["estado_inscripcion"], de_bea["localizacion"]) == ("cerrada", "Ciutat de les Arts")
+    assert _contadores_cuadran()
+
+    # Su .ics se marcó para regenerar y sale ya con el estado nuevo
+    token = bea.get("/share/token").json()["share_token"]
+    assert "Inscripción: cerrada" in bea.get(f"/share/{token}.ics").text
+
+
+def test_aplicar_cambios_solo_ajusta_a_quien_ve_el_cambio(sesion):
+    race = RaceDB(nombre="Behobia", nombre_normalizado="behobia", deporte="Running", estado_inscripcion="abierta")
+    from datetime import date
+    race.fecha = date(2030, 11, 10)
+    sesion.add(race)
+    sesion.flush()
+    sesion.add_all([CarreraDB(user_id=1, race_id=race.id, fecha=race.fecha),
+                    CarreraDB(user_id=2, race_id=race.id, fecha=race.fecha, estado_inscripcion_usuario="cerrada")])
+    sesion.flush()
+
+    # El usuario 2 ya la tenía cerrada: no ve ningún cambio y su dato deja de ser propio
+    assert catalogo.aplicar_cambios(sesion, race, {"estado_inscripcion": "cerrada"}) == [1]
+    assert catalogo.aplicar_cambios(sesion, race, {}) == []
+    enlace = sesion.query(CarreraDB).filter(CarreraDB.user_id == 2).one()
+    assert enlace.estado_inscripcion_usuario is None and enlace.estado_inscripcion == "cerrada"
+
+    # La fecha nueva llega también a la copia que ordena la lista de cada seguidor
+    assert catalogo.aplicar_cambios(sesion, race, {"fecha": date(2030, 11, 17)}) == [1, 2]
+    assert {e.fecha for e in sesion.query(CarreraDB)} == {date(2030, 11, 17)}
+
+    assert catalogo.personalizar(enlace, {"estado_inscripcion": "cerrada"}) is None
+    delta = catalogo.personalizar(enlace, {"deporte": "Trail"})
+    assert delta == Counter({("deporte", "Trail"): 1, ("deporte", "Running"): -1})
+    assert enlace.deporte_usuario == "Trail" and race.deporte == "Running"
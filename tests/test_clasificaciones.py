@@ -0,0 +1,109 @@
+#Índice local de clasificaciones (src/clasificaciones.py): parser de
+#tablas y listados, búsqueda por nombre y una sola descarga por carrera
+#y año.
+
+from datetime import datetime, timedelta
+
+from src import main
+from src.clasificaciones import (
+    buscar_corredor, clave_corredor, guardar_clasificacion, obtener_clasificacion, parsear_clasificacion,
+)
+from src.database import SessionLocal, ClasificacionDB, ClasificacionFilaDB
+
+TABLA = """
+| Pos | Dorsal | Nombre | Categoría | Pos. Cat | Tiempo | Ritmo |
+|---|---|---|---|---|---|---|
+| 1 | 101 | ESPÍN RODRÍGUEZ, Jaime | M-SEN | 1 | 2:31:05 | 3:35/km |
+| 2 | 102 | GARCÍA LÓPEZ, Juan | M-V40 | 1 | 2:40:10 | 3:48/km |
+| total | | | | | | |
+"""
+
+LISTADO_PDF = """CLASIFICACIÓN GENERAL - MARATÓN 2030
+Pos Dorsal Nombre Cat Pos.Cat Tiempo
+1 345 ESPÍN RODRÍGUEZ, Jaime M-SEN 4 3:05:11
+2. 12 MARTÍNEZ RUIZ, Ana F-SEN 1 3:06:40 4:24 min/km
+Página 1 de 12
+"""
+
+
+def test_parsear_tabla():
+    filas = parsear_clasificacion(TABLA)
+    assert filas == [
+        {"nombre": "ESPÍN RODRÍGUEZ, Jaime", "posicion_general": 1, "posicion_categoria": 1, "categoria": "M-SEN",
+         "tiempo": "2:31:05", "ritmo": "3:35/km"},
+        {"nombre": "GARCÍA LÓPEZ, Juan", "posicion_general": 2, "posicion_categoria": 1, "categoria": "M-V40",
+         "tiempo": "2:40:10", "ritmo": "3:48/km"},
+    ]
+
+
+def test_parsear_listado_de_pdf():
+    primera, segunda = parsear_clasificacion(LISTADO_PDF)
+    assert (primera["nombre"], primera["categoria"], primera["posicion_categoria"], primera["tiempo"]) == \
+        ("ESPÍN RODRÍGUEZ, Jaime", "M-SEN", 4, "3:05:11")
+    assert (segunda["posicion_general"], segunda["nombre"], segunda["ritmo"]) == (2, "MARTÍNEZ RUIZ, Ana", "4:24 min/km")
+
+
+def test_buscar_corredor(bd):
+    clasificacion = guardar_clasificacion("Maratón de Valencia", 2030, "https://resultados.example", [
+        {"nombre": nombre, "posicion_general": i, "posicion_categoria": None, "categoria": None,
+         "tiempo": "3:00:00", "ritmo": None}
+        for i, nombre in enumerate(["ESPÍN RODRÍGUEZ, Jaime", "GARCÍA LÓPEZ, Juan", "GARCÍA PÉREZ, Juan"], 1)
+    ])
+    assert clave_corredor("ESPÍN RODRÍGUEZ, Jaime") == clave_corredor("jaime espin rodriguez")
+
+    assert buscar_corredor(clasificacion["id"], "Jaime Espin Rodriguez")["posicion_general"] == 1
+    assert buscar_corredor(clasificacion["id"], "Jaime Espín")["posicion_general"] == 1 # solo parte del nombre
+    assert buscar_corredor(clasificacion["id"], "Juan García") is None # dos candidatos: no se adivina
+    assert buscar_corredor(clasificacion["id"], "Luis Pérez") is None
+    assert buscar_corredor(clasificacion["id"], "") is None
+
+
+def test_guardar_otra_vez_sustituye_las_filas(bd):
+    fila = {"posicion_categoria": None, "categoria": None, "tiempo": "3:00:00", "ritmo": None}
+    primera = guardar_clasificacion("Maratón de Valencia", 2030, None, [
+        dict(fila, nombre=nombre, posicion_general=i) for i, nombre in enumerate(["Ana Ruiz", "Juan Gil"], 1)
+    ])
+    segunda = guardar_clasificacion("Maratón de Valencia", 2030, "https://resultados.example",
+                                    [dict(fila, nombre="Luis Pérez", posicion_general=1)])
+
+    assert segunda["id"] == primera["id"]
+    db = SessionLocal()
+    try:
+        # Una cabecera y solo las filas nuevas: ninguna de la anterior queda huérfana
+        assert db.query(ClasificacionDB).one().url_fuente == "https://resultados.example"
+        assert [f.nombre for f in db.query(ClasificacionFilaDB)] == ["Luis Pérez"]
+    finally:
+        db.close()
+    assert obtener_clasificacion("Maratón de Valencia", 2030)["num_filas"] == 1
+
+
+def test_una_descarga_para_todo_el_club(bd, proveedores_falsos, monkeypatch):
+    extracciones = []
+    original = proveedores_falsos.respuesta_extract
+    monkeypatch.setattr(proveedores_falsos, "respuesta_extract", lambda urls, **kw: extracciones.append(urls) or original(urls, **kw))
+
+    juan = main.buscar_resultado_usuario("Maratón de Valencia", 2030, "Juan García López")
+    ana = main.buscar_resultado_usuario("maraton de valencia", 2030, "Ana Martínez Ruiz")
+    assert (juan.tiempo_oficial, juan.posicion_general, juan.posicion_categoria) == ("2:13:40", 1, 1)
+    assert (ana.tiempo_oficial, ana.posicion_general) == ("2:14:00", 2)
+    assert len(extracciones) == 1
+    assert obtener_clasificacion("Maratón de Valencia", 2030)["num_filas"] == 300
+
+    # Quien no está en el listado se busca en la web + LLM, sin volver a descargarlo
+    otro = main.buscar_resultado_usuario("Maratón de Valencia", 2030, "Nadie Conocido")
+    assert otro.tiempo_oficial == "3:05:11" and len(extracciones) == 1
+
+
+def test_descarga_fallida_se_recuerda(bd, proveedores_falsos, monkeypatch):
+    monkeypatch.setattr(proveedores_falsos, "respuesta_extract", lambda urls, **kw: {"results": [], "failed_results": urls})
+    main.buscar_resultado_usuario("Trail de Guara", 2030, "Juan García López")
+    assert obtener_clasificacion("Trail de Guara", 2030)["num_filas"] == 0
+
+    # Pasado CLASIFICACION_REINTENTO_HORAS se vuelve a intentar
+    db = SessionLocal()
+    try:
+        db.query(ClasificacionDB).update({ClasificacionDB.descargada_en: datetime.now() - timedelta(hours=25)})
+        db.commit()
+    finally:
+        db.close()
+    assert obtener_clasificacion("Trail de Guara", 2030) is None
@@ -0,0 +1,153 @@
+#Calendario público compartido (src/compartir.py): caché por token con
+#ETag/Last-Modified y respuestas 304, y la suscripción .ics precalculada.
+
+from email.utils import format_datetime
+
+from src import compartir
+from src.database import CalendarioIcsDB
+from tests.test_catalogo import _confirmar
+
+
+def _compartir(cliente):
+    return cliente.get("/share/token").json()["share_token"]
+
+
+def test_feed_con_etag_y_304(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    token = _compartir(ana)
+
+    respuesta = ana.get(f"/api/share/{token}/carreras")
+    assert respuesta.status_code == 200
+    assert [c["nombre"] for c in respuesta.json()] == ["Maratón de Valencia"]
+    etag, modificado = respuesta.headers["etag"], respuesta.headers["last-modified"]
+    assert respuesta.headers["cache-control"] == "public, max-age=0, must-revalidate"
+
+    otra = ana.get(f"/api/share/{token}/carreras", headers={"If-None-Match": etag})
+    assert (otra.status_code, otra.content) == (304, b"")
+    assert otra.headers["etag"] == etag
+    assert ana.get(f"/api/share/{token}/carreras", headers={"If-None-Match": f'W/{etag}, "otro"'}).status_code == 304
+    assert ana.get(f"/api/share/{token}/carreras", headers={"If-Modified-Since": modificado}).status_code == 304
+    # If-None-Match manda aunque la fecha coincida
+    assert ana.get(f"/api/share/{token}/carreras",
+                   headers={"If-None-Match": '"otro"', "If-Modified-Since": modificado}).status_code == 200
+
+
+def test_el_feed_cambia_al_cambiar_las_carreras(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    token = _compartir(ana)
+    etag = ana.get(f"/api/share/{token}/carreras").headers["etag"]
+    assert compartir.cache_compartidos.estadisticas()["entradas"] == 1
+    # El índice usuario -> token también está acotado
+    assert compartir._token_por_usuario.estadisticas()["entradas"] == 1
+    assert compartir._token_por_usuario.estadisticas()["max_entradas"] == 2 * compartir.COMPARTIR_CACHE_MAX
+
+    _confirmar(ana, nombre_oficial="Behobia - San Sebastián", fecha="2030-11-09", lugar="Donostia")
+    respuesta = ana.get(f"/api/share/{token}/carreras", headers={"If-None-Match": etag})
+    assert respuesta.status_code == 200 and respuesta.headers["etag"] != etag
+    assert [c["nombre"] for c in respuesta.json()] == ["Behobia - San Sebastián", "Maratón de Valencia"]
+
+    carrera_id = respuesta.json()[0]["id"]
+    assert ana.delete(f"/carreras/{carrera_id}").status_code == 200
+    assert [c["nombre"] for c in ana.get(f"/api/share/{token}/carreras").json()] == ["Maratón de Valencia"]
+
+
+def test_la_pagina_publica_lleva_el_listado(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana, nombre_oficial="Carrera </script><script>alert(1)</script>")
+    token = _compartir(ana)
+
+    html = ana.get(f"/share/{token}").text
+    assert "ana" in html
+    assert "</script><script>alert(1)" not in html # escapado dentro del <script>
+    assert r"\u003c/script\u003e" in html
+
+
+def test_usuario_sin_carreras_y_token_desconocido(clientes):
+    ana = clientes("ana@x.com")
+    token = _compartir(ana)
+    assert ana.get(f"/api/share/{token}/carreras").json() == []
+    assert ana.get("/api/share/no-existe/carreras").status_code == 404
+    assert ana.get("/share/no-existe").status_code == 404
+
+
+def test_fecha_antigua_no_da_304(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    token = _compartir(ana)
+    feed = compartir.obtener_feed(token)
+    antes = format_datetime(feed["last_modified"].replace(year=2000), usegmt=True)
+    assert ana.get(f"/api/share/{token}/carreras", headers={"If-Modified-Since": antes}).status_code == 200
+    assert ana.get(f"/api/share/{token}/carreras", headers={"If-Modified-Since": "no es una fecha"}).status_code == 200
+
+
+#--- Suscripción .ics (calendarios_ics precalculados) ---
+
+def _ics(cliente, token, **cabeceras):
+    return cliente.get(f"/share/{token}.ics", headers=cabeceras)
+
+
+def test_ics_con_un_evento_por_carrera(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    _confirmar(ana, nombre_oficial="Trail; Montes, Valles", fecha="2030-06-09", lugar="Alquézar", distancias=["42 km", "21 km"])
+    token = _compartir(ana)
+
+    respuesta = _ics(ana, token)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == "text/calendar; charset=utf-8"
+    ics = respuesta.text
+    assert ics.startswith("BEGIN:VCALENDAR\r\n") and ics.endswith("END:VCALENDAR\r\n")
+    assert ics.count("BEGIN:VEVENT") == 2
+    desplegado = ics.replace("\r\n ", "")
+    assert "SUMMARY:Trail\\; Montes\\, Valles\r\n" in desplegado
+    assert "DTSTART;VALUE=DATE:20301201\r\nDTEND;VALUE=DATE:20301202\r\n" in desplegado
+    assert "DESCRIPTION:Deporte: Running\\nDistancias: 42 km\\, 21 km\\nInscripción: abierta" in desplegado
+    # Orden por fecha: primero el trail de junio
+    assert ics.index("Trail") < ics.index("Maratón de Valencia")
+    assert all(len(linea.encode("utf-8")) <= 75 for linea in ics.split("\r\n"))
+
+    assert _ics(ana, token, **{"If-None-Match": respuesta.headers["etag"]}).status_code == 304
+    assert _ics(ana, "no-existe").status_code == 404
+
+
+def test_lineas_largas_se_pliegan():
+    linea = compartir._plegar("SUMMARY:" + "á" * 80)
+    trozos = linea.split("\r\n")
+    assert len(trozos) == 3 and all(t.startswith(" ") for t in trozos[1:])
+    assert all(len(t.encode("utf-8")) <= 75 for t in trozos)
+    assert "".join(t.removeprefix(" ") for t in trozos) == "SUMMARY:" + "á" * 80
+
+
+def test_ics_se_renderiza_al_cambiar_y_no_al_leer(clientes, monkeypatch):
+    ana = clientes("ana@x.com")
+    token = _compartir(ana)
+    _confirmar(ana)
+    primero = _ics(ana, token)
+
+    renderizados = []
+    original = compartir.renderizar_ics
+    monkeypatch.setattr(compartir, "renderizar_ics", lambda *a: renderizados.append(1) or original(*a))
+    compartir.cache_ics.limpiar()
+    for _ in range(3):
+        assert _ics(ana, token).text == primero.text # leído de calendarios_ics
+    assert renderizados == []
+
+    assert ana.post("/perfil", json={"nombre_completo": "Ana García"}).status_code == 200
+    assert renderizados == [1]
+    nuevo = _ics(ana, token, **{"If-None-Match": primero.headers["etag"]})
+    assert nuevo.status_code == 200 and "X-WR-CALNAME:Carreras de Ana García" in nuevo.text
+
+
+def test_ics_borrado_se_genera_al_pedirlo(clientes, sesion):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    token = _compartir(ana)
+    sesion.query(CalendarioIcsDB).delete()
+    sesion.commit()
+    compartir.cache_ics.limpiar()
+
+    ics = _ics(ana, token)
+    assert ics.status_code == 200 and "Maratón de Valencia" in ics.text
+    assert sesion.query(CalendarioIcsDB).count() == 1
@@ -0,0 +1,62 @@
+#Selección del contexto que se manda al LLM (src/contexto.py): troceado,
+#duplicados, puntuación y presupuesto de tokens.
+
+from src.contexto import (
+    CONTEXTO_TOKENS_CARRERA, CONTEXTO_TOKENS_RESULTADO, DetectorDuplicados, contexto_carrera, contexto_resultado,
+    estimar_tokens, trocear,
+)
+from src.proveedores_falsos import _clasificacion
+
+RELLENO = "Texto de relleno de la noticia sin nada útil. " * 10
+NOTA = "La Maratón de Valencia se celebrará el 1 de diciembre de 2030 con salida en la Ciudad de las Artes."
+
+
+def test_trocear():
+    texto = "\n".join(["línea corta"] * 10 + ["x" * 1500] + ["", "final"])
+    fragmentos = trocear(texto, tamano=100)
+    assert all(len(f) <= 100 for f in fragmentos)
+    assert fragmentos[0] == "\n".join(["línea corta"] * 8)
+    assert "".join(f for f in fragmentos if f.startswith("x")) == "x" * 1500
+    assert fragmentos[-1] == "final"
+    assert trocear(None) == []
+
+
+def test_duplicados_casi_iguales():
+    detector = DetectorDuplicados(umbral=0.8)
+    assert not detector.es_duplicado(NOTA)
+    assert detector.es_duplicado(NOTA.upper() + " ")
+    assert detector.es_duplicado(NOTA.replace("Artes.", "Artes y las Ciencias."))
+    assert not detector.es_duplicado("Inscripciones abiertas hasta el 15 de noviembre, plazas limitadas a 30.000.")
+
+
+def test_contexto_de_carrera_con_lo_relevante_y_en_orden():
+    resultados = [
+        {"url": "https://a.example", "content": NOTA + "\n" + RELLENO * 2},
+        {"url": "https://b.example", "content": NOTA.replace("Artes.", "Artes y las Ciencias.")}, # nota copiada
+        {"url": "https://c.example", "content": "Distancias: 42 km y 10K. Inscripción abierta.\n" + RELLENO * 40},
+    ]
+    contexto = contexto_carrera(resultados, "Maratón de Valencia", 2030)
+
+    assert contexto.count("se celebrará el 1 de diciembre") == 1
+    assert "relleno" not in contexto
+    assert "Distancias: 42 km y 10K" in contexto
+    assert contexto.index(NOTA) < contexto.index("Distancias") # orden original de las fuentes
+    assert estimar_tokens(contexto) <= CONTEXTO_TOKENS_CARRERA
+    assert estimar_tokens(contexto) < sum(estimar_tokens(r["content"]) for r in resultados) // 4
+
+
+def test_contexto_de_resultado_encuentra_al_corredor():
+    # Miles de filas: solo cabe una parte, y tiene que ser la del corredor
+    filas = _clasificacion(3000).splitlines()
+    filas[2500] = "| 2500 | 3500 | ESPÍN RUIZ, Jaime | M-SEN | 300 | 3:25:12 |"
+    resultados = [
+        {"url": "https://resultados.example/valencia", "title": "Clasificación Maratón Valencia 2030",
+         "content": "\n".join(filas)},
+        {"url": "https://noticias.example", "title": "Crónica", "content": RELLENO},
+    ]
+    contexto = contexto_resultado(resultados, "Maratón de Valencia", 2030, "Jaime Espín")
+
+    assert contexto.startswith("--- FUENTE: https://resultados.example/valencia ---\nTÍTULO: Clasificación")
+    assert "ESPÍN RUIZ, Jaime | M-SEN | 300 | 3:25:12" in contexto
+    assert estimar_tokens(contexto) <= CONTEXTO_TOKENS_RESULTADO
+    assert len(contexto) < len(resultados[0]["content"]) // 5
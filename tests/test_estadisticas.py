@@ -0,0 +1,82 @@
+#Panel /stats a partir de los contadores de estadisticas_usuario
+#(src/estadisticas.py): cada escritura los ajusta y siempre cuadran con
+#recalcularlos desde cero.
+
+from datetime import date
+
+from src import estadisticas
+from src.database import SessionLocal, EstadisticaDB
+from src.main import ResultadoSchema, guardar_resultado_db
+from tests.test_catalogo import _confirmar, _contadores_cuadran
+from tests.test_trabajos import _usuario
+
+
+def test_panel_tras_guardar_actualizar_y_borrar(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    _confirmar(ana, nombre_oficial="Trail de Guara", deporte="Trail", fecha="2030-06-09", estado_inscripcion="pendiente")
+    _confirmar(ana, nombre_oficial="Behobia", fecha="2029-11-09", estado_inscripcion="cerrada")
+    # Cambia la inscripción: sale de "cerrada" y cuenta como abierta
+    assert _confirmar(ana, nombre_oficial="Behobia", fecha="2029-11-09", estado_inscripcion="abierta") == "actualizada"
+    guardar_resultado_db(ResultadoSchema(tiempo_oficial="3:10:00"), "Maratón de Valencia", 2030, _usuario())
+    guardar_resultado_db(ResultadoSchema(tiempo_oficial="3:05:00"), "Maratón de Valencia", 2030, _usuario())
+
+    panel = ana.get("/stats").json()
+    assert panel["carreras"] == 3
+    assert panel["por_deporte"] == {"Running": 2, "Trail": 1}
+    assert panel["por_anio"] == {"2029": 1, "2030": 2}
+    assert list(panel["por_mes"]) == ["2029-11", "2030-06", "2030-12"]
+    assert panel["inscripciones_abiertas"] == 2
+    assert panel["resultados"] == {"total": 2, "carreras_con_resultado": 1, "cobertura": 0.333}
+    assert _contadores_cuadran()
+
+    valencia = next(c for c in ana.get("/carreras").json() if c["nombre"] == "Maratón de Valencia")
+    assert ana.delete(f"/carreras/{valencia['id']}").status_code == 200
+    panel = ana.get("/stats").json()
+    assert panel["carreras"] == 2 and panel["por_deporte"] == {"Running": 1, "Trail": 1}
+    assert panel["resultados"] == {"total": 0, "carreras_con_resultado": 0, "cobertura": 0.0}
+    assert _contadores_cuadran()
+
+    # Los contadores a cero no se quedan en la tabla
+    db = SessionLocal()
+    try:
+        assert db.query(EstadisticaDB).filter(EstadisticaDB.valor <= 0).count() == 0
+    finally:
+        db.close()
+
+
+def test_las_inscripciones_de_carreras_pasadas_no_cuentan(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana, fecha="2020-03-01")
+    _confirmar(ana, nombre_oficial="Otra", fecha="2030-03-01")
+    db = SessionLocal()
+    try:
+        assert estadisticas.resumen(db, _usuario())["inscripciones_abiertas"] == 1
+        assert estadisticas.resumen(db, _usuario(), hoy=date(2019, 1, 1))["inscripciones_abiertas"] == 2
+    finally:
+        db.close()
+
+
+def test_cada_usuario_ve_sus_contadores(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    _confirmar(ana)
+    assert bea.get("/stats").json()["carreras"] == 0
+    _confirmar(bea)
+    assert ana.get("/stats").json()["carreras"] == bea.get("/stats").json()["carreras"] == 1
+    ana.post("/auth/logout")
+    ana.cookies.clear()
+    assert ana.get("/stats").status_code == 401
+
+
+def test_reconstruir_repara_contadores_perdidos(clientes):
+    ana = clientes("ana@x.com")
+    _confirmar(ana)
+    antes = ana.get("/stats").json()
+    db = SessionLocal()
+    try:
+        db.query(EstadisticaDB).delete()
+        db.commit()
+        estadisticas.inicializar_estadisticas(db)
+    finally:
+        db.close()
+    assert ana.get("/stats").json() == antes
@@ -0,0 +1,85 @@
+#Ficheros estáticos con hash en el nombre y comprimidos de antemano
+#(src/estaticos.py).
+
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from src.estaticos import CACHE_INMUTABLE, ActivosEstaticos, _preferida
+
+SCRIPT = b"console.log('racehub');\n" * 200
+
+
+@pytest.fixture
+def activos(tmp_path):
+    (tmp_path / "script.js").write_bytes(SCRIPT)
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "estilo.css").write_bytes(b"body { margin: 0 }\n" * 100)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(range(256)))
+    return ActivosEstaticos(tmp_path)
+
+
+@pytest.fixture
+def cliente(activos):
+    return TestClient(Starlette(routes=[Mount("/static", app=activos)]))
+
+
+def test_urls_con_hash(activos):
+    huella = hashlib.sha256(SCRIPT).hexdigest()[:12]
+    assert activos.url("script.js") == f"/static/script.{huella}.js"
+    assert activos.manifiesto()["css/estilo.css"].startswith("css/estilo.")
+    assert activos.url("no-existe.js") == "/static/no-existe.js"
+
+
+def test_gzip_inmutable_y_304(activos, cliente):
+    url = activos.url("script.js")
+    respuesta = cliente.get(url, headers={"Accept-Encoding": "gzip"})
+    assert respuesta.status_code == 200
+    assert respuesta.content == SCRIPT # httpx lo descomprime
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["cache-control"] == CACHE_INMUTABLE
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+    assert respuesta.headers["content-type"].startswith(("application/javascript", "text/javascript"))
+    assert int(respuesta.headers["content-length"]) < len(SCRIPT)
+
+    sin_comprimir = cliente.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in sin_comprimir.headers
+    assert sin_comprimir.headers["etag"] != respuesta.headers["etag"] # bytes distintos, ETag distinto
+
+    assert cliente.get(url, headers={"If-None-Match": respuesta.headers["etag"]}).status_code == 304
+    cabeza = cliente.head(url, headers={"Accept-Encoding": "gzip"})
+    assert cabeza.status_code == 200 and cabeza.headers["content-length"] == respuesta.headers["content-length"]
+
+
+def test_imagenes_sin_comprimir_y_rutas_sin_hash(activos, cliente):
+    imagen = cliente.get(activos.url("logo.png"), headers={"Accept-Encoding": "gzip"})
+    assert imagen.status_code == 200 and "content-encoding" not in imagen.headers
+
+    # Las rutas antiguas siguen respondiendo, sin caché inmutable
+    antigua = cliente.get("/static/script.js")
+    assert antigua.status_code == 200 and antigua.content == SCRIPT
+    assert antigua.headers.get("cache-control") != CACHE_INMUTABLE
+    assert cliente.get("/static/no-existe.js").status_code == 404
+
+
+@pytest.mark.parametrize("cabecera, esperada", [
+    ("gzip, deflate, br", "br"),
+    ("gzip;q=0.5, br;q=0", "gzip"),
+    ("*", "br"),
+    ("br;q=0, gzip;q=0", "identity"),
+    ("", "identity"),
+    ("gzip;q=abc", "identity"),
+])
+def test_codificacion_preferida(cabecera, esperada):
+    assert _preferida(cabecera, {"identity": b"", "gzip": b"", "br": b""}) == esperada
+
+
+def test_las_plantillas_enlazan_la_version_con_hash(clientes):
+    from src.api import activos_estaticos
+
+    html = clientes("ana@x.com").get("/").text
+    assert activos_estaticos.url("script.js") in html
+    assert 'src="/static/script.js"' not in html
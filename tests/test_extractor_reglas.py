@@ -0,0 +1,117 @@
+#Extractor por reglas con fragmentos como los que devuelve Tavily: la
+#confianza tiene que bajar cuando la evidencia es débil (una fecha que es
+#la de inscripción o publicación, un "ciclistas" suelto en una crónica).
+
+from datetime import date
+
+from src.extractor_reglas import (
+    EXTRACTOR_REGLAS_UMBRAL, extraer_carrera, extraer_deporte, extraer_fecha, extraer_lugar,
+)
+from src.proveedores_falsos import respuesta_search
+from src.texto import normalizar_texto
+
+AÑO = 2035
+
+
+def _resultado(content, title="", url="https://noticias.example.com/1"):
+    return {"url": url, "title": title, "content": content, "score": 0.5}
+
+
+# --- Fecha ---
+def test_fecha_anclada_a_la_carrera_es_segura():
+    fecha, confianza = extraer_fecha("El Maratón de Valencia se celebrará el domingo 2 de diciembre de 2035.", AÑO)
+    assert fecha == date(2035, 12, 2)
+    assert confianza >= 0.8
+
+
+def test_fecha_de_inscripcion_no_es_la_de_la_carrera():
+    texto = ("Maratón de Sevilla: inscripciones abiertas hasta el 15 de enero de 2035. "
+             "La carrera tendrá lugar el 18 de febrero de 2035 con salida en el Estadio de La Cartuja.")
+    fecha, confianza = extraer_fecha(texto, AÑO)
+    assert fecha == date(2035, 2, 18)
+    assert confianza >= 0.8
+
+    # Solo el plazo de inscripción: no hay fecha de carrera
+    assert extraer_fecha("Fecha límite de inscripción: 15 de enero de 2035. Plazas limitadas.", AÑO) == (None, 0.0)
+
+
+def test_fecha_de_publicacion_no_cuenta():
+    texto = "Publicado el 3 de marzo de 2035. Cortes de tráfico en el centro por la prueba del domingo."
+    assert extraer_fecha(texto, AÑO) == (None, 0.0)
+
+
+def test_fecha_suelta_tiene_poca_confianza():
+    fecha, confianza = extraer_fecha("Fotos y vídeos | 14 de junio de 2035 | Galería", AÑO)
+    assert fecha == date(2035, 6, 14)
+    assert confianza < 0.5
+
+
+def test_fechas_repetidas_en_contexto_de_carrera_ganan():
+    texto = ("Recogida de dorsales el 10 de abril de 2035 en la feria del corredor. "
+             "Salida el 11 de abril de 2035 a las 9:00. La prueba del 11 de abril de 2035 cierra la temporada.")
+    fecha, confianza = extraer_fecha(texto, AÑO)
+    assert fecha == date(2035, 4, 11)
+    assert confianza == 1.0
+
+
+# --- Deporte ---
+def test_deporte_por_palabras_completas_y_frecuencia():
+    texto = normalizar_texto("Crónica del Maratón de Valencia: miles de corredores, cortes de tráfico para "
+                             "ciclistas y un recorrido rápido con apenas 20 metros de desnivel.")
+    deporte, confianza = extraer_deporte(texto, "Maratón de Valencia")
+    assert deporte == "Running"
+    assert confianza > 0.8
+
+
+def test_una_mencion_ambigua_no_da_confianza():
+    deporte, confianza = extraer_deporte(normalizar_texto("Aparcamiento para bicicletas junto a la salida."))
+    assert deporte == "Ciclismo"
+    assert confianza < 0.2
+    # "kilómetros" no dice el deporte (antes "km" contaba como running)
+    assert extraer_deporte(normalizar_texto("Recorrido de 15 kilómetros por la ciudad.")) == (None, 0.0)
+
+
+def test_trail_running_es_trail():
+    deporte, _ = extraer_deporte(normalizar_texto("Ultra trail de montaña, la cita del trail running del año."))
+    assert deporte == "Trail"
+
+
+# --- Lugar ---
+def test_lugar_sacado_del_nombre_es_solo_una_suposicion():
+    assert extraer_lugar("Salida: Plaza Mayor de Burgos", "Carrera de Burgos") == ("Plaza Mayor de Burgos", 1.0)
+    lugar, confianza = extraer_lugar("Recorrido rápido y llano.", "Media Maratón de Getafe")
+    assert lugar == "Getafe" and confianza < 0.6
+
+
+# --- Carrera completa ---
+def test_noticia_con_fecha_de_inscripcion_no_se_resuelve_sin_llm():
+    resultados = [_resultado(
+        "Abiertas las inscripciones para la Media Maratón de Getafe hasta el 20 de enero de 2035. "
+        "Distancias: 21K y 10K. Los ciclistas podrán seguir la carrera.",
+        title="Noticias Media Maratón de Getafe",
+    )]
+    _, confianza = extraer_carrera(resultados, "Media Maratón de Getafe", AÑO)
+    assert confianza < EXTRACTOR_REGLAS_UMBRAL
+
+
+def test_web_oficial_clara_se_resuelve_sin_llm():
+    resultados = [_resultado(
+        "El Trail de Guara se celebrará el sábado 9 de junio de 2035. Salida: Alquézar. "
+        "Distancias: 42 km y 21 km con 2.500 m de desnivel positivo. Inscripciones abiertas.",
+        title="Trail de Guara 2035 - Web oficial", url="https://www.trailguara.com/",
+    )]
+    datos, confianza = extraer_carrera(resultados, "Trail de Guara", AÑO)
+    assert confianza >= EXTRACTOR_REGLAS_UMBRAL
+    assert datos["fecha"] == "2035-06-09"
+    assert datos["deporte"] == "Trail"
+    assert datos["lugar"] == "Alquézar"
+    assert datos["estado_inscripcion"] == "abierta"
+
+
+def test_resultados_falsos_claros_siguen_saliendo_por_reglas():
+    nombre = "Carrera de Prueba 2" # "clara" en proveedores_falsos
+    año = date.today().year
+    resultados = respuesta_search(f"{nombre} {año} fecha")["results"]
+    assert "se celebrará" in resultados[0]["content"]
+    datos, confianza = extraer_carrera(resultados, nombre, año)
+    assert datos is not None and confianza >= EXTRACTOR_REGLAS_UMBRAL
@@ -0,0 +1,82 @@
+#Guardado de carreras por lotes (upsert_carreras en src/main.py): estado
+#de cada fila, sentencias que no crecen con el lote y todo o nada.
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from src import main
+from src.database import SessionLocal, CarreraDB, RaceDB, UserDB
+from src.main import CarreraSchema, guardar_lote_en_db
+from tests.test_catalogo import VALENCIA
+
+
+def _carrera(**cambios):
+    return CarreraSchema(**{**VALENCIA, **cambios})
+
+
+def _usuario(sesion, email="ana@x.com"):
+    usuario = UserDB(nombre_completo=email, email=email)
+    sesion.add(usuario)
+    sesion.commit()
+    return usuario.id
+
+
+def test_estado_de_cada_carrera_del_lote(sesion):
+    ana = _usuario(sesion)
+    estados = guardar_lote_en_db([_carrera(), _carrera(nombre_oficial="MARATON DE VALENCIA"),
+                                  _carrera(nombre_oficial="Behobia", fecha="2030-11-09")], ana)
+    assert [e["estado"] for e in estados] == ["insertada", "omitida", "insertada"]
+
+    estados = guardar_lote_en_db([_carrera(), _carrera(nombre_oficial="Behobia", fecha="2030-11-09", lugar="Irun"),
+                                  _carrera(nombre_oficial="Nueva", fecha="2030-05-05")], ana)
+    assert [(e["nombre"], e["estado"]) for e in estados] == [
+        ("Maratón de Valencia", "omitida"), ("Behobia", "actualizada"), ("Nueva", "insertada")]
+    assert sesion.query(CarreraDB).count() == 3
+
+
+def _sentencias(motor, funcion):
+    sentencias = []
+    escuchar = lambda conexion, cursor, sql, *args: sentencias.append(sql.split()[0].upper())
+    event.listen(motor, "before_cursor_execute", escuchar)
+    try:
+        funcion()
+    finally:
+        event.remove(motor, "before_cursor_execute", escuchar)
+    return sentencias
+
+
+def test_las_sentencias_no_crecen_con_el_lote(bd, sesion):
+    ana = _usuario(sesion)
+    lote = lambda n, año: [_carrera(nombre_oficial=f"Carrera {i}", fecha=f"{año}-03-{i % 28 + 1:02d}") for i in range(n)]
+
+    pocas = _sentencias(bd, lambda: guardar_lote_en_db(lote(3, 2030), ana))
+    muchas = _sentencias(bd, lambda: guardar_lote_en_db(lote(60, 2031), ana))
+    assert len(muchas) == len(pocas)
+    assert muchas.count("INSERT") == pocas.count("INSERT")
+    assert sesion.query(CarreraDB).count() == 63
+
+
+def test_un_enlace_por_usuario_y_carrera(sesion):
+    ana = _usuario(sesion)
+    guardar_lote_en_db([_carrera()], ana)
+    race_id = sesion.query(RaceDB.id).scalar()
+    sesion.add(CarreraDB(user_id=ana, race_id=race_id))
+    with pytest.raises(IntegrityError):
+        sesion.commit()
+
+
+def test_el_lote_es_todo_o_nada(sesion, monkeypatch):
+    ana = _usuario(sesion)
+
+    def fallar(db, user_id):
+        raise RuntimeError("fallo a mitad del lote")
+    monkeypatch.setattr(main, "calendario_modificado", fallar)
+    with pytest.raises(RuntimeError):
+        guardar_lote_en_db([_carrera(), _carrera(nombre_oficial="Behobia", fecha="2030-11-09")], ana)
+
+    db = SessionLocal()
+    try:
+        assert db.query(CarreraDB).count() == 0 and db.query(RaceDB).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,163 @@
+#Importación y exportación en CSV/NDJSON (src/intercambio.py): ida y
+#vuelta, errores por fila y que importar no cambia el catálogo que ven
+#los demás.
+
+import csv
+import io
+import json
+
+import pytest
+
+from src import database, intercambio
+from src.database import SessionLocal, RaceDB, ResultadoDB, UserDB
+from src.main import CarreraSchema, guardar_lote_en_db
+from src.metricas import registro
+
+CSV = """nombre,deporte,fecha,localizacion,distancia_resumen,url_oficial,estado_inscripcion,tiempo_oficial,posicion_general,ritmo_medio,comentarios
+Maratón de Valencia,Running,2030-12-01,Valencia,42 km,https://valencia.example,abierta,3:10:00,1500,4:30 min/km,PB
+Behobia - San Sebastián,Running,2030-11-09,Donostia,20 km,,cerrada,1h35m,,,
+Trail de Guara,Trail,2030-06-09,Alquézar,"42 km, 21 km",,pendiente,,,,
+Sin fecha,Running,,Madrid,10 km,,pendiente,,,,
+Maraton de Valencia,Running,2030-12-01,Valencia,42 km,,abierta,,,,
+"""
+
+
+def _exportar(cliente, formato):
+    respuesta = cliente.get("/carreras/exportar", params={"formato": formato})
+    assert respuesta.status_code == 200
+    return respuesta.content.decode("utf-8-sig")
+
+
+def _importar(cliente, cuerpo, formato="csv"):
+    respuesta = cliente.post("/carreras/importar", params={"formato": formato}, content=cuerpo.encode("utf-8"))
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()
+
+
+def _sin_ids(texto):
+    return [{k: v for k, v in fila.items() if k != "carrera_id"} for fila in csv.DictReader(io.StringIO(texto))]
+
+
+def _usuario(email):
+    db = SessionLocal()
+    try:
+        return db.query(UserDB.id).filter(UserDB.email == email).scalar()
+    finally:
+        db.close()
+
+
+def _catalogo(nombre_normalizado="maraton de valencia"):
+    db = SessionLocal()
+    try:
+        return db.query(RaceDB).filter(RaceDB.nombre_normalizado == nombre_normalizado).one()
+    finally:
+        db.close()
+
+
+def _nuevas_y_existentes():
+    contadores = registro._contadores
+    return tuple(contadores.get(("racehub_catalogo_carreras_total", (("origen", origen),)), 0)
+                 for origen in ("nueva", "existente"))
+
+
+def test_importar_informa_errores_y_repetidas(clientes):
+    resumen = _importar(clientes("ana@x.com"), CSV)
+
+    assert resumen["filas"] == 5
+    assert (resumen["insertadas"], resumen["omitidas"], resumen["errores"]) == (3, 1, 1)
+    assert resumen["resultados"] == 2
+    assert resumen["detalle_errores"][0]["linea"] == 5 and "fecha" in resumen["detalle_errores"][0]["error"]
+
+    db = SessionLocal()
+    try:
+        tiempos = sorted(r.tiempo_segundos for r in db.query(ResultadoDB))
+        assert tiempos == [5700, 11400]
+    finally:
+        db.close()
+
+    # Otra vez el mismo fichero: nada nuevo, ni resultados repetidos
+    otra = _importar(clientes("ana@x.com"), CSV)
+    assert (otra["insertadas"], otra["resultados"]) == (0, 0)
+
+
+@pytest.mark.parametrize("formato", ["csv", "ndjson"])
+def test_ida_y_vuelta(clientes, formato):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    _importar(ana, CSV)
+    exportado = _exportar(ana, formato)
+
+    resumen = _importar(bea, exportado, formato)
+    assert (resumen["insertadas"], resumen["resultados"], resumen["errores"]) == (3, 2, 0)
+
+    de_ana, de_bea = _exportar(ana, "csv"), _exportar(bea, "csv")
+    assert _sin_ids(de_ana) == _sin_ids(de_bea)
+    filas = _sin_ids(de_ana)
+    assert [f["fecha"] for f in filas] == ["2030-06-09", "2030-11-09", "2030-12-01"]
+    valencia = filas[-1]
+    assert (valencia["url_oficial"], valencia["tiempo_oficial"], valencia["posicion_general"]) == \
+        ("https://valencia.example", "3:10:00", "1500")
+    if formato == "ndjson":
+        primera = json.loads(exportado.splitlines()[0])
+        assert primera["nombre"] == "Trail de Guara" and primera["distancia_resumen"] == "42 km, 21 km"
+
+
+def test_importar_no_cambia_el_catalogo_de_los_demas(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    # Ana la tiene por una búsqueda (datos oficiales del catálogo)
+    oficial = CarreraSchema(nombre_oficial="Maratón de Valencia", deporte="Running", fecha="2030-12-01",
+                            lugar="Valencia", distancias=["42 km"], url_oficial="https://valencia.example",
+                            estado_inscripcion="abierta")
+    guardar_lote_en_db([oficial], _usuario("ana@x.com"), desde_extraccion=True)
+
+    # Bea importa la misma carrera con otra URL y otra carrera que no existía
+    _importar(bea, "nombre,deporte,fecha,localizacion,distancia_resumen,url_oficial,estado_inscripcion\n"
+                   "Maratón de Valencia,Running,2030-12-01,Villa Mala,42 km,https://evil.example,cerrada\n"
+                   "Carrera Nueva,Running,2030-05-05,Burgos,10 km,https://nueva.example,abierta\n")
+
+    race = _catalogo()
+    assert (race.url_oficial, race.localizacion, race.estado_inscripcion) == \
+        ("https://valencia.example", "Valencia", "abierta")
+    assert _sin_ids(_exportar(ana, "csv"))[0]["url_oficial"] == "https://valencia.example"
+    de_bea = {f["nombre"]: f for f in _sin_ids(_exportar(bea, "csv"))}
+    assert de_bea["Maratón de Valencia"]["url_oficial"] == "https://evil.example"
+
+    # La nueva entra al catálogo solo con lo que la identifica; el resto es de Bea
+    nueva = _catalogo("carrera nueva")
+    assert (nueva.nombre, nueva.deporte, nueva.url_oficial, nueva.localizacion) == ("Carrera Nueva", "Running", None, None)
+    assert nueva.estado_inscripcion == "pendiente"
+    assert de_bea["Carrera Nueva"]["url_oficial"] == "https://nueva.example"
+
+
+def test_metrica_de_catalogo_cuenta_las_nuevas(clientes):
+    antes = _nuevas_y_existentes()
+    _importar(clientes("ana@x.com"), CSV)
+    _importar(clientes("bea@x.com"), CSV)
+    nuevas, existentes = (despues - previo for despues, previo in zip(_nuevas_y_existentes(), antes))
+    # Tres carreras distintas: nuevas con Ana, ya existentes con Bea (y con la repetida de Ana, nada)
+    assert (nuevas, existentes) == (3, 3)
+
+
+def test_importar_en_postgres_usa_copy(motor_postgres):
+    database.inicializar_db()
+    db = SessionLocal()
+    try:
+        for email in ("ana@x.com", "bea@x.com"):
+            db.add(UserDB(nombre_completo=email, email=email))
+        db.commit()
+    finally:
+        db.close()
+    ana, bea = _usuario("ana@x.com"), _usuario("bea@x.com")
+
+    antes = _nuevas_y_existentes()
+    resumen = intercambio.importar([CSV.encode("utf-8")], "csv", ana)
+    assert (resumen["insertadas"], resumen["resultados"]) == (3, 2)
+    intercambio.importar([CSV.replace("https://valencia.example", "https://evil.example").encode("utf-8")], "csv", bea)
+    nuevas, existentes = (despues - previo for despues, previo in zip(_nuevas_y_existentes(), antes))
+    assert (nuevas, existentes) == (3, 3)
+    assert _catalogo().url_oficial is None # lo importado no llega al catálogo
+    db = SessionLocal()
+    try:
+        # Las que entran por COPY llevan el mismo estado por defecto que las del ORM
+        assert {estado for (estado,) in db.query(RaceDB.estado_inscripcion)} == {"pendiente"}
+    finally:
+        db.close()
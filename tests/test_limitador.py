@@ -0,0 +1,119 @@
+#Limitador compartido de llamadas a Groq y Tavily (src/limitador.py):
+#cubo de tokens con reserva para las interactivas, reintentos ante un
+#429, cupo del plan agotado y la versión asíncrona.
+
+import asyncio
+import threading
+
+import pytest
+
+from src import limitador as modulo
+from src.limitador import CuotaAgotada, LimitadorCompartido, PRIORIDAD_FONDO, PRIORIDAD_INTERACTIVA
+
+
+class Error429(Exception):
+    status_code = 429
+
+    class response:
+        headers = {"retry-after": "0"}
+
+
+class UsageLimitExceededError(Exception):
+    """Mismo nombre que la del SDK de Tavily."""
+
+
+@pytest.fixture
+def limitador(tmp_path, monkeypatch):
+    nuevo = LimitadorCompartido(str(tmp_path / "limitador.json"), {"prueba": {"por_segundo": 0.01, "capacidad": 3}})
+    monkeypatch.setattr(modulo, "limitador", nuevo)
+    return nuevo
+
+
+@pytest.fixture
+def rapido(limitador):
+    """Cubo que se rellena al instante: tras un 429 (que lo vacía) no hay que esperar."""
+    limitador.cuotas["prueba"]["por_segundo"] = 1000
+    return limitador
+
+
+def _fallar_y_luego(errores, resultado="ok"):
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        if len(llamadas) <= len(errores):
+            raise errores[len(llamadas) - 1]
+        return resultado
+    return funcion, llamadas
+
+
+def test_cubo_con_reserva_para_interactivas(limitador):
+    # Capacidad 3 con reserva 0.3: el fondo puede gastar 2 y la interactiva la última
+    assert limitador._intentar("prueba", PRIORIDAD_FONDO) == 0
+    assert limitador._intentar("prueba", PRIORIDAD_FONDO) == 0
+    assert limitador._intentar("prueba", PRIORIDAD_FONDO) > 0
+    assert limitador._intentar("prueba", PRIORIDAD_INTERACTIVA) == 0
+    assert limitador._intentar("prueba", PRIORIDAD_INTERACTIVA) > 0
+
+
+def test_el_estado_se_comparte_entre_instancias(limitador):
+    # Otro worker (otra instancia con el mismo fichero) ve los tokens gastados
+    otro = LimitadorCompartido(limitador.ruta, limitador.cuotas)
+    for _ in range(3):
+        assert limitador._intentar("prueba", PRIORIDAD_INTERACTIVA) == 0
+    assert otro._intentar("prueba", PRIORIDAD_INTERACTIVA) > 0
+
+
+def test_sin_turno_a_tiempo_cuota_agotada(limitador, monkeypatch):
+    monkeypatch.setattr(modulo, "LIMITADOR_ESPERA_MAX", 1)
+    for _ in range(3):
+        limitador.adquirir("prueba")
+    with pytest.raises(CuotaAgotada):
+        limitador.adquirir("prueba")
+
+
+def test_429_bloquea_y_reintenta(rapido):
+    funcion, llamadas = _fallar_y_luego([Error429("429 Too Many Requests")])
+
+    assert modulo.llamar_proveedor("prueba", funcion) == "ok"
+
+    assert len(llamadas) == 2
+    assert rapido._estado_local == {} # se usa el fichero, no la memoria
+    with rapido._estado() as estado:
+        assert estado["prueba"]["penalizacion"] == 0 # el éxito relaja el backoff
+
+
+def test_cupo_del_plan_agotado_no_se_reintenta(limitador):
+    funcion, llamadas = _fallar_y_luego([UsageLimitExceededError("This request exceeds your plan's set usage limit")])
+
+    with pytest.raises(CuotaAgotada):
+        modulo.llamar_proveedor("prueba", funcion)
+    assert len(llamadas) == 1
+
+    async def afuncion():
+        return funcion()
+    llamadas.clear()
+    with pytest.raises(CuotaAgotada):
+        asyncio.run(modulo.allamar_proveedor("prueba", afuncion))
+    assert len(llamadas) == 1
+
+
+def test_la_version_asincrona_no_bloquea_el_bucle(rapido, monkeypatch):
+    hilos = []
+    for nombre in ("_intentar", "registrar_429", "registrar_exito"):
+        original = getattr(rapido, nombre)
+
+        def envoltorio(*args, _original=original, **kwargs):
+            hilos.append(threading.current_thread())
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(rapido, nombre, envoltorio)
+
+    funcion, llamadas = _fallar_y_luego([Error429("429")])
+
+    async def afuncion():
+        return funcion()
+    assert asyncio.run(modulo.allamar_proveedor("prueba", afuncion)) == "ok"
+
+    # Al menos dos adquisiciones, el 429 y el éxito: todo fuera del hilo del bucle
+    assert len(hilos) >= 4
+    assert threading.main_thread() not in hilos
@@ -0,0 +1,80 @@
+#Métricas en formato de Prometheus (src/metricas.py y GET /metrics) y el
+#log de peticiones lentas.
+
+from src import api, metricas
+from src.metricas import Registro
+from tests.test_busqueda import MUJER
+
+
+def test_texto_de_prometheus():
+    registro = Registro()
+    registro.contar("racehub_proveedor_429_total", proveedor="groq")
+    registro.contar("racehub_proveedor_429_total", 2, proveedor="groq")
+    registro.contar("racehub_llm_tokens_total", 0.5, etapa='con "comillas"\n')
+    for valor in (0.003, 0.2, 100):
+        registro.observar("racehub_etapa_segundos", valor, etapa="tavily")
+
+    lineas = registro.texto().splitlines()
+    assert "# HELP racehub_proveedor_429_total Respuestas 429 de proveedores externos" in lineas
+    assert "# TYPE racehub_proveedor_429_total counter" in lineas
+    assert 'racehub_proveedor_429_total{proveedor="groq"} 3' in lineas
+    assert 'racehub_llm_tokens_total{etapa="con \\"comillas\\"\\n"} 0.5' in lineas
+    assert "# TYPE racehub_etapa_segundos histogram" in lineas
+    # Buckets acumulados: cada uno cuenta también los de debajo
+    assert 'racehub_etapa_segundos_bucket{etapa="tavily",le="0.005"} 1' in lineas
+    assert 'racehub_etapa_segundos_bucket{etapa="tavily",le="0.25"} 2' in lineas
+    assert 'racehub_etapa_segundos_bucket{etapa="tavily",le="60"} 2' in lineas
+    assert 'racehub_etapa_segundos_bucket{etapa="tavily",le="+Inf"} 3' in lineas
+    assert 'racehub_etapa_segundos_count{etapa="tavily"} 3' in lineas
+    assert 'racehub_etapa_segundos_sum{etapa="tavily"} 100.203' in lineas
+
+
+def test_metrics_tras_una_busqueda(clientes, proveedores_falsos, monkeypatch):
+    ana = clientes("ana@x.com")
+    nuevo = Registro() # sin lo que hayan contado otras pruebas
+    monkeypatch.setattr(metricas, "registro", nuevo)
+    monkeypatch.setattr(api, "registro", nuevo)
+    assert ana.post("/carreras/buscar", json={"nombre": MUJER}).status_code == 200
+    assert ana.delete("/carreras/999").status_code == 404
+
+    respuesta = ana.get("/metrics")
+    assert respuesta.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    texto = respuesta.text
+    assert 'racehub_http_segundos_count{estado="200",metodo="POST",ruta="/carreras/buscar"}' in texto
+    # La plantilla de la ruta, no la URL concreta
+    assert 'ruta="/carreras/{carrera_id}"' in texto and "/carreras/999" not in texto
+    assert 'racehub_llm_tokens_total{etapa="llm_carrera",tipo="prompt"}' in texto
+    assert 'racehub_proveedor_llamadas_total{' in texto
+    assert 'racehub_etapa_segundos_count{etapa="groq.ainvoke"} 1' in texto
+
+
+def test_log_de_peticiones_lentas(clientes, proveedores_falsos, monkeypatch, capsys):
+    ana = clientes("ana@x.com")
+    monkeypatch.setattr(metricas, "METRICAS_PETICION_LENTA", 1e-9)
+    ana.post("/carreras/buscar", json={"nombre": MUJER})
+    salida = capsys.readouterr().out
+    assert "🐢 Petición lenta: POST /carreras/buscar -> 200" in salida
+    # Con el desglose de las etapas, también las que corren en hilos
+    lenta = next(linea for linea in salida.splitlines() if "🐢" in linea)
+    assert "tavily.search" in lenta and "groq.ainvoke" in lenta
+
+    monkeypatch.setattr(metricas, "METRICAS_PETICION_LENTA", 0)
+    ana.get("/auth/me")
+    assert "🐢" not in capsys.readouterr().out
+
+
+def test_las_respuestas_en_streaming_se_miden_hasta_el_final(clientes, proveedores_falsos, monkeypatch, capsys):
+    ana = clientes("ana@x.com")
+    # ~0.1 s de Tavily y ~0.4 s de LLM, todo después de enviar las cabeceras
+    monkeypatch.setattr(proveedores_falsos, "FALSO_LATENCIA_MS", 100)
+    monkeypatch.setattr(metricas, "METRICAS_PETICION_LENTA", 0.3)
+    assert ana.post("/carreras/buscar/stream", json={"nombre": MUJER}).status_code == 200
+    lenta = next(linea for linea in capsys.readouterr().out.splitlines() if "🐢" in linea)
+    assert "POST /carreras/buscar/stream -> 200" in lenta and "tavily.search" in lenta
+
+
+def test_estadisticas_de_cache_con_sesion(clientes):
+    ana = clientes("ana@x.com")
+    assert "vuelo_unico" in ana.get("/cache/estadisticas").json()
+    ana.cookies.clear()
+    assert ana.get("/cache/estadisticas").status_code == 401
@@ -0,0 +1,188 @@
+#Migración de bases existentes al esquema actual (inicializar_db): desde
+#la versión inicial del proyecto (db/schema.sql o create_all de entonces)
+#y desde la última versión con una copia de cada carrera por usuario.
+
+from datetime import date, datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import inspect, text
+
+from src import database, estadisticas
+from src.database import RaceDB, CarreraDB, ResultadoDB, EstadisticaDB
+
+# create_all de la primera versión (SQLite)
+BASE_SQLITE = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, nombre_completo VARCHAR NOT NULL, email VARCHAR, share_token VARCHAR);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE UNIQUE INDEX ix_users_share_token ON users (share_token);
+CREATE TABLE carreras (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), nombre VARCHAR NOT NULL,
+    deporte VARCHAR NOT NULL, fecha DATE, localizacion VARCHAR, distancia_resumen VARCHAR, url_oficial VARCHAR,
+    estado_inscripcion VARCHAR);
+CREATE INDEX ix_carreras_id ON carreras (id);
+CREATE TABLE resultados (id INTEGER PRIMARY KEY, carrera_id INTEGER REFERENCES carreras(id), tiempo_oficial VARCHAR,
+    posicion_general INTEGER, ritmo_medio VARCHAR, comentarios VARCHAR);
+CREATE INDEX ix_resultados_id ON resultados (id);
+"""
+
+# db/schema.sql de la primera versión (PostgreSQL)
+BASE_POSTGRES = """
+CREATE TABLE users (id SERIAL PRIMARY KEY, nombre_completo VARCHAR(255) NOT NULL, email VARCHAR(255) UNIQUE NOT NULL,
+    share_token VARCHAR(255) UNIQUE, creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE carreras (id SERIAL PRIMARY KEY, user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    nombre VARCHAR(255) NOT NULL, deporte VARCHAR(100) NOT NULL, fecha DATE NOT NULL, localizacion VARCHAR(255),
+    distancia_resumen VARCHAR(255), url_oficial TEXT, estado_inscripcion VARCHAR(50) DEFAULT 'pendiente',
+    CONSTRAINT carrera_usuario_unica UNIQUE (user_id, nombre, fecha));
+CREATE TABLE resultados (id SERIAL PRIMARY KEY, carrera_id INTEGER REFERENCES carreras(id),
+    tiempo_oficial VARCHAR(50), posicion_general INTEGER, ritmo_medio VARCHAR(50), comentarios TEXT);
+"""
+
+DATOS = """
+INSERT INTO users (id, nombre_completo, email, share_token) VALUES (1, 'Ana', 'ana@x.com', 'tokA'), (2, 'Bea', 'bea@x.com', NULL);
+INSERT INTO carreras (id, user_id, nombre, deporte, fecha, localizacion, distancia_resumen, url_oficial, estado_inscripcion) VALUES
+    (1, 1, 'Maratón de Valencia', 'Running', '2026-12-06', 'Valencia', '42 km', 'https://valencia.example', 'abierta'),
+    (2, 1, 'Maraton de Valencia', 'Running', '2026-12-06', 'Valencia', '42 km, 10 km', NULL, 'cerrada'),
+    (3, 2, 'Maratón de Valencia', 'Running', '2026-12-06', NULL, NULL, NULL, 'pendiente'),
+    (4, 2, 'Behobia - San Sebastián', 'Running', '2025-11-09', 'Donostia', '20 km', NULL, 'cerrada');
+INSERT INTO resultados (id, carrera_id, tiempo_oficial, posicion_general, ritmo_medio) VALUES
+    (1, 2, '3:10:00', 1500, '4:30 min/km'), (2, 4, '1h35m', NULL, NULL);
+"""
+
+
+def _crear_base(motor, ddl):
+    with motor.begin() as conexion:
+        for sentencia in (ddl + DATOS).split(";"):
+            if sentencia.strip():
+                conexion.exec_driver_sql(sentencia)
+        if motor.dialect.name == "postgresql":
+            for tabla in ("users", "carreras", "resultados"):
+                conexion.exec_driver_sql(f"SELECT setval('{tabla}_id_seq', (SELECT MAX(id) FROM {tabla}))")
+
+
+def _contadores(db):
+    return sorted((e.user_id, e.dimension, e.clave, e.valor) for e in db.query(EstadisticaDB))
+
+
+def _comprobar_catalogo(motor):
+    columnas = {c["name"] for c in inspect(motor).get_columns("carreras")}
+    assert {"id", "user_id", "race_id", "resultado_solicitado_en"} <= columnas
+    assert "nombre" not in columnas and "fecha" in columnas
+    indices = {i["name"] for i in inspect(motor).get_indexes("carreras")}
+    assert {"ix_carreras_race", "ix_carreras_user_fecha"} <= indices
+    assert "ix_carreras_user_race" not in indices
+
+    db = database.SessionLocal()
+    try:
+        races = {(r.nombre_normalizado, r.fecha): r for r in db.query(RaceDB)}
+        assert set(races) == {("maraton de valencia", date(2026, 12, 6)), ("behobia san sebastian", date(2025, 11, 9))}
+        valencia = races[("maraton de valencia", date(2026, 12, 6))]
+        assert valencia.nombre == "Maratón de Valencia" # el nombre más repetido
+
+        # Las dos copias de Ana se funden en la más antigua y el resultado pasa a ella
+        enlaces = sorted((c.id, c.user_id, c.race_id, c.fecha) for c in db.query(CarreraDB))
+        behobia = races[("behobia san sebastian", date(2025, 11, 9))]
+        assert enlaces == [(1, 1, valencia.id, valencia.fecha), (3, 2, valencia.id, valencia.fecha),
+                           (4, 2, behobia.id, behobia.fecha)]
+        assert sorted((r.id, r.carrera_id) for r in db.query(ResultadoDB)) == [(1, 1), (2, 4)]
+        # Los tiempos de texto se convierten a segundos
+        assert {r.id: r.tiempo_segundos for r in db.query(ResultadoDB)} == {1: 11400, 2: 5700}
+
+        # Las consultas del ORM funcionan sobre las tablas migradas y los contadores cuadran
+        de_ana = db.query(CarreraDB).filter(CarreraDB.user_id == 1).one()
+        assert de_ana.nombre == "Maratón de Valencia"
+        # Lo que su copia tenía distinto del catálogo sigue siendo suyo
+        assert (de_ana.url_oficial, de_ana.estado_inscripcion) == ("https://valencia.example", "abierta")
+        assert db.query(CarreraDB).filter(CarreraDB.id == 3).one().url_oficial == valencia.url_oficial
+        antes = _contadores(db)
+        estadisticas.reconstruir(db)
+        db.commit()
+        assert antes == _contadores(db) and antes
+    finally:
+        db.close()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def motor_y_base(request):
+    if request.param == "sqlite":
+        return request.getfixturevalue("motor"), BASE_SQLITE
+    return request.getfixturevalue("motor_postgres"), BASE_POSTGRES
+
+
+def test_migracion_desde_la_version_inicial(motor_y_base):
+    motor, ddl = motor_y_base
+    _crear_base(motor, ddl)
+
+    database.inicializar_db()
+    _comprobar_catalogo(motor)
+
+    # Una segunda vez no hace nada
+    database.inicializar_db()
+    _comprobar_catalogo(motor)
+
+
+def test_migracion_desde_copias_por_usuario_con_columnas_nuevas(motor):
+    # Versión anterior al catálogo: ya con nombre_normalizado, revisiones y el índice de paginación
+    _crear_base(motor, BASE_SQLITE)
+    with motor.begin() as conexion:
+        for columna, tipo in (("nombre_normalizado", "VARCHAR"), ("comprobada_en", "DATETIME"),
+                              ("resultado_solicitado_en", "DATETIME")):
+            conexion.exec_driver_sql(f"ALTER TABLE carreras ADD COLUMN {columna} {tipo}")
+        conexion.exec_driver_sql("CREATE INDEX ix_carreras_user_fecha ON carreras (user_id, fecha, id)")
+        conexion.execute(text("UPDATE carreras SET resultado_solicitado_en = '2026-01-02 10:00:00', "
+                              "comprobada_en = '2026-01-01 09:00:00' WHERE id = 4"))
+
+    database.inicializar_db()
+    _comprobar_catalogo(motor)
+
+    db = database.SessionLocal()
+    try:
+        behobia = db.get(CarreraDB, 4)
+        assert behobia.resultado_solicitado_en is not None
+        assert behobia.race.comprobada_en is not None
+    finally:
+        db.close()
+
+
+def test_migracion_de_enlaces_sin_fecha(motor):
+    # Catálogo ya migrado, de antes de que carreras copiara la fecha de races
+    database.Base.metadata.create_all(bind=motor)
+    with motor.begin() as conexion:
+        conexion.exec_driver_sql("DROP INDEX ix_carreras_user_fecha")
+        conexion.exec_driver_sql("ALTER TABLE carreras DROP COLUMN fecha")
+        conexion.exec_driver_sql("CREATE INDEX ix_carreras_user_race ON carreras (user_id, race_id, id)")
+        conexion.exec_driver_sql("INSERT INTO users (id, nombre_completo, email) VALUES (1, 'Ana', 'ana@x.com')")
+        conexion.exec_driver_sql("INSERT INTO races (id, nombre, nombre_normalizado, deporte, fecha) "
+                                 "VALUES (1, 'Behobia', 'behobia', 'Running', '2030-11-09')")
+        conexion.exec_driver_sql("INSERT INTO carreras (id, user_id, race_id) VALUES (1, 1, 1)")
+
+    database.inicializar_db()
+
+    indices = {i["name"] for i in inspect(motor).get_indexes("carreras")}
+    assert "ix_carreras_user_fecha" in indices and "ix_carreras_user_race" not in indices
+    db = database.SessionLocal()
+    try:
+        assert db.get(CarreraDB, 1).fecha == date(2030, 11, 9)
+    finally:
+        db.close()
+
+
+def test_schema_sql_se_puede_volver_a_aplicar(motor_postgres):
+    # Con datos en todas las tablas que dependen de users, el DROP inicial no falla
+    esquema = (Path(__file__).resolve().parent.parent / "db" / "schema.sql").read_text(encoding="utf-8")
+    with motor_postgres.begin() as conexion:
+        conexion.exec_driver_sql(esquema)
+    database.inicializar_db()
+    db = database.SessionLocal()
+    try:
+        db.add(database.UserDB(id=1, nombre_completo="Ana", email="ana@x.com"))
+        db.flush()
+        ahora = datetime.now()
+        db.add_all([database.TrabajoDB(id="t1", user_id=1, tipo="resultado", creado_en=ahora, actualizado_en=ahora),
+                    EstadisticaDB(user_id=1, dimension="total", clave="", valor=1),
+                    database.CalendarioIcsDB(user_id=1, cuerpo="BEGIN:VCALENDAR", etag='"e"', generado_en=ahora)])
+        db.commit()
+    finally:
+        db.close()
+    with motor_postgres.begin() as conexion:
+        conexion.exec_driver_sql(esquema)
+    assert inspect(motor_postgres).has_table("users")
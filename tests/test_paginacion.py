@@ -0,0 +1,75 @@
+#Lista de carreras paginada por cursor (GET /carreras) y el índice que
+#la sirve.
+
+from sqlalchemy.orm import contains_eager
+
+from src import database
+from src.database import CarreraDB, RaceDB
+from tests.test_catalogo import _confirmar
+
+FECHAS = ["2030-03-01", "2030-01-15", "2030-01-15", "2030-06-30", "2030-02-01"]
+
+
+def _guardar(cliente):
+    for i, fecha in enumerate(FECHAS):
+        deporte = "Trail" if i % 2 else "Running"
+        _confirmar(cliente, nombre_oficial=f"Carrera {i}", fecha=fecha, deporte=deporte)
+
+
+def _recorrer(cliente, **parametros):
+    paginas, cursor = [], None
+    while True:
+        respuesta = cliente.get("/carreras", params={**parametros, **({"cursor": cursor} if cursor else {})})
+        assert respuesta.status_code == 200
+        paginas.append([(c["fecha"], c["nombre"]) for c in respuesta.json()])
+        cursor = respuesta.headers.get("X-Next-Cursor")
+        if not cursor:
+            return paginas
+
+
+def test_paginas_en_orden_sin_repetir_ni_saltar(clientes):
+    ana = clientes("ana@x.com")
+    _guardar(ana)
+    _confirmar(clientes("bea@x.com"), nombre_oficial="De Bea", fecha="2030-01-01")
+
+    paginas = _recorrer(ana, limite=2)
+
+    assert [len(p) for p in paginas] == [2, 2, 1]
+    filas = [fila for pagina in paginas for fila in pagina]
+    assert [fecha for fecha, _ in filas] == sorted(FECHAS)
+    assert len(set(filas)) == len(FECHAS) # los dos del 15 de enero, una vez cada uno
+    assert "De Bea" not in {nombre for _, nombre in filas}
+
+
+def test_filtros_con_cursor(clientes):
+    ana = clientes("ana@x.com")
+    _guardar(ana)
+
+    paginas = _recorrer(ana, limite=1, deporte="trail", **{"from": "2030-01-16"})
+
+    assert paginas == [[("2030-06-30", "Carrera 3")]]
+    corriendo = _recorrer(ana, limite=1, deporte="Running")
+    assert [fecha for pagina in corriendo for fecha, _ in pagina] == ["2030-01-15", "2030-02-01", "2030-03-01"]
+
+
+def test_cursor_invalido(clientes):
+    assert clientes("ana@x.com").get("/carreras", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def _plan(sql):
+    with database.engine.connect() as conexion:
+        return " | ".join(fila[-1] for fila in conexion.exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+
+
+def test_la_pagina_usa_el_indice_del_usuario(sesion):
+    consulta = (
+        sesion.query(CarreraDB).join(RaceDB, RaceDB.id == CarreraDB.race_id)
+        .options(contains_eager(CarreraDB.race))
+        .filter(CarreraDB.user_id == 1, CarreraDB.fecha >= "2030-01-01", CarreraDB.fecha <= "2030-01-31")
+        .order_by(CarreraDB.fecha, CarreraDB.id).limit(51)
+    )
+    sql = str(consulta.statement.compile(database.engine, compile_kwargs={"literal_binds": True}))
+    plan = _plan(sql)
+    # El índice da el rango de fechas ya ordenado: sin ordenar aparte
+    assert "SEARCH carreras USING INDEX ix_carreras_user_fecha (user_id=? AND fecha>? AND fecha<?)" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,70 @@
+#Proveedores falsos de Tavily y Groq (src/proveedores_falsos.py) y la
+#prueba de carga que los usa (bench/carga.py).
+
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from src import main
+from src.limitador import es_rate_limit
+from src.main import CarreraSchema, ResultadoSchema
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def test_busqueda_enlatada_y_estable(proveedores_falsos):
+    tavily = main.get_tavily()
+    assert isinstance(tavily, proveedores_falsos.TavilyFalso)
+    respuesta = tavily.search(query=main._query_carrera("Maratón de Valencia", 2030), max_results=3)
+
+    assert respuesta == tavily.search(query=main._query_carrera("Maratón de Valencia", 2030), max_results=3)
+    assert len(respuesta["results"]) == 3
+    assert "Maratón de Valencia se celebrará el" in respuesta["results"][0]["content"]
+    assert proveedores_falsos._proxima_fecha("Maratón de Valencia") > date.today()
+
+    clasificacion = tavily.extract(urls="https://resultados.example")["results"][0]["raw_content"]
+    assert "GARCÍA LÓPEZ, Juan" in clasificacion and clasificacion.count("\n") == 301
+
+
+def test_salida_estructurada_como_langchain(proveedores_falsos):
+    prompt = main._prompt_carrera("Trail Picos", "contexto", 2030)
+    respuesta = main.get_llm_carreras().invoke(prompt)
+    carrera = main._salida_estructurada(respuesta, "llm_carrera")
+    assert isinstance(carrera, CarreraSchema) and carrera.nombre_oficial == "Trail Picos"
+    assert respuesta["raw"].usage_metadata["total_tokens"] > 60
+
+    resultado = asyncio.run(main.get_llm_resultado().ainvoke("clasificación"))["parsed"]
+    assert isinstance(resultado, ResultadoSchema) and resultado.tiempo_oficial == "3:05:11"
+
+
+def test_errores_simulados(proveedores_falsos, monkeypatch):
+    tavily = main.get_tavily()
+    monkeypatch.setattr(proveedores_falsos, "FALSO_TASA_429", 1)
+    with pytest.raises(proveedores_falsos.Error429Falso) as error:
+        tavily.search(query="cualquiera")
+    assert es_rate_limit(error.value)
+
+    monkeypatch.setattr(proveedores_falsos, "FALSO_TASA_429", 0)
+    monkeypatch.setattr(proveedores_falsos, "FALSO_TASA_ERROR", 1)
+    with pytest.raises(proveedores_falsos.ErrorFalso) as error:
+        asyncio.run(main.get_tavily_async().search(query="cualquiera"))
+    assert not es_rate_limit(error.value)
+
+
+def test_prueba_de_carga_sin_red(tmp_path):
+    entorno = {k: v for k, v in os.environ.items() if k not in ("DATABASE_URL", "LIMITADOR_FICHERO")}
+    entorno["TMPDIR"] = str(tmp_path)
+    salida = subprocess.run(
+        [sys.executable, str(RAIZ / "bench" / "carga.py"), "--usuarios", "3", "--duracion", "1",
+         "--carreras", "3", "--latencia-ms", "5"],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, timeout=60
+    )
+    assert salida.returncode == 0, salida.stderr
+    informe = salida.stdout[salida.stdout.index("operación"):]
+    assert "listar" in informe and "buscar" in informe
+    assert ", 0 errores," in informe
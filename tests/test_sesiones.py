@@ -0,0 +1,60 @@
+#Caché de usuarios autenticados (get_current_user en src/api.py): sin
+#consulta a la base de datos mientras la entrada es válida, y siempre
+#al día tras cambiar el perfil o crear el enlace de compartir.
+
+import pytest
+from sqlalchemy import event
+
+from src.api import cache_usuarios
+from src.database import UserDB
+
+
+@pytest.fixture
+def consultas(bd):
+    """Sentencias SQL ejecutadas contra la base de la prueba."""
+    sentencias = []
+    escuchar = lambda conexion, cursor, sql, *args: sentencias.append(sql)
+    event.listen(bd, "before_cursor_execute", escuchar)
+    yield sentencias
+    event.remove(bd, "before_cursor_execute", escuchar)
+
+
+def test_sin_consultas_mientras_esta_en_cache(clientes, consultas):
+    ana = clientes("ana@x.com")
+    antes = cache_usuarios.estadisticas()
+    consultas.clear()
+    assert ana.get("/auth/me").json() == {"email": "ana@x.com", "nombre": "ana"}
+    assert len(consultas) == 1 # el login invalida la entrada: la primera va a la base
+    for _ in range(4):
+        assert ana.get("/auth/me").json() == {"email": "ana@x.com", "nombre": "ana"}
+    assert len(consultas) == 1
+
+    despues = cache_usuarios.estadisticas()
+    assert despues["fallos"] - antes["fallos"] == 1
+    assert despues["aciertos"] - antes["aciertos"] == 4
+    # La propia consulta de estadísticas se autentica con la caché
+    assert ana.get("/cache/estadisticas").json()["usuarios"]["aciertos"] == despues["aciertos"] + 1
+
+
+def test_cambios_de_perfil_y_token_se_ven_al_momento(clientes):
+    ana = clientes("ana@x.com")
+    assert ana.get("/perfil").json()["nombre"] == "ana"
+    assert ana.post("/perfil", json={"nombre_completo": "Ana García"}).status_code == 200
+    assert ana.get("/perfil").json()["nombre"] == "Ana García"
+
+    token = ana.get("/share/token").json()["share_token"]
+    assert ana.get("/share/token").json()["share_token"] == token # ya en la sesión cacheada
+
+
+def test_cambios_de_otro_worker_llegan_al_caducar(clientes, sesion, monkeypatch):
+    ana = clientes("ana@x.com")
+    ana.get("/auth/me")
+    # Otro worker cambia el nombre: este no se entera hasta que caduca la entrada
+    sesion.query(UserDB).filter(UserDB.email == "ana@x.com").update({UserDB.nombre_completo: "Ana (otro worker)"})
+    sesion.commit()
+    assert ana.get("/auth/me").json()["nombre"] == "ana"
+    monkeypatch.setattr(cache_usuarios, "ttl_segundos", 0)
+    assert ana.get("/auth/me").json()["nombre"] == "Ana (otro worker)"
+
+    ana.cookies.set("user_email", "nadie@x.com")
+    assert ana.get("/auth/me").status_code == 401
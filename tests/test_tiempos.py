@@ -0,0 +1,119 @@
+#Conversión de tiempos, ritmos y distancias de texto libre a números
+#(src/tiempos.py) y las mejores marcas que se calculan con ellos.
+
+import pytest
+
+from src.tiempos import (
+    distancia_resultado, formatear_ritmo, formatear_tiempo, medidas_resultado, parsear_distancia_km, parsear_ritmo,
+    parsear_tiempo,
+)
+from src.main import ResultadoSchema, guardar_resultado_db
+from tests.test_catalogo import _confirmar
+from tests.test_trabajos import _usuario
+
+
+@pytest.mark.parametrize("texto, segundos", [
+    ("1:30:45", 5445),
+    ("01:30:45.3", 5445),
+    ("2.30.15", 9015),
+    ("45:12", 2712),
+    ("1h 30m 45s", 5445),
+    ("3h05'12\"", 11112),
+    ("45'12''", 2712),
+    ("3h05", 11100),
+    ("3h 05 min", 11100),
+    ("2 horas 5 minutos", 7500),
+    ("Tiempo 1h30m", 5400),
+    ("Tiempo oficial: 3:10:00 (real 3:09:41)", 11400),
+    ("1h", 3600),
+])
+def test_parsear_tiempo(texto, segundos):
+    assert parsear_tiempo(texto) == segundos
+
+
+@pytest.mark.parametrize("texto", [None, "", "No encontrado", "Puesto 12", "1:75:00", "DNF"])
+def test_parsear_tiempo_sin_tiempo(texto):
+    assert parsear_tiempo(texto) is None
+
+
+@pytest.mark.parametrize("texto, distancia_km, segundos", [
+    ("1:30", 21.0975, 5400), # mm:ss serían 4 s/km: h:mm
+    ("45:12", 10, 2712), # h:mm serían 45 horas: mm:ss
+    ("4:30", 1, 270),
+    ("1:30", None, 90), # sin distancia, mm:ss
+    ("0:01", 10, None), # ningún ritmo posible
+])
+def test_parsear_tiempo_con_distancia(texto, distancia_km, segundos):
+    assert parsear_tiempo(texto, distancia_km) == segundos
+
+
+def test_medidas_del_resultado():
+    assert medidas_resultado("1:30", None, "Media Maratón") == (5400, None, 21.0975)
+    # Con varias distancias decide el ritmo; sin él no se adivina
+    assert medidas_resultado("1:30", "4:15 min/km", "21 km, 10 km") == (5400, 255, 21.0975)
+    assert medidas_resultado("1:30", None, "21 km, 1 km") == (None, None, None)
+    assert medidas_resultado("2.30.15", None, "42 km, 21 km") == (9015, None, None)
+
+
+@pytest.mark.parametrize("texto, segundos_km", [
+    ("4:30 min/km", 270),
+    ("4'30\"/km", 270),
+    ("7:15/mi", 270),
+    ("No encontrado", None),
+    ("0:00 min/km", None),
+])
+def test_parsear_ritmo(texto, segundos_km):
+    assert parsear_ritmo(texto) == segundos_km
+
+
+@pytest.mark.parametrize("texto, km", [
+    ("42k", 42.195),
+    ("Maratón", 42.195),
+    ("Media Maratón", 21.0975),
+    ("21,097 km", 21.0975),
+    ("10K", 10),
+    ("100 millas", 160.934),
+    ("800 m", 0.8),
+    ("Recorrido urbano", None),
+])
+def test_parsear_distancia_km(texto, km):
+    assert parsear_distancia_km(texto) == km
+
+
+def test_distancia_del_resultado():
+    assert distancia_resultado("42 km", None, None) == 42.195
+    # Varias distancias: la que cuadra con tiempo / ritmo
+    assert distancia_resultado("42 km, 21 km, 10 km", 5700, 270) == 21.0975
+    assert distancia_resultado("42 km, 10 km", None, None) is None
+
+
+def test_formatear():
+    assert formatear_tiempo(5445) == "1:30:45"
+    assert formatear_ritmo(270) == "4:30 min/km"
+    assert formatear_tiempo(None) is None and formatear_ritmo(None) is None
+
+
+#--- Mejores marcas (GET /resultados/mejores-marcas) ---
+
+def test_mejores_marcas_por_deporte_y_distancia(clientes):
+    ana, bea = clientes("ana@x.com"), clientes("bea@x.com")
+    _confirmar(ana)
+    _confirmar(ana, nombre_oficial="Maratón de Sevilla", fecha="2030-02-23", lugar="Sevilla")
+    _confirmar(ana, nombre_oficial="Trail de Guara", deporte="Trail", fecha="2030-06-09", lugar="Alquézar",
+               distancias=["42 km", "21 km"])
+    _confirmar(bea)
+    guardar = lambda tiempo, carrera, ritmo=None, email="ana@x.com": guardar_resultado_db(
+        ResultadoSchema(tiempo_oficial=tiempo, ritmo_medio=ritmo), carrera, 2030, _usuario(email))
+    guardar("3:10:00", "Maratón de Valencia")
+    guardar("3h05'12\"", "Maratón de Sevilla", "4:23 min/km")
+    guardar("No encontrado", "Maratón de Valencia")
+    guardar("2:10:00", "Trail de Guara", "6:10 min/km") # el ritmo dice que fue la de 21 km
+    guardar("2:50:00", "Maratón de Valencia", email="bea@x.com")
+
+    marcas = ana.get("/resultados/mejores-marcas").json()
+    assert [(m["deporte"], m["distancia_km"], m["tiempo"], m["carrera"]) for m in marcas] == [
+        ("Running", 42.195, "3:05:12", "Maratón de Sevilla"),
+        ("Trail", 21.0975, "2:10:00", "Trail de Guara"),
+    ]
+    assert marcas[0]["ritmo"] == "4:23 min/km"
+    assert bea.get("/resultados/mejores-marcas").json()[0]["tiempo"] == "2:50:00"
@@ -0,0 +1,121 @@
+#Tareas en segundo plano de búsqueda de resultados (src/trabajos.py):
+#estados, fallos al guardar, tareas perdidas por un reinicio y el
+#límite de las conexiones SSE.
+
+from datetime import datetime, timedelta
+
+from src import api, trabajos
+from src.database import SessionLocal, TrabajoDB, ResultadoDB, UserDB
+from src.main import ResultadoSchema
+from tests.test_catalogo import VALENCIA, _confirmar
+
+
+def _usuario(email="ana@x.com"):
+    db = SessionLocal()
+    try:
+        return db.query(UserDB).filter(UserDB.email == email).one().id
+    finally:
+        db.close()
+
+
+def _crear_trabajo(user_id, estado, hace_minutos):
+    cuando = datetime.now() - timedelta(minutes=hace_minutos)
+    trabajo = TrabajoDB(id=f"t-{estado}-{hace_minutos}", user_id=user_id, tipo="resultado", estado=estado,
+                        parametros="{}", creado_en=cuando, actualizado_en=cuando)
+    db = SessionLocal()
+    try:
+        db.add(trabajo)
+        db.commit()
+        return trabajo.id
+    finally:
+        db.close()
+
+
+def _resultado_encontrado(monkeypatch):
+    monkeypatch.setattr(trabajos, "buscar_resultado_usuario",
+                        lambda *args, **kwargs: ResultadoSchema(tiempo_oficial="3:10:00", posicion_general=1500))
+
+
+def test_tarea_completada_guarda_el_resultado(clientes, monkeypatch):
+    _confirmar(clientes("ana@x.com"))
+    ana = _usuario()
+    _resultado_encontrado(monkeypatch)
+    trabajo_id = _crear_trabajo(ana, "pendiente", 0)
+
+    trabajos._ejecutar_busqueda_resultado(trabajo_id, ana, VALENCIA["nombre_oficial"], 2030, "Ana", "interactiva")
+
+    trabajo = trabajos.obtener_trabajo(trabajo_id, ana)
+    assert trabajo["estado"] == "completado" and trabajo["terminado"]
+    assert trabajo["resultado"]["tiempo"] == "3:10:00"
+    db = SessionLocal()
+    try:
+        assert db.query(ResultadoDB).one().tiempo_segundos == 11400
+    finally:
+        db.close()
+
+
+def test_si_no_se_puede_guardar_la_tarea_acaba_en_error(clientes, monkeypatch):
+    clientes("ana@x.com")
+    ana = _usuario()
+    _resultado_encontrado(monkeypatch)
+    trabajo_id = _crear_trabajo(ana, "pendiente", 0)
+
+    # La carrera no está en su lista: antes se daba por completada sin guardar nada
+    trabajos._ejecutar_busqueda_resultado(trabajo_id, ana, "Maratón de Ninguna Parte", 2030, "Ana", "interactiva")
+
+    trabajo = trabajos.obtener_trabajo(trabajo_id, ana)
+    assert trabajo["estado"] == "error" and "no está en tu lista" in trabajo["error"]
+    assert trabajo["resultado"] is None
+
+
+def test_tareas_interrumpidas_caducan(clientes):
+    clientes("ana@x.com")
+    ana = _usuario()
+    perdida = _crear_trabajo(ana, "buscando", trabajos.TRABAJOS_TIMEOUT_MIN + 5)
+    en_curso = _crear_trabajo(ana, "buscando", 1)
+    terminada = _crear_trabajo(ana, "completado", trabajos.TRABAJOS_TIMEOUT_MIN + 5)
+
+    # Al arrancar se marcan todas las perdidas; al consultar, la consultada
+    assert trabajos.caducar_trabajos() == 1
+    assert trabajos.obtener_trabajo(perdida, ana)["estado"] == "error"
+    assert trabajos.obtener_trabajo(perdida, ana)["error"] == trabajos.ERROR_CADUCADO
+    assert trabajos.obtener_trabajo(en_curso, ana)["estado"] == "buscando"
+    assert trabajos.obtener_trabajo(terminada, ana)["estado"] == "completado"
+
+    otra = _crear_trabajo(ana, "guardando", trabajos.TRABAJOS_TIMEOUT_MIN + 1)
+    assert trabajos.obtener_trabajo(otra, ana)["terminado"]
+
+
+def test_sse_termina_al_agotar_el_tiempo(clientes, monkeypatch):
+    cliente = clientes("ana@x.com")
+    trabajo_id = _crear_trabajo(_usuario(), "buscando", 0)
+    monkeypatch.setattr(api, "TRABAJOS_SSE_MAX_SEGUNDOS", 0.05)
+    monkeypatch.setattr(api, "TRABAJOS_SSE_INTERVALO", 0.01)
+
+    cuerpo = cliente.get(f"/resultados/trabajos/{trabajo_id}/eventos").text
+
+    assert cuerpo.startswith("event: buscando\n")
+    assert cuerpo.rstrip().split("\n\n")[-1].startswith("event: espera_agotada\n")
+
+
+def test_sse_termina_con_la_tarea(clientes):
+    cliente = clientes("ana@x.com")
+    trabajo_id = _crear_trabajo(_usuario(), "error", 0)
+    assert cliente.get(f"/resultados/trabajos/{trabajo_id}/eventos").text.startswith("event: error\n")
+    assert clientes("bea@x.com").get(f"/resultados/trabajos/{trabajo_id}/eventos").status_code == 404
+
+
+def test_el_endpoint_responde_al_momento_y_la_tarea_termina(clientes, monkeypatch):
+    cliente = clientes("ana@x.com")
+    _confirmar(cliente)
+    _resultado_encontrado(monkeypatch)
+
+    respuesta = cliente.post("/resultados/buscar", json={"nombre_carrera": "Maratón de Valencia", "anio": 2030})
+    assert respuesta.status_code == 202
+    tarea = respuesta.json()
+    assert tarea["estado"] == "pendiente" and tarea["corredor"] == "ana"
+
+    trabajos.cerrar_pool() # espera a que termine
+    estado = cliente.get(tarea["url_estado"]).json()
+    assert estado["estado"] == "completado" and estado["resultado"]["tiempo"] == "3:10:00"
+    assert clientes("bea@x.com").get(tarea["url_estado"]).status_code == 404
@@ -0,0 +1,123 @@
+#Agrupación de búsquedas idénticas en curso (src/vuelo_unico.py), desde
+#hilos y desde asyncio.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.vuelo_unico import VueloCancelado, VueloUnico
+
+
+def _esperar_agrupadas(vuelos, n):
+    limite = time.monotonic() + 5
+    while vuelos.estadisticas()["agrupadas"] < n:
+        assert time.monotonic() < limite, "los seguidores no llegaron a unirse"
+        time.sleep(0.005)
+
+
+def test_una_llamada_para_busquedas_iguales():
+    vuelos, soltar, llamadas = VueloUnico(), threading.Event(), []
+
+    def buscar(nombre):
+        llamadas.append(nombre)
+        soltar.wait(5)
+        return {"nombre": nombre}
+
+    with ThreadPoolExecutor(4) as pool:
+        futuros = [pool.submit(vuelos.ejecutar, "carrera:valencia:2030", buscar, "valencia") for _ in range(4)]
+        _esperar_agrupadas(vuelos, 3)
+        soltar.set()
+        resultados = [f.result(5) for f in futuros]
+
+    assert llamadas == ["valencia"]
+    assert resultados == [{"nombre": "valencia"}] * 4
+    assert vuelos.estadisticas() == {"en_curso": 0, "lideres": 1, "agrupadas": 3}
+    # Terminado el vuelo, la siguiente empieza de cero
+    vuelos.ejecutar("carrera:valencia:2030", buscar, "otra")
+    assert llamadas == ["valencia", "otra"]
+
+
+def test_el_error_del_lider_llega_a_todos():
+    vuelos, soltar = VueloUnico(), threading.Event()
+
+    def fallar():
+        soltar.wait(5)
+        raise ValueError("sin resultados")
+
+    with ThreadPoolExecutor(2) as pool:
+        futuros = [pool.submit(vuelos.ejecutar, "clave", fallar) for _ in range(2)]
+        _esperar_agrupadas(vuelos, 1)
+        soltar.set()
+        for futuro in futuros:
+            with pytest.raises(ValueError, match="sin resultados"):
+                futuro.result(5)
+
+
+def test_lider_asincrono_cancelado_no_cancela_a_los_seguidores():
+    vuelos = VueloUnico()
+
+    async def escenario():
+        lider = asyncio.ensure_future(vuelos.aejecutar("clave", lambda: asyncio.sleep(30)))
+        await asyncio.sleep(0)
+        # Un seguidor síncrono (hilo) y otro asíncrono
+        hilo = asyncio.get_running_loop().run_in_executor(None, vuelos.ejecutar, "clave", lambda: "no se llama")
+        seguidor = asyncio.ensure_future(vuelos.aejecutar("clave", lambda: asyncio.sleep(0)))
+        await asyncio.to_thread(_esperar_agrupadas, vuelos, 2)
+
+        # Se cancela la tarea que hace la llamada (p. ej. al apagar el servidor)
+        vuelos._vuelos["clave"].tarea.cancel()
+        resultados = await asyncio.gather(hilo, seguidor, lider, return_exceptions=True)
+        return resultados
+
+    resultados = asyncio.run(escenario())
+    assert all(isinstance(r, VueloCancelado) for r in resultados), resultados
+    assert vuelos.estadisticas()["en_curso"] == 0
+
+
+def test_seguidor_asincrono_cancelado_no_cancela_la_busqueda():
+    vuelos, llamadas = VueloUnico(), []
+
+    async def buscar():
+        llamadas.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def escenario():
+        lider = asyncio.ensure_future(vuelos.aejecutar("clave", buscar))
+        await asyncio.sleep(0)
+        seguidor = asyncio.ensure_future(vuelos.aejecutar("clave", buscar))
+        await asyncio.sleep(0)
+        seguidor.cancel()
+        return await lider, seguidor.cancelled()
+
+    assert asyncio.run(escenario()) == ("ok", True)
+    assert llamadas == [1]
+
+
+def test_lider_sincrono_interrumpido():
+    vuelos, soltar = VueloUnico(), threading.Event()
+
+    def interrumpir():
+        soltar.wait(5)
+        raise KeyboardInterrupt
+
+    def lider():
+        try:
+            vuelos.ejecutar("clave", interrumpir)
+        except KeyboardInterrupt:
+            return "interrumpido"
+
+    with ThreadPoolExecutor(2) as pool:
+        del_lider = pool.submit(lider)
+        _esperar_llegada = time.monotonic() + 5
+        while vuelos.estadisticas()["en_curso"] == 0 and time.monotonic() < _esperar_llegada:
+            time.sleep(0.005)
+        seguidor = pool.submit(vuelos.ejecutar, "clave", lambda: "no se llama")
+        _esperar_agrupadas(vuelos, 1)
+        soltar.set()
+        assert del_lider.result(5) == "interrumpido"
+        with pytest.raises(VueloCancelado):
+            seguidor.result(5)